@@ -18,6 +18,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "betweencoffee_delivery.settings
 # 先获取基础的ASGI应用
 django_asgi_app = get_asgi_application()
 
+# 處理上次進程遺留的支付發件箱記錄，並定時掃描（沒有 Celery 時）
+from eshop.payment_outbox import start_payment_outbox_worker  # noqa: E402
+
+start_payment_outbox_worker()
+
 # 现在尝试导入Channels相关模块
 try:
     from channels.routing import ProtocolTypeRouter, URLRouter
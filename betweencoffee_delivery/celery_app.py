@@ -39,6 +39,10 @@ if CELERY_AVAILABLE:
             "task": "eshop.tasks.cleanup_old_queues",
             "schedule": crontab(hour=3, minute=0),  # 每天凌晨3點
         },
+        "drain-payment-outbox-every-minute": {
+            "task": "eshop.tasks.drain_payment_outbox",
+            "schedule": 60.0,  # 處理遺留和重試中的支付發件箱記錄
+        },
     }
 else:
     # 提供一個模擬的 Celery 應用，讓導入不報錯
@@ -4,16 +4,16 @@ import logging
 
 from django.utils.deprecation import MiddlewareMixin
 
-from cart.cart import Cart
+from cart.cart import get_cart
 
 logger = logging.getLogger(__name__)
 
 
 class CartMiddleware(MiddlewareMixin):
     def process_request(self, request):
-        # Initialize cart early in the request cycle
+        # Initialize cart early in the request cycle（延遲加載，整個請求共用）
         try:
-            request.cart = Cart(request)
+            request.cart = get_cart(request)
         except Exception as e:
             logger.warning(f"Cart initialization failed (non-critical): {e}")
             # 創建一個空的購物車對象作為後備
@@ -25,12 +25,13 @@ class CartMiddleware(MiddlewareMixin):
             request.cart.session = request.session
             request.cart.user = request.user
             request.cart.cart = {}
+            request.cart._db_items = None
 
     def process_response(self, request, response):
         # Handle cart merging after login
         if hasattr(request, "user") and request.user.is_authenticated:
             cart = getattr(request, "cart", None)
-            if cart and hasattr(cart, "merge_with_user_cart"):
+            if cart is not None and hasattr(cart, "merge_with_user_cart"):
                 cart.merge_with_user_cart(request)
         return response
 
@@ -0,0 +1,111 @@
+# betweencoffee_delivery/page_cache.py
+"""
+菜單 / 首頁 / 商品詳情頁面緩存
+
+商品目錄大約一天才變化一次，但每個匿名請求都完整渲染商品列表。
+這個模塊以商品目錄的版本（eshop.catalog，商品保存或刪除時更新）作為緩存鍵：
+
+1. 模板片段：商品列表和詳情的 HTML 以 {% cache fragment_timeout "名稱" ... catalog_version %}
+   緩存，目錄版本改變後舊片段不再命中；頭像、上次訂單、購物車件數等
+   用戶相關部分在片段之外按請求渲染
+2. 條件請求：ETag 由頁面、URL 參數、目錄版本和請求者相關的部分
+   （用戶、購物車件數、CSRF cookie）計算，未變化時返回 304；
+   匿名且購物車為空時另附 Last-Modified（目錄版本的時間）
+3. 有待顯示的 messages 時不做條件處理（304 會讓訊息消失）
+
+注意：沒有配置共享緩存（CACHES）時片段緩存只在本進程內有效。
+"""
+
+import hashlib
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from cart.cart import cart_item_count
+from eshop.catalog import get_catalog
+
+
+def page_cache_context():
+    """模板片段緩存所需的 context（目錄版本和緩存秒數）"""
+    return {
+        "catalog_version": get_catalog().version,
+        "fragment_timeout": getattr(settings, "PAGE_FRAGMENT_CACHE_SECONDS", 86400),
+    }
+
+
+def catalog_last_modified():
+    """目錄版本的時間（版本為更新時的 time_ns），無法解析時返回 None"""
+    try:
+        return datetime.fromtimestamp(
+            int(get_catalog().version) / 1_000_000_000, tz=timezone.utc
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def _has_messages(request):
+    # len() 不會把訊息標記為已讀
+    return len(get_messages(request)) > 0
+
+
+def page_etag(request, page, *parts, user_parts=True):
+    """
+    頁面的 ETag，不應使用條件請求時返回 None
+
+    Args:
+        page: 頁面名稱
+        parts: URL 參數等其他影響內容的值
+        user_parts: False 表示頁面包含無法低成本判斷是否變化的用戶內容，
+            已登入用戶不使用條件請求
+    """
+    if _has_messages(request):
+        return None
+
+    user = request.user
+    if user.is_authenticated and not user_parts:
+        return None
+
+    key = (
+        page,
+        parts,
+        get_catalog().version,
+        user.pk if user.is_authenticated else None,
+        user.get_username() if user.is_authenticated else "",
+        cart_item_count(request),
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+    )
+    return hashlib.md5(repr(key).encode()).hexdigest()[:16]
+
+
+def conditional_page(page, user_parts=True):
+    """
+    視圖方法的條件請求裝飾器
+
+    @conditional_page("coffee_menu")
+    def get(self, request, *args, **kwargs): ...
+    """
+
+    def etag_func(request, *args, **kwargs):
+        return page_etag(request, page, *args, *kwargs.values(), user_parts=user_parts)
+
+    def last_modified_func(request, *args, **kwargs):
+        if (
+            request.user.is_authenticated
+            or _has_messages(request)
+            or cart_item_count(request)
+        ):
+            return None
+        return catalog_last_modified()
+
+    def decorator(view_func):
+        view_func = condition(
+            etag_func=etag_func, last_modified_func=last_modified_func
+        )(view_func)
+        # 瀏覽器每次都重新驗證，未變化時得到 304
+        return cache_control(private=True, no_cache=True)(view_func)
+
+    return method_decorator(decorator)
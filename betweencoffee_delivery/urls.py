@@ -37,6 +37,7 @@ from .views import (
     CoffeeMenuSearch,
     Index,
     LandingNew,
+    ProductSuggest,
 )
 
 
@@ -62,9 +63,9 @@ urlpatterns = [
     ),  # coffee single with id
     path("bean_menu/", BeanMenu.as_view(), name="bean_menu"),  # bean list
     path("bean/<int:product_id>/", Bean.as_view(), name="bean"),  # bean single with id
-    # Keeping NOT use
     path("coffee_menu/search/", CoffeeMenuSearch.as_view(), name="coffee_menu_search"),
     path("bean_menu/search/", BeanMenuSearch.as_view(), name="bean_menu_search"),
+    path("search/suggest/", ProductSuggest.as_view(), name="product_suggest"),
     # restaurant app 已移除（功能已被 staff_order_management 取代）
     path("about/", About.as_view(), name="about"),
 ]
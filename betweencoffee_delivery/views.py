@@ -14,24 +14,25 @@ a = aardvark, b = baboon, c = cat
 它將它們與函數中的參數進行匹配。當然，您可以*在函數定義和函數呼叫中同時擁有它們。
 """
 
-from django.db.models import Q
-
 # betweencoffee_delivery/views.py
-from django.shortcuts import get_object_or_404, render
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.cache import cache_control
+
+from cart.cart import get_cart  # 請求共享的購物車
+from eshop.catalog import get_catalog
+from eshop.search import search_products, suggest
 
-from cart.cart import Cart  # Import the Cart class
-from eshop.models import BeanItem, CoffeeItem
+from .page_cache import conditional_page, page_cache_context
 
 
 # 處理index, about HTTP 請求所發生的情況
 # 當使用者向伺服器發送 GET 請求時渲染 HTML template模板
 class Index(View):
+    @conditional_page("index", user_parts=False)
     def get(self, request, *args, **kwargs):
-        shop_hot_coffees = CoffeeItem.objects.filter(
-            is_shop_hot_item=True, is_published=True
-        ).order_by("hot_item_order", "id")[:4]
-
         # 简化：上下文处理器已经处理了cart，这里不需要重复
         context = _build_landing_context(request)
         return render(request, "betweencoffee_delivery/index.html", context)
@@ -39,6 +40,7 @@ class Index(View):
 
 # 新 Landing 頁面：讀取實際咖啡/咖啡豆資料（原型 B）
 class LandingNew(View):
+    @conditional_page("landing_new", user_parts=False)
     def get(self, request, *args, **kwargs):
         context = _build_landing_context(request)
         return render(request, "betweencoffee_delivery/landing_v3.html", context)
@@ -46,11 +48,10 @@ class LandingNew(View):
 
 def _build_landing_context(request):
     """共用：首頁 / landing 的商品 + 登入狀態 + 社交頭像 context"""
-    hot_coffees = CoffeeItem.objects.filter(
-        is_shop_hot_item=True, is_published=True
-    ).order_by("hot_item_order", "id")[:4]
-    all_coffees = CoffeeItem.objects.filter(is_published=True)[:9]
-    beans = BeanItem.objects.filter(is_published=True)[:3]
+    catalog = get_catalog()
+    hot_coffees = catalog.hot_coffees()[:4]
+    all_coffees = catalog.published_coffees()[:9]
+    beans = catalog.published_beans()[:3]
 
     context = {
         "shop_hot_coffees": hot_coffees,
@@ -61,6 +62,7 @@ def _build_landing_context(request):
         "user_avatar": "",
         "last_order_image": "",
         "last_order_link": "",
+        **page_cache_context(),
     }
 
     if request.user.is_authenticated:
@@ -178,21 +180,26 @@ def _get_user_avatar(user):
     return ""
 # List out coffee item
 class CoffeeMenu(View):
+    @conditional_page("coffee_menu")
     def get(self, request, *args, **kwargs):
-        coffee_menu = CoffeeItem.objects.all().order_by("sort_order", "id")
-        cart = Cart(request)  # Initialize the cart
+        coffee_menu = get_catalog().coffee_menu()
+        cart = get_cart(request)  # Initialize the cart
 
         context = {
             "coffee_menu": coffee_menu,
             "cart": cart,  # keep cart count fn
+            **page_cache_context(),
         }
         return render(request, "betweencoffee_delivery/coffee_menu.html", context)
 
 
 class Coffee(View):
+    @conditional_page("coffee")
     def get(self, request, product_id, *args, **kwargs):
-        coffee = get_object_or_404(CoffeeItem, id=product_id)
-        cart = Cart(request)  # Initialize the cart
+        coffee = get_catalog().get_coffee(product_id)
+        if coffee is None:
+            raise Http404("No CoffeeItem matches the given query.")
+        cart = get_cart(request)  # Initialize the cart
 
         # 自訂選項組（2026-08-15）：依該咖啡啟用的選項組，提供給詳情頁渲染
         from eshop.models.option_definitions import OPTION_GROUPS
@@ -217,67 +224,85 @@ class Coffee(View):
             "coffee": coffee,
             "cart": cart,  # Add the cart to the context
             "option_groups": enabled_groups,
+            **page_cache_context(),
         }
         return render(request, "betweencoffee_delivery/coffee.html", context)
 
 
 # List out bean item
 class BeanMenu(View):
+    @conditional_page("bean_menu")
     def get(self, request, *args, **kwargs):
-        bean_items = BeanItem.objects.all().order_by("sort_order", "id")
-        cart = Cart(request)  # Initialize the cart
+        bean_items = get_catalog().bean_menu()
+        cart = get_cart(request)  # Initialize the cart
 
         context = {
             "bean_items": bean_items,
             "cart": cart,  # keep cart count fn
+            **page_cache_context(),
         }
         return render(request, "betweencoffee_delivery/bean_menu.html", context)
 
 
 class Bean(View):
+    @conditional_page("bean")
     def get(self, request, product_id, *args, **kwargs):
-        bean = get_object_or_404(BeanItem, id=product_id)
-        cart = Cart(request)  # Initialize the cart
+        bean = get_catalog().get_bean(product_id)
+        if bean is None:
+            raise Http404("No BeanItem matches the given query.")
+        cart = get_cart(request)  # Initialize the cart
 
         context = {
             "bean": bean,
             "cart": cart,  # keep cart count fn
+            **page_cache_context(),
         }
         return render(request, "betweencoffee_delivery/bean.html", context)
 
 
-# Keeping NOT use
+# 菜單搜索：按相關度排序的結果沿用菜單模板渲染（搜索結果不使用片段緩存）
 class CoffeeMenuSearch(View):
     def get(self, request, *args, **kwargs):
-        query = request.GET.get("q")
-        # # 提供Search 搜尋特定的項目, 使用below過濾任何部分匹配結果
-        search_items = CoffeeItem.objects.filter(
-            Q(name__icontains=query)
-            | Q(price__icontains=query)
-            | Q(description__icontains=query)
-        ).order_by("sort_order", "id")
-
-        context = {"search_items": search_items}
+        query = request.GET.get("q", "")
+        context = {
+            "coffee_menu": search_products(query, "coffee"),
+            "cart": get_cart(request),
+            "search_query": query,
+            **page_cache_context(),
+            "fragment_timeout": 0,
+        }
         return render(request, "betweencoffee_delivery/coffee_menu.html", context)
 
 
 class BeanMenuSearch(View):
     def get(self, request, *args, **kwargs):
-        query = request.GET.get("q")
-        # 使用below過濾任何部分匹配結果
-        search_items = BeanItem.objects.filter(
-            Q(name__icontains=query)
-            | Q(price__icontains=query)
-            | Q(description__icontains=query)
-        ).order_by("sort_order", "id")
-
-        context = {"search_items": search_items}
+        query = request.GET.get("q", "")
+        context = {
+            "bean_items": search_products(query, "bean"),
+            "cart": get_cart(request),
+            "search_query": query,
+            **page_cache_context(),
+            "fragment_timeout": 0,
+        }
         return render(request, "betweencoffee_delivery/bean_menu.html", context)
 
 
+# 搜索框自動補全（bc-search.js）：?q=拿&type=coffee
+class ProductSuggest(View):
+    @method_decorator(cache_control(public=True, max_age=60))
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get("q", "")
+        product_type = request.GET.get("type", "")
+        if product_type not in ("", "coffee", "bean"):
+            return JsonResponse({"error": "invalid type"}, status=400)
+        return JsonResponse(
+            {"query": query, "results": suggest(query, product_type or None)}
+        )
+
+
 class About(View):
     def get(self, request, *args, **kwargs):
-        cart = Cart(request)  # Initialize the cart
+        cart = get_cart(request)  # Initialize the cart
 
         context = {
             "cart": cart,  # keep cart count fn
@@ -33,3 +33,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "betweencoffee_delivery.settings")
 
 application = get_wsgi_application()
+
+# 處理上次進程遺留的支付發件箱記錄，並定時掃描（沒有 Celery 時）
+from eshop.payment_outbox import start_payment_outbox_worker  # noqa: E402
+
+start_payment_outbox_worker()
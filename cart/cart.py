@@ -1,30 +1,57 @@
 # cart/cart.py - 修正版本
 import logging
+import time
 from decimal import Decimal, InvalidOperation
 
 from django.conf import settings
+from django.db import transaction
 from django.db.utils import InterfaceError, OperationalError
 
-from eshop.models import BeanItem, CartItem, CoffeeItem
+from eshop.catalog import get_catalog
+from eshop.models import CartItem
 
 logger = logging.getLogger(__name__)
 
+# 會話中緩存的已登入用戶購物車件數 {"user": 用戶ID, "count": 件數, "expires": 時間戳}
+CART_COUNT_SESSION_KEY = "cart_count"
+
 
 class Cart:
-    """購物車類 - 修正版"""
+    """
+    購物車類 - 修正版
+
+    內容在第一次讀取時才加載（已登入用戶此時與數據庫同步一次）。
+    同一請求內請使用 get_cart(request) 取得共享的實例。
+    """
 
     def __init__(self, request):
         self.request = request
         self.session = request.session
         self.user = request.user
-
-        # 從會話加載購物車
-        cart_id = settings.CART_SESSION_ID
-        self.cart = self.session.get(cart_id, {})
-
-        # 如果是已認證用戶，從數據庫同步購物車
-        if self.user.is_authenticated:
-            self.sync_with_database()
+        self._cart = None
+        # 數據庫中的購物車項目快照 {鍵: CartItem}，保存時與購物車內容比對
+        self._db_items = None
+
+    @property
+    def cart(self):
+        """購物車內容（延遲加載）"""
+        if self._cart is None:
+            # 從會話加載購物車
+            self._cart = self.session.get(settings.CART_SESSION_ID, {})
+
+            # 如果是已認證用戶，從數據庫同步購物車
+            if self.user.is_authenticated:
+                self.sync_with_database()
+                self._remember_count()
+        return self._cart
+
+    @cart.setter
+    def cart(self, value):
+        self._cart = value
+
+    @property
+    def is_loaded(self):
+        return self._cart is not None
 
     def sync_with_database(self):
         """同步會話購物車與數據庫購物車"""
@@ -32,15 +59,17 @@ class Cart:
             return
 
         try:
-            # 從數據庫加載購物車項目
-            db_items = CartItem.objects.filter(user=self.user)
+            # 從數據庫加載購物車項目（一次查詢）
+            db_items = list(CartItem.objects.filter(user=self.user))
 
             # 如果有數據庫項目，使用數據庫項目
-            if db_items.exists():
-                self._load_from_db()
-            # 如果會話中有購物車但數據庫沒有，保存到數據庫
-            elif self.cart:
-                self._save_to_db()
+            if db_items:
+                self._load_from_db(db_items)
+            else:
+                self._db_items = {}
+                # 如果會話中有購物車但數據庫沒有，保存到數據庫
+                if self.cart:
+                    self._save_to_db()
         except (InterfaceError, OperationalError) as e:
             logger.warning(f"Database connection error in sync_with_database: {e}")
             # 保持會話中的購物車不變
@@ -49,49 +78,48 @@ class Cart:
             logger.error(f"Unexpected error in sync_with_database: {e}")
             self.cart = self.session.get(settings.CART_SESSION_ID, {})
 
-    def _load_from_db(self):
+    def _remember_count(self):
+        """把已登入用戶的購物車件數緩存到會話（供 cart_count 上下文處理器使用）"""
+        if not self.user.is_authenticated:
+            return
+        cached = self.session.get(CART_COUNT_SESSION_KEY) or {}
+        count = len(self)
+        if (
+            cached.get("user") == self.user.pk
+            and cached.get("count") == count
+            and cached.get("expires", 0) > time.time()
+        ):
+            return
+        self.session[CART_COUNT_SESSION_KEY] = {
+            "user": self.user.pk,
+            "count": count,
+            "expires": time.time() + getattr(settings, "CART_COUNT_CACHE_SECONDS", 300),
+        }
+
+    def _load_from_db(self, db_items=None):
         """從數據庫加載購物車"""
         if not self.user.is_authenticated:
             return
 
-        db_items = CartItem.objects.filter(user=self.user)
+        if db_items is None:
+            db_items = CartItem.objects.filter(user=self.user)
         self.cart = {}
+        self._db_items = {}
 
-        # 批量獲取產品
-        coffee_ids = []
-        bean_ids = []
+        # 商品資料來自進程內的目錄快照，不需要額外查詢
+        catalog = get_catalog()
 
         for item in db_items:
-            if item.product_type == "coffee":
-                coffee_ids.append(item.product_id)
-            elif item.product_type == "bean":
-                bean_ids.append(item.product_id)
-
-        coffees = CoffeeItem.objects.in_bulk(coffee_ids) if coffee_ids else {}
-        beans = BeanItem.objects.in_bulk(bean_ids) if bean_ids else {}
+            # 生成唯一鍵
+            key = self._db_item_key(item)
+            # 商品已下架的項目也記入快照，下次保存時刪除
+            self._db_items.setdefault(key, item)
 
-        for item in db_items:
-            product = None
-            if item.product_type == "coffee":
-                product = coffees.get(item.product_id)
-            elif item.product_type == "bean":
-                product = beans.get(item.product_id)
+            product = catalog.get(item.product_type, item.product_id)
 
             if not product:
                 continue
 
-            # 生成唯一鍵
-            key = self._generate_item_key(
-                item.product_type,
-                item.product_id,
-                item.cup_level,
-                item.milk_level,
-                item.strength_level,
-                item.grinding_level,
-                item.weight,
-                item.options_json,
-            )
-
             # 計算價格 - 使用修正的 _calculate_price 方法
             price = self._calculate_price(product, item.product_type, item.weight)
 
@@ -109,6 +137,19 @@ class Cart:
                 "extra_options": item.options_json or {},
             }
 
+    def _db_item_key(self, item):
+        """數據庫購物車項目的鍵"""
+        return self._generate_item_key(
+            item.product_type,
+            item.product_id,
+            item.cup_level,
+            item.milk_level,
+            item.strength_level,
+            item.grinding_level,
+            item.weight,
+            item.options_json,
+        )
+
     def _generate_item_key(
         self,
         product_type,
@@ -226,71 +267,77 @@ class Cart:
         # 如果是已認證用戶，同時保存到數據庫
         if self.user.is_authenticated:
             self._save_to_db()
+            self._remember_count()
 
     def _save_to_db(self):
-        """保存購物車到數據庫"""
+        """
+        保存購物車到數據庫
+
+        與加載時的快照比對，只寫入差異：新項目一次 bulk_create，數量變化
+        一次 bulk_update，移除的項目一次 delete，在同一個事務中執行；
+        查詢數不隨購物車大小增長。
+        """
         if not self.user.is_authenticated:
             return
 
-        # 獲取現有的數據庫項目
-        existing_items = CartItem.objects.filter(user=self.user)
-        existing_keys = {}
-
-        for item in existing_items:
-            key = self._generate_item_key(
-                item.product_type,
-                item.product_id,
-                item.cup_level,
-                item.milk_level,
-                item.strength_level,
-                item.grinding_level,
-                item.weight,
-                item.options_json,
-            )
-            existing_keys[key] = item
+        if self._db_items is None:
+            # 購物車未經數據庫加載（例如同步時數據庫出錯），先讀取現有項目
+            self._db_items = {}
+            for item in CartItem.objects.filter(user=self.user):
+                self._db_items.setdefault(self._db_item_key(item), item)
 
-        # 更新或創建購物車項目
+        to_create = {}
+        to_update = []
         for key, item_data in self.cart.items():
+            existing = self._db_items.get(key)
+            if existing is not None:
+                # 更新現有項目（選項都在鍵中，只有數量會變）
+                if existing.quantity != item_data["quantity"]:
+                    existing.quantity = item_data["quantity"]
+                    to_update.append(existing)
+                continue
+
             parts = key.split("_")
             if len(parts) < 2:
                 continue
 
-            product_type = parts[0]
-            product_id = int(parts[1])
-
-            # 獲取選項
-            cup_level = item_data.get("cup_level")
-            milk_level = item_data.get("milk_level")
-            strength_level = item_data.get("strength_level")
-            grinding_level = item_data.get("grinding_level")
-            weight = item_data.get("weight", "200g")
-            extra_options = item_data.get("extra_options") or {}
-
-            # 檢查是否已存在
-            if key in existing_keys:
-                # 更新現有項目
-                cart_item = existing_keys[key]
-                cart_item.quantity = item_data["quantity"]
-                cart_item.save()
-                del existing_keys[key]
-            else:
-                # 創建新項目
-                CartItem.objects.create(
-                    user=self.user,
-                    product_type=product_type,
-                    product_id=product_id,
-                    quantity=item_data["quantity"],
-                    cup_level=cup_level,
-                    milk_level=milk_level,
-                    strength_level=strength_level,
-                    grinding_level=grinding_level,
-                    weight=weight,
-                    options_json=extra_options,
-                )
+            # 創建新項目
+            to_create[key] = CartItem(
+                user=self.user,
+                product_type=parts[0],
+                product_id=int(parts[1]),
+                quantity=item_data["quantity"],
+                cup_level=item_data.get("cup_level"),
+                milk_level=item_data.get("milk_level"),
+                strength_level=item_data.get("strength_level"),
+                grinding_level=item_data.get("grinding_level"),
+                weight=item_data.get("weight", "200g"),
+                options_json=item_data.get("extra_options") or {},
+            )
 
         # 刪除不再存在的項目
-        for key, cart_item in existing_keys.items():
-            cart_item.delete()
+        removed = [key for key in self._db_items if key not in self.cart]
+
+        if not (to_create or to_update or removed):
+            return
+
+        with transaction.atomic():
+            if to_create:
+                CartItem.objects.bulk_create(to_create.values())
+            if to_update:
+                CartItem.objects.bulk_update(to_update, ["quantity"])
+            if removed:
+                CartItem.objects.filter(
+                    user=self.user, pk__in=[self._db_items[key].pk for key in removed]
+                ).delete()
+
+        for key in removed:
+            del self._db_items[key]
+        if all(item.pk is not None for item in to_create.values()):
+            self._db_items.update(to_create)
+        else:
+            # 數據庫不返回新項目的主鍵時，下次保存重新讀取
+            self._db_items = None
 
     def clear(self):
         """清空購物車"""
@@ -299,6 +346,8 @@ class Cart:
 
         if self.user.is_authenticated:
             CartItem.objects.filter(user=self.user).delete()
+            self._db_items = {}
+            self._remember_count()
 
         self.session.modified = True
 
@@ -379,3 +428,41 @@ class Cart:
     def __len__(self):
         """購物車商品總數"""
         return sum(item.get("quantity", 0) for item in self.cart.values())
+
+
+def get_cart(request):
+    """
+    取得請求共享的購物車（中間件、上下文處理器和視圖共用，每個請求只同步一次）
+
+    請求中途登入（request.user 改變）時重新建立。
+    """
+    cart = getattr(request, "cart", None)
+    if not isinstance(cart, Cart) or cart.user is not request.user:
+        cart = Cart(request)
+        request.cart = cart
+    return cart
+
+
+def cart_item_count(request):
+    """
+    購物車件數（不需要加載整個購物車）
+
+    - 本請求已加載購物車：直接計算
+    - 訪客：購物車只在會話中，直接計算
+    - 已登入用戶：使用會話中緩存的件數（購物車保存時更新，
+      CART_COUNT_CACHE_SECONDS 後過期，以反映其他裝置的修改）；
+      沒有緩存時加載一次購物車
+    """
+    cart = getattr(request, "cart", None)
+    if isinstance(cart, Cart) and cart.is_loaded and cart.user is request.user:
+        return len(cart)
+
+    user = request.user
+    if not user.is_authenticated:
+        items = request.session.get(settings.CART_SESSION_ID, {})
+        return sum(item.get("quantity", 0) for item in items.values())
+
+    cached = request.session.get(CART_COUNT_SESSION_KEY) or {}
+    if cached.get("user") == user.pk and cached.get("expires", 0) > time.time():
+        return cached.get("count", 0)
+    return len(get_cart(request))
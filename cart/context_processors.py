@@ -1,13 +1,12 @@
 # cart/context_processors.py - 簡化版
-from .cart import Cart
+from .cart import cart_item_count
 
 
 def cart_count(request):
     """購物車上下文處理器"""
     try:
-        cart = Cart(request)
         return {
-            "cart_count": len(cart),
+            "cart_count": cart_item_count(request),
         }
     except Exception:
         return {"cart_count": 0}
@@ -11,7 +11,7 @@ from django.views.decorators.http import require_GET, require_POST
 from eshop.models import BeanItem, CoffeeItem
 from eshop.view_utils import handle_cart_error
 
-from .cart import Cart
+from .cart import get_cart
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +20,7 @@ logger = logging.getLogger(__name__)
 def cart_detail(request):
     """購物車詳情頁面 - 直接重定向到訂單確認頁面"""
     try:
-        cart = Cart(request)
+        cart = get_cart(request)
 
         if len(cart) == 0:
             messages.warning(request, "購物車是空的，請先選購商品")
@@ -96,7 +96,7 @@ def add_to_cart(request, product_id, product_type):
         except (ValueError, TypeError):
             quantity = 1
 
-        cart = Cart(request)
+        cart = get_cart(request)
         cart.add(product, product_type, quantity, **options)
 
         # 計算單價
@@ -130,7 +130,7 @@ def remove_from_cart(request, item_key):
             del request.session["quick_order_data"]
             request.session.modified = True
 
-        cart = Cart(request)
+        cart = get_cart(request)
         cart.remove(item_key)
 
         # 如果購物車為空，清除 pending_order
@@ -159,7 +159,7 @@ def update_cart(request):
         if quantity < 1:
             quantity = 1
 
-        cart = Cart(request)
+        cart = get_cart(request)
         cart.update(item_key, quantity)
 
         # 計算該項目的總價
@@ -198,7 +198,7 @@ def update_cart(request):
 def clear_cart(request):
     """清空購物車"""
     try:
-        cart = Cart(request)
+        cart = get_cart(request)
         cart.clear()
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
             return JsonResponse({"success": True, "message": "購物車已清空"})
@@ -218,7 +218,7 @@ def clear_cart(request):
 def checkout_page(request):
     """一頁式結帳頁面"""
     try:
-        cart = Cart(request)
+        cart = get_cart(request)
 
         if len(cart) == 0:
             messages.warning(request, "購物車是空的，請先選購商品")
@@ -239,7 +239,7 @@ def checkout_page(request):
 def create_order(request):
     """從購物車創建訂單"""
     try:
-        cart = Cart(request)
+        cart = get_cart(request)
 
         if len(cart) == 0:
             messages.error(request, "購物車為空")
@@ -271,7 +271,7 @@ def create_order(request):
 def create_order_ajax(request):
     """一頁式結帳 AJAX 提交 - 創建訂單"""
     try:
-        cart = Cart(request)
+        cart = get_cart(request)
 
         if len(cart) == 0:
             return JsonResponse({"success": False, "message": "購物車為空"})
@@ -339,7 +339,7 @@ def create_order_ajax(request):
 def cart_count(request):
     """獲取購物車商品數量及詳情（API）- 供滑出購物車使用"""
     try:
-        cart = Cart(request)
+        cart = get_cart(request)
         items = []
         for item in cart:
             extra_opts = item.get("extra_options") or {}
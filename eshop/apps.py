@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class EshopConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "eshop"
+
+    def ready(self):
+        from . import catalog, image_derivatives, queue_changes, queue_state_store
+
+        # 商品變更時使進程內的商品目錄快照失效
+        catalog.connect_signals()
+        # 訂單 / 隊列項變更時記錄變更序號（員工端增量輪詢）
+        queue_changes.connect_signals()
+        # 隊列項變更時同步隊列狀態存儲（未啟用存儲時信號處理器直接返回）
+        queue_state_store.connect_signals()
+        # 商品圖片上傳後生成 WebP/AVIF 縮圖
+        image_derivatives.connect_signals()
@@ -0,0 +1,226 @@
+# eshop/catalog.py
+"""
+商品目錄快照 - 進程內緩存的咖啡 / 咖啡豆
+
+訂單商品補全（價格、圖片、選項排序）、購物車載入和菜單頁面原本各自
+查詢 CoffeeItem / BeanItem，渲染一個 40 單的員工隊列會重複查詢同樣的商品。
+這個模塊改為：
+
+1. 每個進程保存一份完整的商品快照（兩次查詢構建），包含模型實例
+   （選項開關、選項排序、價格）和預先計算的圖片 URL
+2. 共享緩存中的版本鍵（CATALOG_VERSION_CACHE_KEY）標識當前目錄版本；
+   商品保存或刪除時（post_save / post_delete）更新版本，各進程最多每
+   CATALOG_VERSION_CHECK_SECONDS 秒檢查一次版本，不一致時重建
+3. 快照只讀：調用方不可修改其中的模型實例
+
+注意：沒有配置共享緩存（CACHES）時版本鍵只在本進程內有效，
+其他進程要等到重啟才會看到商品變更。
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models.base import get_image_url
+
+logger = logging.getLogger("eshop.catalog")
+
+CATALOG_VERSION_CACHE_KEY = "catalog:version"
+
+DEFAULT_IMAGES = {
+    "coffee": "/static/images/default-coffee.png",
+    "bean": "/static/images/default-bean.png",
+}
+DEFAULT_PRODUCT_IMAGE = "/static/images/default-product.png"
+
+
+class CatalogSnapshot:
+    """某個版本的商品目錄（只讀）"""
+
+    def __init__(self, coffees, beans, version):
+        self.coffees = {coffee.id: coffee for coffee in coffees}
+        self.beans = {bean.id: bean for bean in beans}
+        self.version = version
+        self.image_urls = {}
+        self._image_srcsets = {}
+        for product_type, products in (("coffee", coffees), ("bean", beans)):
+            for product in products:
+                self.image_urls[(product_type, product.id)] = get_image_url(
+                    product.image, DEFAULT_IMAGES[product_type]
+                )
+
+    @classmethod
+    def build(cls, version):
+        from .models import BeanItem, CoffeeItem
+
+        return cls(
+            list(CoffeeItem.objects.order_by("id")),
+            list(BeanItem.objects.order_by("id")),
+            version,
+        )
+
+    @staticmethod
+    def _normalize_id(product_id):
+        try:
+            return int(product_id)
+        except (TypeError, ValueError):
+            return None
+
+    def get(self, product_type, product_id):
+        """按類型和ID獲取商品，不存在返回 None"""
+        products = {"coffee": self.coffees, "bean": self.beans}.get(product_type)
+        if products is None:
+            return None
+        return products.get(self._normalize_id(product_id))
+
+    def get_coffee(self, product_id):
+        return self.coffees.get(self._normalize_id(product_id))
+
+    def get_bean(self, product_id):
+        return self.beans.get(self._normalize_id(product_id))
+
+    def image_url(self, product_type, product_id):
+        """商品圖片 URL（沒有圖片時返回該類型的默認圖片）"""
+        return self.image_urls.get(
+            (product_type, self._normalize_id(product_id)), DEFAULT_PRODUCT_IMAGE
+        )
+
+    def image_srcset(self, product_type, product_id, fmt="webp"):
+        """
+        商品圖片縮圖的 srcset（沒有縮圖時返回空字符串）
+
+        只緩存非空的結果：縮圖在後台或其他進程（backfill 命令）生成，
+        空結果交給 image_derivatives 的查詢緩存按間隔重新檢查。
+        """
+        key = (product_type, self._normalize_id(product_id), fmt)
+        cached = self._image_srcsets.get(key)
+        if cached:
+            return cached
+
+        from .image_derivatives import srcset
+
+        product = self.get(product_type, product_id)
+        value = srcset(product.image, fmt) if product else ""
+        if value:
+            self._image_srcsets[key] = value
+        return value
+
+    # ==================== 菜單列表 ====================
+
+    def coffee_menu(self):
+        """咖啡菜單（按 sort_order 排序）"""
+        return sorted(self.coffees.values(), key=lambda c: (c.sort_order, c.id))
+
+    def bean_menu(self):
+        """咖啡豆菜單（按 sort_order 排序）"""
+        return sorted(self.beans.values(), key=lambda b: (b.sort_order, b.id))
+
+    def published_coffees(self):
+        return [coffee for coffee in self.coffees.values() if coffee.is_published]
+
+    def published_beans(self):
+        return [bean for bean in self.beans.values() if bean.is_published]
+
+    def hot_coffees(self):
+        """已上架的熱門咖啡（按 hot_item_order 排序）"""
+        return sorted(
+            (c for c in self.published_coffees() if c.is_shop_hot_item),
+            key=lambda c: (c.hot_item_order, c.id),
+        )
+
+
+class CatalogCache:
+    """進程內的商品目錄快照，按共享緩存中的版本鍵失效"""
+
+    def __init__(self, check_interval=None):
+        if check_interval is None:
+            check_interval = getattr(settings, "CATALOG_VERSION_CHECK_SECONDS", 1.0)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self.stats = {"builds": 0, "version_checks": 0}
+
+    def _current_version(self):
+        version = cache.get(CATALOG_VERSION_CACHE_KEY)
+        if version is None:
+            cache.add(CATALOG_VERSION_CACHE_KEY, str(time.time_ns()), None)
+            version = cache.get(CATALOG_VERSION_CACHE_KEY)
+        return version
+
+    def get(self):
+        """獲取當前版本的快照（必要時重建）"""
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and now - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            version = self._current_version()
+            self.stats["version_checks"] += 1
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = CatalogSnapshot.build(version)
+                self._snapshot = snapshot
+                self.stats["builds"] += 1
+                logger.debug(
+                    f"📦 商品目錄快照已重建: 版本 {version}, "
+                    f"{len(snapshot.coffees)} 款咖啡, {len(snapshot.beans)} 款咖啡豆"
+                )
+            self._checked_at = now
+            return snapshot
+
+    def invalidate(self):
+        """更新共享版本鍵並丟棄本進程的快照"""
+        cache.set(CATALOG_VERSION_CACHE_KEY, str(time.time_ns()), None)
+        with self._lock:
+            self._snapshot = None
+
+
+# 全局實例
+_catalog_cache = None
+
+
+def get_catalog_cache():
+    """獲取商品目錄緩存實例"""
+    global _catalog_cache
+    if _catalog_cache is None:
+        _catalog_cache = CatalogCache()
+    return _catalog_cache
+
+
+def get_catalog():
+    """獲取當前的商品目錄快照（便捷函數）"""
+    return get_catalog_cache().get()
+
+
+def invalidate_catalog(**kwargs):
+    """
+    商品變更時使目錄失效（post_save / post_delete 信號處理器）
+
+    立即失效本進程的快照；事務提交後再更新一次版本，
+    避免其他進程在提交前重建到舊資料。
+    """
+    catalog_cache = get_catalog_cache()
+    catalog_cache.invalidate()
+    transaction.on_commit(catalog_cache.invalidate)
+
+
+def connect_signals():
+    """連接商品模型的 post_save / post_delete 信號（由 EshopConfig.ready 調用）"""
+    from django.db.models.signals import post_delete, post_save
+
+    from .models import BeanItem, CoffeeItem
+
+    for model in (CoffeeItem, BeanItem):
+        label = model._meta.model_name
+        post_save.connect(
+            invalidate_catalog, sender=model, dispatch_uid=f"catalog_save_{label}"
+        )
+        post_delete.connect(
+            invalidate_catalog, sender=model, dispatch_uid=f"catalog_delete_{label}"
+        )
@@ -12,6 +12,7 @@ import logging
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 # ✅ 導入 WebSocketManager
 from .websocket_manager import websocket_manager
@@ -499,16 +500,41 @@ class OrderConsumer(BaseOrderConsumer):
         status = event.get("status")
         logger.debug(f"📤 發送雙格式訂單狀態更新: 訂單 {order_id}, 狀態: {status}")
 
+    @staticmethod
+    def _countdown_fields(event):
+        """
+        倒數欄位：剩餘秒數（未提供時由 ISO 格式的 estimated_time 計算）
+        和服務端時間，客戶端據此在本地插值倒數
+        """
+        now = timezone.now()
+        remaining_seconds = event.get("remaining_seconds")
+        estimated_time = event.get("estimated_time")
+        if remaining_seconds is None and estimated_time:
+            try:
+                eta = parse_datetime(estimated_time)
+            except (TypeError, ValueError):
+                eta = None
+            if eta is not None:
+                remaining_seconds = max(int((eta - now).total_seconds()), 0)
+        return {
+            "remaining_seconds": remaining_seconds,
+            "server_time": now.timestamp(),
+            "timestamp": now.isoformat(),
+        }
+
     async def queue_position_update(self, event):
-        """隊列位置更新（專門針對排隊位置變化）"""
+        """
+        隊列位置/預計時間更新
+
+        由 order_eta.push_eta_updates 在位置或預計完成時間真正改變時推送
+        """
         await self._send_json(
             {
                 "type": "queue_position",
                 "order_id": event.get("order_id", self.order_id),
                 "position": event.get("position"),
                 "estimated_time": event.get("estimated_time"),
-                "remaining_seconds": event.get("remaining_seconds"),
-                "timestamp": timezone.now().isoformat(),
+                **self._countdown_fields(event),
             }
         )
 
@@ -519,8 +545,7 @@ class OrderConsumer(BaseOrderConsumer):
                 "type": "estimated_time",
                 "order_id": event.get("order_id", self.order_id),
                 "estimated_time": event.get("estimated_time"),
-                "remaining_seconds": event.get("remaining_seconds"),
-                "timestamp": timezone.now().isoformat(),
+                **self._countdown_fields(event),
             }
         )
 
@@ -736,16 +761,48 @@ class QueueConsumer(BaseOrderConsumer):
 
     # ========== 訊息處理方法（由 channel_layer.group_send 觸發）==========
 
+    @staticmethod
+    def _queue_update_payload(event):
+        """隊列更新事件轉為前端格式"""
+        return {
+            "type": "queue_update",
+            "action": event.get("action", "update"),
+            "update_type": event.get("update_type"),
+            "order_id": event.get("order_id"),
+            "position": event.get("position"),
+            "queue_type": event.get("queue_type", "waiting"),
+            "data": event.get("data", {}),
+            "timestamp": event.get("timestamp") or timezone.now().isoformat(),
+        }
+
     async def queue_update(self, event):
         """隊列更新（通用）"""
+        payload = self._queue_update_payload(event)
+        payload["timestamp"] = timezone.now().isoformat()
+        await self._send_json(payload)
+
+    async def queue_batch(self, event):
+        """
+        合併後的隊列更新（來自 websocket_batcher）
+
+        拆開批次中的事件，轉為 queue_update 格式後以一個 queue_batch 訊息發送，
+        前端收到一次訊息只需刷新一次。
+        """
+        events = [
+            self._queue_update_payload(item) for item in event.get("events") or []
+        ]
+        if not events:
+            return
+
         await self._send_json(
             {
-                "type": "queue_update",
-                "action": event.get("action", "update"),
-                "order_id": event.get("order_id"),
-                "position": event.get("position"),
-                "queue_type": event.get("queue_type", "waiting"),
-                "data": event.get("data", {}),
+                "type": "queue_batch",
+                "events": events,
+                "order_ids": [
+                    item["data"].get("order_id") or item["order_id"]
+                    for item in events
+                    if item["data"].get("order_id") or item["order_id"]
+                ],
                 "timestamp": timezone.now().isoformat(),
             }
         )
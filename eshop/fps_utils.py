@@ -1,50 +1,15 @@
 # eshop/fps_utils.py
-import base64
 import logging
-from io import BytesIO
-
-import qrcode
-from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
 
 def generate_fps_qr_code(order):
-    """生成FPS转数快二维码 - 使用HKQR標準格式"""
-    try:
-        # FPS支付信息 - 使用HKQR標準格式
-        # HKQR標準格式: 000201010212... 開頭的EMVCo標準
-        merchant_id = getattr(settings, "FPS_MERCHANT_ID", "68492033")
-        merchant_name = "Between Coffee"
-        amount = str(order.total_price)
-        reference = f"BC{order.id:06d}"
-
-        # 構建標準化的FPS支付字符串
-        # 格式: FPS://{merchant_id}?amount={amount}&ref={reference}
-        fps_string = (
-            f"FPS://{merchant_id}"
-            f"?amount={amount}"
-            f"&currency=HKD"
-            f"&reference={reference}"
-            f"&merchant={merchant_name}"
-        )
-
-        # 生成二维码
-        qr = qrcode.QRCode(
-            version=2,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(fps_string)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-
-        return base64.b64encode(buffer.getvalue()).decode()
+    """生成FPS转数快二维码 - 使用HKQR標準格式（按內容緩存，見 eshop/qr_codes.py）"""
+    from .qr_codes import QR_KIND_FPS, fps_qr_payload, get_qr_base64
 
+    try:
+        return get_qr_base64(QR_KIND_FPS, fps_qr_payload(order)) or None
     except Exception as e:
         logger.error(f"生成FPS二维码失败: {str(e)}")
         return None
@@ -0,0 +1,349 @@
+# eshop/image_derivatives.py
+"""
+商品圖片衍生尺寸 - WebP/AVIF 縮圖與 srcset
+
+CoffeeItem / BeanItem 的上傳圖片原本以原始解析度提供（media/ 約 140MB），
+菜單和首頁的每張卡片都下載整張原圖。這個模塊：
+
+1. 為每張原圖生成固定寬度（IMAGE_DERIVATIVE_WIDTHS，預設 320/640/960）的
+   AVIF 和 WebP 縮圖（Pillow 不支援的格式自動略過），不放大比原圖寬的尺寸
+2. 文件名包含原圖內容的雜湊，例如
+   derivatives/coffee_images/latte-3f2a9c1b7d0e-640w.webp，
+   原圖替換後自動使用新文件，舊文件可以長期緩存
+3. 商品保存後（事務提交後）在後台線程生成；已有的文件不會重新生成。
+   backfill 見 generate_image_derivatives 管理命令；
+   IMAGE_DERIVATIVES_LAZY=True 時查詢到缺少縮圖的圖片也會排程生成
+4. responsive_image / srcset 只返回磁碟上已存在的縮圖，沒有縮圖時調用方
+   使用原圖；查詢結果按原圖的修改時間和大小緩存在進程內
+"""
+
+import hashlib
+import logging
+import os
+import posixpath
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+logger = logging.getLogger("eshop.image_derivatives")
+
+DERIVATIVE_DIR = "derivatives"
+DEFAULT_WIDTHS = (320, 640, 960)
+# 按偏好排序：<picture> 中先列出的格式優先
+DEFAULT_FORMATS = ("avif", "webp")
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+QUALITY = {"avif": 55, "webp": 80}
+
+# 商品模型上需要生成縮圖的圖片欄位
+IMAGE_FIELDS = ("image", "image_index")
+
+# 進程內查詢緩存的項目數上限
+MAX_CACHED_LOOKUPS = 2048
+
+
+def get_widths():
+    return tuple(sorted(getattr(settings, "IMAGE_DERIVATIVE_WIDTHS", DEFAULT_WIDTHS)))
+
+
+def get_formats():
+    """配置的格式中 Pillow 支援編碼的部分"""
+    from PIL import features
+
+    return tuple(
+        fmt
+        for fmt in getattr(settings, "IMAGE_DERIVATIVE_FORMATS", DEFAULT_FORMATS)
+        if features.check(fmt)
+    )
+
+
+def _source_path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def content_hash(path):
+    """原圖內容的雜湊（前 12 位十六進位）"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def source_width(path):
+    """
+    原圖的顯示寬度（只讀取文件頭）
+
+    按 EXIF 方向交換寬高，與生成時 exif_transpose 之後的寬度一致。
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        if image.getexif().get(0x0112) in (5, 6, 7, 8):
+            return image.height
+        return image.width
+
+
+def expected_widths(path):
+    """會為這張原圖生成的寬度（不放大：只包含比原圖窄的寬度）"""
+    try:
+        width = source_width(path)
+    except Exception:
+        # 無法讀取的圖片也不會生成縮圖
+        return ()
+    return tuple(w for w in get_widths() if w < width)
+
+
+def derivative_name(source_name, digest, width, fmt):
+    """縮圖的存儲名稱（相對 MEDIA_ROOT）"""
+    directory, filename = posixpath.split(source_name.replace(os.sep, "/"))
+    stem = os.path.splitext(filename)[0]
+    return posixpath.join(DERIVATIVE_DIR, directory, f"{stem}-{digest}-{width}w.{fmt}")
+
+
+# ==================== 生成 ====================
+
+
+def generate_derivatives(source_name, force=False):
+    """
+    為一張原圖生成所有縮圖
+
+    Args:
+        source_name: 圖片的存儲名稱（ImageField.name）
+        force: 重新生成已存在的文件
+
+    Returns:
+        int: 本次寫入的文件數
+    """
+    from PIL import Image, ImageOps
+
+    path = _source_path(source_name)
+    digest = content_hash(path)
+    formats = get_formats()
+    written = 0
+
+    with Image.open(path) as original:
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+            image.mode == "P" and "transparency" in image.info
+        )
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+        for width in get_widths():
+            if width >= image.width:
+                continue
+            targets = [
+                (fmt, derivative_name(source_name, digest, width, fmt))
+                for fmt in formats
+            ]
+            targets = [
+                (fmt, name)
+                for fmt, name in targets
+                if force or not os.path.exists(_source_path(name))
+            ]
+            if not targets:
+                continue
+
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.LANCZOS)
+            for fmt, name in targets:
+                target = _source_path(name)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                # 先寫臨時文件再改名，並行生成時不會讀到寫了一半的文件
+                temporary = f"{target}.{os.getpid()}.tmp"
+                resized.save(temporary, format=fmt.upper(), quality=QUALITY[fmt])
+                os.replace(temporary, target)
+                written += 1
+
+    _lookup_cache.discard(source_name)
+    if written:
+        logger.info(f"🖼️ {source_name}: 生成了 {written} 個縮圖")
+    return written
+
+
+class DerivativeScheduler:
+    """後台生成縮圖（單線程，同一張圖片排隊中時不重複排程）"""
+
+    def __init__(self):
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, source_name):
+        with self._lock:
+            if source_name in self._pending:
+                return False
+            self._pending.add(source_name)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="image-derivatives"
+                )
+        self._executor.submit(self._run, source_name)
+        return True
+
+    def _run(self, source_name):
+        try:
+            if generate_derivatives(source_name):
+                # 緩存的頁面片段包含 srcset，新縮圖需要新的目錄版本
+                from .catalog import get_catalog_cache
+
+                get_catalog_cache().invalidate()
+        except Exception as e:
+            logger.error(f"❌ 生成縮圖失敗 {source_name}: {str(e)}")
+        finally:
+            with self._lock:
+                self._pending.discard(source_name)
+
+
+# 全局實例
+_derivative_scheduler = None
+
+
+def get_derivative_scheduler():
+    """獲取縮圖生成調度器實例"""
+    global _derivative_scheduler
+    if _derivative_scheduler is None:
+        _derivative_scheduler = DerivativeScheduler()
+    return _derivative_scheduler
+
+
+def schedule_product_images(instance):
+    """排程生成商品所有圖片欄位的縮圖（事務提交後）"""
+    if not getattr(settings, "IMAGE_DERIVATIVES_ENABLED", True):
+        return
+    for field in IMAGE_FIELDS:
+        image = getattr(instance, field, None)
+        name = getattr(image, "name", None)
+        if name:
+            transaction.on_commit(
+                lambda name=name: get_derivative_scheduler().schedule(name)
+            )
+
+
+def _product_saved(sender, instance, **kwargs):
+    schedule_product_images(instance)
+
+
+def connect_signals():
+    """連接商品模型的 post_save 信號（由 EshopConfig.ready 調用）"""
+    from django.db.models.signals import post_save
+
+    from .models import BeanItem, CoffeeItem
+
+    for model in (CoffeeItem, BeanItem):
+        post_save.connect(
+            _product_saved,
+            sender=model,
+            dispatch_uid=f"image_derivatives_{model._meta.model_name}",
+        )
+
+
+# ==================== 查詢 ====================
+
+
+class _LookupCache:
+    """
+    原圖 → 已存在縮圖的查詢緩存
+
+    以 (修改時間, 大小) 識別原圖版本；縮圖不完整的結果在
+    IMAGE_DERIVATIVE_RECHECK_SECONDS 後重新檢查（其他進程可能已生成）。
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, version):
+        entry = self._entries.get(name)
+        if entry is None or entry[0] != version:
+            return None
+        _, result, complete, checked_at = entry
+        recheck = getattr(settings, "IMAGE_DERIVATIVE_RECHECK_SECONDS", 60)
+        if not complete and time.monotonic() - checked_at > recheck:
+            return None
+        return result
+
+    def set(self, name, version, result, complete):
+        with self._lock:
+            if len(self._entries) >= MAX_CACHED_LOOKUPS:
+                self._entries.clear()
+            self._entries[name] = (version, result, complete, time.monotonic())
+
+    def discard(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_lookup_cache = _LookupCache()
+
+
+def _lookup(source_name):
+    """返回 {格式: [(url, 寬度), ...]}，原圖不存在時返回 None"""
+    path = _source_path(source_name)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _lookup_cache.get(source_name, version)
+    if cached is not None:
+        return cached
+
+    digest = content_hash(path)
+    sources = {}
+    complete = True
+    # 不會生成的寬度（≥ 原圖寬度）不算缺少，否則這些圖片永遠需要重新檢查
+    widths = expected_widths(path)
+    for fmt in get_formats():
+        for width in widths:
+            name = derivative_name(source_name, digest, width, fmt)
+            if os.path.exists(_source_path(name)):
+                sources.setdefault(fmt, []).append((default_storage.url(name), width))
+            else:
+                complete = False
+
+    _lookup_cache.set(source_name, version, sources, complete)
+    if not sources and getattr(settings, "IMAGE_DERIVATIVES_LAZY", False):
+        get_derivative_scheduler().schedule(source_name)
+    return sources
+
+
+def responsive_image(image):
+    """
+    圖片的縮圖集合
+
+    Args:
+        image: ImageField 的值或存儲名稱
+
+    Returns:
+        dict: {格式: "url 320w, url 640w"}（只包含已生成的格式，按偏好排序）；
+        沒有縮圖時返回空字典
+    """
+    name = image if isinstance(image, str) else getattr(image, "name", None)
+    if not name or not getattr(settings, "IMAGE_DERIVATIVES_ENABLED", True):
+        return {}
+    try:
+        sources = _lookup(name)
+    except Exception as e:
+        logger.warning(f"⚠️ 查詢縮圖失敗 {name}: {str(e)}")
+        return {}
+    if not sources:
+        return {}
+    return {
+        fmt: ", ".join(f"{url} {width}w" for url, width in sources[fmt])
+        for fmt in get_formats()
+        if fmt in sources
+    }
+
+
+def srcset(image, fmt="webp"):
+    """某一格式的 srcset 字符串，沒有縮圖時返回空字符串"""
+    return responsive_image(image).get(fmt, "")
@@ -0,0 +1,400 @@
+# eshop/kitchen_simulator.py
+"""
+廚房離散事件模擬器 - 隊列子系統負載基準
+
+以模擬時鐘驅動真實的隊列代碼（OrderModel 保存 → CoffeeQueueManager
+入隊，SmartOrderAllocator 推薦員工，OrderStatusManager 開始製作 / 標記就緒，
+CoffeeQueueManager 重新計算隊列時間），不需要等待真實時間：
+
+1. 訂單到達：按泊松過程合成（快速 / 普通訂單、不同 pickup_time_choice），
+   或從 JSON 文件重放
+2. 員工：模擬員工按效率因子和隨機波動完成製作，
+   基礎時間來自 UnifiedTimeService.calculate_preparation_time
+3. 報告：等待隊列長度分位數、ETA 誤差（入隊時的預計完成時間 vs 模擬
+   實際完成時間）、每種操作的查詢數和耗時
+
+注意：隊列代碼使用真實時鐘計算預計時間，模擬時鐘只決定事件順序，
+ETA 誤差反映的是預計時間模型本身（例如忽略已製作時間）的偏差。
+"""
+
+import heapq
+import json
+import logging
+import math
+import random
+import statistics
+import time
+from collections import defaultdict
+
+from django.db import connection, reset_queries, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+logger = logging.getLogger("eshop.kitchen_simulator")
+
+PICKUP_TIME_CHOICES = ("5", "10", "15", "20", "30")
+
+# 每單杯數的權重（1-4 杯）
+DEFAULT_CUP_WEIGHTS = (0.55, 0.3, 0.1, 0.05)
+
+# 默認 12 個模擬員工，約可處理每小時 300 單的高峰
+DEFAULT_BARISTA_EFFICIENCIES = (0.9, 1.0, 1.1) * 4
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentile(values, fraction):
+    """最近秩分位數"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, math.ceil(len(ordered) * fraction) - 1)
+    return ordered[index]
+
+
+class OperationMetrics:
+    """記錄每種操作的查詢數和耗時"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)  # 操作名稱 -> [(毫秒, 查詢數)]
+
+    def measure(self, name, func, *args, **kwargs):
+        # 查詢日誌有長度上限，每次測量前清空以免計數失真
+        reset_queries()
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            result = func(*args, **kwargs)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        self.samples[name].append((elapsed_ms, len(queries)))
+        return result
+
+    def summary(self):
+        report = {}
+        for name, samples in self.samples.items():
+            times = [ms for ms, _ in samples]
+            queries = [count for _, count in samples]
+            report[name] = {
+                "count": len(samples),
+                "mean_ms": round(statistics.mean(times), 3),
+                "p95_ms": round(percentile(times, 0.95), 3),
+                "mean_queries": round(statistics.mean(queries), 1),
+                "max_queries": max(queries),
+            }
+        return report
+
+
+class KitchenSimulator:
+    """
+    廚房離散事件模擬器
+
+    參數：
+    - orders_per_hour: 合成訂單的到達率
+    - duration_minutes: 合成訂單的到達時段長度（模擬分鐘）
+    - barista_efficiencies: 每個模擬員工的效率因子
+    - barista_capacity: 每個模擬員工可同時製作的杯數（max_concurrent_orders）
+    - quick_ratio: 快速訂單比例
+    - noise: 實際製作時間的隨機波動（對數正態分佈的 sigma）
+    - seed: 隨機種子（固定後結果可重現，用作回歸基準）
+    - arrivals: 重放的到達列表，提供時不再合成
+    """
+
+    def __init__(
+        self,
+        orders_per_hour=300,
+        duration_minutes=60,
+        barista_efficiencies=DEFAULT_BARISTA_EFFICIENCIES,
+        barista_capacity=4,
+        quick_ratio=0.3,
+        noise=0.15,
+        seed=None,
+        arrivals=None,
+    ):
+        self.orders_per_hour = orders_per_hour
+        self.duration_minutes = duration_minutes
+        self.barista_efficiencies = list(barista_efficiencies)
+        self.barista_capacity = barista_capacity
+        self.quick_ratio = quick_ratio
+        self.noise = noise
+        self.random = random.Random(seed)
+        self.arrivals = arrivals
+        self.metrics = OperationMetrics()
+
+    # ==================== 到達流 ====================
+
+    def synthesize_arrivals(self):
+        """按泊松過程合成到達流"""
+        arrivals = []
+        rate_per_minute = self.orders_per_hour / 60
+        now = 0.0
+        while rate_per_minute > 0:
+            now += self.random.expovariate(rate_per_minute)
+            if now > self.duration_minutes:
+                break
+            arrivals.append(
+                {
+                    "at_minute": round(now, 3),
+                    "cups": self.random.choices(
+                        range(1, len(DEFAULT_CUP_WEIGHTS) + 1), DEFAULT_CUP_WEIGHTS
+                    )[0],
+                    "order_type": (
+                        "quick" if self.random.random() < self.quick_ratio else "normal"
+                    ),
+                    "pickup_time_choice": self.random.choice(PICKUP_TIME_CHOICES),
+                }
+            )
+        return arrivals
+
+    @staticmethod
+    def load_arrivals(path):
+        """
+        從 JSON 文件讀取到達列表
+
+        格式：[{"at_minute": 0.5, "cups": 2, "order_type": "quick",
+               "pickup_time_choice": "10"}, ...]
+        """
+        with open(path, encoding="utf-8") as handle:
+            arrivals = json.load(handle)
+        return sorted(arrivals, key=lambda arrival: arrival["at_minute"])
+
+    # ==================== 運行 ====================
+
+    def run(self, keep_data=False):
+        """
+        運行模擬
+
+        默認在事務中運行並在結束時回滾；keep_data=True 時保留生成的資料。
+
+        返回：報告字典（見 _build_report）
+        """
+        arrivals = self.arrivals
+        if arrivals is None:
+            arrivals = self.synthesize_arrivals()
+
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                report = self._simulate(arrivals)
+                if not keep_data:
+                    raise _Rollback()
+        except _Rollback:
+            pass
+
+        report["wall_clock_seconds"] = round(time.perf_counter() - started, 2)
+        report["data_kept"] = keep_data
+        return report
+
+    def _simulate(self, arrivals):
+        from .models import Barista
+        from .queue_manager_refactored import CoffeeQueueManager
+        from .smart_allocation import SmartOrderAllocator
+
+        self.manager = CoffeeQueueManager()
+        self.allocator = SmartOrderAllocator()
+
+        baristas = [
+            Barista.objects.create(
+                name=f"sim-barista-{index + 1}",
+                efficiency_factor=efficiency,
+                max_concurrent_orders=self.barista_capacity,
+            )
+            for index, efficiency in enumerate(self.barista_efficiencies)
+        ]
+        self.baristas = {barista.name: barista for barista in baristas}
+        self.busy_cups = {barista.name: 0 for barista in baristas}
+
+        self.waiting = {}  # 訂單ID -> 模擬訂單
+        self.orders = []
+        self.queue_lengths = []
+        events = []
+        sequence = 0
+        for arrival in arrivals:
+            heapq.heappush(events, (arrival["at_minute"], sequence, "arrival", arrival))
+            sequence += 1
+
+        clock = 0.0
+        while events:
+            clock, _, kind, payload = heapq.heappop(events)
+            if kind == "arrival":
+                self._on_arrival(clock, payload)
+            else:
+                self._on_finish(clock, payload)
+
+            started = self._dispatch(clock)
+            for sim_order in started:
+                heapq.heappush(
+                    events, (sim_order["finish_at"], sequence, "finish", sim_order)
+                )
+                sequence += 1
+
+            if kind == "finish" or started:
+                # 狀態變更後的隊列時間重新計算（生產環境由調度器合併執行）
+                self.metrics.measure(
+                    "recalculate_times", self.manager.update_estimated_times
+                )
+
+            self.queue_lengths.append(len(self.waiting))
+
+        return self._build_report(clock)
+
+    def _on_arrival(self, clock, arrival):
+        from .models import CoffeeQueue, OrderModel
+
+        order_type = arrival.get("order_type", "normal")
+        created_at = timezone.now()
+        # 已支付訂單保存時由 CoffeeQueueManager.add__to_queue 入隊
+        order = self.metrics.measure(
+            "place_order",
+            OrderModel.objects.create,
+            items=[{"type": "coffee", "id": 1, "quantity": arrival["cups"]}],
+            total_price=35 * arrival["cups"],
+            payment_status="paid",
+            order_type=order_type,
+            is_quick_order=order_type == "quick",
+            pickup_time_choice=arrival.get("pickup_time_choice", "5"),
+        )
+
+        queue_item = CoffeeQueue.objects.filter(order=order).first()
+        predicted = None
+        if queue_item and queue_item.estimated_completion_time:
+            predicted = (
+                queue_item.estimated_completion_time - created_at
+            ).total_seconds() / 60
+
+        sim_order = {
+            "order_id": order.id,
+            "order_type": order_type,
+            "cups": arrival["cups"],
+            "arrived_at": clock,
+            "predicted_minutes": predicted,
+        }
+        self.orders.append(sim_order)
+        if queue_item:
+            self.waiting[order.id] = sim_order
+
+    def _on_finish(self, clock, sim_order):
+        from .order_status_manager import OrderStatusManager
+
+        self.metrics.measure(
+            "mark_as_ready",
+            OrderStatusManager.mark_as_ready_manually,
+            order_id=sim_order["order_id"],
+            staff_name=sim_order["barista"],
+        )
+        sim_order["ready_at"] = clock
+        self.busy_cups[sim_order["barista"]] -= sim_order["cups"]
+
+    def _can_take(self, name, cups):
+        """員工是否還有足夠的並發杯數（空閒員工總可以接單）"""
+        busy = self.busy_cups[name]
+        return busy == 0 or busy + cups <= self.baristas[name].max_concurrent_orders
+
+    def _dispatch(self, clock):
+        """有空位的員工按隊列順序接單，返回開始製作的模擬訂單"""
+        from .models import CoffeeQueue
+        from .order_status_manager import OrderStatusManager
+
+        started = []
+        while self.waiting:
+            queue_item = self.metrics.measure(
+                "next_in_queue",
+                lambda: CoffeeQueue.objects.select_related("order")
+                .filter(status="waiting", order_id__in=list(self.waiting))
+                .order_by("position", "id")
+                .first(),
+            )
+            if queue_item is None:
+                break
+
+            cups = self.waiting[queue_item.order_id]["cups"]
+            candidates = [name for name in self.baristas if self._can_take(name, cups)]
+            if not candidates:
+                break
+
+            recommendation = self.metrics.measure(
+                "allocate_order", self.allocator.allocate_order, queue_item.order
+            )
+            name = recommendation.get("recommended_barista_name")
+            if name not in candidates:
+                # 推薦的員工沒有空位時由負載最輕的員工接單
+                name = min(
+                    candidates,
+                    key=lambda n: (
+                        self.busy_cups[n],
+                        self.baristas[n].efficiency_factor,
+                    ),
+                )
+
+            self.metrics.measure(
+                "start_preparation",
+                OrderStatusManager.mark_as_preparing_manually,
+                order_id=queue_item.order_id,
+                barista_name=name,
+            )
+
+            sim_order = self.waiting.pop(queue_item.order_id)
+            self.busy_cups[name] += cups
+            sim_order["barista"] = name
+            sim_order["started_at"] = clock
+            sim_order["finish_at"] = clock + self._preparation_minutes(
+                cups, self.baristas[name].efficiency_factor
+            )
+            started.append(sim_order)
+        return started
+
+    def _preparation_minutes(self, cups, efficiency_factor):
+        from .time_calculation import unified_time_service
+
+        base = unified_time_service.calculate_preparation_time(cups)
+        return base * efficiency_factor * self.random.lognormvariate(0, self.noise)
+
+    # ==================== 報告 ====================
+
+    def _build_report(self, clock):
+        finished = [o for o in self.orders if "ready_at" in o]
+        waits = [o["started_at"] - o["arrived_at"] for o in finished]
+        eta_errors = [
+            (o["ready_at"] - o["arrived_at"]) - o["predicted_minutes"]
+            for o in finished
+            if o["predicted_minutes"] is not None
+        ]
+        by_type = defaultdict(list)
+        for o in finished:
+            by_type[o["order_type"]].append(o["ready_at"] - o["arrived_at"])
+
+        def rounded(value):
+            return round(value, 2)
+
+        return {
+            "orders": len(self.orders),
+            "orders_ready": len(finished),
+            "simulated_minutes": rounded(clock),
+            "baristas": self.barista_efficiencies,
+            "queue_length": {
+                "p50": percentile(self.queue_lengths, 0.5),
+                "p95": percentile(self.queue_lengths, 0.95),
+                "max": max(self.queue_lengths, default=0),
+            },
+            "wait_minutes": {
+                "mean": rounded(statistics.mean(waits)) if waits else 0,
+                "p95": rounded(percentile(waits, 0.95)),
+            },
+            "turnaround_minutes_by_type": {
+                order_type: {
+                    "mean": rounded(statistics.mean(values)),
+                    "p95": rounded(percentile(values, 0.95)),
+                }
+                for order_type, values in by_type.items()
+            },
+            "eta_error_minutes": {
+                "mean": rounded(statistics.mean(eta_errors)) if eta_errors else 0,
+                "mean_abs": (
+                    rounded(statistics.mean(abs(e) for e in eta_errors))
+                    if eta_errors
+                    else 0
+                ),
+                "p95_abs": rounded(percentile([abs(e) for e in eta_errors], 0.95)),
+            },
+            "operations": self.metrics.summary(),
+        }
@@ -6,57 +6,131 @@
 2. 分析員工效率
 3. 優化分配策略
 4. 提供學習建議
+
+製作表現持久化在資料庫中，所有進程共享：
+- BaristaPerformanceStat: 每個員工（及每種杯數）的 Welford 均值 / 方差和
+  EWMA，每次標記就緒時以一條 UPDATE 原子更新（O(1)）
+- PreparationHourlyRollup: 每小時每個員工的彙總，歷史分析只讀取彙總行
 """
 
 import logging
 from collections import defaultdict
 from datetime import timedelta
 
-from django.db.models import Avg, Count
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, ExtractHour
 from django.utils import timezone
 
 logger = logging.getLogger("eshop.learning_optimizer")
 
+# 性能比（預計 / 實際）的有效範圍，超出的樣本（例如誤點就緒）會被截斷
+PERFORMANCE_RATIO_BOUNDS = (0.1, 10.0)
+
+
+def _welford_update(mean_field, m2_field, value):
+    """
+    Welford 增量更新的 F 表達式（在 UPDATE 中引用的都是更新前的值）
+
+    mean' = mean + (x - mean) / (n + 1)
+    m2'   = m2 + (x - mean) * (x - mean')
+    """
+    x = Value(float(value), output_field=FloatField())
+    n_plus_one = Cast(F("sample_count"), FloatField()) + Value(1.0)
+    delta = x - F(mean_field)
+    new_mean = F(mean_field) + delta / n_plus_one
+    return {mean_field: new_mean, m2_field: F(m2_field) + delta * (x - new_mean)}
+
 
 class LearningOptimizer:
     """學習優化器 - 用於優化員工分配策略"""
 
-    def __init__(self):
+    def __init__(self, ewma_alpha=None):
         self.logger = logger
-        self.performance_data = defaultdict(list)
+        if ewma_alpha is None:
+            ewma_alpha = getattr(settings, "LEARNING_EWMA_ALPHA", 0.05)
+        self.ewma_alpha = ewma_alpha
         self.strategy_weights = {"balanced": 1.0, "fastest": 0.8, "round_robin": 0.6}
 
-    def record_performance(self, order_id, barista_id, actual_time, estimated_time):
+    def record_performance(
+        self,
+        order_id,
+        barista_id,
+        actual_time,
+        estimated_time,
+        coffee_count=0,
+        completed_at=None,
+    ):
         """
         記錄性能數據
 
+        更新員工的合計統計行和對應杯數的統計行，以及所在小時的彙總行。
+
         Args:
             order_id: 訂單ID
-            barista_id: 員工ID
+            barista_id: 員工標識（與 CoffeeQueue.barista 相同，使用名稱）
             actual_time: 實際製作時間（分鐘）
             estimated_time: 預計製作時間（分鐘）
+            coffee_count: 咖啡杯數（0 表示只更新合計統計）
+            completed_at: 完成時間（默認現在）
         """
+        from .models import BaristaPerformanceStat, PreparationHourlyRollup
+
         try:
+            barista = str(barista_id)
             performance_ratio = estimated_time / actual_time if actual_time > 0 else 1.0
+            low, high = PERFORMANCE_RATIO_BOUNDS
+            performance_ratio = max(low, min(high, performance_ratio))
 
-            self.performance_data[barista_id].append(
-                {
-                    "order_id": order_id,
-                    "actual_time": actual_time,
-                    "estimated_time": estimated_time,
-                    "performance_ratio": performance_ratio,
-                    "timestamp": timezone.now().isoformat(),
-                }
+            cup_keys = {BaristaPerformanceStat.ALL_CUP_COUNTS, coffee_count}
+            hour = (completed_at or timezone.now()).replace(
+                minute=0, second=0, microsecond=0
             )
+            ratio = Value(performance_ratio, output_field=FloatField())
+
+            with transaction.atomic():
+                # 統計行不存在時先插入空行，再以一條 UPDATE 增量更新
+                BaristaPerformanceStat.objects.bulk_create(
+                    [
+                        BaristaPerformanceStat(barista=barista, coffee_count=cups)
+                        for cups in cup_keys
+                    ],
+                    ignore_conflicts=True,
+                )
+                BaristaPerformanceStat.objects.filter(
+                    barista=barista, coffee_count__in=cup_keys
+                ).update(
+                    ratio_ewma=Case(
+                        When(sample_count=0, then=ratio),
+                        default=F("ratio_ewma") * (1 - self.ewma_alpha)
+                        + ratio * self.ewma_alpha,
+                        output_field=FloatField(),
+                    ),
+                    **_welford_update("ratio_mean", "ratio_m2", performance_ratio),
+                    **_welford_update(
+                        "actual_minutes_mean", "actual_minutes_m2", actual_time
+                    ),
+                    sample_count=F("sample_count") + 1,
+                    updated_at=timezone.now(),
+                )
 
-            # 限制每個員工的記錄數量
-            if len(self.performance_data[barista_id]) > 100:
-                self.performance_data[barista_id] = self.performance_data[barista_id][
-                    -100:
-                ]
+                PreparationHourlyRollup.objects.bulk_create(
+                    [PreparationHourlyRollup(hour=hour, barista=barista)],
+                    ignore_conflicts=True,
+                )
+                PreparationHourlyRollup.objects.filter(
+                    hour=hour, barista=barista
+                ).update(
+                    order_count=F("order_count") + 1,
+                    cup_count=F("cup_count") + coffee_count,
+                    total_actual_minutes=F("total_actual_minutes") + actual_time,
+                    total_estimated_minutes=F("total_estimated_minutes")
+                    + estimated_time,
+                )
 
             self.logger.debug(
-                f"記錄性能數據: 員工 #{barista_id}, "
+                f"記錄性能數據: 員工 {barista}, "
                 f"訂單 #{order_id}, "
                 f"實際時間: {actual_time}分鐘, "
                 f"預計時間: {estimated_time}分鐘, "
@@ -66,32 +140,60 @@ class LearningOptimizer:
         except Exception as e:
             self.logger.error(f"記錄性能數據失敗: {str(e)}")
 
-    def get_barista_efficiency(self, barista_id):
+    def record_queue_completion(self, queue_item):
         """
-        獲取員工效率
+        根據已就緒的隊列項記錄性能數據
 
         Returns:
-            效率因子 (0.5-2.0)
+            bool: 是否已記錄（缺少員工或時間時跳過）
         """
-        try:
-            if barista_id not in self.performance_data:
-                return 1.0  # 默認值
+        start = queue_item.actual_start_time
+        end = queue_item.actual_completion_time
+        if not queue_item.barista or not start or not end or end <= start:
+            return False
+
+        self.record_performance(
+            queue_item.order_id,
+            queue_item.barista,
+            actual_time=(end - start).total_seconds() / 60,
+            estimated_time=queue_item.preparation_time_minutes,
+            coffee_count=queue_item.coffee_count,
+            completed_at=end,
+        )
+        return True
 
-            performances = self.performance_data[barista_id]
+    def get_barista_efficiency(self, barista_id, coffee_count=None):
+        """
+        獲取員工效率（讀取一行持久化統計）
 
-            if not performances:
-                return 1.0
+        Args:
+            barista_id: 員工標識（名稱）
+            coffee_count: 指定杯數時使用該杯數的統計
 
-            # 計算平均性能比
-            total_ratio = sum(p["performance_ratio"] for p in performances)
-            avg_ratio = total_ratio / len(performances)
+        Returns:
+            效率因子 (0.5-2.0)
+        """
+        from .models import BaristaPerformanceStat
+
+        try:
+            stat = (
+                BaristaPerformanceStat.objects.filter(
+                    barista=str(barista_id),
+                    coffee_count=coffee_count or BaristaPerformanceStat.ALL_CUP_COUNTS,
+                    sample_count__gt=0,
+                )
+                .values("ratio_ewma")
+                .first()
+            )
+            if stat is None:
+                return 1.0  # 默認值
 
             # 限制範圍
-            efficiency = max(0.5, min(2.0, avg_ratio))
+            efficiency = max(0.5, min(2.0, stat["ratio_ewma"]))
 
             self.logger.debug(
-                f"員工 #{barista_id} 效率計算: "
-                f"平均性能比: {avg_ratio:.2f}, "
+                f"員工 {barista_id} 效率計算: "
+                f"性能比 EWMA: {stat['ratio_ewma']:.2f}, "
                 f"效率因子: {efficiency:.2f}"
             )
 
@@ -101,9 +203,31 @@ class LearningOptimizer:
             self.logger.error(f"計算員工效率失敗: {str(e)}")
             return 1.0
 
+    def get_performance_stats(self, barista_id):
+        """
+        獲取員工按杯數的統計
+
+        Returns:
+            {杯數: {'samples', 'ratio_mean', 'ratio_std', 'ratio_ewma',
+                    'actual_minutes_mean', 'actual_minutes_std'}}（0 為合計）
+        """
+        from .models import BaristaPerformanceStat
+
+        stats = {}
+        for stat in BaristaPerformanceStat.objects.filter(barista=str(barista_id)):
+            stats[stat.coffee_count] = {
+                "samples": stat.sample_count,
+                "ratio_mean": round(stat.ratio_mean, 3),
+                "ratio_std": round(stat.ratio_variance**0.5, 3),
+                "ratio_ewma": round(stat.ratio_ewma, 3),
+                "actual_minutes_mean": round(stat.actual_minutes_mean, 2),
+                "actual_minutes_std": round(stat.actual_minutes_variance**0.5, 2),
+            }
+        return stats
+
     def analyze_historical_data(self, days=7):
         """
-        分析歷史數據
+        分析歷史數據（讀取每小時彙總）
 
         Args:
             days: 分析的天數
@@ -112,19 +236,15 @@ class LearningOptimizer:
             分析結果字典
         """
         try:
-            from .models import CoffeeQueue
+            from .models import PreparationHourlyRollup
 
             start_date = timezone.now() - timedelta(days=days)
+            rollups = PreparationHourlyRollup.objects.filter(hour__gte=start_date)
 
-            # 獲取完成的隊列項
-            completed_queues = CoffeeQueue.objects.filter(
-                status="ready",
-                actual_start_time__gte=start_date,
-                actual_start_time__isnull=False,
-                actual_completion_time__isnull=False,
+            totals = rollups.aggregate(
+                orders=Sum("order_count"), actual=Sum("total_actual_minutes")
             )
-
-            total_orders = completed_queues.count()
+            total_orders = totals["orders"] or 0
 
             if total_orders == 0:
                 return {
@@ -139,57 +259,40 @@ class LearningOptimizer:
                     },
                 }
 
-            # 計算平均製作時間
-            avg_prep_time = (
-                completed_queues.aggregate(avg_time=Avg("preparation_time_minutes"))[
-                    "avg_time"
-                ]
-                or 0
-            )
+            # 平均實際製作時間
+            avg_prep_time = totals["actual"] / total_orders
 
             # 按員工分組統計
             efficiency_by_barista = {}
-            barista_stats = {}
-
-            for queue in completed_queues:
-                if queue.barista and queue.barista not in barista_stats:
-                    barista_stats[queue.barista] = {
-                        "total_orders": 0,
-                        "total_time": 0,
-                        "avg_time": 0,
-                    }
-
-                if queue.barista in barista_stats:
-                    barista_stats[queue.barista]["total_orders"] += 1
-                    barista_stats[queue.barista][
-                        "total_time"
-                    ] += queue.preparation_time_minutes
+            barista_stats = (
+                rollups.values("barista")
+                .annotate(orders=Sum("order_count"), actual=Sum("total_actual_minutes"))
+                .order_by("barista")
+            )
 
             # 計算員工效率
-            for barista_name, stats in barista_stats.items():
-                if stats["total_orders"] > 0:
-                    avg_time = stats["total_time"] / stats["total_orders"]
-                    efficiency = avg_prep_time / avg_time if avg_time > 0 else 1.0
-                    efficiency = max(0.5, min(2.0, efficiency))
-
-                    efficiency_by_barista[barista_name] = {
-                        "total_orders": stats["total_orders"],
-                        "average_time": round(avg_time, 1),
-                        "efficiency_factor": round(efficiency, 2),
-                    }
+            for stats in barista_stats:
+                avg_time = stats["actual"] / stats["orders"]
+                efficiency = avg_prep_time / avg_time if avg_time > 0 else 1.0
+                efficiency = max(0.5, min(2.0, efficiency))
+
+                efficiency_by_barista[stats["barista"]] = {
+                    "total_orders": stats["orders"],
+                    "average_time": round(avg_time, 1),
+                    "efficiency_factor": round(efficiency, 2),
+                }
 
             # 分析最繁忙時段
-            from django.db.models.functions import ExtractHour
-
             hourly_stats = (
-                completed_queues.annotate(hour=ExtractHour("actual_start_time"))
-                .values("hour")
-                .annotate(count=Count("id"))
+                rollups.annotate(hour_of_day=ExtractHour("hour"))
+                .values("hour_of_day")
+                .annotate(count=Sum("order_count"))
                 .order_by("-count")[:5]
             )
 
             busiest_hours = [
-                f"{stat['hour']}:00 ({stat['count']}訂單)" for stat in hourly_stats
+                f"{stat['hour_of_day']}:00 ({stat['count']}訂單)"
+                for stat in hourly_stats
             ]
 
             # 生成建議
@@ -224,6 +327,102 @@ class LearningOptimizer:
 
             return {"success": False, "message": f"分析失敗: {str(e)}", "data": None}
 
+    def rebuild_from_history(self, days=30):
+        """
+        從已就緒的隊列項重建統計和每小時彙總（首次部署或修復時使用）
+
+        只掃描一次歷史行；重建範圍內的彙總行和所有統計行會被覆蓋。
+
+        Returns:
+            int: 使用的隊列項數
+        """
+        from .models import BaristaPerformanceStat, CoffeeQueue, PreparationHourlyRollup
+
+        start_date = timezone.now() - timedelta(days=days)
+        rows = (
+            CoffeeQueue.objects.filter(
+                status__in=["ready", "completed"],
+                actual_completion_time__gte=start_date,
+                actual_start_time__isnull=False,
+            )
+            .exclude(barista__isnull=True)
+            .exclude(barista="")
+            .order_by("actual_completion_time")
+            .values_list(
+                "barista",
+                "coffee_count",
+                "preparation_time_minutes",
+                "actual_start_time",
+                "actual_completion_time",
+            )
+        )
+
+        low, high = PERFORMANCE_RATIO_BOUNDS
+        stats = {}
+        rollups = defaultdict(lambda: [0, 0, 0.0, 0.0])
+        used = 0
+
+        for barista, cups, estimated, started, completed in rows.iterator():
+            actual = (completed - started).total_seconds() / 60
+            if actual <= 0:
+                continue
+            used += 1
+            ratio = max(low, min(high, estimated / actual))
+
+            for key in {(barista, 0), (barista, cups)}:
+                stat = stats.setdefault(
+                    key, BaristaPerformanceStat(barista=key[0], coffee_count=key[1])
+                )
+                stat.sample_count += 1
+                n = stat.sample_count
+                delta = ratio - stat.ratio_mean
+                stat.ratio_mean += delta / n
+                stat.ratio_m2 += delta * (ratio - stat.ratio_mean)
+                stat.ratio_ewma = (
+                    ratio
+                    if n == 1
+                    else stat.ratio_ewma * (1 - self.ewma_alpha)
+                    + ratio * self.ewma_alpha
+                )
+                delta = actual - stat.actual_minutes_mean
+                stat.actual_minutes_mean += delta / n
+                stat.actual_minutes_m2 += delta * (actual - stat.actual_minutes_mean)
+
+            hour = completed.replace(minute=0, second=0, microsecond=0)
+            rollup = rollups[(hour, barista)]
+            rollup[0] += 1
+            rollup[1] += cups
+            rollup[2] += actual
+            rollup[3] += estimated
+
+        with transaction.atomic():
+            BaristaPerformanceStat.objects.all().delete()
+            BaristaPerformanceStat.objects.bulk_create(stats.values(), batch_size=500)
+
+            PreparationHourlyRollup.objects.filter(hour__gte=start_date).delete()
+            PreparationHourlyRollup.objects.bulk_create(
+                [
+                    PreparationHourlyRollup(
+                        hour=hour,
+                        barista=barista,
+                        order_count=orders,
+                        cup_count=cups,
+                        total_actual_minutes=actual,
+                        total_estimated_minutes=estimated,
+                    )
+                    for (hour, barista), (orders, cups, actual, estimated) in (
+                        rollups.items()
+                    )
+                ],
+                batch_size=500,
+            )
+
+        self.logger.info(
+            f"學習統計已重建: {used} 個隊列項, "
+            f"{len(stats)} 個統計行, {len(rollups)} 個每小時彙總"
+        )
+        return used
+
     def _generate_recommendations(
         self, total_orders, avg_prep_time, efficiency_by_barista
     ):
@@ -434,29 +633,18 @@ class LearningOptimizer:
 
     def clear_old_data(self, days_old=30):
         """
-        清理舊數據
+        清理舊數據（刪除過期的每小時彙總；增量統計由 EWMA 自然淡化）
 
         Args:
             days_old: 清理多少天前的數據
         """
+        from .models import PreparationHourlyRollup
+
         try:
             cutoff_date = timezone.now() - timedelta(days=days_old)
-            cutoff_iso = cutoff_date.isoformat()
-
-            cleared_count = 0
-
-            for barista_id, performances in list(self.performance_data.items()):
-                # 過濾掉舊數據
-                new_performances = [
-                    p for p in performances if p["timestamp"] >= cutoff_iso
-                ]
-
-                cleared_count += len(performances) - len(new_performances)
-                self.performance_data[barista_id] = new_performances
-
-                # 如果沒有數據了，刪除該員工的記錄
-                if not new_performances:
-                    del self.performance_data[barista_id]
+            cleared_count, _ = PreparationHourlyRollup.objects.filter(
+                hour__lt=cutoff_date
+            ).delete()
 
             self.logger.info(f"清理舊數據完成: 清理了 {cleared_count} 條記錄")
 
@@ -496,6 +684,12 @@ def record_order_performance(order_id, barista_id, actual_time, estimated_time):
     )
 
 
+def record_queue_completion(queue_item):
+    """根據已就緒的隊列項記錄性能數據（便捷函數）"""
+    optimizer = get_learning_optimizer()
+    return optimizer.record_queue_completion(queue_item)
+
+
 def get_optimization_suggestions(order_id=None):
     """獲取優化建議（便捷函數）"""
     optimizer = get_learning_optimizer()
@@ -0,0 +1,50 @@
+# eshop/management/commands/backfill_display_payloads.py
+"""
+管理命令：為已支付但沒有商品顯示數據（或版本過舊）的訂單計算 display_payload
+
+新訂單在支付時自動計算；這個命令用於遷移後補齊舊訂單。
+
+python manage.py backfill_display_payloads --batch-size 500
+"""
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from eshop.models import OrderModel
+from eshop.models.order import DISPLAY_PAYLOAD_VERSION
+
+
+class Command(BaseCommand):
+    help = "為已支付訂單補齊預先計算的商品顯示數據"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="每批更新數")
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        orders = (
+            OrderModel.objects.without_qr_codes()
+            .filter(payment_status="paid")
+            .filter(
+                Q(display_payload__isnull=True)
+                | ~Q(display_payload__version=DISPLAY_PAYLOAD_VERSION)
+            )
+            .order_by("id")
+        )
+
+        batch = []
+        updated = 0
+        for order in orders.iterator(chunk_size=batch_size):
+            order.refresh_display_payload(save=False)
+            batch.append(order)
+            if len(batch) >= batch_size:
+                OrderModel.objects.bulk_update(batch, ["display_payload"])
+                updated += len(batch)
+                batch = []
+        if batch:
+            OrderModel.objects.bulk_update(batch, ["display_payload"])
+            updated += len(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ 已為 {updated} 個訂單計算商品顯示數據")
+        )
@@ -0,0 +1,153 @@
+# eshop/management/commands/benchmark_display_payload.py
+"""
+管理命令：比較訂單序列化成本（每次重新處理商品 vs 預先計算的 display_payload）
+
+在事務中生成指定數量的已支付訂單，分別測量員工隊列（prepare_order_data）
+和 API（OrderDataSerializer.serialize_order）每個訂單的耗時與查詢數，
+結束時回滾，不會留下任何資料。
+
+python manage.py benchmark_display_payload --orders 40 --samples 20
+"""
+
+import statistics
+import time
+
+import pytz
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from eshop.models import BeanItem, CoffeeItem, OrderModel
+from eshop.serializers import OrderDataSerializer
+from eshop.utils.order_item_processor import OrderItemProcessor
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "比較訂單序列化成本（重新處理商品 vs display_payload），不保留任何資料"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=40, help="訂單數")
+        parser.add_argument(
+            "--samples", type=int, default=20, help="每種方式的測量次數"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"訂單: {options['orders']}, 每種方式測量 {options['samples']} 次\n"
+        )
+        self.stdout.write(
+            f"{'方式':<28} | {'每單查詢':>8} | {'每單µs':>9} | {'p95µs':>9}"
+        )
+
+        try:
+            with transaction.atomic():
+                order_ids = self._populate(options["orders"])
+                self._run(order_ids, options["samples"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("\n✅ 基準測試完成，資料已回滾"))
+
+    def _populate(self, order_count):
+        coffee = CoffeeItem.objects.create(name="bench-latte", price=38)
+        bean = BeanItem.objects.create(
+            name="bench-ethiopia", price_200g=120, price_500g=260
+        )
+        orders = []
+        for index in range(order_count):
+            items = [
+                {
+                    "type": "coffee",
+                    "id": coffee.id,
+                    "name": coffee.name,
+                    "quantity": 1 + index % 3,
+                    "cup_level": "Medium",
+                    "milk_level": "Light",
+                    "extra_options": {
+                        "cup_level": "Medium",
+                        "strength_level": "Normal",
+                    },
+                },
+                {
+                    "type": "bean",
+                    "id": bean.id,
+                    "name": bean.name,
+                    "quantity": 1,
+                    "weight": "200g",
+                    "grinding_level": "Medium",
+                },
+            ]
+            orders.append(
+                OrderModel.objects.create(
+                    items=items, total_price=158, payment_status="paid"
+                )
+            )
+        return [order.id for order in orders]
+
+    def _run(self, order_ids, samples):
+        now = timezone.now()
+        hk_tz = pytz.timezone("Asia/Hong_Kong")
+        cases = [
+            (
+                "隊列：重新處理商品",
+                False,
+                lambda order: OrderItemProcessor.prepare_order_data(
+                    order, now=now, hk_tz=hk_tz, include_queue_info=False
+                ),
+            ),
+            (
+                "隊列：display_payload",
+                True,
+                lambda order: OrderItemProcessor.prepare_order_data(
+                    order, now=now, hk_tz=hk_tz, include_queue_info=False
+                ),
+            ),
+            (
+                "API：重新處理商品",
+                False,
+                lambda order: OrderDataSerializer.serialize_order(
+                    order, include_queue_info=False
+                ),
+            ),
+            (
+                "API：display_payload",
+                True,
+                lambda order: OrderDataSerializer.serialize_order(
+                    order, include_queue_info=False
+                ),
+            ),
+        ]
+
+        for label, use_payload, func in cases:
+            per_order = []
+            query_count = 0
+            for _ in range(samples):
+                orders = list(
+                    OrderModel.objects.without_qr_codes().filter(id__in=order_ids)
+                )
+                if not use_payload:
+                    for order in orders:
+                        order.display_payload = None
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for order in orders:
+                        func(order)
+                    elapsed = time.perf_counter() - started
+                per_order.append(elapsed * 1_000_000 / len(orders))
+                query_count = len(queries) / len(orders)
+
+            self.stdout.write(
+                f"{label:<28} | {query_count:>8.1f} | "
+                f"{statistics.mean(per_order):>9.1f} | {self._p95(per_order):>9.1f}"
+            )
+
+    @staticmethod
+    def _p95(values):
+        ordered = sorted(values)
+        return ordered[int(len(ordered) * 0.95) - 1] if ordered else 0
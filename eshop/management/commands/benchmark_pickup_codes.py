@@ -0,0 +1,115 @@
+# eshop/management/commands/benchmark_pickup_codes.py
+"""
+管理命令：比較取餐碼分配延遲（逐個探測 vs 取餐碼池）
+
+在事務中生成指定數量的歷史訂單，分別測量舊的探測方式和取餐碼池的
+分配延遲，結束時回滾，不會留下任何資料。
+
+python manage.py benchmark_pickup_codes --history 9000 --samples 200
+"""
+
+import secrets
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from eshop.models import OrderModel, PickupCodePool
+from eshop.pickup_codes import PICKUP_CODE_SPACE, PickupCodeAllocator
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "比較取餐碼分配延遲（逐個探測 vs 取餐碼池），不保留任何資料"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--history", type=int, default=9000, help="最多生成的歷史訂單數"
+        )
+        parser.add_argument(
+            "--samples", type=int, default=200, help="每個歷史規模的分配次數"
+        )
+
+    def handle(self, *args, **options):
+        history = min(options["history"], len(PICKUP_CODE_SPACE) - 1)
+        samples = options["samples"]
+        steps = sorted({0, history // 3, history * 2 // 3, history})
+
+        self.stdout.write(f"歷史訂單規模: {steps}, 每個規模分配 {samples} 次\n")
+        self.stdout.write(
+            f"{'歷史訂單':>8} | {'探測 平均ms':>11} | {'探測 p95ms':>10} | "
+            f"{'探測 查詢數':>10} | {'池 平均ms':>9} | {'池 p95ms':>8}"
+        )
+
+        try:
+            with transaction.atomic():
+                self._run(steps, samples)
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("\n✅ 基準測試完成，資料已回滾"))
+
+    def _run(self, steps, samples):
+        codes = list(PICKUP_CODE_SPACE)
+        secrets.SystemRandom().shuffle(codes)
+        created = 0
+
+        for size in steps:
+            # 歷史訂單按舊規則佔用全局唯一的取餐碼
+            OrderModel.objects.bulk_create(
+                [
+                    OrderModel(
+                        items=[],
+                        status="completed",
+                        payment_status="paid",
+                        pickup_code=code,
+                    )
+                    for code in codes[created:size]
+                ],
+                batch_size=1000,
+            )
+            created = size
+
+            probe_times, probe_queries = [], []
+            for _ in range(samples):
+                started = time.perf_counter()
+                probe_queries.append(self._legacy_probe())
+                probe_times.append((time.perf_counter() - started) * 1000)
+
+            # 每個規模使用新的取餐碼池，所有歷史碼都已過冷卻期
+            PickupCodePool.objects.all().delete()
+            allocator = PickupCodeAllocator(quiet_minutes=0)
+            allocator.seed()
+            pool_times = []
+            for _ in range(samples):
+                started = time.perf_counter()
+                allocator.allocate()
+                pool_times.append((time.perf_counter() - started) * 1000)
+
+            self.stdout.write(
+                f"{size:>8} | {statistics.mean(probe_times):>11.3f} | "
+                f"{self._p95(probe_times):>10.3f} | "
+                f"{statistics.mean(probe_queries):>10.1f} | "
+                f"{statistics.mean(pool_times):>9.3f} | "
+                f"{self._p95(pool_times):>8.3f}"
+            )
+
+    @staticmethod
+    def _legacy_probe(max_attempts=400):
+        """舊的全局唯一探測方式，返回使用的查詢數"""
+        for attempt in range(1, max_attempts + 1):
+            code = "".join(secrets.choice(string.digits) for _ in range(4))
+            if not OrderModel.objects.filter(pickup_code=code).exists():
+                return attempt
+        return max_attempts
+
+    @staticmethod
+    def _p95(values):
+        ordered = sorted(values)
+        return ordered[int(len(ordered) * 0.95) - 1] if ordered else 0
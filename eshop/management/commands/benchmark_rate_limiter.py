@@ -0,0 +1,115 @@
+# eshop/management/commands/benchmark_rate_limiter.py
+"""
+管理命令：測量每次速率限制檢查的耗時（舊的時間戳列表 vs 令牌桶）
+
+舊實現為每個識別符保存窗口內所有請求的時間戳，每次檢查重建列表；
+令牌桶只保存兩個值。配置了 Redis（django-redis 或 channels_redis）時
+同時測量 Redis 後端，或以 --redis-url 指定。
+
+python manage.py benchmark_rate_limiter --checks 20000 --limit 1000
+"""
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from eshop.rate_limiter import RateLimiter
+
+
+class Command(BaseCommand):
+    help = "測量每次速率限制檢查的耗時（舊的時間戳列表 vs 令牌桶）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--checks", type=int, default=20000, help="檢查次數")
+        parser.add_argument(
+            "--limit", type=int, default=1000, help="每個窗口允許的請求數"
+        )
+        parser.add_argument(
+            "--identifiers", type=int, default=100, help="輪流檢查的識別符數"
+        )
+        parser.add_argument("--redis-url", default="", help="Redis 地址（可選）")
+
+    def handle(self, *args, **options):
+        checks = options["checks"]
+        limit = options["limit"]
+        identifiers = [f"bench:{i}" for i in range(options["identifiers"])]
+
+        self.stdout.write(
+            f"檢查次數: {checks}, limit: {limit}/分鐘, 識別符: {len(identifiers)}\n"
+        )
+        self.stdout.write(f"{'實現':<12} | {'平均µs':>8} | {'p95µs':>8}")
+
+        legacy_cache = {}
+        self._report(
+            "時間戳列表",
+            lambda key: self._legacy_check(legacy_cache, key, limit, 60),
+            identifiers,
+            checks,
+        )
+
+        local = RateLimiter(redis_client=False)
+        self._report(
+            "令牌桶(本地)",
+            lambda key: local.check(key, "bench", limit=limit, window_minutes=1),
+            identifiers,
+            checks,
+        )
+
+        client = self._redis_client(options["redis_url"])
+        if client is not None:
+            limiter = RateLimiter(redis_client=client)
+            self._report(
+                "令牌桶(Redis)",
+                lambda key: limiter.check(key, "bench", limit=limit, window_minutes=1),
+                identifiers,
+                checks,
+            )
+            client.delete(*[f"rate_limit:bench:{key}" for key in identifiers])
+        else:
+            self.stdout.write("（未配置 Redis，跳過 Redis 後端）")
+
+        self.stdout.write(self.style.SUCCESS("\n✅ 基準測試完成"))
+
+    def _report(self, name, check, identifiers, checks):
+        timings = []
+        for i in range(checks):
+            key = identifiers[i % len(identifiers)]
+            started = time.perf_counter()
+            check(key)
+            timings.append((time.perf_counter() - started) * 1_000_000)
+        self.stdout.write(
+            f"{name:<12} | {statistics.mean(timings):>8.2f} | "
+            f"{self._p95(timings):>8.2f}"
+        )
+
+    @staticmethod
+    def _redis_client(redis_url):
+        if redis_url:
+            import redis
+
+            return redis.Redis.from_url(redis_url)
+        from eshop.rate_limiter import _configured_redis_client
+
+        try:
+            return _configured_redis_client()
+        except Exception:
+            return None
+
+    @staticmethod
+    def _legacy_check(cache, identifier, limit, window_seconds):
+        """舊的 SecurityUtils.check_rate_limit 算法"""
+        current_time = time.time()
+        history = [
+            t for t in cache.get(identifier, []) if current_time - t < window_seconds
+        ]
+        if len(history) >= limit:
+            return False
+        history.append(current_time)
+        cache[identifier] = history
+        return True
+
+    @staticmethod
+    def _p95(values):
+        ordered = sorted(values)
+        return ordered[int(len(ordered) * 0.95) - 1] if ordered else 0
@@ -0,0 +1,152 @@
+# eshop/management/commands/benchmark_workload_snapshot.py
+"""
+管理命令：比較員工工作負載查詢（逐個員工查詢 vs 工作負載快照）
+
+在事務中生成指定數量的員工和隊列項，分別測量舊的逐個員工查詢方式
+和 WorkloadSnapshot 的查詢數與延遲，結束時回滾，不會留下任何資料。
+
+python manage.py benchmark_workload_snapshot --baristas 20 --queue-items 200
+"""
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from eshop.models import Barista, CoffeeQueue, OrderModel
+from eshop.smart_allocation import BaristaWorkloadManager, WorkloadSnapshot
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "比較員工工作負載查詢（逐個員工 vs 快照），不保留任何資料"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--baristas", type=int, default=20, help="員工數")
+        parser.add_argument(
+            "--queue-items", type=int, default=200, help="隊列項數（一半正在製作）"
+        )
+        parser.add_argument(
+            "--samples", type=int, default=50, help="每種方式的測量次數"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"員工: {options['baristas']}, 隊列項: {options['queue_items']}, "
+            f"每種方式測量 {options['samples']} 次\n"
+        )
+        self.stdout.write(
+            f"{'方式':<24} | {'查詢數':>6} | {'平均ms':>8} | {'p95ms':>8}"
+        )
+
+        try:
+            with transaction.atomic():
+                self._populate(options["baristas"], options["queue_items"])
+                self._run(options["samples"])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+        self.stdout.write(self.style.SUCCESS("\n✅ 基準測試完成，資料已回滾"))
+
+    def _populate(self, barista_count, queue_item_count):
+        baristas = Barista.objects.bulk_create(
+            [
+                Barista(name=f"bench-barista-{index}", max_concurrent_orders=4)
+                for index in range(barista_count)
+            ]
+        )
+        orders = OrderModel.objects.bulk_create(
+            [
+                OrderModel(
+                    items=[],
+                    status="preparing",
+                    payment_status="paid",
+                    pickup_code=f"{index + 1:04d}",
+                )
+                for index in range(queue_item_count)
+            ]
+        )
+        CoffeeQueue.objects.bulk_create(
+            [
+                CoffeeQueue(
+                    order=order,
+                    position=index + 1,
+                    status="preparing" if index % 2 == 0 else "waiting",
+                    barista=baristas[index % len(baristas)].name,
+                    coffee_count=1 + index % 3,
+                )
+                for index, order in enumerate(orders)
+            ]
+        )
+
+    def _run(self, samples):
+        manager = BaristaWorkloadManager()
+        cases = [
+            ("逐個員工（舊）", self._legacy_all_workloads),
+            ("快照 + 訂單明細", lambda: manager.get_all_baristas_workload()),
+            (
+                "快照（分配策略）",
+                lambda: manager.get_all_baristas_workload(include_orders=False),
+            ),
+        ]
+
+        legacy_loads = None
+        for label, func in cases:
+            times = []
+            for _ in range(samples):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    workloads = func()
+                    times.append((time.perf_counter() - started) * 1000)
+
+            loads = {w["name"]: w["current_load"] for w in workloads}
+            if legacy_loads is None:
+                legacy_loads = loads
+            elif loads != legacy_loads:
+                self.stdout.write(self.style.ERROR(f"❌ {label} 的負載與舊方式不一致"))
+
+            self.stdout.write(
+                f"{label:<24} | {len(queries):>6} | "
+                f"{statistics.mean(times):>8.3f} | {self._p95(times):>8.3f}"
+            )
+
+        # 快照只需構建一次，之後同一請求內的讀取不再查詢
+        snapshot = WorkloadSnapshot.build()
+        with CaptureQueriesContext(connection) as queries:
+            snapshot.active_workloads(include_orders=False)
+        self.stdout.write(f"{'共享快照內再次讀取':<24} | {len(queries):>6} |")
+
+    @staticmethod
+    def _legacy_all_workloads():
+        """舊的實現：每個員工重新查詢員工、隊列項和訂單"""
+        workloads = []
+        for barista in Barista.objects.filter(is_active=True):
+            barista = Barista.objects.get(id=barista.id)
+            current_orders = []
+            total_coffee_count = 0
+            for queue in CoffeeQueue.objects.filter(
+                barista=barista.name, status="preparing"
+            ):
+                current_orders.append(
+                    {"order_id": queue.order.id, "coffee_count": queue.coffee_count}
+                )
+                total_coffee_count += queue.coffee_count
+            workloads.append(
+                {
+                    "name": barista.name,
+                    "current_load": total_coffee_count,
+                    "current_orders": current_orders,
+                }
+            )
+        return workloads
+
+    @staticmethod
+    def _p95(values):
+        ordered = sorted(values)
+        return ordered[int(len(ordered) * 0.95) - 1] if ordered else 0
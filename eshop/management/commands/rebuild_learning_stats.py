@@ -0,0 +1,21 @@
+# eshop/management/commands/rebuild_learning_stats.py
+"""
+管理命令：從已就緒的隊列項重建學習優化器的統計和每小時彙總
+
+python manage.py rebuild_learning_stats --days 30
+"""
+
+from django.core.management.base import BaseCommand
+
+from eshop.learning_optimizer import get_learning_optimizer
+
+
+class Command(BaseCommand):
+    help = "從歷史隊列項重建員工表現統計和每小時彙總"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30, help="重建最近多少天的數據")
+
+    def handle(self, *args, **options):
+        used = get_learning_optimizer().rebuild_from_history(days=options["days"])
+        self.stdout.write(self.style.SUCCESS(f"✅ 已根據 {used} 個隊列項重建學習統計"))
@@ -0,0 +1,131 @@
+# eshop/management/commands/simulate_kitchen.py
+"""
+管理命令：廚房離散事件模擬 / 隊列子系統負載基準
+
+以模擬時鐘驅動真實的隊列代碼，報告隊列長度分位數、ETA 誤差、
+每種操作的查詢數和耗時。默認結束時回滾，不會留下任何資料。
+
+python manage.py simulate_kitchen --rate 300 --minutes 60 --baristas 0.9,1.0,1.1 --seed 1
+python manage.py simulate_kitchen --replay arrivals.json --json report.json
+"""
+
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from eshop.kitchen_simulator import DEFAULT_BARISTA_EFFICIENCIES, KitchenSimulator
+
+
+class Command(BaseCommand):
+    help = "廚房離散事件模擬：以合成或重放的訂單流驅動隊列代碼並報告性能"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rate", type=float, default=300, help="每小時訂單數")
+        parser.add_argument(
+            "--minutes", type=float, default=60, help="訂單到達時段（模擬分鐘）"
+        )
+        parser.add_argument(
+            "--baristas",
+            default=",".join(str(value) for value in DEFAULT_BARISTA_EFFICIENCIES),
+            help="模擬員工的效率因子，以逗號分隔（默認 12 個員工）",
+        )
+        parser.add_argument(
+            "--capacity", type=int, default=4, help="每個員工可同時製作的杯數"
+        )
+        parser.add_argument(
+            "--quick-ratio", type=float, default=0.3, help="快速訂單比例"
+        )
+        parser.add_argument(
+            "--noise", type=float, default=0.15, help="實際製作時間的隨機波動"
+        )
+        parser.add_argument("--seed", type=int, default=None, help="隨機種子")
+        parser.add_argument("--replay", help="重放的到達列表 JSON 文件")
+        parser.add_argument("--json", dest="json_path", help="把報告寫入 JSON 文件")
+        parser.add_argument(
+            "--keep-data", action="store_true", help="保留模擬生成的資料"
+        )
+        parser.add_argument(
+            "--verbose-logs", action="store_true", help="保留隊列代碼的 INFO 日誌"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            efficiencies = [float(value) for value in options["baristas"].split(",")]
+        except ValueError:
+            raise CommandError("--baristas 必須是以逗號分隔的數字")
+        if not efficiencies:
+            raise CommandError("至少需要一個模擬員工")
+
+        arrivals = None
+        if options["replay"]:
+            arrivals = KitchenSimulator.load_arrivals(options["replay"])
+
+        simulator = KitchenSimulator(
+            orders_per_hour=options["rate"],
+            duration_minutes=options["minutes"],
+            barista_efficiencies=efficiencies,
+            barista_capacity=options["capacity"],
+            quick_ratio=options["quick_ratio"],
+            noise=options["noise"],
+            seed=options["seed"],
+            arrivals=arrivals,
+        )
+
+        if not options["verbose_logs"]:
+            logging.disable(logging.INFO)
+        try:
+            report = simulator.run(keep_data=options["keep_data"])
+        finally:
+            logging.disable(logging.NOTSET)
+
+        self._print_report(report)
+
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as handle:
+                json.dump(report, handle, ensure_ascii=False, indent=2)
+            self.stdout.write(f"報告已寫入 {options['json_path']}")
+
+    def _print_report(self, report):
+        queue = report["queue_length"]
+        eta = report["eta_error_minutes"]
+        wait = report["wait_minutes"]
+
+        self.stdout.write(
+            f"訂單: {report['orders']} (完成 {report['orders_ready']}), "
+            f"模擬時長: {report['simulated_minutes']} 分鐘, "
+            f"員工效率: {report['baristas']}"
+        )
+        self.stdout.write(
+            f"等待隊列長度: p50 {queue['p50']}, p95 {queue['p95']}, max {queue['max']}"
+        )
+        self.stdout.write(
+            f"等待開始製作: 平均 {wait['mean']} 分鐘, p95 {wait['p95']} 分鐘"
+        )
+        for order_type, turnaround in report["turnaround_minutes_by_type"].items():
+            self.stdout.write(
+                f"{order_type} 訂單完成時間: 平均 {turnaround['mean']} 分鐘, "
+                f"p95 {turnaround['p95']} 分鐘"
+            )
+        self.stdout.write(
+            f"ETA 誤差（實際 - 預計）: 平均 {eta['mean']} 分鐘, "
+            f"平均絕對 {eta['mean_abs']} 分鐘, p95 絕對 {eta['p95_abs']} 分鐘\n"
+        )
+
+        self.stdout.write(
+            f"{'操作':<20} | {'次數':>6} | {'平均ms':>9} | {'p95ms':>9} | "
+            f"{'平均查詢':>8} | {'最多查詢':>8}"
+        )
+        for name, stats in report["operations"].items():
+            self.stdout.write(
+                f"{name:<20} | {stats['count']:>6} | {stats['mean_ms']:>9.3f} | "
+                f"{stats['p95_ms']:>9.3f} | {stats['mean_queries']:>8.1f} | "
+                f"{stats['max_queries']:>8}"
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✅ 模擬完成，耗時 {report['wall_clock_seconds']} 秒"
+                f"{'' if report['data_kept'] else '，資料已回滾'}"
+            )
+        )
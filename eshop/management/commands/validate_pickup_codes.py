@@ -4,14 +4,16 @@ from collections import Counter
 from django.core.management.base import BaseCommand
 
 from eshop.models import OrderModel
+from eshop.pickup_codes import TERMINAL_ORDER_STATUSES
 
 
 class Command(BaseCommand):
-    help = "验证所有订单的取餐码是否唯一"
+    help = "验证未完成订单的取餐码是否唯一（已完成订单的取餐码会被回收）"
 
     def handle(self, *args, **options):
-        # 获取所有订单的取餐码
-        pickup_codes = OrderModel.objects.values_list("pickup_code", flat=True)
+        # 获取未完成订单的取餐码
+        active_orders = OrderModel.objects.exclude(status__in=TERMINAL_ORDER_STATUSES)
+        pickup_codes = active_orders.values_list("pickup_code", flat=True)
 
         # 统计每个取餐码的出现次数
         code_counts = Counter(pickup_codes)
@@ -30,7 +32,7 @@ class Command(BaseCommand):
 
             # 显示使用这些取餐码的订单
             for code in duplicate_codes:
-                orders = OrderModel.objects.filter(pickup_code=code)
+                orders = active_orders.filter(pickup_code=code)
                 self.stdout.write(f"  使用取餐码 '{code}' 的订单ID:")
                 for order in orders:
                     self.stdout.write(f"    - {order.id} (创建于: {order.created_at})")
@@ -41,7 +43,7 @@ class Command(BaseCommand):
         total_codes = len(pickup_codes)
         unique_codes = len(code_counts)
         self.stdout.write("\n统计信息:")
-        self.stdout.write(f"  总订单数: {total_codes}")
+        self.stdout.write(f"  未完成订单数: {total_codes}")
         self.stdout.write(f"  唯一取餐码数: {unique_codes}")
         self.stdout.write(f"  重复取餐码数: {len(duplicate_codes)}")
 
@@ -0,0 +1,75 @@
+# Generated by Django 4.2.21 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+import eshop.models.pickup_code
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eshop", "0063_remove_coffeeitem_option_group_order_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PickupCodePool",
+            fields=[
+                (
+                    "code",
+                    models.CharField(
+                        max_length=4,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="取餐碼",
+                    ),
+                ),
+                (
+                    "shuffle_key",
+                    models.PositiveIntegerField(
+                        default=eshop.models.pickup_code.random_shuffle_key,
+                        verbose_name="排序鍵",
+                    ),
+                ),
+                (
+                    "allocated_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="分配時間"
+                    ),
+                ),
+                (
+                    "released_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="釋放時間"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "取餐碼池",
+                "verbose_name_plural": "取餐碼池",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="pickupcodepool",
+            index=models.Index(
+                condition=models.Q(("allocated_at__isnull", True)),
+                fields=["shuffle_key"],
+                name="pickup_code_free_idx",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ordermodel",
+            name="pickup_code",
+            field=models.CharField(blank=True, db_index=True, max_length=4),
+        ),
+        migrations.AddConstraint(
+            model_name="ordermodel",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(
+                    ("status__in", ["completed", "cancelled"]), _negated=True
+                ),
+                fields=("pickup_code",),
+                name="unique_active_pickup_code",
+            ),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 4.2.21 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eshop", "0064_pickupcodepool_active_pickup_code"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BaristaPerformanceStat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("barista", models.CharField(max_length=100, verbose_name="員工")),
+                (
+                    "coffee_count",
+                    models.PositiveIntegerField(
+                        default=0, help_text="0 表示所有杯數", verbose_name="咖啡杯數"
+                    ),
+                ),
+                (
+                    "sample_count",
+                    models.PositiveIntegerField(default=0, verbose_name="樣本數"),
+                ),
+                ("ratio_mean", models.FloatField(default=0, verbose_name="性能比均值")),
+                (
+                    "ratio_m2",
+                    models.FloatField(default=0, verbose_name="性能比離差平方和"),
+                ),
+                (
+                    "ratio_ewma",
+                    models.FloatField(default=0, verbose_name="性能比 EWMA"),
+                ),
+                (
+                    "actual_minutes_mean",
+                    models.FloatField(default=0, verbose_name="實際時間均值"),
+                ),
+                (
+                    "actual_minutes_m2",
+                    models.FloatField(default=0, verbose_name="實際時間離差平方和"),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "員工表現統計",
+                "verbose_name_plural": "員工表現統計",
+            },
+        ),
+        migrations.CreateModel(
+            name="PreparationHourlyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("hour", models.DateTimeField(verbose_name="小時")),
+                ("barista", models.CharField(max_length=100, verbose_name="員工")),
+                (
+                    "order_count",
+                    models.PositiveIntegerField(default=0, verbose_name="訂單數"),
+                ),
+                (
+                    "cup_count",
+                    models.PositiveIntegerField(default=0, verbose_name="咖啡杯數"),
+                ),
+                (
+                    "total_actual_minutes",
+                    models.FloatField(default=0, verbose_name="實際時間合計"),
+                ),
+                (
+                    "total_estimated_minutes",
+                    models.FloatField(default=0, verbose_name="預計時間合計"),
+                ),
+            ],
+            options={
+                "verbose_name": "製作每小時彙總",
+                "verbose_name_plural": "製作每小時彙總",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="baristaperformancestat",
+            constraint=models.UniqueConstraint(
+                fields=("barista", "coffee_count"),
+                name="unique_barista_performance_stat",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="preparationhourlyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("hour", "barista"), name="unique_preparation_hourly_rollup"
+            ),
+        ),
+    ]
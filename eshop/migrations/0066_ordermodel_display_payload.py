@@ -0,0 +1,20 @@
+# Generated by Django 4.2.21 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eshop", "0065_learning_stats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ordermodel",
+            name="display_payload",
+            field=models.JSONField(
+                blank=True, editable=False, null=True, verbose_name="商品顯示數據"
+            ),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.21 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eshop", "0066_ordermodel_display_payload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueueChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("order_id", models.BigIntegerField(verbose_name="訂單ID")),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True, db_index=True, verbose_name="變更時間"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "隊列變更",
+                "verbose_name_plural": "隊列變更",
+            },
+        ),
+    ]
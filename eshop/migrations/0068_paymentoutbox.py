@@ -0,0 +1,76 @@
+# Generated by Django 4.2.21 on 2026-10-17 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eshop", "0067_queuechange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentOutbox",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("order_id", models.BigIntegerField(verbose_name="訂單ID")),
+                ("event", models.CharField(max_length=30, verbose_name="事件")),
+                (
+                    "payload",
+                    models.JSONField(blank=True, default=dict, verbose_name="事件資料"),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "待處理"),
+                            ("done", "已完成"),
+                            ("failed", "已放棄"),
+                        ],
+                        default="pending",
+                        max_length=10,
+                        verbose_name="狀態",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="嘗試次數"),
+                ),
+                ("last_error", models.TextField(blank=True, verbose_name="最後錯誤")),
+                (
+                    "created_at",
+                    models.DateTimeField(auto_now_add=True, verbose_name="建立時間"),
+                ),
+                (
+                    "processed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="處理時間"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "支付發件箱",
+                "verbose_name_plural": "支付發件箱",
+                "indexes": [
+                    models.Index(
+                        fields=["status", "id"], name="payment_outbox_status_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="paymentoutbox",
+            constraint=models.UniqueConstraint(
+                fields=("order_id", "event"), name="payment_outbox_order_event_uniq"
+            ),
+        ),
+    ]
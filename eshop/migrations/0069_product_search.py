@@ -0,0 +1,92 @@
+# Generated by Django 4.2.21 on 2026-10-17 12:00
+
+from django.db import migrations, transaction
+
+# 全文搜索向量的 GIN 索引（與 eshop.models.shop_items.product_search_vector
+# 相同的表達式）。表達式索引只適用於 PostgreSQL，不放在模型 Meta 中
+SEARCH_FIELD_WEIGHTS = (
+    ("name", "A"),
+    ("highlight", "B"),
+    ("origin", "C"),
+    ("flavor", "D"),
+)
+SEARCH_INDEXES = (
+    ("coffeeitem", "coffeeitem_search_gin"),
+    ("beanitem", "beanitem_search_gin"),
+)
+
+# pg_trgm 索引（商品名稱的模糊匹配）。擴展不可用或沒有權限時略過，
+# eshop.search 在運行時檢查擴展是否已安裝
+TRIGRAM_INDEXES = (
+    ("eshop_coffeeitem_name_trgm", "eshop_coffeeitem"),
+    ("eshop_beanitem_name_trgm", "eshop_beanitem"),
+)
+
+
+def _search_index(name):
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    vector = None
+    for field, weight in SEARCH_FIELD_WEIGHTS:
+        part = SearchVector(field, weight=weight, config="simple")
+        vector = part if vector is None else vector + part
+    return GinIndex(vector, name=name)
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for model_name, name in SEARCH_INDEXES:
+        schema_editor.add_index(
+            apps.get_model("eshop", model_name), _search_index(name)
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for model_name, name in SEARCH_INDEXES:
+        schema_editor.remove_index(
+            apps.get_model("eshop", model_name), _search_index(name)
+        )
+
+
+def create_trigram_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+        try:
+            with transaction.atomic(using=connection.alias):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception:
+            return
+        for name, table in TRIGRAM_INDEXES:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {name} ON {table} "
+                "USING gin (name gin_trgm_ops)"
+            )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, _ in TRIGRAM_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("eshop", "0068_paymentoutbox"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
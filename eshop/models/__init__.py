@@ -9,12 +9,20 @@ eshop.models 套件 - 模型模組拆分
 - order.py: OrderModel
 - queue_models.py: CoffeeQueue, Barista, CoffeePreparationTime
 - audit_log.py: AuditLog
+- pickup_code.py: PickupCodePool
+- queue_change.py: QueueChange
+- payment_outbox.py: PaymentOutbox
+- learning_stats.py: BaristaPerformanceStat, PreparationHourlyRollup
 """
 
 # 從子模組匯入
 from .audit_log import AuditLog
 from .base import get_image_url, get_product_image_url
 from .cart_item import CartItem
+from .learning_stats import BaristaPerformanceStat, PreparationHourlyRollup
 from .order import OrderModel
+from .payment_outbox import PaymentOutbox
+from .pickup_code import PickupCodePool
+from .queue_change import QueueChange
 from .queue_models import Barista, CoffeePreparationTime, CoffeeQueue
 from .shop_items import BeanItem, CoffeeItem
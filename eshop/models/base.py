@@ -43,27 +43,15 @@ def get_product_image_url(item_data):
     本地開發：image.url 返回 /media/xxx.jpg，由 Django static() helper 提供服務。
     生產環境：image.url 返回 /static/media/xxx.jpg，由 Whitenoise 提供服務。
     """
-    # 延遲導入以避免循環依賴
-    from .shop_items import BeanItem, CoffeeItem
-
     # 如果已經有圖片 URL，直接返回
     if item_data.get("image"):
         return item_data["image"]
 
-    # 如果沒有圖片 URL，嘗試從數據庫獲取
-    try:
-        if item_data.get("type") == "coffee":
-            coffee = CoffeeItem.objects.get(id=item_data["id"])
-            if coffee.image and hasattr(coffee.image, "name") and coffee.image.name:
-                return get_image_url(coffee.image, "/static/images/default-coffee.png")
-            return "/static/images/default-coffee.png"
-        elif item_data.get("type") == "bean":
-            bean = BeanItem.objects.get(id=item_data["id"])
-            if bean.image and hasattr(bean.image, "name") and bean.image.name:
-                return get_image_url(bean.image, "/static/images/default-bean.png")
-            return "/static/images/default-bean.png"
-    except (CoffeeItem.DoesNotExist, BeanItem.DoesNotExist):
-        pass
+    # 如果沒有圖片 URL，從商品目錄快照獲取（延遲導入以避免循環依賴）
+    if item_data.get("type") in ("coffee", "bean"):
+        from eshop.catalog import get_catalog
+
+        return get_catalog().image_url(item_data["type"], item_data.get("id"))
 
     # 默認圖片
     return "/static/images/default-product.png"
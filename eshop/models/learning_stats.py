@@ -0,0 +1,86 @@
+# eshop/models/learning_stats.py
+"""
+學習優化器的持久化統計
+
+- BaristaPerformanceStat: 每個員工（及每種杯數）的增量統計
+  （Welford 均值 / 方差和 EWMA），每次完成製作以一條 UPDATE 原子更新
+- PreparationHourlyRollup: 每小時每個員工的製作彙總，歷史分析直接讀取
+
+更新和讀取邏輯見 eshop/learning_optimizer.py。
+"""
+
+from django.db import models
+
+
+class BaristaPerformanceStat(models.Model):
+    """員工製作表現的增量統計"""
+
+    # 所有杯數合計的統計行
+    ALL_CUP_COUNTS = 0
+
+    barista = models.CharField(max_length=100, verbose_name="員工")
+    coffee_count = models.PositiveIntegerField(
+        default=ALL_CUP_COUNTS, verbose_name="咖啡杯數", help_text="0 表示所有杯數"
+    )
+    sample_count = models.PositiveIntegerField(default=0, verbose_name="樣本數")
+
+    # 性能比 = 預計時間 / 實際時間（>1 表示比預計快）
+    ratio_mean = models.FloatField(default=0, verbose_name="性能比均值")
+    ratio_m2 = models.FloatField(default=0, verbose_name="性能比離差平方和")
+    ratio_ewma = models.FloatField(default=0, verbose_name="性能比 EWMA")
+
+    actual_minutes_mean = models.FloatField(default=0, verbose_name="實際時間均值")
+    actual_minutes_m2 = models.FloatField(default=0, verbose_name="實際時間離差平方和")
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["barista", "coffee_count"],
+                name="unique_barista_performance_stat",
+            ),
+        ]
+        verbose_name = "員工表現統計"
+        verbose_name_plural = "員工表現統計"
+
+    def __str__(self):
+        cups = "全部" if self.coffee_count == self.ALL_CUP_COUNTS else self.coffee_count
+        return f"{self.barista} ({cups}杯): {self.sample_count} 個樣本"
+
+    @property
+    def ratio_variance(self):
+        """性能比的樣本方差"""
+        if self.sample_count < 2:
+            return 0.0
+        return self.ratio_m2 / (self.sample_count - 1)
+
+    @property
+    def actual_minutes_variance(self):
+        """實際製作時間的樣本方差"""
+        if self.sample_count < 2:
+            return 0.0
+        return self.actual_minutes_m2 / (self.sample_count - 1)
+
+
+class PreparationHourlyRollup(models.Model):
+    """每小時每個員工的製作彙總"""
+
+    hour = models.DateTimeField(verbose_name="小時")
+    barista = models.CharField(max_length=100, verbose_name="員工")
+    order_count = models.PositiveIntegerField(default=0, verbose_name="訂單數")
+    cup_count = models.PositiveIntegerField(default=0, verbose_name="咖啡杯數")
+    total_actual_minutes = models.FloatField(default=0, verbose_name="實際時間合計")
+    total_estimated_minutes = models.FloatField(default=0, verbose_name="預計時間合計")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hour", "barista"], name="unique_preparation_hourly_rollup"
+            ),
+        ]
+        verbose_name = "製作每小時彙總"
+        verbose_name_plural = "製作每小時彙總"
+
+    def __str__(self):
+        return f"{self.hour:%Y-%m-%d %H}:00 {self.barista}: {self.order_count} 單"
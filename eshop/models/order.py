@@ -4,28 +4,41 @@
 包含 OrderModel 模型，為系統核心業務模型。
 """
 
-import base64
-import io
 import json
 import logging
 import warnings
 from datetime import timedelta
 
-import qrcode
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 
-from .base import get_image_url, get_product_image_url
-from .shop_items import BeanItem, CoffeeItem
+from .base import get_product_image_url
 
 logger = logging.getLogger(__name__)
 
 
+# 以 base64 保存二維碼的大字段，列表查詢不需要載入
+QR_CODE_FIELDS = ("qr_code", "fps_qr_code")
+
+# display_payload 的結構版本，結構變更時加一，舊版本的 payload 會在讀取時重建
+DISPLAY_PAYLOAD_VERSION = 1
+
+
+class OrderQuerySet(models.QuerySet):
+    """訂單查詢集"""
+
+    def without_qr_codes(self):
+        """延遲載入二維碼大字段（隊列、歷史等列表查詢使用）"""
+        return self.defer(*QR_CODE_FIELDS)
+
+
 class OrderModel(models.Model):
     """訂單模型 - 系統核心業務模型"""
 
+    objects = OrderQuerySet.as_manager()
+
     # ====== 基礎字段 ======
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -99,6 +112,10 @@ class OrderModel(models.Model):
 
     is_delivery = models.BooleanField(default=False)
     items = models.JSONField()
+    # 支付時預先計算的商品顯示數據（見 build_display_payload）
+    display_payload = models.JSONField(
+        blank=True, null=True, editable=False, verbose_name="商品顯示數據"
+    )
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True, verbose_name="最后更新时间")
@@ -118,7 +135,8 @@ class OrderModel(models.Model):
     order_number = models.CharField(
         max_length=20, unique=True, blank=True, null=True, verbose_name="訂單編號"
     )
-    pickup_code = models.CharField(max_length=4, unique=True, blank=True)
+    # 唯一性只限未完成訂單（見 Meta.constraints），完成後的碼可回收
+    pickup_code = models.CharField(max_length=4, blank=True, db_index=True)
     qr_code = models.TextField(blank=True, null=True)
     estimated_ready_time = models.DateTimeField(blank=True, null=True)
 
@@ -238,6 +256,13 @@ class OrderModel(models.Model):
             models.Index(fields=["updated_at"]),
             models.Index(fields=["status", "updated_at"]),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["pickup_code"],
+                condition=~models.Q(status__in=["completed", "cancelled"]),
+                name="unique_active_pickup_code",
+            ),
+        ]
         verbose_name = "订单"
         verbose_name_plural = "订单"
 
@@ -427,12 +452,28 @@ class OrderModel(models.Model):
 
         return display_items
 
+    @property
+    def qr_code_url(self):
+        """取餐二維碼圖片 URL（按需生成並緩存）"""
+        from ..qr_codes import QR_KIND_ORDER, get_qr_url
+
+        if not self.id or not self.pickup_code:
+            return ""
+        return get_qr_url(self, QR_KIND_ORDER)
+
+    @property
+    def fps_qr_code_url(self):
+        """FPS 付款二維碼圖片 URL（按需生成並緩存）"""
+        from ..qr_codes import QR_KIND_FPS, get_qr_url
+
+        if not self.id:
+            return ""
+        return get_qr_url(self, QR_KIND_FPS)
+
     @property
     def qr_code_data_url(self):
-        """獲取二維碼的 data URL"""
-        if self.qr_code:
-            return f"data:image/png;base64,{self.qr_code}"
-        return ""
+        """獲取二維碼圖片地址（原為 data URL，現指向按需生成的圖片）"""
+        return self.qr_code_url
 
     @property
     def order_summary_info(self):
@@ -521,35 +562,12 @@ class OrderModel(models.Model):
         else:
             items = self.items
 
-        coffee_ids = set()
-        bean_ids = set()
-        needs_price = False
-        needs_image = False
+        # 商品資料來自進程內的目錄快照，不再每次查詢 CoffeeItem / BeanItem
+        catalog = None
+        if any("price" not in item or "image" not in item for item in items):
+            from eshop.catalog import get_catalog
 
-        for item in items:
-            if "price" not in item:
-                needs_price = True
-                if item.get("type") == "coffee":
-                    coffee_ids.add(item["id"])
-                elif item.get("type") == "bean":
-                    bean_ids.add(item["id"])
-            if "image" not in item:
-                needs_image = True
-                if item.get("type") == "coffee":
-                    coffee_ids.add(item["id"])
-                elif item.get("type") == "bean":
-                    bean_ids.add(item["id"])
-
-        coffee_map = {}
-        bean_map = {}
-
-        if coffee_ids and (needs_price or needs_image):
-            coffee_qs = CoffeeItem.objects.filter(id__in=coffee_ids)
-            coffee_map = {c.id: c for c in coffee_qs}
-
-        if bean_ids and (needs_price or needs_image):
-            bean_qs = BeanItem.objects.filter(id__in=bean_ids)
-            bean_map = {b.id: b for b in bean_qs}
+            catalog = get_catalog()
 
         for item in items:
             try:
@@ -557,11 +575,10 @@ class OrderModel(models.Model):
                 item_id = item.get("id")
 
                 if "price" not in item:
-                    if item_type == "coffee" and item_id in coffee_map:
-                        product = coffee_map[item_id]
+                    product = catalog.get(item_type, item_id)
+                    if item_type == "coffee" and product is not None:
                         item["price"] = float(product.price)
-                    elif item_type == "bean" and item_id in bean_map:
-                        product = bean_map[item_id]
+                    elif item_type == "bean" and product is not None:
                         weight = item.get("weight", "200g")
                         item["price"] = float(product.get_price(weight))
                     else:
@@ -578,32 +595,7 @@ class OrderModel(models.Model):
                     item["total_price"] = float(item["total_price"])
 
                 if "image" not in item:
-                    if item_type == "coffee" and item_id in coffee_map:
-                        product = coffee_map[item_id]
-                        if (
-                            product.image
-                            and hasattr(product.image, "name")
-                            and product.image.name
-                        ):
-                            item["image"] = get_image_url(
-                                product.image, "/static/images/default-coffee.png"
-                            )
-                        else:
-                            item["image"] = "/static/images/default-coffee.png"
-                    elif item_type == "bean" and item_id in bean_map:
-                        product = bean_map[item_id]
-                        if (
-                            product.image
-                            and hasattr(product.image, "name")
-                            and product.image.name
-                        ):
-                            item["image"] = get_image_url(
-                                product.image, "/static/images/default-bean.png"
-                            )
-                        else:
-                            item["image"] = "/static/images/default-bean.png"
-                    else:
-                        item["image"] = "/static/images/default-product.png"
+                    item["image"] = catalog.image_url(item_type, item_id)
             except (TypeError, ValueError, KeyError):
                 item["price"] = 0.0
                 item["total_price"] = 0.0
@@ -638,13 +630,9 @@ class OrderModel(models.Model):
                         get_option_label,
                         sort_option_keys_for_coffee,
                     )
-                    from .shop_items import CoffeeItem
+                    from eshop.catalog import get_catalog
 
-                    coffee = None
-                    try:
-                        coffee = CoffeeItem.objects.get(id=item.get("id"))
-                    except (CoffeeItem.DoesNotExist, TypeError, ValueError):
-                        coffee = None
+                    coffee = get_catalog().get_coffee(item.get("id"))
                     ordered_keys = sort_option_keys_for_coffee(
                         coffee, list(has_extra.keys())
                     )
@@ -705,6 +693,52 @@ class OrderModel(models.Model):
         """返回帶有中文選項的商品列表"""
         return self.get_items(with_chinese_options=True)
 
+    # ====== 預先計算的商品顯示數據 ======
+    def build_display_payload(self):
+        """
+        計算商品顯示數據（中文選項、圖片、分類統計和選項文本）
+
+        商品在結帳後不再變化，這部分數據在訂單支付時計算一次並保存到
+        display_payload，隊列、API 和訂單歷史直接讀取；
+        狀態和隊列相關的字段仍按當前資料即時生成。
+        """
+        from eshop.utils.order_item_processor import OrderItemProcessor
+
+        items = self.get_items_with_chinese_options()
+        return {
+            "version": DISPLAY_PAYLOAD_VERSION,
+            "items": OrderItemProcessor.process_order_items(items),
+        }
+
+    def get_display_payload(self):
+        """
+        返回商品顯示數據
+
+        優先使用已保存的 display_payload；未保存（舊訂單、未支付）或版本不符時
+        即時計算並緩存在實例上，不寫回資料庫（見 backfill_display_payloads 命令）。
+        商品圖片的 image_srcset 隨縮圖生成而變化，每次讀取時加上，不保存。
+        """
+        from eshop.utils.order_item_processor import OrderItemProcessor
+
+        payload = self.display_payload
+        if not payload or payload.get("version") != DISPLAY_PAYLOAD_VERSION:
+            if not hasattr(self, "_display_payload"):
+                self._display_payload = self.build_display_payload()
+            payload = self._display_payload
+        return {
+            **payload,
+            "items": OrderItemProcessor.with_image_srcsets(payload["items"]),
+        }
+
+    def refresh_display_payload(self, save=True):
+        """重新計算並（可選）保存商品顯示數據"""
+        self.display_payload = self.build_display_payload()
+        if save and self.pk:
+            OrderModel.objects.filter(pk=self.pk).update(
+                display_payload=self.display_payload
+            )
+        return self.display_payload
+
     @staticmethod
     def translate_option(option_type, value):
         """靜態方法：轉換選項值為中文"""
@@ -1123,10 +1157,7 @@ class OrderModel(models.Model):
                     if not self.preparation_time_minutes:
                         self.preparation_time_minutes = 0
 
-            # 生成二维码数据
-            if not self.qr_code and self.pickup_code:
-                logger.info("生成二维码数据")
-                self.qr_code = self.generate_qr_code_data()
+            # 二维码不再在保存时生成，见 qr_code_url（首次访问时生成并缓存）
 
             # ====== 检查并更新订单状态 ======
             # 如果订单已支付且状态是 pending，更新为 waiting
@@ -1134,6 +1165,21 @@ class OrderModel(models.Model):
                 logger.info("更新订单状态为 waiting（等待制作）")
                 self.status = "waiting"
 
+            # 支付后预先计算商品显示数据（商品在结帐后不再变化，只计算一次）
+            if self.payment_status == "paid" and self.items:
+                payload = self.display_payload
+                if not payload or payload.get("version") != DISPLAY_PAYLOAD_VERSION:
+                    try:
+                        self.display_payload = self.build_display_payload()
+                        update_fields = kwargs.get("update_fields")
+                        if update_fields is not None:
+                            kwargs["update_fields"] = {
+                                *update_fields,
+                                "display_payload",
+                            }
+                    except Exception as e:
+                        logger.warning(f"计算商品显示数据失败: {e}")
+
             # 调用父类保存方法
             super().save(*args, **kwargs)
             logger.info(f"订单保存成功: {self.id}")
@@ -1187,7 +1233,7 @@ class OrderModel(models.Model):
 
             logger.error(f"详细错误: {traceback.format_exc()}")
             # 如果是唯一约束错误，重新生成取餐码并重试
-            if "pickup_code_key" in str(e):
+            if "unique_active_pickup_code" in str(e):
                 logger.info("检测到取餐码重复，重新生成并重试")
                 self.pickup_code = self.generate_unique_pickup_code()
                 super().save(*args, **kwargs)
@@ -1218,95 +1264,63 @@ class OrderModel(models.Model):
         return f"{prefix}{new_seq:04d}"
 
     def generate_unique_pickup_code(self):
-        """生成唯一的取餐码 - 4位数字版本"""
+        """生成唯一的取餐码 - 4位数字版本，从取餐码池分配"""
+        from eshop.pickup_codes import allocate_pickup_code
+
+        try:
+            code = allocate_pickup_code()
+            if code:
+                return code
+        except Exception as e:
+            logger.error(f"取餐码池分配失败: {str(e)}")
+
+        return self._probe_unique_pickup_code()
+
+    @staticmethod
+    def _pickup_code_in_use(code):
+        """取餐码是否被未完成的订单占用"""
+        return (
+            OrderModel.objects.filter(pickup_code=code)
+            .exclude(status__in=["completed", "cancelled"])
+            .exists()
+        )
+
+    def _probe_unique_pickup_code(self):
+        """逐个探测取餐码 - 取餐码池不可用时的后备方案"""
         import secrets
         import string
-        import time
 
         max_attempts = 100
 
-        # 方法1：使用时间戳 + 随机数（推荐）
-        for attempt in range(max_attempts):
-            # 生成4位数字码：时间戳后2位 + 随机2位
-            timestamp_part = str(int(time.time() * 1000))[-2:]  # 时间戳后2位
-            random_part = "".join(secrets.choice(string.digits) for _ in range(2))
-            code = timestamp_part + random_part
-
-            if not OrderModel.objects.filter(pickup_code=code).exists():
-                logger.info(f"生成时间戳取餐码: {code}")
-                return code
-
-        # 方法2：纯随机4位数字
+        # 方法1：纯随机4位数字
         for attempt in range(max_attempts):
             code = "".join(secrets.choice(string.digits) for _ in range(4))
-            if not OrderModel.objects.filter(pickup_code=code).exists():
+            if code != "0000" and not self._pickup_code_in_use(code):
                 logger.info(f"生成随机取餐码: {code}")
                 return code
 
-        # 方法3：UUID简化版（取前4位数字）
-        import uuid
-
-        for attempt in range(max_attempts):
-            uuid_int = uuid.uuid4().int
-            # 从UUID中提取4位数字
-            code = str(uuid_int % 10000).zfill(4)  # 确保4位，不足补0
-            if not OrderModel.objects.filter(pickup_code=code).exists():
-                logger.info(f"使用UUID取餐码: {code}")
+        # 方法2：顺序生成
+        for number in range(1, 10000):
+            code = f"{number:04d}"
+            if not self._pickup_code_in_use(code):
+                logger.info(f"使用顺序取餐码: {code}")
                 return code
 
-        # 方法4：最后的手段 - 顺序生成
-        last_code = OrderModel.objects.order_by("-id").first()
-        if last_code and last_code.pickup_code:
-            try:
-                last_num = int(last_code.pickup_code)
-                for i in range(1, 100):
-                    code = str((last_num + i) % 10000).zfill(4)
-                    if not OrderModel.objects.filter(pickup_code=code).exists():
-                        logger.info(f"使用顺序取餐码: {code}")
-                        return code
-            except ValueError:
-                pass
-
         # 如果所有方法都失败，返回一个安全的默认值
         code = "1234"
         logger.warning(f"所有取餐码生成方法都失败，使用默认值: {code}")
         return code
 
     def generate_qr_code_data(self):
-        """生成二维码数据"""
-        logger.info(f"开始生成二维码，订单: {self.id}")
+        """生成二维码数据（base64 PNG，按内容缓存）"""
+        from ..qr_codes import QR_KIND_ORDER, get_qr_base64, order_qr_payload
 
         # 确保取餐码已生成
         if not self.pickup_code:
             logger.info(f"订单 {self.id} 没有取餐码，调用 save() 生成")
             self.save()  # 这会触发取餐码生成
 
-        # 二维码包含订单ID和取餐码
-        qr_data = f"Order: {self.id}, Pickup Code: {self.pickup_code}"
-
-        try:
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(qr_data)
-            qr.make(fit=True)
-
-            img = qr.make_image(fill_color="black", back_color="white")
-            buffer = io.BytesIO()
-            img.save(buffer, format="PNG")
-
-            qr_code_data = base64.b64encode(buffer.getvalue()).decode()
-            logger.info(f"订单 {self.id} 二维码生成成功")
-
-            return qr_code_data
-
-        except Exception as e:
-            logger.error(f"生成二维码失败: {str(e)}")
-            # 返回空字符串而不是报错
-            return ""
+        return get_qr_base64(QR_KIND_ORDER, order_qr_payload(self))
 
     # 取餐码验证
     def clean(self):
@@ -1315,10 +1329,11 @@ class OrderModel(models.Model):
         if self.pickup_code == "0000":
             raise ValidationError({"pickup_code": "取餐码不能为0000"})
 
-        # 确保取餐码唯一（虽然数据库层面已经有约束）
-        if (
+        # 确保取餐码在未完成订单中唯一（虽然数据库层面已经有约束）
+        if self.status not in ("completed", "cancelled") and (
             OrderModel.objects.exclude(id=self.id)
             .filter(pickup_code=self.pickup_code)
+            .exclude(status__in=["completed", "cancelled"])
             .exists()
         ):
             raise ValidationError({"pickup_code": "取餐码必须唯一"})
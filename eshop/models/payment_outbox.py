@@ -0,0 +1,50 @@
+# eshop/models/payment_outbox.py
+"""
+PaymentOutbox 模型 - 支付成功副作用的事務發件箱
+
+支付狀態變更和發件箱記錄在同一個事務中寫入：回調只需等待狀態提交，
+積分、審計日誌和通知由 eshop/payment_outbox.py 的工作者在事務提交後
+批量執行。每個 (訂單, 事件) 只有一行，重複的支付回調不會重複發放積分。
+"""
+
+from django.db import models
+
+
+class PaymentOutbox(models.Model):
+    """支付成功副作用發件箱"""
+
+    STATUS_CHOICES = [
+        ("pending", "待處理"),
+        ("done", "已完成"),
+        ("failed", "已放棄"),
+    ]
+
+    # 不使用外鍵：與 QueueChange 相同，訂單刪除後記錄仍保留
+    order_id = models.BigIntegerField(verbose_name="訂單ID")
+    event = models.CharField(max_length=30, verbose_name="事件")
+    payload = models.JSONField(default=dict, blank=True, verbose_name="事件資料")
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default="pending",
+        verbose_name="狀態",
+    )
+    attempts = models.PositiveIntegerField(default=0, verbose_name="嘗試次數")
+    last_error = models.TextField(blank=True, verbose_name="最後錯誤")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="建立時間")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="處理時間")
+
+    class Meta:
+        verbose_name = "支付發件箱"
+        verbose_name_plural = "支付發件箱"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["order_id", "event"], name="payment_outbox_order_event_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "id"], name="payment_outbox_status_idx"),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} 訂單 {self.order_id} {self.event} ({self.status})"
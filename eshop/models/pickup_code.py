@@ -0,0 +1,44 @@
+# eshop/models/pickup_code.py
+"""
+PickupCodePool 模型 - 取餐碼池
+
+每個 4 位取餐碼一行。allocated_at 為空表示空閒，分配時按隨機的
+shuffle_key 取出一個空閒碼；訂單完成或取消並經過冷卻期後，碼會被回收。
+分配和回收邏輯見 eshop/pickup_codes.py。
+"""
+
+import secrets
+
+from django.db import models
+from django.db.models import Q
+
+
+def random_shuffle_key():
+    """取餐碼在池中的隨機排序鍵"""
+    return secrets.randbelow(2**31 - 1)
+
+
+class PickupCodePool(models.Model):
+    """取餐碼池 - 預先生成的空閒取餐碼"""
+
+    code = models.CharField(max_length=4, primary_key=True, verbose_name="取餐碼")
+    shuffle_key = models.PositiveIntegerField(
+        default=random_shuffle_key, verbose_name="排序鍵"
+    )
+    allocated_at = models.DateTimeField(null=True, blank=True, verbose_name="分配時間")
+    released_at = models.DateTimeField(null=True, blank=True, verbose_name="釋放時間")
+
+    class Meta:
+        indexes = [
+            # 只索引空閒碼，分配時按 shuffle_key 取第一行
+            models.Index(
+                fields=["shuffle_key"],
+                condition=Q(allocated_at__isnull=True),
+                name="pickup_code_free_idx",
+            ),
+        ]
+        verbose_name = "取餐碼池"
+        verbose_name_plural = "取餐碼池"
+
+    def __str__(self):
+        return f"{self.code} ({'已分配' if self.allocated_at else '空閒'})"
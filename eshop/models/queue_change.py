@@ -0,0 +1,27 @@
+# eshop/models/queue_change.py
+"""
+QueueChange 模型 - 隊列變更日誌
+
+訂單或隊列項每次變化寫入一行，自增 id 即單調遞增的變更序號，
+員工端輪詢以序號作為增量查詢的游標（而不是時間字符串）。
+只保留最近一段時間的記錄，記錄和查詢邏輯見 eshop/queue_changes.py。
+"""
+
+from django.db import models
+
+
+class QueueChange(models.Model):
+    """隊列變更日誌"""
+
+    # 不使用外鍵：訂單刪除後仍需告知客戶端移除
+    order_id = models.BigIntegerField(verbose_name="訂單ID")
+    created_at = models.DateTimeField(
+        auto_now_add=True, db_index=True, verbose_name="變更時間"
+    )
+
+    class Meta:
+        verbose_name = "隊列變更"
+        verbose_name_plural = "隊列變更"
+
+    def __str__(self):
+        return f"#{self.id} 訂單 {self.order_id}"
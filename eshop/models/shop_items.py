@@ -6,6 +6,7 @@
 
 import logging
 
+from django.contrib.postgres.search import SearchVector
 from django.db import models
 from django.utils import timezone
 
@@ -13,6 +14,31 @@ from .base import get_image_url
 
 logger = logging.getLogger(__name__)
 
+# 商品搜索的欄位和權重（A 最高）。'simple' 配置不做詞幹處理，
+# 適合中英混合的商品名稱
+SEARCH_FIELD_WEIGHTS = (
+    ("name", "A"),
+    ("highlight", "B"),
+    ("origin", "C"),
+    ("flavor", "D"),
+)
+SEARCH_CONFIG = "simple"
+
+
+def product_search_vector():
+    """
+    商品的全文搜索向量
+
+    eshop.search 的查詢使用這個表達式；遷移 0069 在 PostgreSQL 上以相同的
+    表達式建立 GIN 索引（不放在 Meta.indexes，其他數據庫不支持），
+    修改欄位或權重時需同時更新遷移中的索引。
+    """
+    vector = None
+    for field, weight in SEARCH_FIELD_WEIGHTS:
+        part = SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
 
 class CoffeeItem(models.Model):
     """咖啡商品模型"""
@@ -122,6 +148,12 @@ class CoffeeItem(models.Model):
         else:
             return "/static/images/default-coffee-index.png"
 
+    def get_index_image_field(self):
+        """首頁圖片使用的欄位（供 responsive_img 查詢縮圖）"""
+        if self.image_index and self.image_index.name:
+            return self.image_index
+        return self.image
+
     def get_detail_image(self):
         """獲取詳情頁圖片"""
         if self.image and hasattr(self.image, "name") and self.image.name:
@@ -207,6 +239,12 @@ class BeanItem(models.Model):
         else:
             return "/static/images/default-bean-index.png"
 
+    def get_index_image_field(self):
+        """首頁圖片使用的欄位（供 responsive_img 查詢縮圖）"""
+        if self.image_index and self.image_index.name:
+            return self.image_index
+        return self.image
+
     def get_detail_image(self):
         """獲取詳情頁圖片"""
         if self.image and hasattr(self.image, "name") and self.image.name:
@@ -43,12 +43,9 @@ def send_whatsapp_ready_notification(order):
 
 def send_order_notification(order):
     """發送訂單通知到所有連接的客戶端"""
-    from asgiref.sync import async_to_sync
-    from channels.layers import get_channel_layer
+    from .websocket_manager import websocket_manager
 
     try:
-        channel_layer = get_channel_layer()
-
         notification_data = {
             "type": "order_notification",
             "order_id": order.id,
@@ -58,10 +55,9 @@ def send_order_notification(order):
             "timestamp": order.updated_at.isoformat(),
         }
 
-        # 发送到订单特定的频道组
-        async_to_sync(channel_layer.group_send)(
-            f"order_{order.id}",
-            {"type": "send_notification", "data": notification_data},
+        # 发送到订单特定的频道组（排入出站隊列，不阻塞）
+        websocket_manager.enqueue_broadcast(
+            f"order_{order.id}", "send_notification", {"data": notification_data}
         )
 
         logger.info(f"推送通知已发送: 订单 {order.id} 状态变为 {order.status}")
@@ -0,0 +1,134 @@
+# eshop/order_eta.py
+"""
+顧客端訂單預計時間 - 服務端推送與條件輪詢
+
+推送：等待項的預計完成時間或位置真正改變時（update_estimated_times /
+reorder_waiting_queue 只寫回有變化的行），在事務提交後向 order_<id> 群組
+發送 queue_position 更新。OrderConsumer 附上 remaining_seconds 和
+server_time，客戶端在本地插值倒數，不再定時輪詢倒數API。
+
+輪詢（WebSocket 不可用時的後備）：order_status_version 以一次查詢讀取
+訂單和隊列項中影響顯示的欄位，以及排在這個訂單前面的隊列項數和製作中的
+項數（排隊位置和提示文字取決於這些），生成 ETag；後面加入或變化的訂單
+不影響 ETag。請求帶 If-None-Match 且未變化時直接返回 304，不再序列化訂單。
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Func, IntegerField, OuterRef, Subquery
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags
+
+logger = logging.getLogger(__name__)
+
+# 影響顧客端訂單狀態顯示的欄位
+ORDER_STATUS_VERSION_FIELDS = (
+    "status",
+    "payment_status",
+    "updated_at",
+    "estimated_ready_time",
+    "queue_item__status",
+    "queue_item__position",
+    "queue_item__estimated_completion_time",
+    "queue_item__updated_at",
+)
+
+
+def push_eta_updates(updates):
+    """
+    推送預計時間/位置有變化的訂單（當前事務提交後發送）
+
+    Args:
+        updates: 可迭代的字典，包含 order_id，以及 position 和/或
+            estimated_completion_time（只推送提供的欄位）
+    """
+    if not getattr(settings, "ORDER_ETA_PUSH", True):
+        return
+
+    # 同一訂單的多次變化合併為一條
+    merged = {}
+    for update in updates:
+        data = merged.setdefault(update["order_id"], {})
+        if "position" in update:
+            data["position"] = update["position"]
+        if "estimated_completion_time" in update:
+            eta = update["estimated_completion_time"]
+            data["estimated_time"] = eta.isoformat() if eta else None
+    if not merged:
+        return
+
+    def _send():
+        from .websocket_utils import send_order_update
+
+        for order_id, data in merged.items():
+            try:
+                send_order_update(order_id, "queue_position", data)
+            except Exception as e:
+                logger.error(f"❌ 推送訂單 #{order_id} 預計時間失敗: {str(e)}")
+        logger.debug(f"⏱️ 推送了 {len(merged)} 個訂單的預計時間")
+
+    transaction.on_commit(_send)
+
+
+def _count(queryset):
+    """COUNT 子查詢（不分組），用於 annotate"""
+    return Subquery(
+        queryset.order_by()
+        .annotate(count=Func(F("id"), function="COUNT"))
+        .values("count"),
+        output_field=IntegerField(),
+    )
+
+
+def order_status_version(order_id):
+    """
+    一次查詢取得訂單狀態版本
+
+    Returns:
+        tuple: (user_id, etag)，訂單不存在時返回 (None, None)
+    """
+    from .models import CoffeeQueue, OrderModel
+
+    live = CoffeeQueue.objects.filter(status__in=("waiting", "preparing"))
+    ahead = live.filter(position__lt=OuterRef("queue_item__position"))
+    row = (
+        OrderModel.objects.filter(id=order_id)
+        .annotate(
+            live_ahead=_count(ahead),
+            waiting_ahead=_count(ahead.filter(status="waiting")),
+            preparing=_count(live.filter(status="preparing")),
+        )
+        .values_list(
+            "user_id",
+            *ORDER_STATUS_VERSION_FIELDS,
+            "live_ahead",
+            "waiting_ahead",
+            "preparing",
+        )
+        .first()
+    )
+    if row is None:
+        return None, None
+    digest = hashlib.md5(repr(row[1:]).encode()).hexdigest()[:16]
+    return row[0], f'"{digest}"'
+
+
+def not_modified_response(request, etag):
+    """請求的 If-None-Match 與 ETag 相同時返回 304，否則返回 None"""
+    if etag and etag in parse_etags(request.headers.get("If-None-Match", "")):
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+    return None
+
+
+def set_version_headers(response, etag):
+    """為完整響應加上 ETag（客戶端下次輪詢時帶 If-None-Match）"""
+    if etag:
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+    return response
@@ -7,15 +7,16 @@
 - 支付狀態更新
 - 購物車清空
 - 線下付款確認（FPS/現金）
-- 會員積分添加
-- WebSocket 通知發送
+- 寫入支付成功副作用的發件箱（會員積分、審計日誌、WebSocket 通知）
 """
 
 import logging
 
+from django.db import transaction
 from django.utils import timezone
 
 from ..models import OrderModel
+from ..payment_outbox import enqueue_payment_success
 from .order_type_analyzer import OrderTypeAnalyzer
 
 logger = logging.getLogger(__name__)
@@ -29,137 +30,34 @@ class PaymentHandler:
         self.items = order.get_items()
 
     @classmethod
-    def process_payment_success(cls, order_id, request=None):
-        """處理支付成功後的統一邏輯（含購物車清空）- 修復支付狀態更新"""
+    def process_payment_success(cls, order_id, request=None, staff_name=None):
+        """
+        處理支付成功後的統一邏輯（含購物車清空）
+
+        支付狀態、加入隊列和發件箱記錄在同一個事務中提交；積分、審計日誌
+        和 WebSocket 通知由發件箱工作者在提交後執行（見 eshop/payment_outbox.py），
+        時間重新計算交給隊列調度器，回調不再等待這些副作用。
+        """
         try:
             logger.info(f"🔄 開始處理訂單 #{order_id} 支付成功")
 
-            order = OrderModel.objects.get(id=order_id)
-            manager = cls(order)
+            with transaction.atomic():
+                # 鎖定訂單：支付網關的重複回調串行處理
+                order = OrderModel.objects.select_for_update().get(id=order_id)
+                queue_item = cls._apply_payment_success(order)
+                enqueue_payment_success(order, staff_name=staff_name)
 
-            # ✅ 修復：更新支付狀態為 'paid'
-            # 支援從 payment_pending 和 pending 兩種狀態轉為 paid
-            if order.payment_status not in ["paid", "payment_pending"]:
-                order.payment_status = "paid"
-                order.paid_at = timezone.now()
-                logger.info(f"✅ 訂單 #{order_id} 支付狀態更新為 paid，設置支付時間")
-            elif order.payment_status == "payment_pending":
-                # 從 payment_pending 轉為 paid（員工確認 FPS 付款）
-                order.payment_status = "paid"
-                order.paid_at = timezone.now()
-                logger.info(
-                    f"✅ FPS 訂單 #{order_id} 員工確認付款，支付狀態更新為 paid"
-                )
-            else:
-                logger.info(f"ℹ️ 訂單 #{order_id} 已經是 paid 狀態")
+                # ✅ 修改：重新計算所有訂單時間（事務提交後由調度器合併執行）
+                from ..queue_scheduler import request_queue_recalculation
 
-            # ✅ 修復：確保訂單狀態正確
-            if order.status == "pending":
-                # 分析訂單類型
-                order_type = OrderTypeAnalyzer.analyze_order_type(order)
-                if order_type["is_beans_only"]:
-                    order.status = "ready"
-                    logger.info(f"✅ 純咖啡豆訂單 #{order_id} 狀態更新為 ready")
-                else:
-                    order.status = "waiting"
-                    logger.info(f"✅ 訂單 #{order_id} 狀態更新為 waiting")
-            elif order.payment_status == "payment_pending":
-                # 如果支付狀態還是 payment_pending（FPS/現金等待確認時）
-                order_type = OrderTypeAnalyzer.analyze_order_type(order)
-                if order_type["is_beans_only"]:
-                    order.status = "ready"
-                else:
-                    order.status = "waiting"
-                logger.info(
-                    f"✅ FPS/現金訂單 #{order_id} 支付狀態從 payment_pending 更新為 paid，訂單狀態更新為 {order.status}"
+                time_recalculated = request_queue_recalculation(
+                    reason="payment_confirmed", order_id=order.id, full=True
                 )
 
-            # ✅ 修復：保存所有更新
-            order.save()
-            logger.info(
-                f"✅ 訂單 #{order_id} 保存成功: status={order.status}, payment_status={order.payment_status}, paid_at={order.paid_at}"
-            )
-
-            # ✅ 修改：加入隊列邏輯
-            queue_item = None
-            if manager.should_add_to_queue():
-                logger.info(f"✅ 訂單 #{order_id} 需要加入隊列")
-
-                # 如果是快速訂單，計算相關時間
-                if order.order_type == "quick":
-                    order.calculate_times_based_on_pickup_choice()
-                    order.save()
-                    logger.info(f"快速訂單 #{order.id} 已計算取貨時間")
-
-                # 將訂單加入隊列
-                from ..queue_manager_refactored import CoffeeQueueManager
-
-                queue_manager = CoffeeQueueManager()
-                queue_result = queue_manager.add__to_queue(order)
-
-                if queue_result.get("success"):
-                    queue_item = queue_result["data"]["queue_item"]
-                    logger.info(
-                        f"訂單 {order.id} 已加入製作隊列，位置: {queue_item.position}"
-                    )
-                else:
-                    logger.error(
-                        f"訂單 {order.id} 加入隊列失敗: {queue_result.get('message')}"
-                    )
-            else:
-                logger.info(f"ℹ️ 訂單 #{order_id} 不需要加入隊列")
-
-            # ✅ 修改：重新計算所有訂單時間
-            logger.info(f"🔄 訂單 #{order_id} 支付成功，開始統一時間計算...")
-            from ..queue_manager_refactored import CoffeeQueueManager
-
-            queue_manager = CoffeeQueueManager()
-            time_result = queue_manager.recalculate_all__times()
-
             # ✅ 修改：如果有request，清空購物車
             if request:
                 cls.clear_user_cart_and_session(request)
 
-            # ✅ 修改：發送WebSocket通知（同時通知訂單群組和隊列群組）
-            try:
-                from ..websocket_utils import send_payment_update, send_queue_update
-
-                # 1. 發送到特定訂單群組（顧客端）
-                send_payment_update(
-                    order_id=order_id,
-                    payment_status="paid",
-                    data={
-                        "payment_method": order.payment_method,
-                        "message": "支付成功，訂單已加入隊列",
-                    },
-                )
-                # 2. 發送到隊列群組（員工端），觸發員工頁面刷新
-                send_queue_update(
-                    update_type="payment_confirmed",
-                    data={
-                        "order_id": order_id,
-                        "payment_method": order.payment_method,
-                        "message": f"訂單 #{order_id} 支付確認，已加入隊列",
-                    },
-                )
-            except Exception as ws_error:
-                logger.error(f"發送WebSocket通知失敗: {str(ws_error)}")
-
-            # ✅ 新增：添加會員積分（支付成功後自動添加）
-            if order.user:
-                try:
-                    from socialuser.models_enhanced import CustomerLoyalty
-
-                    loyalty, created = CustomerLoyalty.objects.get_or_create(
-                        user=order.user
-                    )
-                    points_earned = loyalty.add_points_from_order(order)
-                    logger.info(
-                        f"✅ 用戶 {order.user.username} 訂單 #{order.id} 獲得 {points_earned} 積分"
-                    )
-                except Exception as e:
-                    logger.error(f"添加會員積分失敗: {str(e)}")
-
             logger.info(f"✅ 訂單 {order_id} 支付成功處理完成")
 
             return {
@@ -168,7 +66,7 @@ class PaymentHandler:
                 "order": order,
                 "queue_item": queue_item,
                 "message": "支付成功處理完成",
-                "time_recalculated": time_result.get("success", False),
+                "time_recalculated": time_recalculated,
             }
 
         except OrderModel.DoesNotExist:
@@ -186,14 +84,92 @@ class PaymentHandler:
                 "error": str(error),
             }
 
+    @classmethod
+    def _apply_payment_success(cls, order):
+        """更新支付和訂單狀態，需要時加入隊列；返回隊列項（未加入時為 None）"""
+        manager = cls(order)
+        order_id = order.id
+
+        # ✅ 修復：更新支付狀態為 'paid'
+        # 支援從 payment_pending 和 pending 兩種狀態轉為 paid
+        if order.payment_status not in ["paid", "payment_pending"]:
+            order.payment_status = "paid"
+            order.paid_at = timezone.now()
+            logger.info(f"✅ 訂單 #{order_id} 支付狀態更新為 paid，設置支付時間")
+        elif order.payment_status == "payment_pending":
+            # 從 payment_pending 轉為 paid（員工確認 FPS 付款）
+            order.payment_status = "paid"
+            order.paid_at = timezone.now()
+            logger.info(f"✅ FPS 訂單 #{order_id} 員工確認付款，支付狀態更新為 paid")
+        else:
+            logger.info(f"ℹ️ 訂單 #{order_id} 已經是 paid 狀態")
+
+        # ✅ 修復：確保訂單狀態正確
+        if order.status == "pending":
+            # 分析訂單類型
+            order_type = OrderTypeAnalyzer.analyze_order_type(order)
+            if order_type["is_beans_only"]:
+                order.status = "ready"
+                logger.info(f"✅ 純咖啡豆訂單 #{order_id} 狀態更新為 ready")
+            else:
+                order.status = "waiting"
+                logger.info(f"✅ 訂單 #{order_id} 狀態更新為 waiting")
+        elif order.payment_status == "payment_pending":
+            # 如果支付狀態還是 payment_pending（FPS/現金等待確認時）
+            order_type = OrderTypeAnalyzer.analyze_order_type(order)
+            if order_type["is_beans_only"]:
+                order.status = "ready"
+            else:
+                order.status = "waiting"
+            logger.info(
+                f"✅ FPS/現金訂單 #{order_id} 支付狀態從 payment_pending 更新為 paid，訂單狀態更新為 {order.status}"
+            )
+
+        # ✅ 修復：保存所有更新
+        order.save()
+        logger.info(
+            f"✅ 訂單 #{order_id} 保存成功: status={order.status}, payment_status={order.payment_status}, paid_at={order.paid_at}"
+        )
+
+        # ✅ 修改：加入隊列邏輯
+        queue_item = None
+        if manager.should_add_to_queue():
+            logger.info(f"✅ 訂單 #{order_id} 需要加入隊列")
+
+            # 如果是快速訂單，計算相關時間
+            if order.order_type == "quick":
+                order.calculate_times_based_on_pickup_choice()
+                order.save()
+                logger.info(f"快速訂單 #{order.id} 已計算取貨時間")
+
+            # 將訂單加入隊列
+            from ..queue_manager_refactored import CoffeeQueueManager
+
+            queue_manager = CoffeeQueueManager()
+            queue_result = queue_manager.add__to_queue(order)
+
+            if queue_result.get("success"):
+                queue_item = queue_result["data"]["queue_item"]
+                logger.info(
+                    f"訂單 {order.id} 已加入製作隊列，位置: {queue_item.position}"
+                )
+            else:
+                logger.error(
+                    f"訂單 {order.id} 加入隊列失敗: {queue_result.get('message')}"
+                )
+        else:
+            logger.info(f"ℹ️ 訂單 #{order_id} 不需要加入隊列")
+
+        return queue_item
+
     @staticmethod
     def clear_user_cart_and_session(request):
         """清空用戶的購物車和session - 保持不變"""
         try:
-            from cart.cart import Cart
+            from cart.cart import get_cart
 
             # 1. 清空購物車對象
-            cart = Cart(request)
+            cart = get_cart(request)
             cart.clear()
 
             # 2. 清除相關session數據
@@ -254,7 +230,7 @@ class PaymentHandler:
             order.save(update_fields=["payment_method"])
 
             # 調用核心方法處理支付成功邏輯
-            result = cls.process_payment_success(order_id)
+            result = cls.process_payment_success(order_id, staff_name=staff_name)
 
             if not result.get("success"):
                 logger.error(
@@ -350,48 +326,58 @@ class PaymentHandler:
 
     @classmethod
     def process_payment_and_update_status(cls, order_id, payment_method="unknown"):
-        """處理支付成功並更新狀態（替換原有的支付成功邏輯）"""
-        try:
-            pass
+        """
+        處理支付成功並更新狀態（替換原有的支付成功邏輯）
 
-            order = OrderModel.objects.get(id=order_id)
+        與 process_payment_success 相同：鎖定訂單行，支付狀態、加入隊列和
+        發件箱記錄在同一個事務中提交，重複回調不會重複加入隊列或寫入副作用。
+        """
+        try:
+            with transaction.atomic():
+                # 鎖定訂單：支付網關的重複回調串行處理
+                order = OrderModel.objects.select_for_update().get(id=order_id)
 
-            # 驗證當前狀態
-            if order.payment_status == "paid":
-                return {"success": True, "message": "訂單已支付", "order": order}
+                # 驗證當前狀態
+                if order.payment_status == "paid":
+                    return {"success": True, "message": "訂單已支付", "order": order}
 
-            # 更新支付狀態
-            order.payment_status = "paid"
-            order.payment_method = payment_method
-            order.paid_at = timezone.now()
+                # 更新支付狀態
+                order.payment_status = "paid"
+                order.payment_method = payment_method
+                order.paid_at = timezone.now()
 
-            # 根據訂單類型設置初始狀態
-            order_type = OrderTypeAnalyzer.analyze_order_type(order)
+                # 根據訂單類型設置初始狀態
+                order_type = OrderTypeAnalyzer.analyze_order_type(order)
 
-            if order_type["is_beans_only"]:
-                # 純咖啡豆訂單直接標記為就緒
-                order.status = "ready"
-            else:
-                # 含咖啡飲品訂單標記為等待中
-                order.status = "waiting"
+                if order_type["is_beans_only"]:
+                    # 純咖啡豆訂單直接標記為就緒
+                    order.status = "ready"
+                else:
+                    # 含咖啡飲品訂單標記為等待中
+                    order.status = "waiting"
 
-            order.save(
-                update_fields=["payment_status", "payment_method", "paid_at", "status"]
-            )
+                order.save(
+                    update_fields=[
+                        "payment_status",
+                        "payment_method",
+                        "paid_at",
+                        "status",
+                    ]
+                )
 
-            # 創建或更新隊列項
-            from ..queue_manager_refactored import CoffeeQueueManager
+                # 創建或更新隊列項
+                from ..queue_manager_refactored import CoffeeQueueManager
 
-            queue_manager = CoffeeQueueManager()
-            queue_result = queue_manager.add__to_queue(order)
-            queue_item = (
-                queue_result["data"]["queue_item"]
-                if queue_result.get("success")
-                else None
-            )
+                queue_manager = CoffeeQueueManager()
+                queue_result = queue_manager.add__to_queue(order)
+                queue_item = (
+                    queue_result["data"]["queue_item"]
+                    if queue_result.get("success")
+                    else None
+                )
 
-            # 觸發相關事件
-            cls._trigger_payment_success_events(order, payment_method)
+                # 觸發相關事件（發件箱記錄隨事務提交）
+                cls._trigger_payment_success_events(order, payment_method)
 
             logger.info(
                 f"Order {order_id} payment processed successfully via {payment_method}"
@@ -409,7 +395,8 @@ class PaymentHandler:
 
     @staticmethod
     def _trigger_payment_success_events(order, payment_method):
-        """觸發支付成功相關事件"""
+        """觸發支付成功相關事件（寫入發件箱，提交後由工作者執行）"""
+        enqueue_payment_success(order)
 
     def should_add_to_queue(self):
         """判斷訂單是否應該加入隊列"""
@@ -12,7 +12,6 @@
 """
 
 import logging
-import threading
 from datetime import timedelta
 
 from django.utils import timezone
@@ -33,8 +32,14 @@ class StatusChanger:
     # ==================== 業務邏輯：處理訂單狀態變化的統一方法 ====================
 
     @classmethod
-    def process_order_status_change(cls, order_id, new_status, staff_name=None):
-        """處理訂單狀態變化的統一邏輯 - 包含統一時間計算"""
+    def process_order_status_change(
+        cls, order_id, new_status, staff_name=None, recalculate=True
+    ):
+        """
+        處理訂單狀態變化的統一邏輯 - 包含統一時間計算
+
+        recalculate=False 時跳過時間計算，由調用方統一處理（批量操作）。
+        """
         from ..audit_logger import log_audit  # 延遲導入，避免循環依賴
 
         try:
@@ -82,19 +87,20 @@ class StatusChanger:
                 logger.warning(f"⚠️ 訂單 #{order_id} 無對應 CoffeeQueue 記錄")
 
             # ✅ 重要：觸發統一時間計算
-            from ..queue_manager_refactored import CoffeeQueueManager
+            if recalculate:
+                from ..queue_manager_refactored import CoffeeQueueManager
 
-            queue_manager = CoffeeQueueManager()
+                queue_manager = CoffeeQueueManager()
 
-            logger.info("🔄 訂單狀態變化，開始統一時間計算...")
-            time_result = queue_manager.recalculate_all__times()
+                logger.info("🔄 訂單狀態變化，開始統一時間計算...")
+                time_result = queue_manager.recalculate_all__times()
 
-            if time_result.get("success"):
-                logger.info("✅ 訂單狀態變化後時間計算完成")
-            else:
-                logger.warning(
-                    f"⚠️ 訂單狀態變化後時間計算有問題: {time_result.get('message')}"
-                )
+                if time_result.get("success"):
+                    logger.info("✅ 訂單狀態變化後時間計算完成")
+                else:
+                    logger.warning(
+                        f"⚠️ 訂單狀態變化後時間計算有問題: {time_result.get('message')}"
+                    )
 
             # ============================================================
             # 🔧 修復：發送WebSocket通知（統一使用 'status' 類型）
@@ -138,7 +144,7 @@ class StatusChanger:
                 "order_id": order_id,
                 "old_status": old_status,
                 "new_status": new_status,
-                "time_recalculated": True,
+                "time_recalculated": recalculate,
             }
 
         except OrderModel.DoesNotExist:
@@ -157,22 +163,22 @@ class StatusChanger:
 
             results = []
             for order_id, new_status in order_status_list:
-                result = cls.process_order_status_change(order_id, new_status)
+                result = cls.process_order_status_change(
+                    order_id, new_status, recalculate=False
+                )
                 results.append(result)
 
-            # 批量處理後統一計算時間（只計算一次）
-            logger.info("🔄 批量處理完成，開始統一時間計算...")
-            from ..queue_manager_refactored import CoffeeQueueManager
+            # 批量處理後統一計算時間（只計算一次，由調度器合併執行）
+            logger.info("🔄 批量處理完成，排程統一時間計算...")
+            from ..queue_scheduler import request_queue_recalculation
 
-            queue_manager = CoffeeQueueManager()
+            request_queue_recalculation(reason="batch_status_change", full=True)
 
-            time_result = queue_manager.recalculate_all__times()
-
-            logger.info(
-                f"✅ 批量處理完成，統一時間計算結果: {time_result.get('success')}"
-            )
-
-            return {"success": True, "results": results, "time_recalculated": True}
+            return {
+                "success": True,
+                "results": results,
+                "time_recalculation_scheduled": True,
+            }
 
         except Exception as e:
             logger.error(f"❌ 批量處理訂單狀態變化失敗: {str(e)}")
@@ -384,22 +390,13 @@ class StatusChanger:
                 queue_item.save()
                 logger.info(f"✅ 訂單 #{order_id} 隊列項已更新")
 
-            # 5. 更新隊列時間（異步處理，不阻塞響應）
+            # 5. 更新隊列時間（交給調度器合併執行，不阻塞響應）
             try:
-                from ..queue_manager_refactored import CoffeeQueueManager
+                from ..queue_scheduler import request_queue_recalculation
 
-                queue_manager = CoffeeQueueManager()
-
-                def async_update_queue_times():
-                    try:
-                        queue_manager.update_estimated_times()
-                        logger.info(f"✅ 訂單 #{order_id} 隊列時間已異步更新")
-                    except Exception as e:
-                        logger.error(f"❌ 異步更新隊列時間失敗: {str(e)}")
-
-                thread = threading.Thread(target=async_update_queue_times)
-                thread.daemon = True
-                thread.start()
+                request_queue_recalculation(
+                    reason="preparation_started", order_id=order_id
+                )
 
             except Exception as queue_error:
                 logger.error(f"❌ 隊列時間更新失敗: {str(queue_error)}")
@@ -473,6 +470,11 @@ class StatusChanger:
                     f"✅ 訂單 #{order_id} 隊列項已更新: 狀態 → ready, 位置 {old_position} → 0"
                 )
 
+                # 記錄製作表現（持久化的增量統計，所有進程共享）
+                from ..learning_optimizer import record_queue_completion
+
+                record_queue_completion(queue_item)
+
             # 發送 WebSocket 通知
             try:
                 from ..websocket_utils import send_order_update, send_staff_action
@@ -230,7 +230,10 @@ class StatusDisplay:
                 if item.order_id == self.order.id:
                     current_position = idx
                 if item.status == "waiting":
-                    waiting_items_count += 1
+                    # 只計算排在前面的等待項，後面加入的訂單不影響顯示
+                    # （與 order_status_version 的 ETag 一致）
+                    if item.position < queue_item.position:
+                        waiting_items_count += 1
                 elif item.status == "preparing":
                     preparing_items_count += 1
 
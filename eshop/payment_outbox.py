@@ -0,0 +1,375 @@
+# eshop/payment_outbox.py
+"""
+支付成功副作用 - 事務發件箱
+
+支付回調原本在請求中依次執行加入隊列、重新計算、通知、積分等步驟，
+任何一步變慢都會拖慢回調，中途失敗則部分副作用丟失。現在：
+
+1. process_payment_success 在同一事務中更新支付狀態、加入隊列，並寫入
+   發件箱記錄（enqueue_payment_success）
+2. 事務提交後喚醒工作者：有 Celery 時排程 drain_payment_outbox 任務
+   （beat 每分鐘再執行一次），否則由進程內的後台線程處理；
+   PAYMENT_OUTBOX_SYNC=True 時在提交後同步處理（開發和測試）
+   進程內工作者在服務器啟動時（start_payment_outbox_worker）處理一次，
+   之後每 PAYMENT_OUTBOX_SWEEP_SECONDS 秒掃描，提交後、處理前進程重啟
+   遺留的記錄不需要等到下一筆支付
+3. 工作者以 SELECT ... FOR UPDATE SKIP LOCKED 批量領取待處理記錄，
+   每個副作用和完成標記在同一個事務中提交，多個工作者不會重複執行；
+   失敗的記錄保留並重試，超過 PAYMENT_OUTBOX_MAX_ATTEMPTS 次後放棄
+
+事件：
+- notify: 通知顧客端（支付狀態）和員工端（刷新隊列）
+- loyalty_points: 發放會員積分
+- audit: 寫入審計日誌
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_SUCCESS_EVENTS = ("notify", "loyalty_points", "audit")
+
+# 線下付款由員工確認時使用的審計動作
+OFFLINE_AUDIT_ACTIONS = {
+    "fps": "payment_fps_confirmed",
+    "cash": "payment_cash_confirmed",
+}
+
+
+def enqueue_payment_success(order, staff_name=None):
+    """
+    寫入支付成功的發件箱記錄（在支付狀態變更的事務中調用）
+
+    同一訂單重複調用（例如支付網關重複回調）不會產生新記錄。
+    """
+    from .models import PaymentOutbox
+
+    payload = {
+        "payment_method": order.payment_method,
+        "staff_name": staff_name or "",
+    }
+    PaymentOutbox.objects.bulk_create(
+        [
+            PaymentOutbox(order_id=order.id, event=event, payload=payload)
+            for event in PAYMENT_SUCCESS_EVENTS
+        ],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(wake_outbox_worker)
+
+
+def wake_outbox_worker():
+    """喚醒發件箱工作者（事務提交後調用）"""
+    if getattr(settings, "PAYMENT_OUTBOX_SYNC", False):
+        drain_outbox()
+        return
+
+    from .tasks import drain_payment_outbox
+
+    if hasattr(drain_payment_outbox, "delay"):
+        try:
+            drain_payment_outbox.delay()
+            return
+        except Exception as e:
+            logger.warning(f"⚠️ 排程發件箱任務失敗，改用進程內處理: {str(e)}")
+    get_payment_outbox_drainer().wake()
+
+
+def start_payment_outbox_worker():
+    """
+    服務器進程啟動時調用（asgi.py / wsgi.py）
+
+    沒有 Celery 時啟動進程內工作者：立即處理上次進程遺留的待處理記錄，
+    之後定時掃描。有 Celery 時由 beat 定時執行 drain_payment_outbox。
+
+    Returns:
+        bool: 是否啟動了進程內工作者
+    """
+    if getattr(settings, "PAYMENT_OUTBOX_SYNC", False):
+        return False
+
+    from .tasks import drain_payment_outbox
+
+    if hasattr(drain_payment_outbox, "delay"):
+        return False
+    get_payment_outbox_drainer().wake()
+    return True
+
+
+# ==================== 副作用處理 ====================
+
+
+def _handle_notify(row, order):
+    """通知顧客端和員工端（當前事務提交後發送）"""
+    order_id = row.order_id
+    payment_method = row.payload.get("payment_method")
+
+    def _send():
+        from .websocket_utils import send_payment_update, send_queue_update
+
+        # 1. 發送到特定訂單群組（顧客端）
+        send_payment_update(
+            order_id=order_id,
+            payment_status="paid",
+            data={
+                "payment_method": payment_method,
+                "message": "支付成功，訂單已加入隊列",
+            },
+        )
+        # 2. 發送到隊列群組（員工端），觸發員工頁面刷新
+        send_queue_update(
+            update_type="payment_confirmed",
+            data={
+                "order_id": order_id,
+                "payment_method": payment_method,
+                "message": f"訂單 #{order_id} 支付確認，已加入隊列",
+            },
+        )
+
+    transaction.on_commit(_send)
+
+
+def _handle_loyalty_points(row, order):
+    """發放會員積分（訂單已刪除或訪客訂單時跳過）"""
+    if order is None or order.user is None:
+        return
+
+    from socialuser.models_enhanced import CustomerLoyalty
+
+    loyalty, _ = CustomerLoyalty.objects.get_or_create(user=order.user)
+    points_earned = loyalty.add_points_from_order(order)
+    logger.info(
+        f"✅ 用戶 {order.user.username} 訂單 #{order.id} 獲得 {points_earned} 積分"
+    )
+
+
+def _handle_audit(row, order):
+    """寫入支付成功的審計日誌"""
+    from .audit_logger import log_audit
+
+    payment_method = row.payload.get("payment_method")
+    staff_name = row.payload.get("staff_name")
+    action = "payment_auto_paid"
+    if staff_name and payment_method in OFFLINE_AUDIT_ACTIONS:
+        action = OFFLINE_AUDIT_ACTIONS[payment_method]
+    log_audit(
+        action,
+        order=order,
+        staff_name=staff_name or "系統",
+        payment_method=payment_method,
+    )
+
+
+HANDLERS = {
+    "notify": _handle_notify,
+    "loyalty_points": _handle_loyalty_points,
+    "audit": _handle_audit,
+}
+
+
+# ==================== 批量處理 ====================
+
+
+def _drain_batch(batch_size, max_attempts):
+    """領取並處理一批記錄，返回 (領取數, 完成數, 失敗數)"""
+    from .models import OrderModel, PaymentOutbox
+
+    with transaction.atomic():
+        rows = list(
+            PaymentOutbox.objects.select_for_update(skip_locked=True)
+            .filter(status="pending")
+            .order_by("id")[:batch_size]
+        )
+        if not rows:
+            return 0, 0, 0
+
+        orders = OrderModel.objects.select_related("user").in_bulk(
+            {row.order_id for row in rows}
+        )
+        now = timezone.now()
+        done = failed = 0
+        for row in rows:
+            row.attempts += 1
+            try:
+                handler = HANDLERS.get(row.event)
+                if handler is None:
+                    raise ValueError(f"未知的發件箱事件: {row.event}")
+                # 保存點：失敗的副作用只回滾自己
+                with transaction.atomic():
+                    handler(row, orders.get(row.order_id))
+                row.status = "done"
+                row.processed_at = now
+                row.last_error = ""
+                done += 1
+            except Exception as e:
+                failed += 1
+                row.last_error = str(e)[:1000]
+                if row.attempts >= max_attempts:
+                    row.status = "failed"
+                    row.processed_at = now
+                    logger.error(
+                        f"❌ 發件箱 #{row.id} 訂單 #{row.order_id} {row.event} "
+                        f"已失敗 {row.attempts} 次，放棄: {str(e)}"
+                    )
+                else:
+                    logger.warning(
+                        f"⚠️ 發件箱 #{row.id} 訂單 #{row.order_id} {row.event} "
+                        f"失敗（第 {row.attempts} 次），稍後重試: {str(e)}"
+                    )
+
+        PaymentOutbox.objects.bulk_update(
+            rows, ["status", "attempts", "last_error", "processed_at"]
+        )
+    return len(rows), done, failed
+
+
+def drain_outbox(batch_size=None):
+    """
+    處理所有待處理的發件箱記錄
+
+    Returns:
+        dict: {done, failed}；有失敗記錄時本次停止，留待下次重試
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, "PAYMENT_OUTBOX_BATCH_SIZE", 50)
+    max_attempts = getattr(settings, "PAYMENT_OUTBOX_MAX_ATTEMPTS", 5)
+
+    totals = {"done": 0, "failed": 0}
+    while True:
+        claimed, done, failed = _drain_batch(batch_size, max_attempts)
+        totals["done"] += done
+        totals["failed"] += failed
+        if failed or claimed < batch_size:
+            break
+
+    if totals["done"] or totals["failed"]:
+        logger.info(
+            f"📮 支付發件箱: 完成 {totals['done']} 個，失敗 {totals['failed']} 個"
+        )
+    return totals
+
+
+class PaymentOutboxDrainer:
+    """進程內發件箱工作者（沒有 Celery 時使用）"""
+
+    def __init__(self, retry_seconds=None, sweep_seconds=None, drain=None):
+        """
+        Args:
+            retry_seconds: 有失敗記錄時的重試間隔
+            sweep_seconds: 沒有喚醒時的掃描間隔（0 表示只在喚醒時處理）
+            drain: 處理函數，默認 drain_outbox
+        """
+        if retry_seconds is None:
+            retry_seconds = getattr(settings, "PAYMENT_OUTBOX_RETRY_SECONDS", 30)
+        if sweep_seconds is None:
+            sweep_seconds = getattr(settings, "PAYMENT_OUTBOX_SWEEP_SECONDS", 60)
+        self.retry_seconds = retry_seconds
+        self.sweep_seconds = sweep_seconds
+        self._drain = drain or drain_outbox
+
+        self._condition = threading.Condition()
+        self._worker = None
+        # stop() 後遞增，舊的工作線程看到世代改變即退出
+        self._generation = 0
+        self._pending = False
+        self._running = False
+
+        self.stats = {
+            "woken": 0,
+            "runs": 0,
+            "done": 0,
+            "failed": 0,
+            "last_run_at": None,
+        }
+
+    def wake(self):
+        """請求處理一次（不阻塞）"""
+        with self._condition:
+            self.stats["woken"] += 1
+            self._pending = True
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run_loop,
+                    args=(self._generation,),
+                    name="payment-outbox",
+                    daemon=True,
+                )
+                self._worker.start()
+            self._condition.notify_all()
+
+    def _run_loop(self, generation):
+        """工作線程：被喚醒時處理；有失敗記錄時按重試間隔、否則按掃描間隔處理"""
+        retry = False
+        while True:
+            with self._condition:
+                if not self._pending and generation == self._generation:
+                    timeout = self.retry_seconds if retry else self.sweep_seconds
+                    self._condition.wait(timeout or None)
+                if generation != self._generation:
+                    return
+                self._pending = False
+                self._running = True
+
+            try:
+                totals = self._drain()
+                retry = totals["failed"] > 0
+                with self._condition:
+                    self.stats["runs"] += 1
+                    self.stats["done"] += totals["done"]
+                    self.stats["failed"] += totals["failed"]
+                    self.stats["last_run_at"] = timezone.now().isoformat()
+            except Exception as e:
+                retry = True
+                logger.error(f"❌ 處理支付發件箱失敗: {str(e)}", exc_info=True)
+            finally:
+                # 不在兩次處理之間佔用資料庫連線
+                connection.close()
+                with self._condition:
+                    self._running = False
+                    self._condition.notify_all()
+
+    def wait_until_idle(self, timeout=5.0):
+        """等待已喚醒的處理完成（供管理命令和測試使用）"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self, timeout=1.0):
+        """停止工作線程（供測試和進程退出使用）"""
+        with self._condition:
+            self._generation += 1
+            self._pending = False
+            worker, self._worker = self._worker, None
+            self._condition.notify_all()
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self.stats)
+            stats["pending"] = self._pending
+            stats["running"] = self._running
+        return stats
+
+
+# 全局實例
+_payment_outbox_drainer = None
+
+
+def get_payment_outbox_drainer():
+    """獲取進程內發件箱工作者實例"""
+    global _payment_outbox_drainer
+    if _payment_outbox_drainer is None:
+        _payment_outbox_drainer = PaymentOutboxDrainer()
+    return _payment_outbox_drainer
@@ -0,0 +1,228 @@
+# eshop/pickup_codes.py
+"""
+取餐碼分配器 - 預先生成的空閒碼池
+
+舊的 generate_unique_pickup_code 逐個隨機探測（最多 400 次 exists 查詢），
+歷史訂單越多越慢，最後退回固定的 "1234"。這個模塊改為：
+
+1. PickupCodePool 表保存全部 9999 個取餐碼（"0000" 不可用），按隨機
+   shuffle_key 排序
+2. 分配：PostgreSQL 以一條 UPDATE ... RETURNING 取出一個空閒碼
+   （FOR UPDATE SKIP LOCKED，併發分配互不阻塞），一次往返；其他數據庫
+   以 ORM 選取後條件更新
+3. 唯一性只限未完成的訂單；已完成或取消的訂單經過冷卻期
+   （PICKUP_CODE_QUIET_MINUTES）後，碼會在池用盡時批量回收
+4. 池為空表（首次使用）時自動根據現有訂單生成
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, Max, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger("eshop.pickup_codes")
+
+# 不再佔用取餐碼的訂單狀態
+TERMINAL_ORDER_STATUSES = ("completed", "cancelled")
+
+# 可用的取餐碼（"0000" 不可用，見 OrderModel.clean）
+PICKUP_CODE_SPACE = [f"{number:04d}" for number in range(1, 10000)]
+
+
+class PickupCodeAllocator:
+    """取餐碼分配器"""
+
+    def __init__(self, quiet_minutes=None, allocation_grace_minutes=10):
+        if quiet_minutes is None:
+            quiet_minutes = getattr(settings, "PICKUP_CODE_QUIET_MINUTES", 24 * 60)
+        self.quiet_period = timedelta(minutes=quiet_minutes)
+        # 已分配但訂單尚未保存的碼，在寬限期內不會被回收
+        self.allocation_grace = timedelta(minutes=allocation_grace_minutes)
+
+    def allocate(self):
+        """
+        分配一個取餐碼
+
+        Returns:
+            str: 取餐碼；池中沒有可用碼時返回 None
+        """
+        code = self._pop_free_code()
+        if code is not None:
+            return code
+
+        # 池用盡：回收已完成訂單的碼；空表則先生成
+        if not self.recycle() and self.seed() == 0:
+            logger.error("❌ 取餐碼池已用盡，沒有可回收的取餐碼")
+            return None
+        return self._pop_free_code()
+
+    def _pop_free_code(self):
+        """取出並標記一個空閒碼"""
+        if connection.vendor != "postgresql":
+            return self._pop_free_code_orm()
+
+        from .models import PickupCodePool
+
+        table = connection.ops.quote_name(PickupCodePool._meta.db_table)
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {table} SET allocated_at = %s
+                WHERE code = (
+                    SELECT code FROM {table}
+                    WHERE allocated_at IS NULL
+                      AND (released_at IS NULL OR released_at <= %s)
+                    ORDER BY shuffle_key
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING code
+                """,
+                [now, now - self.quiet_period],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _pop_free_code_orm(self, attempts=5):
+        """其他數據庫：鎖定並選取一個空閒碼，條件更新失敗（被併發取走）時重試"""
+        from .models import PickupCodePool
+
+        now = timezone.now()
+        free = PickupCodePool.objects.filter(allocated_at__isnull=True).filter(
+            Q(released_at__isnull=True) | Q(released_at__lte=now - self.quiet_period)
+        )
+        for _ in range(attempts):
+            with transaction.atomic():
+                code = (
+                    free.select_for_update()
+                    .order_by("shuffle_key")
+                    .values_list("code", flat=True)
+                    .first()
+                )
+                if code is None:
+                    return None
+                if free.filter(code=code).update(allocated_at=now):
+                    return code
+        return None
+
+    def recycle(self):
+        """
+        回收沒有未完成訂單佔用的取餐碼
+
+        釋放時間取使用該碼的訂單最後更新時間，冷卻期從那時開始計算。
+
+        Returns:
+            int: 回收的取餐碼數量
+        """
+        from .models import OrderModel, PickupCodePool
+
+        now = timezone.now()
+        orders_with_code = OrderModel.objects.filter(pickup_code=OuterRef("code"))
+        last_used = (
+            orders_with_code.order_by()
+            .values("pickup_code")
+            .annotate(last_updated=Max("updated_at"))
+            .values("last_updated")
+        )
+        recycled = (
+            PickupCodePool.objects.filter(
+                allocated_at__isnull=False,
+                allocated_at__lt=now - self.allocation_grace,
+            )
+            .exclude(
+                Exists(orders_with_code.exclude(status__in=TERMINAL_ORDER_STATUSES))
+            )
+            .update(
+                allocated_at=None,
+                released_at=Coalesce(Subquery(last_used), Value(now)),
+            )
+        )
+        if recycled:
+            logger.info(f"♻️ 已回收 {recycled} 個取餐碼")
+        return recycled
+
+    def seed(self):
+        """
+        池為空時根據現有訂單生成全部取餐碼
+
+        未完成訂單的碼標記為已分配；歷史訂單的碼以其最後更新時間作為
+        釋放時間（仍受冷卻期限制）。
+
+        Returns:
+            int: 新生成的取餐碼數量（池已存在時為 0）
+        """
+        from .models import OrderModel, PickupCodePool
+
+        if PickupCodePool.objects.exists():
+            return 0
+
+        now = timezone.now()
+        active_codes = set(
+            OrderModel.objects.exclude(status__in=TERMINAL_ORDER_STATUSES)
+            .exclude(pickup_code="")
+            .values_list("pickup_code", flat=True)
+        )
+        last_used = dict(
+            OrderModel.objects.filter(status__in=TERMINAL_ORDER_STATUSES)
+            .exclude(pickup_code="")
+            .order_by()
+            .values("pickup_code")
+            .annotate(last_updated=Max("updated_at"))
+            .values_list("pickup_code", "last_updated")
+        )
+
+        rows = [
+            PickupCodePool(
+                code=code,
+                allocated_at=now if code in active_codes else None,
+                released_at=last_used.get(code),
+            )
+            for code in PICKUP_CODE_SPACE
+        ]
+        with transaction.atomic():
+            # 多個進程同時生成時忽略已存在的行
+            PickupCodePool.objects.bulk_create(
+                rows, batch_size=2000, ignore_conflicts=True
+            )
+
+        logger.info(
+            f"🎫 取餐碼池已生成: {len(rows)} 個取餐碼, {len(active_codes)} 個已被佔用"
+        )
+        return len(rows)
+
+    def get_stats(self):
+        """取餐碼池統計"""
+        from .models import PickupCodePool
+
+        cooling_after = timezone.now() - self.quiet_period
+        pool = PickupCodePool.objects.all()
+        return {
+            "total": pool.count(),
+            "allocated": pool.filter(allocated_at__isnull=False).count(),
+            "cooling": pool.filter(
+                allocated_at__isnull=True, released_at__gt=cooling_after
+            ).count(),
+            "quiet_minutes": int(self.quiet_period.total_seconds() // 60),
+        }
+
+
+# 全局實例
+_pickup_code_allocator = None
+
+
+def get_pickup_code_allocator():
+    """獲取取餐碼分配器實例"""
+    global _pickup_code_allocator
+    if _pickup_code_allocator is None:
+        _pickup_code_allocator = PickupCodeAllocator()
+    return _pickup_code_allocator
+
+
+def allocate_pickup_code():
+    """分配一個取餐碼（便捷函數）"""
+    return get_pickup_code_allocator().allocate()
@@ -0,0 +1,116 @@
+# eshop/qr_codes.py
+"""
+二維碼按需生成和緩存
+
+訂單取餐二維碼和 FPS 付款二維碼原本在保存訂單 / 打開付款頁時同步渲染
+PNG 並以 base64 存入訂單行。這個模塊改為：
+
+1. 第一次訪問時才渲染，按內容摘要緩存 PNG（Django 緩存後端）
+2. 摘要以 SECRET_KEY 簽名，作為圖片 URL 的版本參數：
+   內容不變 URL 不變，可設置 immutable 長期緩存；沒有摘要無法訪問
+3. 由 order_qr_code 視圖以 ETag 提供圖片
+"""
+
+import base64
+import hashlib
+import hmac
+import io
+import logging
+from decimal import Decimal
+
+import qrcode
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+
+logger = logging.getLogger("eshop.qr_codes")
+
+QR_KIND_ORDER = "order"
+QR_KIND_FPS = "fps"
+
+# 各類二維碼的渲染參數
+QR_RENDER_OPTIONS = {
+    QR_KIND_ORDER: {"version": 1, "error_correction": qrcode.constants.ERROR_CORRECT_L},
+    QR_KIND_FPS: {"version": 2, "error_correction": qrcode.constants.ERROR_CORRECT_M},
+}
+
+CACHE_KEY_PREFIX = "qr_png"
+
+
+def order_qr_payload(order):
+    """取餐二維碼內容：訂單ID和取餐碼"""
+    return f"Order: {order.id}, Pickup Code: {order.pickup_code}"
+
+
+def fps_qr_payload(order):
+    """FPS 轉數快付款字符串"""
+    merchant_id = getattr(settings, "FPS_MERCHANT_ID", "68492033")
+    merchant_name = "Between Coffee"
+    reference = f"BC{order.id:06d}"
+    return (
+        f"FPS://{merchant_id}"
+        f"?amount={Decimal(str(order.total_price)):.2f}"
+        f"&currency=HKD"
+        f"&reference={reference}"
+        f"&merchant={merchant_name}"
+    )
+
+
+def qr_payload(order, kind):
+    if kind == QR_KIND_FPS:
+        return fps_qr_payload(order)
+    return order_qr_payload(order)
+
+
+def qr_digest(kind, payload):
+    """內容摘要（以 SECRET_KEY 簽名，不能由取餐碼推算）"""
+    message = f"{kind}:{payload}".encode()
+    signature = hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256)
+    return signature.hexdigest()[:32]
+
+
+def render_qr_png(kind, payload):
+    """渲染二維碼 PNG"""
+    qr = qrcode.QRCode(box_size=10, border=4, **QR_RENDER_OPTIONS[kind])
+    qr.add_data(payload)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def get_qr_png(kind, payload):
+    """
+    獲取二維碼 PNG（按內容摘要緩存）
+
+    Returns:
+        tuple: (摘要, PNG bytes)
+    """
+    digest = qr_digest(kind, payload)
+    cache_key = f"{CACHE_KEY_PREFIX}:{digest}"
+    png = cache.get(cache_key)
+    if png is None:
+        png = render_qr_png(kind, payload)
+        cache.set(
+            cache_key, png, getattr(settings, "QR_CODE_CACHE_TIMEOUT", 7 * 24 * 3600)
+        )
+        logger.debug(f"二維碼已渲染並緩存: {kind} {digest}")
+    return digest, png
+
+
+def get_qr_base64(kind, payload):
+    """獲取二維碼 PNG 的 base64 字符串（兼容舊的內嵌 data URL 用法）"""
+    try:
+        return base64.b64encode(get_qr_png(kind, payload)[1]).decode()
+    except Exception as e:
+        logger.error(f"生成二維碼失敗: {str(e)}")
+        return ""
+
+
+def get_qr_url(order, kind=QR_KIND_ORDER):
+    """訂單二維碼圖片 URL（帶內容摘要，內容改變時 URL 也改變）"""
+    digest = qr_digest(kind, qr_payload(order, kind))
+    path = reverse("eshop:order_qr_code", kwargs={"order_id": order.id, "kind": kind})
+    return f"{path}?v={digest}"
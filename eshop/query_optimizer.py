@@ -89,10 +89,12 @@ class QueryOptimizer:
         from django.db import transaction
 
         from .models import OrderModel
+        from .queue_changes import record_queue_changes
 
         with transaction.atomic():
             orders = OrderModel.objects.filter(id__in=order_ids)
             updated_count = orders.update(status=new_status)
+            record_queue_changes(order_ids)
 
             # 使相关缓存失效
             cls.invalidate_cache("active_orders")
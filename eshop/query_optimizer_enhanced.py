@@ -1,16 +1,18 @@
 """
 查詢優化器 - 階段2數據庫優化
 統一管理所有數據庫查詢，減少N+1問題
+
+隊列相關的查詢委託給 eshop.views.queue_processors.QueueSnapshot
 """
 
 import logging
-from datetime import timedelta
 from typing import Dict, List
 
 from django.db.models import Prefetch
 from django.utils import timezone
 
 from eshop.models import CoffeeQueue, OrderModel
+from eshop.utils.order_item_processor import OrderItemProcessor
 
 logger = logging.getLogger(__name__)
 
@@ -22,23 +24,23 @@ class QueryOptimizer:
     def get_waiting_queues():
         """
         獲取等待隊列（優化版）
-        使用 select_related 減少查詢次數
+        與隊列快照引擎使用相同的查詢
         """
-        return (
-            CoffeeQueue.objects.filter(status="waiting")
-            .select_related("order")
-            .order_by("position")
-        )
+        from eshop.views.queue_processors import QueueSnapshot
+
+        return QueueSnapshot.queue_rows().filter(status="waiting")
 
     @staticmethod
     def get_preparing_queues():
         """
         獲取製作中隊列（優化版）
-        使用 select_related 減少查詢次數
+        與隊列快照引擎使用相同的查詢
         """
+        from eshop.views.queue_processors import QueueSnapshot
+
         return (
-            CoffeeQueue.objects.filter(status="preparing")
-            .select_related("order")
+            QueueSnapshot.queue_rows()
+            .filter(status="preparing")
             .order_by("estimated_completion_time")
         )
 
@@ -46,31 +48,22 @@ class QueryOptimizer:
     def get_ready_orders():
         """
         獲取就緒訂單（優化版）
-        使用 select_related 減少查詢次數
+        與隊列快照引擎使用相同的查詢（最新的 20 筆）
         """
-        return (
-            OrderModel.objects.filter(
-                status="ready", payment_status="paid", picked_up_at__isnull=True
-            )
-            .select_related("queue_item")
-            .order_by("-ready_at")[:20]
-        )
+        from eshop.views.queue_processors import QueueSnapshot
+
+        return QueueSnapshot.order_rows(timezone.now()).filter(section="ready_orders")
 
     @staticmethod
     def get_completed_orders(hours=4):
         """
         獲取已完成訂單（優化版）
-        使用 select_related 減少查詢次數
+        與隊列快照引擎使用相同的查詢（最新的 50 筆）
         """
-        time_threshold = timezone.now() - timedelta(hours=hours)
-        return (
-            OrderModel.objects.filter(
-                status="completed",
-                picked_up_at__isnull=False,
-                picked_up_at__gte=time_threshold,
-            )
-            .select_related("queue_item")
-            .order_by("-picked_up_at")[:50]
+        from eshop.views.queue_processors import QueueSnapshot
+
+        return QueueSnapshot.order_rows(timezone.now(), completed_hours=hours).filter(
+            section="completed_orders"
         )
 
     @staticmethod
@@ -122,44 +115,42 @@ class QueryOptimizer:
     def get_unified_queue_data_optimized():
         """
         獲取統一隊列數據（優化版）
-        批量處理所有查詢，減少數據庫往返
+        由隊列快照引擎一次載入（最多兩次查詢），隊列項映射取自已載入的記錄
         """
-        try:
-            # 1. 批量獲取所有隊列數據
-            waiting_queues = QueryOptimizer.get_waiting_queues()
-            preparing_queues = QueryOptimizer.get_preparing_queues()
-            ready_orders = QueryOptimizer.get_ready_orders()
-            completed_orders = QueryOptimizer.get_completed_orders()
-
-            # 2. 收集所有訂單ID用於批量查詢
-            all_order_ids = set()
-
-            # 等待隊列訂單ID
-            for queue_item in waiting_queues:
-                if queue_item.order_id:
-                    all_order_ids.add(queue_item.order_id)
+        from eshop.views.queue_processors import QueueSnapshot
 
-            # 製作中隊列訂單ID
-            for queue_item in preparing_queues:
-                if queue_item.order_id:
-                    all_order_ids.add(queue_item.order_id)
-
-            # 就緒訂單ID
-            for order in ready_orders:
-                all_order_ids.add(order.id)
-
-            # 已完成訂單ID
-            for order in completed_orders:
-                all_order_ids.add(order.id)
+        try:
+            buckets = QueueSnapshot().fetch(
+                (
+                    "waiting_orders",
+                    "preparing_orders",
+                    "ready_orders",
+                    "completed_orders",
+                )
+            )
 
-            # 3. 批量獲取所有 CoffeeQueue 數據
-            coffee_queue_map = QueryOptimizer.get_coffee_queue_map(list(all_order_ids))
+            coffee_queue_map = {}
+            for queue_item in buckets["waiting_orders"] + buckets["preparing_orders"]:
+                coffee_queue_map[queue_item.order_id] = queue_item
+            for order in buckets["ready_orders"] + buckets["completed_orders"]:
+                queue_item = OrderItemProcessor.get_queue_item(order)
+                if queue_item:
+                    coffee_queue_map[order.id] = queue_item
+
+            all_order_ids = {
+                queue_item.order_id
+                for queue_item in buckets["waiting_orders"]
+                + buckets["preparing_orders"]
+            } | {
+                order.id
+                for order in buckets["ready_orders"] + buckets["completed_orders"]
+            }
 
             return {
-                "waiting_queues": waiting_queues,
-                "preparing_queues": preparing_queues,
-                "ready_orders": ready_orders,
-                "completed_orders": completed_orders,
+                "waiting_queues": buckets["waiting_orders"],
+                "preparing_queues": buckets["preparing_orders"],
+                "ready_orders": buckets["ready_orders"],
+                "completed_orders": buckets["completed_orders"],
                 "coffee_queue_map": coffee_queue_map,
                 "total_orders": len(all_order_ids),
             }
@@ -167,10 +158,10 @@ class QueryOptimizer:
         except Exception as e:
             logger.error(f"獲取統一隊列數據（優化版）失敗: {str(e)}", exc_info=True)
             return {
-                "waiting_queues": CoffeeQueue.objects.none(),
-                "preparing_queues": CoffeeQueue.objects.none(),
-                "ready_orders": OrderModel.objects.none(),
-                "completed_orders": OrderModel.objects.none(),
+                "waiting_queues": [],
+                "preparing_queues": [],
+                "ready_orders": [],
+                "completed_orders": [],
                 "coffee_queue_map": {},
                 "total_orders": 0,
             }
@@ -193,21 +184,27 @@ class BatchOrderProcessor:
         返回:
             訂單數據列表
         """
-        from eshop.utils.order_item_processor import OrderItemProcessor
-
         if not orders:
             return []
 
-        # 批量獲取所有相關數據
-        order_ids = [order.id for order in orders]
-
-        # 批量查詢 CoffeeQueue 數據
-        coffee_queue_map = QueryOptimizer.get_coffee_queue_map(order_ids)
+        # 已通過 select_related 載入隊列項的訂單不需要再查詢
+        queue_cached = OrderModel.queue_item.is_cached
+        coffee_queue_map = {}
+        if include_queue_info:
+            coffee_queue_map = QueryOptimizer.get_coffee_queue_map(
+                [order.id for order in orders if not queue_cached(order)]
+            )
 
         # 批量處理訂單
         results = []
         for order in orders:
-            queue_item = coffee_queue_map.get(order.id) if include_queue_info else None
+            queue_item = None
+            if include_queue_info:
+                queue_item = (
+                    OrderItemProcessor.get_queue_item(order)
+                    if queue_cached(order)
+                    else coffee_queue_map.get(order.id)
+                )
             order_data = OrderItemProcessor.prepare_order_data(
                 order,
                 queue_item=queue_item,
@@ -233,69 +230,10 @@ class BatchOrderProcessor:
         返回:
             就緒訂單數據列表
         """
-        from eshop.utils.order_item_processor import OrderItemProcessor
-
-        if not orders:
-            return []
-
-        # 批量獲取所有相關數據
-        order_ids = [order.id for order in orders]
-        coffee_queue_map = QueryOptimizer.get_coffee_queue_map(order_ids)
-
-        # 批量處理訂單
-        results = []
-        for order in orders:
-            # 純咖啡豆訂單不顯示咖啡師（現貨商品）
-            items = order.get_items()
-            is_beans_only = (
-                all(item.get("type") == "bean" for item in items) if items else False
-            )
+        from eshop.views.queue_processors import ReadyOrderProcessor
 
-            # 使用基礎處理器準備數據
-            order_data = OrderItemProcessor.prepare_order_data(
-                order, now=now, hk_tz=hk_tz, include_queue_info=False
-            )
-
-            if not order_data:
-                continue
-
-            # 添加咖啡師信息
-            if is_beans_only:
-                order_data["barista"] = ""
-            else:
-                queue_item = coffee_queue_map.get(order.id)
-                order_data["barista"] = (
-                    queue_item.barista
-                    if queue_item and queue_item.barista
-                    else "未分配"
-                )
-
-            # 添加就緒時間信息
-            if order.ready_at and hk_tz:
-                from django.utils import timezone
-
-                ready_time = order.ready_at
-                if ready_time.tzinfo is None:
-                    ready_time = timezone.make_aware(ready_time)
-                ready_at_hk = ready_time.astimezone(hk_tz)
-
-                order_data["ready_at"] = ready_at_hk.isoformat()
-                order_data["completed_time"] = ready_at_hk.strftime("%H:%M")
-
-                # 計算等待時間
-                if now and not is_beans_only:
-                    wait_seconds = (now - ready_at_hk).total_seconds()
-                    wait_minutes = int(wait_seconds / 60)
-                    order_data["wait_minutes"] = wait_minutes
-                    order_data["wait_display"] = (
-                        f"{wait_minutes}分鐘前" if wait_minutes > 0 else "刚刚"
-                    )
-
-            results.append(order_data)
-
-        # 按就緒時間排序
-        results.sort(key=lambda x: x.get("ready_at") or "", reverse=True)
-        return results
+        # 與隊列快照引擎使用相同的處理器
+        return ReadyOrderProcessor(now, hk_tz).process(list(orders))
 
 
 class CacheManager:
@@ -0,0 +1,140 @@
+# eshop/queue_changes.py
+"""
+隊列變更日誌 - 員工端增量輪詢的變更序號
+
+訂單（OrderModel）和隊列項（CoffeeQueue）保存或刪除時，通過信號在事務提交後
+寫入 QueueChange；批量更新（bulk_update / update）不觸發信號，
+由調用方顯式調用 record_queue_changes。
+
+get_unified_queue_data 以 QueueChange 的自增 id 作為游標：
+- 客戶端帶上次響應的 cursor 請求，服務端只處理 id > cursor 的變更涉及的訂單
+- 游標早於保留窗口（記錄已清理）或超出範圍時返回全量數據
+- 同時寫入的兩個事務可能以與序號相反的順序提交，因此增量查詢會重讀
+  最近 QUEUE_DELTA_OVERLAP_SECONDS 秒內的變更（客戶端按訂單ID覆蓋，重複無害）
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _retention_minutes():
+    return getattr(settings, "QUEUE_CHANGE_RETENTION_MINUTES", 30)
+
+
+def _overlap_seconds():
+    return getattr(settings, "QUEUE_DELTA_OVERLAP_SECONDS", 2)
+
+
+def record_queue_changes(order_ids):
+    """記錄訂單變更（在當前事務提交後寫入）"""
+    order_ids = sorted({int(order_id) for order_id in order_ids if order_id})
+    if not order_ids:
+        return
+
+    def _write():
+        from .models import QueueChange
+
+        try:
+            QueueChange.objects.bulk_create(
+                [QueueChange(order_id=order_id) for order_id in order_ids]
+            )
+        except Exception as e:
+            logger.error(f"❌ 記錄隊列變更失敗: {str(e)}")
+
+    transaction.on_commit(_write)
+
+
+def get_current_cursor():
+    """當前最新的變更序號（沒有記錄時為 0）"""
+    from .models import QueueChange
+
+    return QueueChange.objects.aggregate(cursor=Max("id"))["cursor"] or 0
+
+
+def get_changes_since(since):
+    """
+    讀取游標之後的變更
+
+    Returns:
+        dict: {
+            'cursor': 0,           # 新的游標
+            'order_ids': set(),    # 有變化的訂單ID
+            'expired': False,      # 游標已失效，需要返回全量數據
+        }
+    """
+    from .models import QueueChange
+
+    bounds = QueueChange.objects.aggregate(oldest=Min("id"), cursor=Max("id"))
+    cursor = bounds["cursor"] or 0
+
+    # 游標早於保留的最舊記錄（中間的記錄已清理），或大於最新序號（資料被重置）
+    if since > cursor or (
+        bounds["oldest"] is not None and since + 1 < bounds["oldest"]
+    ):
+        return {"cursor": cursor, "order_ids": set(), "expired": True}
+
+    overlap_start = timezone.now() - timedelta(seconds=_overlap_seconds())
+    order_ids = set(
+        QueueChange.objects.filter(
+            Q(id__gt=since) | Q(created_at__gte=overlap_start)
+        ).values_list("order_id", flat=True)
+    )
+    return {"cursor": cursor, "order_ids": order_ids, "expired": False}
+
+
+def prune_queue_changes():
+    """清理保留窗口之前的變更記錄（始終保留最新一行，用於判斷游標是否失效）"""
+    from .models import QueueChange
+
+    latest = get_current_cursor()
+    cutoff = timezone.now() - timedelta(minutes=_retention_minutes())
+    deleted, _ = QueueChange.objects.filter(
+        created_at__lt=cutoff, id__lt=latest
+    ).delete()
+    if deleted:
+        logger.debug(f"🧹 清理了 {deleted} 條隊列變更記錄")
+    return deleted
+
+
+# ==================== 信號 ====================
+
+
+def _on_order_changed(sender, instance, **kwargs):
+    record_queue_changes([instance.pk])
+
+
+def _on_queue_item_changed(sender, instance, **kwargs):
+    record_queue_changes([instance.order_id])
+
+
+def connect_signals():
+    """連接訂單和隊列項的 post_save / post_delete 信號（由 EshopConfig.ready 調用）"""
+    from django.db.models.signals import post_delete, post_save
+
+    from .models import CoffeeQueue, OrderModel
+
+    post_save.connect(
+        _on_order_changed, sender=OrderModel, dispatch_uid="queue_changes_order_save"
+    )
+    post_delete.connect(
+        _on_order_changed,
+        sender=OrderModel,
+        dispatch_uid="queue_changes_order_delete",
+    )
+    post_save.connect(
+        _on_queue_item_changed,
+        sender=CoffeeQueue,
+        dispatch_uid="queue_changes_queue_save",
+    )
+    post_delete.connect(
+        _on_queue_item_changed,
+        sender=CoffeeQueue,
+        dispatch_uid="queue_changes_queue_delete",
+    )
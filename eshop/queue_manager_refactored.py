@@ -15,6 +15,9 @@
 import logging
 from datetime import timedelta
 
+from django.db import transaction
+from django.db.models import F, Q, Sum, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
 from .error_handling import (
@@ -24,13 +27,17 @@ from .error_handling import (
     handle_success,
 )
 from .models import CoffeeQueue, OrderModel
+from .order_eta import push_eta_updates
 from .order_status_manager import OrderStatusManager
+from .queue_changes import record_queue_changes
+from .queue_state_store import get_queue_state_store
 from .smart_allocation import (
     allocate_new_order,
     get_recommendations_for_order,
     get_smart_allocator,
     initialize_smart_system,
     optimize_order_preparation,
+    workload_snapshot,
 )
 from .time_calculation import unified_time_service
 
@@ -64,7 +71,8 @@ class CoffeeQueueManager:
                 'coffee_count': 0,
                 'preparation_time_minutes': 0,
                 'status': 'waiting',
-                'queue_item': CoffeeQueue實例（通過兼容性包裝器訪問）
+                'queue_item': CoffeeQueue實例（通過兼容性包裝器訪問）,
+                'position_changes': [...]（重新排序移動的隊列項）
             },
             'details': {...},
             'timestamp': '...',
@@ -158,13 +166,17 @@ class CoffeeQueueManager:
             )
 
             # 檢查並重新排序隊列
+            position_changes = []
             if use_priority:
-                reordered = self._check_and_reorder_queue()
-                if reordered:
+                position_changes = self._check_and_reorder_queue()
+                if position_changes:
                     self.logger.info(f"🔄 訂單 #{order.id} 隊列重新排序完成")
+                    for change in position_changes:
+                        if change["queue_item_id"] == queue_item.id:
+                            queue_item.position = change["new_position"]
 
-            # 更新隊列時間
-            time_updated = self.update_estimated_times()
+            # 更新隊列時間（新項在 added_at 順序的末尾，只需計算尾部）
+            time_updated = self.update_estimated_times_from(queue_item)
             if time_updated:
                 self.logger.info(f"⏰ 訂單 #{order.id} 隊列時間更新完成")
 
@@ -186,7 +198,8 @@ class CoffeeQueueManager:
                     "preparation_time_minutes": preparation_time,
                     "status": "waiting",
                     "queue_item": queue_item,
-                    "queue_reordered": reordered if use_priority else False,
+                    "queue_reordered": bool(position_changes),
+                    "position_changes": position_changes,
                     "time_updated": time_updated,
                 },
                 message=f"訂單 #{order.id} 成功加入隊列",
@@ -547,8 +560,10 @@ class CoffeeQueueManager:
         3. 普通訂單按加入隊列時間排序
         """
         try:
-            waiting_queues = CoffeeQueue.objects.filter(status="waiting").order_by(
-                "added_at"
+            waiting_queues = (
+                CoffeeQueue.objects.filter(status="waiting")
+                .select_related("order")
+                .order_by("added_at")
             )
 
             if not waiting_queues.exists():
@@ -613,62 +628,96 @@ class CoffeeQueueManager:
             return self._get_next_simple_position()
 
     def _check_and_reorder_queue(self):
-        """檢查並重新排序隊列"""
+        """
+        檢查並重新排序隊列
+
+        Returns:
+            list: 位置有變化的隊列項差異（見 reorder_waiting_queue），
+            空列表表示無需重新排序
+        """
         try:
-            waiting_queues = CoffeeQueue.objects.filter(status="waiting")
+            return self.reorder_waiting_queue()
 
-            if not waiting_queues.exists():
-                self.logger.debug("隊列為空，無需重新排序")
-                return False
+        except Exception as e:
+            self.logger.error(f"檢查隊列排序失敗: {str(e)}")
+            return []
 
-            # 收集信息並排序
-            queues_info = []
-            for queue in waiting_queues:
-                queues_info.append(
-                    {
-                        "queue_id": queue.id,
-                        "order_id": queue.order.id,
-                        "order_type": queue.order.order_type,
-                        "current_position": queue.position,
-                        "added_at": queue.added_at.timestamp() if queue.added_at else 0,
-                    }
-                )
+    def reorder_waiting_queue(self):
+        """
+        集合式重新排序等待中的隊列項
 
-            # 排序：快速訂單優先，然後按加入隊列時間
-            queues_info.sort(
-                key=lambda x: (0 if x["order_type"] == "quick" else 1, x["added_at"])
-            )
+        排序規則與 _calculate_priority_position 一致：快速訂單優先，
+        然後按加入隊列時間（added_at）排序。
 
-            # 檢查是否需要重新排序
-            needs_reorder = any(
-                info["current_position"] != index + 1
-                for index, info in enumerate(queues_info)
-            )
+        只用一次查詢讀取所有等待項及其訂單類型，只對位置真正改變的行
+        在同一事務內執行一次 bulk_update（UPDATE ... CASE）。
 
-            if not needs_reorder:
-                self.logger.debug("隊列順序正常，無需重新排序")
-                return False
+        Returns:
+            list: 位置有變化的隊列項，格式:
+            [
+                {
+                    'queue_item_id': 0,
+                    'order_id': 0,
+                    'old_position': 0,
+                    'new_position': 0,
+                },
+                ...
+            ]
+        """
+        store = get_queue_state_store()
+        if store is not None:
+            # 啟用隊列狀態存儲時在內存中排序，位置由存儲延遲寫回
+            return store.reorder_waiting()
+
+        with transaction.atomic():
+            rows = list(
+                CoffeeQueue.objects.select_for_update(of=("self",))
+                .filter(status="waiting")
+                .select_related("order")
+                .only("id", "position", "added_at", "order__id", "order__order_type")
+                .order_by("added_at", "id")
+            )
 
-            # 重新排序
-            self.logger.info("重新排序隊列...")
+            if not rows:
+                self.logger.debug("隊列為空，無需重新排序")
+                return []
 
-            # 暫時清除位置
-            for queue in waiting_queues:
-                queue.position = 0
-                queue.save()
+            # 排序：快速訂單優先，然後按加入隊列時間（sort 為穩定排序）
+            rows.sort(key=lambda queue: 0 if queue.order.order_type == "quick" else 1)
 
-            # 分配新位置
-            for index, info in enumerate(queues_info, start=1):
-                queue = CoffeeQueue.objects.get(id=info["queue_id"])
+            now = timezone.now()
+            changed = []
+            moved = []
+            for index, queue in enumerate(rows, start=1):
+                if queue.position == index:
+                    continue
+                moved.append(
+                    {
+                        "queue_item_id": queue.id,
+                        "order_id": queue.order.id,
+                        "old_position": queue.position,
+                        "new_position": index,
+                    }
+                )
                 queue.position = index
-                queue.save()
+                queue.updated_at = now
+                changed.append(queue)
 
-            self.logger.info(f"隊列重新排序完成，共 {len(queues_info)} 個訂單")
-            return True
+            if not changed:
+                self.logger.debug("隊列順序正常，無需重新排序")
+                return []
 
-        except Exception as e:
-            self.logger.error(f"檢查隊列排序失敗: {str(e)}")
-            return False
+            CoffeeQueue.objects.bulk_update(changed, ["position", "updated_at"])
+            record_queue_changes(change["order_id"] for change in moved)
+            push_eta_updates(
+                {"order_id": change["order_id"], "position": change["new_position"]}
+                for change in moved
+            )
+
+        self.logger.info(
+            f"隊列重新排序完成: 共 {len(rows)} 個訂單, 移動了 {len(moved)} 個"
+        )
+        return moved
 
     # ==================== 重要方法 ====================
 
@@ -682,6 +731,7 @@ class CoffeeQueueManager:
             'message': '操作消息',
             'data': {
                 'queue_reordered': True/False,
+                'position_changes': [...],
                 'quick_s_updated': 0,
                 'urgent_s_found': 0,
                 'total_quick_s': 0,
@@ -698,7 +748,8 @@ class CoffeeQueueManager:
             self.logger.info("🔄 === 開始統一重新計算所有訂單時間 ===")
 
             # 1. 檢查並重新排序隊列
-            needs_reorder = self._check_and_reorder_queue()
+            position_changes = self._check_and_reorder_queue()
+            needs_reorder = bool(position_changes)
 
             if needs_reorder:
                 self.logger.info("✅ 隊列已重新排序，準備更新時間")
@@ -785,6 +836,7 @@ class CoffeeQueueManager:
                 "message": "時間重新計算完成",
                 "details": {
                     "queue_reordered": needs_reorder,
+                    "position_changes": position_changes,
                     "quick_s_updated": quick_s_updated,
                     "urgent_s_found": urgent_s_count,
                     "total_quick_s": quick_s.count(),
@@ -816,16 +868,27 @@ class CoffeeQueueManager:
                 model="OrderModel",
             )
 
-    def update_estimated_times(self):
+    def update_estimated_times(self, from_position=1):
         """
         更新隊列預計時間 - 使用錯誤處理框架
 
+        等待中的隊列項按 added_at 順序串聯計算：每一項的開始時間是前面
+        所有項製作時間的累計。累計值由資料庫窗口函數
+        SUM(preparation_time_minutes) OVER (ORDER BY added_at) 一次算出，
+        只有時間真正改變的行才以一次 bulk_update 寫回。
+
+        Args:
+            from_position: 從第幾個等待項（按 added_at 排序，從 1 開始）
+                開始重新計算。大於 1 時，前面的項保持不變，第 k 項從第 k-1
+                項已保存的預計完成時間接續計算（不早於當前時間）。
+
         返回格式:
         {
             'success': True/False,
             'message': '操作消息',
             'data': {
                 'waiting_s_updated': 0,
+                'from_position': 1,
                 'current_time': '...',
                 'total_preparation_minutes': 0,
                 'timestamp': '...'
@@ -837,28 +900,27 @@ class CoffeeQueueManager:
         """
         try:
             current_time = unified_time_service.get_hong_kong_time()
-            waiting_queues = CoffeeQueue.objects.filter(status="waiting").order_by(
-                "added_at"
-            )
-
-            cumulative_time = timedelta(minutes=0)
-            waiting_s_updated = 0
-            total_preparation_minutes = 0
-
-            for queue in waiting_queues:
-                estimated_start = current_time + cumulative_time
-                queue.estimated_start_time = estimated_start
+            from_position = max(int(from_position or 1), 1)
 
-                prep_time = timedelta(minutes=queue.preparation_time_minutes)
-                queue.estimated_completion_time = estimated_start + prep_time
+            store = get_queue_state_store()
+            if store is not None:
+                # 啟用隊列狀態存儲時在內存中計算，時間由存儲延遲寫回
+                computed = store.update_estimated_times(current_time, from_position)
+            else:
+                computed = self._update_estimated_times_in_db(
+                    current_time, from_position
+                )
 
-                queue.save()
-                cumulative_time += prep_time
-                waiting_s_updated += 1
-                total_preparation_minutes += queue.preparation_time_minutes
+            if computed is None:
+                self.logger.debug(
+                    f"第 {from_position - 1} 項沒有預計完成時間，改為完整重新計算"
+                )
+                return self.update_estimated_times()
+            waiting_s_updated, total_preparation_minutes = computed
 
             self.logger.info(
                 f"⏰ 更新隊列預計時間完成: "
+                f"從第 {from_position} 項開始, "
                 f"更新了 {waiting_s_updated} 個等待訂單, "
                 f"總製作時間: {total_preparation_minutes} 分鐘"
             )
@@ -867,6 +929,7 @@ class CoffeeQueueManager:
                 operation="update_estimated_times",
                 data={
                     "waiting_s_updated": waiting_s_updated,
+                    "from_position": from_position,
                     "current_time": current_time.isoformat(),
                     "total_preparation_minutes": total_preparation_minutes,
                     "timestamp": current_time.isoformat(),
@@ -884,6 +947,107 @@ class CoffeeQueueManager:
                 model="CoffeeQueue",
             )
 
+    def _update_estimated_times_in_db(self, current_time, from_position):
+        """
+        以窗口函數計算等待項預計時間並寫回資料庫
+
+        Returns:
+            tuple: (更新的項數, 總製作分鐘數)，錨點缺少預計完成時間時返回 None
+        """
+        window_order = [F("added_at").asc(), F("id").asc()]
+        waiting_queues = (
+            CoffeeQueue.objects.filter(status="waiting")
+            .annotate(
+                queue_rank=Window(RowNumber(), order_by=window_order),
+                cumulative_minutes=Window(
+                    Sum("preparation_time_minutes"), order_by=window_order
+                ),
+            )
+            .filter(queue_rank__gte=from_position - 1)
+            .only(
+                "id",
+                "order_id",
+                "position",
+                "preparation_time_minutes",
+                "estimated_start_time",
+                "estimated_completion_time",
+            )
+            .order_by("added_at", "id")
+        )
+        rows = list(waiting_queues)
+
+        # 第 k-1 項作為錨點：從它已保存的預計完成時間接續
+        base_time = current_time
+        base_minutes = 0
+        total_preparation_minutes = rows[-1].cumulative_minutes if rows else 0
+        if from_position > 1 and rows and rows[0].queue_rank < from_position:
+            anchor = rows.pop(0)
+            if not anchor.estimated_completion_time:
+                return None
+            base_time = max(anchor.estimated_completion_time, current_time)
+            base_minutes = anchor.cumulative_minutes
+
+        now = timezone.now()
+        changed = []
+        for queue in rows:
+            offset = queue.cumulative_minutes - base_minutes
+            estimated_start = base_time + timedelta(
+                minutes=offset - queue.preparation_time_minutes
+            )
+            estimated_completion = base_time + timedelta(minutes=offset)
+
+            if (
+                queue.estimated_start_time == estimated_start
+                and queue.estimated_completion_time == estimated_completion
+            ):
+                continue
+
+            queue.estimated_start_time = estimated_start
+            queue.estimated_completion_time = estimated_completion
+            queue.updated_at = now
+            changed.append(queue)
+
+        if changed:
+            CoffeeQueue.objects.bulk_update(
+                changed,
+                ["estimated_start_time", "estimated_completion_time", "updated_at"],
+            )
+            record_queue_changes(queue.order_id for queue in changed)
+            push_eta_updates(
+                {
+                    "order_id": queue.order_id,
+                    "position": queue.position,
+                    "estimated_completion_time": queue.estimated_completion_time,
+                }
+                for queue in changed
+            )
+        return len(changed), total_preparation_minutes
+
+    def update_estimated_times_from(self, queue_item):
+        """
+        只重新計算某個等待項及其之後的預計時間
+
+        用於隊列尾部的變化（例如新訂單加入），避免改寫前面所有項。
+        """
+        if queue_item.status != "waiting" or not queue_item.added_at:
+            return self.update_estimated_times()
+
+        store = get_queue_state_store()
+        if store is not None:
+            rank = store.waiting_rank(queue_item.id)
+            return self.update_estimated_times(from_position=rank or 1)
+
+        from_position = (
+            CoffeeQueue.objects.filter(status="waiting")
+            .filter(
+                Q(added_at__lt=queue_item.added_at)
+                | Q(added_at=queue_item.added_at, id__lt=queue_item.id)
+            )
+            .count()
+            + 1
+        )
+        return self.update_estimated_times(from_position=from_position)
+
     def verify_queue_integrity(self):
         """
         驗證隊列完整性 - 使用錯誤處理框架
@@ -907,6 +1071,10 @@ class CoffeeQueueManager:
         }
         """
         try:
+            store = get_queue_state_store()
+            if store is not None:
+                return self._verify_queue_integrity_from_store(store)
+
             issues = []
 
             # 檢查ready訂單位置
@@ -982,6 +1150,44 @@ class CoffeeQueueManager:
                 model="CoffeeQueue",
             )
 
+    def _verify_queue_integrity_from_store(self, store):
+        """從隊列狀態存儲驗證完整性（不查詢資料庫）"""
+        issues = []
+
+        ready_with_position = [
+            entry for entry in store.get_items("ready") if entry["position"] > 0
+        ]
+        if ready_with_position:
+            issues.append(f"發現 {len(ready_with_position)} 個ready訂單有隊列位置")
+
+        counts = store.get_counts()
+        total_count = sum(counts.values())
+        has_issues = len(issues) > 0
+
+        if has_issues:
+            self.logger.warning(f"⚠️ 隊列完整性檢查發現問題: {len(issues)} 個問題")
+            for issue in issues:
+                self.logger.warning(f"  - {issue}")
+
+        return handle_success(
+            operation="verify_queue_integrity",
+            data={
+                "has_issues": has_issues,
+                "issues": issues,
+                "waiting_count": counts["waiting"],
+                "preparing_count": counts["preparing"],
+                "ready_count": counts["ready"],
+                "total_count": total_count,
+                "source": "queue_state_store",
+                "timestamp": unified_time_service.get_hong_kong_time().isoformat(),
+            },
+            message=(
+                f"隊列完整性檢查完成，發現 {len(issues)} 個問題"
+                if has_issues
+                else "隊列完整性檢查通過"
+            ),
+        )
+
     def sync__queue_status(self):
         """
         同步訂單與隊列狀態 - 使用錯誤處理框架
@@ -1291,12 +1497,14 @@ class CoffeeQueueManager:
 
             _ = OrderModel.objects.get(id=order_id)
 
-            # 獲取智能建議
-            recommendations_result = get_recommendations_for_order(order_id)
+            # 建議和系統狀態共享同一個工作負載快照
+            with workload_snapshot():
+                # 獲取智能建議
+                recommendations_result = get_recommendations_for_order(order_id)
 
-            # 獲取系統狀態
-            allocator = get_smart_allocator()
-            system_status = allocator.get_system_status()
+                # 獲取系統狀態
+                allocator = get_smart_allocator()
+                system_status = allocator.get_system_status()
 
             # 獲取優化建議
             optimization_result = optimize_order_preparation(order_id)
@@ -1394,7 +1602,13 @@ class CoffeeQueueManager:
                 'load_balanced': True/False,
                 'recommendations_generated': 0,
                 'system_status_before': {...},
-                'system_status_after': {...}
+                'system_status_after': {...},
+                'batch_allocation': {
+                    'predicted_makespan': 批量分配的預計最後完成時間（分鐘）,
+                    'greedy_makespan': 逐個分配的預計最後完成時間（分鐘）,
+                    'improvement': 縮短的分鐘數,
+                    ...
+                }
             },
             'details': {...},
             'timestamp': '...',
@@ -1436,6 +1650,14 @@ class CoffeeQueueManager:
                     self.logger.error(f"優化訂單 #{queue.order.id} 失敗: {str(e)}")
                     continue
 
+            # 批量分配預測（不寫入），與逐個分配比較最後完成時間
+            batch_result = allocator.allocate_batch()
+            batch_allocation = {
+                key: value
+                for key, value in batch_result.items()
+                if key != "assignments"
+            }
+
             # 獲取優化後的系統狀態
             system_status_after = allocator.get_system_status()
 
@@ -1459,6 +1681,7 @@ class CoffeeQueueManager:
                 "system_status_before": system_status_before,
                 "system_status_after": system_status_after,
                 "total_waiting_s": waiting_queues.count(),
+                "batch_allocation": batch_allocation,
             }
 
             self.logger.info(
@@ -1467,6 +1690,11 @@ class CoffeeQueueManager:
                 f"節省 {total_time_savings:.1f} 分鐘, "
                 f"負載均衡: {'是' if load_balanced else '否'}"
             )
+            if batch_result.get("success"):
+                self.logger.info(
+                    f"📦 批量分配預測: {batch_result['predicted_makespan']} 分鐘 "
+                    f"(逐個分配: {batch_result['greedy_makespan']} 分鐘)"
+                )
 
             return handle_success(
                 operation="optimize_queue_with_smart_allocation",
@@ -0,0 +1,203 @@
+# eshop/queue_scheduler.py
+"""
+隊列時間重新計算調度器
+
+員工連續點擊「開始製作」等操作時，每次都開線程執行 update_estimated_times
+會讓多個線程同時改寫相同的隊列行，並各自佔用資料庫連線。
+
+這個模塊提供進程內唯一的調度器：
+1. 在合併窗口（預設 200ms）內的請求合併為一次執行
+2. 同一時間最多只有一次重新計算在執行
+3. 每次執行後只發送一次 queue_updates 廣播
+4. 記錄請求、合併、執行次數
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger("eshop.queue_scheduler")
+
+# 單次廣播中保留的觸發原因數量上限
+MAX_REASONS_PER_RUN = 20
+
+
+class QueueRecalculationScheduler:
+    """隊列重新計算調度器 - 合併請求並串行執行"""
+
+    def __init__(self, window_ms=None):
+        if window_ms is None:
+            window_ms = getattr(settings, "QUEUE_RECALC_WINDOW_MS", 200)
+        self.window_seconds = max(window_ms, 0) / 1000.0
+
+        self._condition = threading.Condition()
+        self._worker = None
+        self._pending = False
+        self._running = False
+        self._full = False
+        self._reasons = []
+        self._order_ids = set()
+
+        self.stats = {
+            "requested": 0,  # 收到的請求數
+            "coalesced": 0,  # 併入已排程執行的請求數
+            "executed": 0,  # 實際執行次數
+            "failed": 0,  # 執行失敗次數
+            "last_run_at": None,
+            "last_duration_ms": None,
+        }
+
+    def request_recalculation(self, reason="", order_id=None, full=False):
+        """
+        請求一次隊列時間重新計算（不阻塞）
+
+        在事務提交後才排程，確保工作線程讀到已提交的資料。
+
+        Args:
+            reason: 觸發原因，會出現在合併後的廣播中
+            order_id: 觸發的訂單ID（可選）
+            full: True 執行 recalculate_all__times，否則只執行 update_estimated_times
+        """
+        transaction.on_commit(lambda: self._enqueue(reason, order_id, full))
+        return True
+
+    def _enqueue(self, reason, order_id, full):
+        with self._condition:
+            self.stats["requested"] += 1
+            if self._pending:
+                self.stats["coalesced"] += 1
+
+            self._pending = True
+            self._full = self._full or full
+            if reason and len(self._reasons) < MAX_REASONS_PER_RUN:
+                self._reasons.append(reason)
+            if order_id is not None:
+                self._order_ids.add(order_id)
+
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run_loop, name="queue-recalculation", daemon=True
+                )
+                self._worker.start()
+
+            self._condition.notify_all()
+
+    def _run_loop(self):
+        """工作線程：等待請求，經過合併窗口後執行一次"""
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+            # 合併窗口內到達的請求併入本次執行
+            time.sleep(self.window_seconds)
+
+            with self._condition:
+                full = self._full
+                reasons = self._reasons
+                order_ids = sorted(self._order_ids)
+                self._pending = False
+                self._full = False
+                self._reasons = []
+                self._order_ids = set()
+                self._running = True
+
+            try:
+                self._execute(full, reasons, order_ids)
+            finally:
+                with self._condition:
+                    self._running = False
+                    self._condition.notify_all()
+
+    def _execute(self, full, reasons, order_ids):
+        """執行重新計算並發送一次合併廣播"""
+        from .queue_manager_refactored import CoffeeQueueManager
+        from .websocket_utils import send_queue_update
+
+        started = time.monotonic()
+        try:
+            queue_manager = CoffeeQueueManager()
+            if full:
+                result = queue_manager.recalculate_all__times()
+            else:
+                result = queue_manager.update_estimated_times()
+
+            duration_ms = round((time.monotonic() - started) * 1000, 1)
+            with self._condition:
+                self.stats["executed"] += 1
+                self.stats["last_run_at"] = timezone.now().isoformat()
+                self.stats["last_duration_ms"] = duration_ms
+
+            send_queue_update(
+                update_type="queue_recalculated",
+                data={
+                    "full": full,
+                    "success": result.get("success", False),
+                    "reasons": reasons,
+                    "order_ids": order_ids,
+                    "duration_ms": duration_ms,
+                    "timestamp": timezone.now().isoformat(),
+                },
+            )
+            logger.info(
+                f"⏰ 隊列重新計算完成: {'完整' if full else '預計時間'}, "
+                f"合併了 {len(reasons)} 個原因, 耗時 {duration_ms}ms"
+            )
+
+        except Exception as e:
+            with self._condition:
+                self.stats["failed"] += 1
+            logger.error(f"❌ 隊列重新計算失敗: {str(e)}", exc_info=True)
+        finally:
+            # 不在兩次執行之間佔用資料庫連線
+            connection.close()
+
+    def wait_until_idle(self, timeout=5.0):
+        """等待所有已排程的重新計算完成（供管理命令和測試使用）"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def get_stats(self):
+        """獲取調度器統計"""
+        with self._condition:
+            stats = dict(self.stats)
+            stats["pending"] = self._pending
+            stats["running"] = self._running
+
+        executed_or_pending = stats["requested"] - stats["coalesced"]
+        stats["coalesce_ratio"] = (
+            round(stats["requested"] / executed_or_pending, 2)
+            if executed_or_pending
+            else 0
+        )
+        stats["window_ms"] = int(self.window_seconds * 1000)
+        return stats
+
+
+# 全局實例
+_queue_scheduler = None
+
+
+def get_queue_scheduler():
+    """獲取隊列重新計算調度器實例"""
+    global _queue_scheduler
+    if _queue_scheduler is None:
+        _queue_scheduler = QueueRecalculationScheduler()
+    return _queue_scheduler
+
+
+def request_queue_recalculation(reason="", order_id=None, full=False):
+    """請求隊列重新計算（便捷函數）"""
+    return get_queue_scheduler().request_recalculation(
+        reason=reason, order_id=order_id, full=full
+    )
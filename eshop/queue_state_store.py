@@ -0,0 +1,679 @@
+# eshop/queue_state_store.py
+"""
+隊列狀態存儲 - 內存權威狀態 + 延遲寫回
+
+隊列的讀取路徑（完整性檢查、員工負載、重新排序、預計時間）每次都重新
+查詢 CoffeeQueue 和 OrderModel。啟用 QUEUE_STATE_STORE_ENABLED 後：
+
+1. 進程內保存 waiting / preparing / ready 三個有序集合
+   （CHANNEL_LAYERS 使用 channels_redis 時改用 Redis 有序集合，多進程共享）
+2. 首次使用時從資料庫載入，之後由 CoffeeQueue 保存信號（在
+   EshopConfig.ready() 中連接）和 CoffeeQueueManager 的操作更新
+3. 位置和預計時間等可重新計算的欄位先寫入存儲，由後台線程批量寫回
+4. 定期對賬：以資料庫為準，修正存儲中的差異並記錄
+
+狀態變更（開始製作、就緒、取消）仍然直接寫入資料庫，存儲只跟隨。
+
+內存存儲只在單進程部署中使用：QUEUE_STATE_STORE_PROCESSES（默認讀取
+WEB_CONCURRENCY）大於 1 且沒有 Redis 時不啟用存儲，各進程直接查詢資料庫，
+避免每個進程各自延遲寫回而互相覆蓋。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+logger = logging.getLogger("eshop.queue_state_store")
+
+# 存儲中保留的隊列狀態
+LIVE_STATUSES = ("waiting", "preparing", "ready")
+
+# 每個隊列項保存的欄位
+DATETIME_FIELDS = (
+    "added_at",
+    "estimated_start_time",
+    "estimated_completion_time",
+    "actual_start_time",
+    "actual_completion_time",
+)
+ENTRY_FIELDS = (
+    "id",
+    "order_id",
+    "order_type",
+    "status",
+    "position",
+    "coffee_count",
+    "preparation_time_minutes",
+    "barista",
+) + DATETIME_FIELDS
+
+
+def _waiting_sort_key(entry):
+    """等待隊列排序：快速訂單優先，然後按加入時間"""
+    return (
+        0 if entry["order_type"] == "quick" else 1,
+        entry["added_at"] or timezone.now(),
+        entry["id"],
+    )
+
+
+def _added_sort_key(entry):
+    """按加入時間排序（預計時間的串聯順序）"""
+    return (entry["added_at"] or timezone.now(), entry["id"])
+
+
+class QueueStateStore:
+    """進程內隊列狀態存儲"""
+
+    backend = "memory"
+
+    def __init__(self, flush_interval_ms=None, reconcile_interval_seconds=None):
+        if flush_interval_ms is None:
+            flush_interval_ms = getattr(settings, "QUEUE_STATE_FLUSH_INTERVAL_MS", 500)
+        if reconcile_interval_seconds is None:
+            reconcile_interval_seconds = getattr(
+                settings, "QUEUE_STATE_RECONCILE_INTERVAL_SECONDS", 300
+            )
+        self.flush_interval_seconds = max(flush_interval_ms, 0) / 1000.0
+        self.reconcile_interval_seconds = reconcile_interval_seconds
+
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._dirty = {}  # queue_item_id -> 待寫回欄位集合
+        self._loaded = False
+        self._flusher = None
+        self._stop_event = threading.Event()
+
+        self.stats = {
+            "loads": 0,
+            "flushes": 0,
+            "rows_flushed": 0,
+            "reconciles": 0,
+            "last_reconcile_differences": 0,
+            "last_flush_at": None,
+            "last_reconcile_at": None,
+        }
+
+    # ==================== 存儲原語（Redis 後端覆寫） ====================
+
+    def _all_entries(self):
+        return list(self._entries.values())
+
+    def _get_entry(self, queue_item_id):
+        entry = self._entries.get(queue_item_id)
+        return dict(entry) if entry else None
+
+    def _put_entries(self, entries):
+        for entry in entries:
+            self._entries[entry["id"]] = dict(entry)
+
+    def _delete_entries(self, queue_item_ids):
+        for queue_item_id in queue_item_ids:
+            self._entries.pop(queue_item_id, None)
+
+    def _replace_all(self, entries):
+        self._entries = {entry["id"]: dict(entry) for entry in entries}
+
+    # ==================== 載入和更新 ====================
+
+    @staticmethod
+    def entry_from_instance(queue_item, order_type=None):
+        """將 CoffeeQueue 實例轉換為存儲項"""
+        if order_type is None:
+            order = queue_item._state.fields_cache.get("order")
+            order_type = getattr(order, "order_type", None)
+        entry = {
+            "id": queue_item.id,
+            "order_id": queue_item.order_id,
+            "order_type": order_type or "normal",
+            "status": queue_item.status,
+            "position": queue_item.position,
+            "coffee_count": queue_item.coffee_count,
+            "preparation_time_minutes": queue_item.preparation_time_minutes,
+            "barista": queue_item.barista,
+        }
+        for field in DATETIME_FIELDS:
+            entry[field] = getattr(queue_item, field)
+        return entry
+
+    def _fetch_from_db(self):
+        """一次查詢讀取所有在隊列中的項"""
+        from .models import CoffeeQueue
+
+        rows = (
+            CoffeeQueue.objects.filter(status__in=LIVE_STATUSES)
+            .select_related("order")
+            .only(
+                "id",
+                "order__id",
+                "order__order_type",
+                "status",
+                "position",
+                "coffee_count",
+                "preparation_time_minutes",
+                "barista",
+                *DATETIME_FIELDS,
+            )
+        )
+        return [
+            self.entry_from_instance(queue, order_type=queue.order.order_type)
+            for queue in rows
+        ]
+
+    def load(self):
+        """從資料庫載入所有在隊列中的項（覆蓋存儲內容）"""
+        self.flush()
+        entries = self._fetch_from_db()
+        with self._lock:
+            self._replace_all(entries)
+            self._loaded = True
+            self.stats["loads"] += 1
+
+        logger.info(f"📥 隊列狀態存儲已載入: {len(entries)} 個隊列項 ({self.backend})")
+        self._ensure_flusher()
+        return len(entries)
+
+    def ensure_loaded(self):
+        if not self._loaded:
+            self.load()
+
+    def upsert(self, entry):
+        """寫入一個隊列項（來自資料庫寫入，覆蓋未寫回的欄位）"""
+        with self._lock:
+            self._dirty.pop(entry["id"], None)
+            if entry["status"] in LIVE_STATUSES:
+                self._put_entries([entry])
+            else:
+                self._delete_entries([entry["id"]])
+
+    def discard(self, queue_item_id):
+        with self._lock:
+            self._dirty.pop(queue_item_id, None)
+            self._delete_entries([queue_item_id])
+
+    # ==================== 讀取 ====================
+
+    def get_entry(self, queue_item_id):
+        self.ensure_loaded()
+        with self._lock:
+            return self._get_entry(queue_item_id)
+
+    def get_items(self, status, barista=None):
+        """
+        獲取某個狀態的隊列項（已排序的副本）
+
+        waiting 按隊列位置規則排序，其他狀態按加入時間排序。
+        """
+        self.ensure_loaded()
+        with self._lock:
+            entries = [
+                dict(entry)
+                for entry in self._all_entries()
+                if entry["status"] == status
+                and (barista is None or entry["barista"] == barista)
+            ]
+        entries.sort(key=_waiting_sort_key if status == "waiting" else _added_sort_key)
+        return entries
+
+    def get_counts(self):
+        self.ensure_loaded()
+        counts = dict.fromkeys(LIVE_STATUSES, 0)
+        with self._lock:
+            for entry in self._all_entries():
+                counts[entry["status"]] += 1
+        return counts
+
+    def get_barista_loads(self):
+        """每位員工正在製作的咖啡杯數"""
+        loads = {}
+        for entry in self.get_items("preparing"):
+            if entry["barista"]:
+                loads[entry["barista"]] = (
+                    loads.get(entry["barista"], 0) + entry["coffee_count"]
+                )
+        return loads
+
+    def waiting_rank(self, queue_item_id):
+        """等待項按 added_at 的排名（從 1 開始），不在等待隊列返回 None"""
+        waiting = sorted(self.get_items("waiting"), key=_added_sort_key)
+        for rank, entry in enumerate(waiting, start=1):
+            if entry["id"] == queue_item_id:
+                return rank
+        return None
+
+    # ==================== 內存計算（延遲寫回） ====================
+
+    def _mark_dirty(self, entries, fields):
+        self._put_entries(entries)
+        for entry in entries:
+            self._dirty.setdefault(entry["id"], set()).update(fields)
+
+    def reorder_waiting(self):
+        """
+        在存儲中重新排序等待隊列，返回與
+        CoffeeQueueManager.reorder_waiting_queue 相同格式的差異
+        """
+        from .order_eta import push_eta_updates
+
+        self.ensure_loaded()
+        with self._lock:
+            waiting = self.get_items("waiting")
+            moved = []
+            changed = []
+            for index, entry in enumerate(waiting, start=1):
+                if entry["position"] == index:
+                    continue
+                moved.append(
+                    {
+                        "queue_item_id": entry["id"],
+                        "order_id": entry["order_id"],
+                        "old_position": entry["position"],
+                        "new_position": index,
+                    }
+                )
+                entry["position"] = index
+                changed.append(entry)
+            self._mark_dirty(changed, ["position"])
+
+        if moved:
+            logger.debug(f"存儲內重新排序: 移動了 {len(moved)} 個等待項")
+            push_eta_updates(
+                {"order_id": change["order_id"], "position": change["new_position"]}
+                for change in moved
+            )
+        return moved
+
+    def update_estimated_times(self, current_time, from_position=1):
+        """
+        在存儲中串聯計算等待項預計時間（規則同
+        CoffeeQueueManager.update_estimated_times）
+
+        Returns:
+            tuple: (更新的項數, 總製作分鐘數)，錨點缺少完成時間時返回 None
+        """
+        from .order_eta import push_eta_updates
+
+        self.ensure_loaded()
+        with self._lock:
+            waiting = sorted(self.get_items("waiting"), key=_added_sort_key)
+            total_minutes = sum(entry["preparation_time_minutes"] for entry in waiting)
+
+            base_time = current_time
+            start_index = 0
+            if from_position > 1 and len(waiting) >= from_position - 1:
+                anchor = waiting[from_position - 2]
+                if not anchor["estimated_completion_time"]:
+                    return None
+                base_time = max(anchor["estimated_completion_time"], current_time)
+                start_index = from_position - 1
+
+            changed = []
+            for entry in waiting[start_index:]:
+                estimated_start = base_time
+                base_time = base_time + timedelta(
+                    minutes=entry["preparation_time_minutes"]
+                )
+                if (
+                    entry["estimated_start_time"] == estimated_start
+                    and entry["estimated_completion_time"] == base_time
+                ):
+                    continue
+                entry["estimated_start_time"] = estimated_start
+                entry["estimated_completion_time"] = base_time
+                changed.append(entry)
+            self._mark_dirty(
+                changed, ["estimated_start_time", "estimated_completion_time"]
+            )
+
+        push_eta_updates(
+            {
+                "order_id": entry["order_id"],
+                "position": entry["position"],
+                "estimated_completion_time": entry["estimated_completion_time"],
+            }
+            for entry in changed
+        )
+        return len(changed), total_minutes
+
+    # ==================== 寫回和對賬 ====================
+
+    def flush(self):
+        """將延遲的欄位批量寫回資料庫，返回寫回的行數"""
+        from .models import CoffeeQueue
+        from .queue_changes import record_queue_changes
+
+        with self._lock:
+            if not self._dirty:
+                return 0
+            dirty, self._dirty = self._dirty, {}
+            snapshots = {
+                queue_item_id: self._get_entry(queue_item_id) for queue_item_id in dirty
+            }
+
+        # 按欄位組合分組，每組一次 bulk_update
+        groups = {}
+        now = timezone.now()
+        for queue_item_id, fields in dirty.items():
+            entry = snapshots.get(queue_item_id)
+            if not entry:
+                continue
+            instance = CoffeeQueue(id=queue_item_id, updated_at=now)
+            for field in fields:
+                setattr(instance, field, entry[field])
+            groups.setdefault(tuple(sorted(fields)), []).append(instance)
+
+        try:
+            with transaction.atomic():
+                for fields, instances in groups.items():
+                    CoffeeQueue.objects.bulk_update(
+                        instances, list(fields) + ["updated_at"]
+                    )
+                record_queue_changes(
+                    entry["order_id"] for entry in snapshots.values() if entry
+                )
+        except Exception:
+            # 寫回失敗時恢復髒標記，下次再試（已被新狀態覆蓋的項除外）
+            with self._lock:
+                for queue_item_id, fields in dirty.items():
+                    self._dirty.setdefault(queue_item_id, set()).update(fields)
+            raise
+
+        rows = sum(len(instances) for instances in groups.values())
+        with self._lock:
+            self.stats["flushes"] += 1
+            self.stats["rows_flushed"] += rows
+            self.stats["last_flush_at"] = now.isoformat()
+        return rows
+
+    def reconcile(self):
+        """
+        與資料庫對賬：先寫回未提交的欄位，再以資料庫為準覆蓋存儲
+
+        Returns:
+            list: 差異列表，每項為
+            {'queue_item_id': 0, 'field': '...', 'store': ..., 'db': ...}
+        """
+        self.flush()
+        db_entries = {entry["id"]: entry for entry in self._fetch_from_db()}
+
+        differences = []
+        with self._lock:
+            store_entries = {entry["id"]: entry for entry in self._all_entries()}
+            for queue_item_id in store_entries.keys() | db_entries.keys():
+                store_entry = store_entries.get(queue_item_id)
+                db_entry = db_entries.get(queue_item_id)
+                if store_entry is None or db_entry is None:
+                    differences.append(
+                        {
+                            "queue_item_id": queue_item_id,
+                            "field": "*",
+                            "store": "present" if store_entry else "missing",
+                            "db": "present" if db_entry else "missing",
+                        }
+                    )
+                    continue
+                for field in ENTRY_FIELDS:
+                    if store_entry.get(field) != db_entry.get(field):
+                        differences.append(
+                            {
+                                "queue_item_id": queue_item_id,
+                                "field": field,
+                                "store": store_entry.get(field),
+                                "db": db_entry.get(field),
+                            }
+                        )
+
+            self._replace_all(db_entries.values())
+            self._loaded = True
+            self.stats["reconciles"] += 1
+            self.stats["last_reconcile_differences"] = len(differences)
+            self.stats["last_reconcile_at"] = timezone.now().isoformat()
+
+        if differences:
+            logger.warning(
+                f"⚠️ 隊列狀態對賬發現 {len(differences)} 個差異，已以資料庫為準"
+            )
+        else:
+            logger.debug("✅ 隊列狀態對賬一致")
+        return differences
+
+    def _ensure_flusher(self):
+        if not self.flush_interval_seconds:
+            return
+        with self._lock:
+            if self._flusher is None or not self._flusher.is_alive():
+                self._stop_event.clear()
+                self._flusher = threading.Thread(
+                    target=self._flush_loop, name="queue-state-flusher", daemon=True
+                )
+                self._flusher.start()
+
+    def _flush_loop(self):
+        """後台線程：定期寫回，並按間隔對賬"""
+        last_reconcile = time.monotonic()
+        while not self._stop_event.wait(self.flush_interval_seconds):
+            try:
+                self.flush()
+                if (
+                    self.reconcile_interval_seconds
+                    and time.monotonic() - last_reconcile
+                    >= self.reconcile_interval_seconds
+                ):
+                    self.reconcile()
+                    last_reconcile = time.monotonic()
+            except Exception as e:
+                logger.error(f"❌ 隊列狀態寫回失敗: {str(e)}", exc_info=True)
+            finally:
+                connection.close()
+
+    def stop(self):
+        """停止後台寫回線程（先寫回剩餘欄位）"""
+        self._stop_event.set()
+        self.flush()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["dirty"] = len(self._dirty)
+            stats["loaded"] = self._loaded
+        stats["backend"] = self.backend
+        stats["counts"] = self.get_counts() if self._loaded else {}
+        return stats
+
+
+class RedisQueueStateStore(QueueStateStore):
+    """
+    Redis 隊列狀態存儲 - 多個進程共享同一份狀態
+
+    每個隊列項以 JSON 保存在一個 hash 中，每個狀態一個有序集合
+    （分數為加入時間戳），計數直接使用 ZCARD。延遲寫回的髒標記仍是
+    進程內的：每個進程寫回自己計算出的欄位。
+    """
+
+    backend = "redis"
+
+    def __init__(self, redis_url=None, key_prefix="queue_state", client=None, **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(redis_url)
+        self.redis = client
+        self.items_key = f"{key_prefix}:items"
+        self.status_key = f"{key_prefix}:status:" + "{}"
+
+    @staticmethod
+    def _encode(entry):
+        data = dict(entry)
+        for field in DATETIME_FIELDS:
+            if data.get(field):
+                data[field] = data[field].isoformat()
+        return json.dumps(data)
+
+    @staticmethod
+    def _decode(raw):
+        data = json.loads(raw)
+        for field in DATETIME_FIELDS:
+            if data.get(field):
+                data[field] = parse_datetime(data[field])
+        return data
+
+    def _score(self, entry):
+        return entry["added_at"].timestamp() if entry["added_at"] else 0
+
+    def _all_entries(self):
+        return [self._decode(raw) for raw in self.redis.hvals(self.items_key)]
+
+    def _get_entry(self, queue_item_id):
+        raw = self.redis.hget(self.items_key, queue_item_id)
+        return self._decode(raw) if raw else None
+
+    def _put_entries(self, entries):
+        if not entries:
+            return
+        pipe = self.redis.pipeline()
+        for entry in entries:
+            pipe.hset(self.items_key, entry["id"], self._encode(entry))
+            for status in LIVE_STATUSES:
+                if status == entry["status"]:
+                    pipe.zadd(
+                        self.status_key.format(status),
+                        {entry["id"]: self._score(entry)},
+                    )
+                else:
+                    pipe.zrem(self.status_key.format(status), entry["id"])
+        pipe.execute()
+
+    def _delete_entries(self, queue_item_ids):
+        if not queue_item_ids:
+            return
+        pipe = self.redis.pipeline()
+        pipe.hdel(self.items_key, *queue_item_ids)
+        for status in LIVE_STATUSES:
+            pipe.zrem(self.status_key.format(status), *queue_item_ids)
+        pipe.execute()
+
+    def _replace_all(self, entries):
+        pipe = self.redis.pipeline()
+        pipe.delete(
+            self.items_key,
+            *[self.status_key.format(status) for status in LIVE_STATUSES],
+        )
+        pipe.execute()
+        self._put_entries(list(entries))
+
+    def get_counts(self):
+        self.ensure_loaded()
+        pipe = self.redis.pipeline()
+        for status in LIVE_STATUSES:
+            pipe.zcard(self.status_key.format(status))
+        return dict(zip(LIVE_STATUSES, pipe.execute()))
+
+
+# ==================== 信號：跟隨資料庫寫入 ====================
+
+
+def _on_queue_saved(sender, instance, **kwargs):
+    store = _queue_state_store
+    if store is None:
+        return
+    entry = QueueStateStore.entry_from_instance(instance)
+    if entry["status"] in LIVE_STATUSES and not instance._state.fields_cache.get(
+        "order"
+    ):
+        # 沒有已緩存的訂單時保留存儲中已知的訂單類型
+        existing = store._get_entry(instance.id)
+        if existing:
+            entry["order_type"] = existing["order_type"]
+    # 立即寫入，讓同一事務內的後續計算能看到新隊列項；
+    # 事務回滾留下的差異由定期對賬修正
+    store.upsert(entry)
+
+
+def _on_queue_deleted(sender, instance, **kwargs):
+    store = _queue_state_store
+    if store is None:
+        return
+    store.discard(instance.id)
+
+
+def connect_signals():
+    """隊列項保存 / 刪除時同步存儲（由 EshopConfig.ready() 調用）"""
+    from .models import CoffeeQueue
+
+    post_save.connect(
+        _on_queue_saved, sender=CoffeeQueue, dispatch_uid="queue_state_store_save"
+    )
+    post_delete.connect(
+        _on_queue_deleted,
+        sender=CoffeeQueue,
+        dispatch_uid="queue_state_store_delete",
+    )
+
+
+def _redis_url_from_channel_layers():
+    """CHANNEL_LAYERS 使用 channels_redis 時返回其 Redis 地址"""
+    layer = getattr(settings, "CHANNEL_LAYERS", {}).get("default", {})
+    if "channels_redis" not in layer.get("BACKEND", ""):
+        return None
+    hosts = layer.get("CONFIG", {}).get("hosts") or []
+    if not hosts or not isinstance(hosts[0], str):
+        return None
+    return hosts[0]
+
+
+def _configured_processes():
+    """部署的 Web 進程數（QUEUE_STATE_STORE_PROCESSES，默認 WEB_CONCURRENCY）"""
+    processes = getattr(settings, "QUEUE_STATE_STORE_PROCESSES", None)
+    if processes is None:
+        processes = os.environ.get("WEB_CONCURRENCY") or 1
+    try:
+        return int(processes)
+    except (TypeError, ValueError):
+        return 1
+
+
+# 全局實例
+_queue_state_store = None
+_memory_store_refused = False
+
+
+def get_queue_state_store():
+    """
+    獲取隊列狀態存儲實例
+
+    未設置 QUEUE_STATE_STORE_ENABLED，或多進程部署沒有可用的 Redis 時
+    返回 None，調用方應回退到資料庫查詢。
+    """
+    global _queue_state_store, _memory_store_refused
+    if not getattr(settings, "QUEUE_STATE_STORE_ENABLED", False):
+        return None
+
+    if _queue_state_store is None and not _memory_store_refused:
+        redis_url = _redis_url_from_channel_layers()
+        if redis_url:
+            try:
+                _queue_state_store = RedisQueueStateStore(redis_url)
+            except Exception as e:
+                logger.warning(f"⚠️ Redis 隊列狀態存儲不可用，改用內存: {str(e)}")
+        if _queue_state_store is None:
+            processes = _configured_processes()
+            if processes > 1:
+                # 各進程的內存存儲互不可見，延遲寫回會以過期的位置覆蓋其他進程
+                _memory_store_refused = True
+                logger.warning(
+                    f"⚠️ {processes} 個進程沒有共享的 Redis，不啟用內存隊列狀態存儲，"
+                    f"改為直接查詢資料庫"
+                )
+            else:
+                _queue_state_store = QueueStateStore()
+    return _queue_state_store
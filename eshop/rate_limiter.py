@@ -0,0 +1,352 @@
+# eshop/rate_limiter.py
+"""
+速率限制 - 令牌桶，跨進程共享
+
+每個 (策略, 識別符) 一個令牌桶：容量為策略的 limit，每秒補充
+limit / (window_minutes * 60) 個令牌，每次請求消耗一個。只保存
+(令牌數, 上次補充時間) 兩個值，檢查為 O(1)，記憶體不隨請求數增長。
+
+後端：
+- Redis：默認緩存為 django-redis 時使用其連線，否則使用 channels_redis
+  的地址；桶的讀取、補充和扣減在一段 Lua 腳本中原子執行，所有 daphne
+  進程共享同一個桶
+- 本地：沒有 Redis（開發環境）或 Redis 出錯時使用進程內的有界 LRU 字典
+
+策略來自 SecurityConfig.get_rate_limit_config；RateLimitMiddleware 按
+RATE_LIMIT_RULES 的路徑前綴套用策略，rate_limit 裝飾器用於單個視圖。
+"""
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "rate_limit"
+
+# (路徑前綴, 策略, 方法)；按順序匹配第一條，策略為 None 表示不限制
+DEFAULT_RULES = (
+    # 支付網關的回調不是用戶請求
+    ("/eshop/payment/alipay/notify/", None, None),
+    ("/eshop/payment/alipay/callback/", None, None),
+    ("/eshop/payment/paypal/callback/", None, None),
+    ("/accounts/login/", "auth", ("POST",)),
+    ("/accounts/signup/", "auth", ("POST",)),
+    ("/accounts/password/reset/", "auth", ("POST",)),
+    ("/eshop/payment/", "payment", ("GET", "POST")),
+    ("/eshop/order/", "order", ("POST",)),
+)
+
+# KEYS[1]: 桶；ARGV: 容量, 每毫秒補充的令牌數, 當前毫秒, 過期毫秒
+# 返回 {是否允許, 剩餘令牌（放大1000倍取整）}
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(bucket[1])
+local updated = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+    updated = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return {allowed, math.floor(tokens * 1000)}
+"""
+
+
+class LocalTokenBuckets:
+    """進程內令牌桶（開發環境及 Redis 不可用時的後備）"""
+
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys or getattr(
+            settings, "RATE_LIMIT_LOCAL_MAX_KEYS", 10000
+        )
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, now):
+        """消耗一個令牌，返回 (是否允許, 剩餘令牌)"""
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = capacity
+            else:
+                tokens, updated = bucket
+                tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            # 最久未使用的桶先淘汰（淘汰的桶相當於已補滿）
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RateLimiter:
+    """令牌桶速率限制器"""
+
+    def __init__(self, redis_client=None):
+        self.local = LocalTokenBuckets()
+        self._redis = redis_client
+        self._script = None
+        self.stats = {
+            "checks": 0,
+            "denied": 0,
+            "redis_errors": 0,
+        }
+
+    # ==================== 後端 ====================
+
+    def _get_redis(self):
+        """返回 Redis 客戶端，沒有配置時返回 None（結果會被緩存）"""
+        if self._redis is None:
+            self._redis = False
+            try:
+                self._redis = _configured_redis_client() or False
+            except Exception as e:
+                logger.warning(f"⚠️ 無法連接速率限制的 Redis，改用本地令牌桶: {e}")
+        return self._redis or None
+
+    @property
+    def backend(self):
+        return "redis" if self._get_redis() is not None else "local"
+
+    def _take_redis(self, client, key, capacity, rate, now):
+        if self._script is None:
+            self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        # 桶補滿所需的時間之後即可過期
+        ttl_ms = int(math.ceil(capacity / rate * 1000)) + 1000
+        allowed, tokens = self._script(
+            keys=[key], args=[capacity, rate / 1000.0, int(now * 1000), ttl_ms]
+        )
+        return bool(allowed), int(tokens) / 1000.0
+
+    # ==================== 檢查 ====================
+
+    def check(self, identifier, policy="default", limit=None, window_minutes=None):
+        """
+        消耗一個令牌
+
+        Args:
+            identifier: 識別符（用戶ID、IP地址等）
+            policy: SecurityConfig 中的速率限制策略名
+            limit / window_minutes: 覆蓋策略的設定
+
+        Returns:
+            dict: {allowed, remaining, reset_in, limit, window_minutes}
+            reset_in 為拒絕時距下一個令牌、允許時距桶補滿的秒數
+        """
+        if limit is None or window_minutes is None:
+            from .security_config import security_config
+
+            config = security_config.get_rate_limit_config(policy)
+            limit = config["limit"] if limit is None else limit
+            window_minutes = (
+                config["window_minutes"] if window_minutes is None else window_minutes
+            )
+
+        capacity = max(int(limit), 1)
+        rate = capacity / (window_minutes * 60.0)
+        key = f"{KEY_PREFIX}:{policy}:{identifier}"
+        now = time.time()
+
+        client = self._get_redis()
+        if client is not None:
+            try:
+                allowed, tokens = self._take_redis(client, key, capacity, rate, now)
+            except Exception as e:
+                self.stats["redis_errors"] += 1
+                logger.warning(f"⚠️ Redis 速率限制檢查失敗，改用本地令牌桶: {e}")
+                allowed, tokens = self.local.take(key, capacity, rate, now)
+        else:
+            allowed, tokens = self.local.take(key, capacity, rate, now)
+
+        self.stats["checks"] += 1
+        if allowed:
+            reset_in = (capacity - tokens) / rate
+        else:
+            self.stats["denied"] += 1
+            reset_in = (1 - tokens) / rate
+
+        return {
+            "allowed": allowed,
+            "remaining": int(tokens),
+            "reset_in": int(math.ceil(reset_in)),
+            "limit": capacity,
+            "window_minutes": window_minutes,
+        }
+
+    def get_stats(self):
+        return {**self.stats, "backend": self.backend}
+
+
+def _configured_redis_client():
+    """默認緩存為 django-redis 時使用其連線，否則使用 channels_redis 的地址"""
+    cache_backend = (
+        getattr(settings, "CACHES", {}).get("default", {}).get("BACKEND", "")
+    )
+    if "django_redis" in cache_backend:
+        from django_redis import get_redis_connection
+
+        return get_redis_connection("default")
+
+    from .queue_state_store import _redis_url_from_channel_layers
+
+    redis_url = _redis_url_from_channel_layers()
+    if redis_url:
+        import redis
+
+        return redis.Redis.from_url(
+            redis_url, socket_timeout=0.5, socket_connect_timeout=0.5
+        )
+    return None
+
+
+# ==================== 請求識別 ====================
+
+
+def client_ip(request):
+    """
+    客戶端 IP
+
+    RATE_LIMIT_PROXY_COUNT 為部署前面的反向代理層數：大於 0 時從
+    X-Forwarded-For 右側取對應的地址（左側的地址可以被客戶端偽造）。
+    """
+    proxy_count = getattr(settings, "RATE_LIMIT_PROXY_COUNT", 0)
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    if proxy_count and forwarded:
+        addresses = [address.strip() for address in forwarded.split(",")]
+        if len(addresses) >= proxy_count:
+            return addresses[-proxy_count]
+    return request.META.get("REMOTE_ADDR", "unknown")
+
+
+def request_identifier(request):
+    """已登入用戶按用戶ID限制，其他按 IP"""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return f"ip:{client_ip(request)}"
+
+
+def too_many_requests(request, result):
+    """429 響應（API 請求返回 JSON）"""
+    message = "請求過於頻繁，請稍後再試"
+    wants_json = (
+        "/api/" in request.path
+        or "json" in request.headers.get("Accept", "")
+        or request.headers.get("X-Requested-With") == "XMLHttpRequest"
+    )
+    if wants_json:
+        response = JsonResponse(
+            {
+                "success": False,
+                "message": message,
+                "error_code": "rate_limited",
+                "retry_after": result["reset_in"],
+            },
+            status=429,
+        )
+    else:
+        response = HttpResponse(message, status=429, content_type="text/plain")
+    response["Retry-After"] = str(result["reset_in"])
+    return response
+
+
+# ==================== 中間件和裝飾器 ====================
+
+
+class RateLimitMiddleware:
+    """按路徑前綴套用速率限制策略（員工使用 admin 策略）"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rules = getattr(settings, "RATE_LIMIT_RULES", DEFAULT_RULES)
+
+    def _match(self, request):
+        for prefix, policy, methods in self.rules:
+            if request.path.startswith(prefix):
+                if policy is None or (methods and request.method not in methods):
+                    return None
+                return policy
+        return None
+
+    def __call__(self, request):
+        if getattr(settings, "RATE_LIMIT_ENABLED", True):
+            policy = self._match(request)
+            if policy is not None:
+                user = getattr(request, "user", None)
+                if user is not None and user.is_staff:
+                    policy = "admin"
+                result = get_rate_limiter().check(request_identifier(request), policy)
+                if not result["allowed"]:
+                    logger.warning(
+                        f"🚫 速率限制: {request_identifier(request)} "
+                        f"{request.method} {request.path} (策略 {policy})"
+                    )
+                    return too_many_requests(request, result)
+        return self.get_response(request)
+
+
+def rate_limit(policy="default", methods=None, key=None):
+    """
+    視圖速率限制裝飾器
+
+    @rate_limit("payment")
+    def fps_payment(request, order_id): ...
+
+    Args:
+        policy: SecurityConfig 中的速率限制策略名
+        methods: 只限制這些 HTTP 方法（默認全部）
+        key: 自訂識別符函數 key(request) -> str（默認用戶ID或IP）
+    """
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if getattr(settings, "RATE_LIMIT_ENABLED", True) and (
+                methods is None or request.method in methods
+            ):
+                identifier = (key or request_identifier)(request)
+                result = get_rate_limiter().check(
+                    f"{view_func.__name__}:{identifier}", policy
+                )
+                if not result["allowed"]:
+                    logger.warning(f"🚫 速率限制: {identifier} {request.path}")
+                    return too_many_requests(request, result)
+            return view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# 全局實例
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    """獲取速率限制器實例"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
@@ -0,0 +1,326 @@
+# eshop/search.py
+"""
+商品搜索 - 咖啡 / 咖啡豆的排序搜索和自動補全
+
+原本的搜索視圖以 icontains 串接 OR 條件，每次全表掃描、不能排序，
+也不容忍錯字。這個模塊：
+
+1. 搜索名稱、亮點標語、產地和風味，權重依次遞減（SEARCH_FIELD_WEIGHTS）
+2. PostgreSQL：以 GIN 索引的全文搜索向量做前綴匹配和排序；安裝了 pg_trgm
+   時加上名稱的三元組相似度（容忍錯字）；中文查詢另以子串匹配補充
+   （'simple' 配置不會切分連續的中文）
+3. 其他數據庫或 PRODUCT_SEARCH_BACKEND="memory"：按商品目錄版本在進程內
+   預先建立 n-gram 索引（英文三元組、中文單字和二元組），按重疊率評分
+4. 結果為商品目錄快照中已上架的商品，按相關度排序
+5. suggest() 為自動補全提供結果，按目錄版本和查詢前綴緩存在共享緩存中
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.urls import reverse
+
+from .catalog import get_catalog
+from .models.shop_items import SEARCH_FIELD_WEIGHTS
+
+logger = logging.getLogger("eshop.search")
+
+PRODUCT_TYPES = ("coffee", "bean")
+
+# 與 PostgreSQL ts_rank 的默認權重一致（D, C, B, A = 0.1, 0.2, 0.4, 1.0）
+RANK_WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.2, "D": 0.1}
+
+MAX_QUERY_LENGTH = 50
+SUGGEST_CACHE_PREFIX = "search:suggest"
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+# 中文連續字符為一個詞，其他文字按非單詞字符分隔
+_TOKEN_RE = re.compile(f"[{_CJK}]+|[^\\W{_CJK}]+")
+
+
+def normalize_query(text):
+    """全形轉半形、不區分大小寫、合併空白，並限制長度"""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return " ".join(text.split())[:MAX_QUERY_LENGTH]
+
+
+def _is_cjk(token):
+    return re.match(f"[{_CJK}]", token) is not None
+
+
+def ngrams(text, prefix=False):
+    """
+    文字的 n-gram 集合
+
+    英文等按詞加空白前後綴取三元組（與 pg_trgm 相同）；中文取單字和二元組。
+    prefix=True 用於查詢：最後不加空白後綴，輸入到一半的詞也能匹配。
+    """
+    grams = set()
+    for token in _TOKEN_RE.findall(text):
+        if _is_cjk(token):
+            grams.update(token)
+            grams.update(token[i : i + 2] for i in range(len(token) - 1))
+        else:
+            padded = f"  {token}" if prefix else f"  {token} "
+            grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _query_grams(query):
+    """查詢的 n-gram：中文詞超過一個字時只用二元組，避免單字匹配過多"""
+    grams = set()
+    for token in _TOKEN_RE.findall(query):
+        if _is_cjk(token) and len(token) > 1:
+            grams.update(token[i : i + 2] for i in range(len(token) - 1))
+        else:
+            grams.update(ngrams(token, prefix=True))
+    return grams
+
+
+# ==================== 進程內 n-gram 索引 ====================
+
+
+class NgramIndex:
+    """某個目錄版本的 n-gram 倒排索引（只包含已上架的商品）"""
+
+    def __init__(self, snapshot):
+        self.version = snapshot.version
+        self._entries = {}
+        self._postings = {}
+        menus = {"coffee": snapshot.coffee_menu(), "bean": snapshot.bean_menu()}
+        for product_type, products in menus.items():
+            entries = self._entries[product_type] = []
+            postings = self._postings[product_type] = {}
+            for product in products:
+                if not product.is_published:
+                    continue
+                fields = []
+                for field, weight in SEARCH_FIELD_WEIGHTS:
+                    text = normalize_query(str(getattr(product, field, "") or ""))
+                    if text:
+                        fields.append((text, RANK_WEIGHTS[weight], ngrams(text)))
+                position = len(entries)
+                entries.append((product, fields))
+                for _, _, grams in fields:
+                    for gram in grams:
+                        postings.setdefault(gram, set()).add(position)
+
+    def search(self, query, product_type, limit=None):
+        """返回按相關度排序的商品列表"""
+        query = normalize_query(query)
+        query_grams = _query_grams(query)
+        if not query_grams:
+            return []
+
+        postings = self._postings.get(product_type, {})
+        candidates = set()
+        for gram in query_grams:
+            candidates.update(postings.get(gram, ()))
+
+        min_similarity = getattr(settings, "SEARCH_MIN_SIMILARITY", 0.5)
+        scored = []
+        for position in candidates:
+            product, fields = self._entries[product_type][position]
+            best = rank = 0.0
+            for text, weight, grams in fields:
+                similarity = len(query_grams & grams) / len(query_grams)
+                if query in text:
+                    similarity = 1.0
+                best = max(best, similarity)
+                rank += weight * similarity
+            if best < min_similarity:
+                continue
+            if fields and fields[0][0].startswith(query):
+                rank += 0.5
+            scored.append((-rank, product.sort_order, product.id, product))
+
+        scored.sort(key=lambda item: item[:3])
+        return [item[3] for item in scored[:limit]]
+
+
+class SearchIndexCache:
+    """按商品目錄版本重建的進程內 n-gram 索引"""
+
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = get_catalog()
+        index = self._index
+        if index is not None and index.version == snapshot.version:
+            return index
+        with self._lock:
+            if self._index is None or self._index.version != snapshot.version:
+                self._index = NgramIndex(snapshot)
+                logger.debug(f"🔎 商品搜索索引已重建: 版本 {snapshot.version}")
+            return self._index
+
+
+# 全局實例
+_search_index_cache = None
+
+
+def get_search_index():
+    """獲取當前目錄版本的 n-gram 索引"""
+    global _search_index_cache
+    if _search_index_cache is None:
+        _search_index_cache = SearchIndexCache()
+    return _search_index_cache.get()
+
+
+# ==================== PostgreSQL ====================
+
+_has_trigram = None
+
+
+def has_trigram():
+    """數據庫是否已安裝 pg_trgm（檢查一次）"""
+    global _has_trigram
+    if _has_trigram is None:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _has_trigram = cursor.fetchone() is not None
+        except DatabaseError:
+            _has_trigram = False
+    return _has_trigram
+
+
+def get_search_backend():
+    """搜索後端："postgres" 或 "memory"（PRODUCT_SEARCH_BACKEND，默認按數據庫選擇）"""
+    backend = getattr(settings, "PRODUCT_SEARCH_BACKEND", "auto")
+    if backend == "auto":
+        return "postgres" if connection.vendor == "postgresql" else "memory"
+    return backend
+
+
+def _postgres_search(query, product_type, limit=None):
+    """以全文搜索向量（和 pg_trgm）查詢，返回排序後的商品 ID"""
+    from django.contrib.postgres.search import (
+        SearchQuery,
+        SearchRank,
+        TrigramSimilarity,
+    )
+    from django.db.models import F, Q
+
+    from .models import BeanItem, CoffeeItem
+    from .models.shop_items import SEARCH_CONFIG, product_search_vector
+
+    model = {"coffee": CoffeeItem, "bean": BeanItem}[product_type]
+    tokens = _TOKEN_RE.findall(query)
+    if not tokens:
+        return []
+
+    # 每個詞都做前綴匹配（自動補全時最後一個詞通常未輸入完）
+    search_query = SearchQuery(
+        " & ".join(f"'{token}':*" for token in tokens),
+        search_type="raw",
+        config=SEARCH_CONFIG,
+    )
+    queryset = model.objects.filter(is_published=True).annotate(
+        search=product_search_vector()
+    )
+    condition = Q(search=search_query)
+    rank = SearchRank(F("search"), search_query)
+
+    if any(_is_cjk(token) for token in tokens):
+        # 'simple' 配置把連續的中文當作一個詞，詞中間的部分以子串匹配
+        for field, _ in SEARCH_FIELD_WEIGHTS:
+            condition |= Q(**{f"{field}__contains": query})
+
+    if has_trigram():
+        # name % 查詢 可使用 gin_trgm_ops 索引（閾值為 pg_trgm.similarity_threshold）
+        condition |= Q(name__trigram_similar=query)
+        rank = rank + TrigramSimilarity("name", query)
+
+    return list(
+        queryset.filter(condition)
+        .annotate(rank=rank)
+        .order_by("-rank", "sort_order", "id")
+        .values_list("id", flat=True)[:limit]
+    )
+
+
+# ==================== 公共接口 ====================
+
+
+def search_products(query, product_type="coffee", limit=None):
+    """
+    搜索已上架的商品
+
+    Args:
+        query: 用戶輸入的查詢
+        product_type: 'coffee' 或 'bean'
+        limit: 最多返回的數量（None 表示不限）
+
+    Returns:
+        list: 商品目錄快照中的商品，按相關度排序
+    """
+    if product_type not in PRODUCT_TYPES:
+        raise ValueError(f"不支持的商品類型: {product_type}")
+    query = normalize_query(query)
+    if not query:
+        return []
+
+    if get_search_backend() == "postgres":
+        try:
+            ids = _postgres_search(query, product_type, limit)
+        except DatabaseError as e:
+            logger.warning(f"⚠️ 數據庫搜索失敗，改用進程內索引: {str(e)}")
+        else:
+            catalog = get_catalog()
+            products = (catalog.get(product_type, product_id) for product_id in ids)
+            return [product for product in products if product is not None]
+
+    return get_search_index().search(query, product_type, limit)
+
+
+def suggest(query, product_type=None, limit=None):
+    """
+    自動補全結果（JSON 可序列化）
+
+    每個查詢前綴的結果按目錄版本緩存 SEARCH_SUGGEST_CACHE_SECONDS 秒，
+    逐字輸入時同一前綴只查詢一次；商品變更後版本改變，舊結果不再命中。
+
+    Args:
+        query: 用戶已輸入的文字
+        product_type: 'coffee'、'bean'，None 表示兩者
+        limit: 最多返回的數量（默認 SEARCH_SUGGEST_LIMIT）
+    """
+    if limit is None:
+        limit = getattr(settings, "SEARCH_SUGGEST_LIMIT", 8)
+    types = PRODUCT_TYPES if not product_type else (product_type,)
+    query = normalize_query(query)
+    if not query:
+        return []
+
+    catalog = get_catalog()
+    digest = hashlib.md5(query.encode()).hexdigest()
+    key = f"{SUGGEST_CACHE_PREFIX}:{catalog.version}:{'+'.join(types)}:{limit}:{digest}"
+    results = cache.get(key)
+    if results is not None:
+        return results
+
+    results = []
+    for type_ in types:
+        for product in search_products(query, type_, limit):
+            results.append(
+                {
+                    "type": type_,
+                    "id": product.id,
+                    "name": product.name,
+                    "highlight": product.highlight,
+                    "url": reverse(type_, args=[product.id]),
+                    "image": catalog.image_url(type_, product.id),
+                }
+            )
+    results = results[:limit]
+    cache.set(key, results, getattr(settings, "SEARCH_SUGGEST_CACHE_SECONDS", 300))
+    return results
@@ -89,7 +89,7 @@ class OrderDataSerializer:
             if include_items:
                 items_data = []
                 try:
-                    items = order.get_items_with_chinese_options()
+                    items = order.get_display_payload()["items"]["all_items"]
                     for item in items:
                         item_data = {
                             "type": item.get("type", ""),
@@ -126,9 +126,9 @@ class OrderDataSerializer:
 
             # 訂單類型標識
             try:
-                items = order.get_items()
-                has_coffee = any(item.get("type") == "coffee" for item in items)
-                has_beans = any(item.get("type") == "bean" for item in items)
+                item_result = order.get_display_payload()["items"]
+                has_coffee = item_result["has_coffee"]
+                has_beans = item_result["has_beans"]
 
                 order_data["has_coffee"] = has_coffee
                 order_data["has_beans"] = has_beans
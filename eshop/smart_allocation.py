@@ -14,11 +14,157 @@
 - 確保工作負載均衡
 """
 
+import contextvars
 import logging
+from contextlib import contextmanager
 from datetime import timedelta
 
+from django.utils import timezone
+
 logger = logging.getLogger(__name__)
 
+# 當前分配 / 請求內共享的工作負載快照（見 workload_snapshot）
+_active_snapshot = contextvars.ContextVar("workload_snapshot", default=None)
+
+
+class WorkloadSnapshot:
+    """
+    員工工作負載快照
+
+    一次聚合查詢得到所有員工及其正在製作的咖啡杯數
+    （GROUP BY barista 的 SUM(coffee_count)），在同一次分配或請求內
+    由所有分配策略共享，不再按員工逐個查詢。
+    正在製作的訂單明細只在需要時以一次查詢載入。
+    """
+
+    def __init__(self, baristas, loads, current_orders=None):
+        self.baristas = {barista.id: barista for barista in baristas}
+        self.loads = loads  # 員工名稱 -> 正在製作的杯數
+        self._current_orders = current_orders  # 員工名稱 -> 訂單明細
+        self.built_at = timezone.now()
+
+    @classmethod
+    def build(cls):
+        """從資料庫（或已啟用的隊列狀態存儲）構建快照"""
+        from django.db.models import IntegerField, OuterRef, Subquery, Sum
+        from django.db.models.functions import Coalesce
+
+        from .models import Barista, CoffeeQueue
+        from .queue_state_store import get_queue_state_store
+
+        store = get_queue_state_store()
+        if store is not None:
+            # 負載和明細都從隊列狀態存儲讀取
+            current_orders = {}
+            for entry in store.get_items("preparing"):
+                current_orders.setdefault(entry["barista"], []).append(
+                    {
+                        "order_id": entry["order_id"],
+                        "coffee_count": entry["coffee_count"],
+                        "start_time": entry["actual_start_time"],
+                        "queue_id": entry["id"],
+                    }
+                )
+            return cls(
+                list(Barista.objects.all()),
+                store.get_barista_loads(),
+                current_orders,
+            )
+
+        preparing_load = (
+            CoffeeQueue.objects.filter(status="preparing", barista=OuterRef("name"))
+            .order_by()
+            .values("barista")
+            .annotate(total=Sum("coffee_count"))
+            .values("total")
+        )
+        baristas = list(
+            Barista.objects.annotate(
+                preparing_load=Coalesce(
+                    Subquery(preparing_load, output_field=IntegerField()), 0
+                )
+            )
+        )
+        loads = {barista.name: barista.preparing_load for barista in baristas}
+        return cls(baristas, loads)
+
+    @property
+    def current_orders(self):
+        """正在製作的訂單明細（首次訪問時一次查詢載入）"""
+        if self._current_orders is None:
+            from .models import CoffeeQueue
+
+            current_orders = {}
+            rows = (
+                CoffeeQueue.objects.filter(status="preparing")
+                .order_by("actual_start_time", "id")
+                .values(
+                    "id", "order_id", "coffee_count", "actual_start_time", "barista"
+                )
+            )
+            for row in rows:
+                current_orders.setdefault(row["barista"], []).append(
+                    {
+                        "order_id": row["order_id"],
+                        "coffee_count": row["coffee_count"],
+                        "start_time": row["actual_start_time"],
+                        "queue_id": row["id"],
+                    }
+                )
+            self._current_orders = current_orders
+        return self._current_orders
+
+    def workload(self, barista_id, include_orders=True):
+        """單個員工的工作負載（格式同 get_barista_workload），不存在返回 None"""
+        barista = self.baristas.get(barista_id)
+        if barista is None:
+            return None
+
+        current_load = self.loads.get(barista.name, 0)
+        workload = {
+            "barista_id": barista.id,
+            "name": barista.name,
+            "max_concurrent": barista.max_concurrent_orders,
+            "current_load": current_load,
+            "available_slots": max(0, barista.max_concurrent_orders - current_load),
+            "efficiency_factor": barista.efficiency_factor,
+            "is_available": barista.is_available(),
+        }
+        if include_orders:
+            workload["current_orders"] = list(self.current_orders.get(barista.name, []))
+        return workload
+
+    def active_workloads(self, include_orders=True):
+        """所有在崗員工的工作負載"""
+        return [
+            self.workload(barista.id, include_orders=include_orders)
+            for barista in self.baristas.values()
+            if barista.is_active
+        ]
+
+
+@contextmanager
+def workload_snapshot():
+    """
+    在 with 區塊內共享同一個工作負載快照（可嵌套，內層沿用外層快照）
+
+    用法：
+        with workload_snapshot():
+            allocator.allocate_order(order)
+            allocator.get_system_status()
+    """
+    current = _active_snapshot.get()
+    if current is not None:
+        yield current
+        return
+
+    snapshot = WorkloadSnapshot.build()
+    token = _active_snapshot.set(snapshot)
+    try:
+        yield snapshot
+    finally:
+        _active_snapshot.reset(token)
+
 
 class BaristaWorkloadManager:
     """
@@ -36,6 +182,10 @@ class BaristaWorkloadManager:
 
         return Barista.objects.filter(is_active=True)
 
+    def get_snapshot(self):
+        """當前共享的工作負載快照，沒有時構建一個新的"""
+        return _active_snapshot.get() or WorkloadSnapshot.build()
+
     def get_barista_workload(self, barista_id):
         """
         獲取指定員工的當前工作負載
@@ -53,56 +203,19 @@ class BaristaWorkloadManager:
             'efficiency_factor': 0.9
         }
         """
-        from .models import Barista, CoffeeQueue
-
-        try:
-            barista = Barista.objects.get(id=barista_id)
-
-            # 獲取該員工正在製作的訂單
-            current_queues = CoffeeQueue.objects.filter(
-                barista=barista.name, status="preparing"
-            )
-
-            current_orders = []
-            total_coffee_count = 0
-
-            for queue in current_queues:
-                current_orders.append(
-                    {
-                        "order_id": queue.order.id,
-                        "coffee_count": queue.coffee_count,
-                        "start_time": queue.actual_start_time,
-                        "queue_id": queue.id,
-                    }
-                )
-                total_coffee_count += queue.coffee_count
-
-            available_slots = max(0, barista.max_concurrent_orders - total_coffee_count)
-
-            return {
-                "barista_id": barista.id,
-                "name": barista.name,
-                "max_concurrent": barista.max_concurrent_orders,
-                "current_load": total_coffee_count,
-                "available_slots": available_slots,
-                "current_orders": current_orders,
-                "efficiency_factor": barista.efficiency_factor,
-                "is_available": barista.is_available(),
-            }
-
-        except Barista.DoesNotExist:
+        workload = self.get_snapshot().workload(barista_id)
+        if workload is None:
             self.logger.error(f"員工 #{barista_id} 不存在")
-            return None
+        return workload
 
-    def get_all_baristas_workload(self):
-        """獲取所有員工的工作負載"""
-        baristas = self.get_all_baristas()
-        workloads = []
+    def get_all_baristas_workload(self, include_orders=True):
+        """
+        獲取所有員工的工作負載
 
-        for barista in baristas:
-            workload = self.get_barista_workload(barista.id)
-            if workload:
-                workloads.append(workload)
+        參數：
+        - include_orders: 是否包含正在製作的訂單明細（分配策略不需要）
+        """
+        workloads = self.get_snapshot().active_workloads(include_orders=include_orders)
 
         # 按可用槽位排序（可用槽位多的排前面）
         workloads.sort(key=lambda x: x["available_slots"], reverse=True)
@@ -233,8 +346,10 @@ class SmartOrderAllocator:
                     "skip_allocation": True,
                 }
 
-            # 獲取所有員工的工作負載
-            workloads = self.workload_manager.get_all_baristas_workload()
+            # 獲取所有員工的工作負載（同一快照內共享）
+            workloads = self.workload_manager.get_all_baristas_workload(
+                include_orders=False
+            )
 
             if not workloads:
                 return {
@@ -419,6 +534,177 @@ class SmartOrderAllocator:
         # 確保最小時間
         return max(2, round(adjusted_minutes, 1))
 
+    def allocate_batch(self, max_orders=None, apply=False):
+        """
+        批量分配：一次為所有未分配的等待訂單選擇員工
+
+        逐個分配的貪心策略在高峰時容易令員工負載不均、拉長最後完成時間。
+        這裡把等待訂單和在崗員工一起考慮，使用 LPT（最長處理時間優先）：
+        訂單按製作時間由長到短排序，每個訂單分配給完成時間最早的員工
+        （考慮效率因子、現有負載和最大並發杯數）。
+        時間複雜度 O(n log n + n·m)，訂單數受 max_orders 限制。
+
+        參數：
+        - max_orders: 最多考慮的訂單數（默認 BATCH_ALLOCATION_MAX_ORDERS）
+        - apply: 是否把分配結果寫入隊列項的 barista 字段
+
+        返回：
+        {
+            'success': True/False,
+            'assignments': [...],
+            'predicted_makespan': 批量分配的預計最後完成時間（分鐘）,
+            'greedy_makespan': 逐個均衡分配的預計最後完成時間（分鐘）,
+            'improvement': 縮短的分鐘數,
+            'barista_finish_times': {員工名稱: 預計完成時間},
+            'orders_considered': 考慮的訂單數,
+            'truncated': 是否有訂單超出 max_orders,
+            'applied': 是否已寫入,
+            'message': 描述信息
+        }
+        """
+        from django.conf import settings
+        from django.db.models import Q
+
+        from .models import CoffeeQueue
+        from .queue_changes import record_queue_changes
+
+        if max_orders is None:
+            max_orders = getattr(settings, "BATCH_ALLOCATION_MAX_ORDERS", 200)
+
+        try:
+            workloads = self.workload_manager.get_all_baristas_workload(
+                include_orders=False
+            )
+            if not workloads:
+                return {"success": False, "message": "沒有在崗員工"}
+
+            unassigned = (
+                CoffeeQueue.objects.filter(status="waiting", coffee_count__gt=0)
+                .filter(Q(barista__isnull=True) | Q(barista=""))
+                .order_by("position", "id")
+                .values("id", "order_id", "coffee_count")
+            )
+            orders = list(unassigned[: max_orders + 1])
+            truncated = len(orders) > max_orders
+            orders = orders[:max_orders]
+
+            assignments, finish_times = self._lpt_assignment(orders, workloads)
+            _, greedy_finish_times = self._greedy_assignment(orders, workloads)
+
+            predicted_makespan = round(max(finish_times.values()), 1)
+            greedy_makespan = round(max(greedy_finish_times.values()), 1)
+
+            if apply and assignments:
+                queue_items = [
+                    CoffeeQueue(id=a["queue_id"], barista=a["barista_name"])
+                    for a in assignments
+                ]
+                CoffeeQueue.objects.bulk_update(queue_items, ["barista"])
+                record_queue_changes(a["order_id"] for a in assignments)
+                self.logger.info(f"✅ 批量分配已寫入 {len(queue_items)} 個隊列項")
+
+            return {
+                "success": True,
+                "assignments": assignments,
+                "predicted_makespan": predicted_makespan,
+                "greedy_makespan": greedy_makespan,
+                "improvement": round(greedy_makespan - predicted_makespan, 1),
+                "barista_finish_times": {
+                    name: round(minutes, 1) for name, minutes in finish_times.items()
+                },
+                "orders_considered": len(orders),
+                "truncated": truncated,
+                "applied": apply and bool(assignments),
+                "message": (
+                    f"批量分配 {len(assignments)} 個訂單，預計 {predicted_makespan} 分鐘"
+                    f"完成（逐個分配: {greedy_makespan} 分鐘）"
+                ),
+            }
+
+        except Exception as e:
+            self.logger.error(f"批量分配失敗: {str(e)}")
+            return {"success": False, "message": f"批量分配失敗: {str(e)}"}
+
+    def _initial_finish_times(self, workloads):
+        """各員工完成現有負載的預計時間（分鐘）"""
+        return {
+            w["name"]: self._calculate_estimated_time(
+                w["current_load"], w["efficiency_factor"]
+            )
+            for w in workloads
+        }
+
+    def _eligible_workloads(self, workloads, coffee_count):
+        """可以一次製作該杯數的員工；沒有時所有員工都可以（按順序製作）"""
+        eligible = [w for w in workloads if w["max_concurrent"] >= coffee_count]
+        return eligible or workloads
+
+    def _lpt_assignment(self, orders, workloads):
+        """
+        LPT 分配：訂單按製作時間由長到短，分配給完成時間最早的員工
+
+        返回：(分配列表, {員工名稱: 預計完成時間})
+        """
+        finish_times = self._initial_finish_times(workloads)
+        assignments = []
+
+        for order in sorted(orders, key=lambda o: o["coffee_count"], reverse=True):
+            coffee_count = order["coffee_count"]
+            best = min(
+                self._eligible_workloads(workloads, coffee_count),
+                key=lambda w: (
+                    finish_times[w["name"]]
+                    + self._calculate_estimated_time(
+                        coffee_count, w["efficiency_factor"]
+                    ),
+                    w["barista_id"],
+                ),
+            )
+            start = finish_times[best["name"]]
+            finish_times[best["name"]] = start + self._calculate_estimated_time(
+                coffee_count, best["efficiency_factor"]
+            )
+            assignments.append(
+                {
+                    "queue_id": order["id"],
+                    "order_id": order["order_id"],
+                    "coffee_count": coffee_count,
+                    "barista_id": best["barista_id"],
+                    "barista_name": best["name"],
+                    "estimated_start": round(start, 1),
+                    "estimated_finish": round(finish_times[best["name"]], 1),
+                }
+            )
+
+        return assignments, finish_times
+
+    def _greedy_assignment(self, orders, workloads):
+        """
+        逐個均衡分配（與 _balanced_allocation 相同的選擇規則）：
+        按隊列順序把每個訂單分配給當前杯數最少的員工，用作對比
+
+        返回：(分配列表, {員工名稱: 預計完成時間})
+        """
+        finish_times = self._initial_finish_times(workloads)
+        loads = {w["name"]: w["current_load"] for w in workloads}
+        assignments = []
+
+        for order in orders:
+            coffee_count = order["coffee_count"]
+            chosen = min(
+                self._eligible_workloads(workloads, coffee_count),
+                key=lambda w: loads[w["name"]],
+            )
+            loads[chosen["name"]] += coffee_count
+            finish_times[chosen["name"]] += self._calculate_estimated_time(
+                coffee_count, chosen["efficiency_factor"]
+            )
+            assignments.append(
+                {"queue_id": order["id"], "barista_name": chosen["name"]}
+            )
+
+        return assignments, finish_times
+
     def optimize_parallel_preparation(self, order):
         """
         優化並行製作策略
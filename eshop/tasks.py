@@ -225,3 +225,16 @@ def cleanup_old_queues():
     except Exception as e:
         logger.error(f"❌ 清理舊隊列任務失敗: {str(e)}")
         return {"success": False, "error": str(e)}
+
+
+@shared_task
+def drain_payment_outbox():
+    """處理支付成功的發件箱記錄（支付事務提交後排程；beat 每分鐘執行一次以重試）"""
+    try:
+        from .payment_outbox import drain_outbox
+
+        return {"success": True, **drain_outbox()}
+
+    except Exception as e:
+        logger.error(f"❌ 處理支付發件箱任務失敗: {str(e)}")
+        return {"success": False, "error": str(e)}
@@ -0,0 +1,45 @@
+# eshop/templatetags/image_tags.py
+"""商品圖片縮圖模板標籤（WebP/AVIF srcset）"""
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from eshop.image_derivatives import MIME_TYPES, responsive_image
+
+register = template.Library()
+
+DEFAULT_SIZES = "(max-width: 768px) 100vw, 50vw"
+
+
+@register.filter
+def srcset(image, fmt="webp"):
+    """圖片某一格式的 srcset
+    用法：{{ coffee.image|srcset }} / {{ coffee.image|srcset:"avif" }}
+    """
+    return responsive_image(image).get(fmt, "")
+
+
+@register.simple_tag
+def responsive_img(image, src, alt="", css_class="", sizes=DEFAULT_SIZES, **attrs):
+    """<picture>：有縮圖時先列出 AVIF/WebP 來源，<img> 保留原圖作為後備
+    用法：{% responsive_img coffee.image coffee.get_detail_image alt=coffee.name css_class="img" %}
+    """
+    sources = responsive_image(image)
+    extra = format_html_join("", ' {}="{}"', sorted(attrs.items()))
+    img = format_html(
+        '<img src="{}" alt="{}"{}{}>',
+        src,
+        alt,
+        format_html(' class="{}"', css_class) if css_class else "",
+        extra,
+    )
+    if not sources:
+        return img
+    return format_html(
+        "<picture>{}{}</picture>",
+        format_html_join(
+            "",
+            '<source type="{}" srcset="{}" sizes="{}">',
+            ((MIME_TYPES[fmt], value, sizes) for fmt, value in sources.items()),
+        ),
+        img,
+    )
@@ -0,0 +1,112 @@
+"""
+購物車測試
+"""
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from cart.cart import Cart
+from eshop.models import CartItem, CoffeeItem
+
+
+class CartRequestScopeTestCase(TestCase):
+    """每個請求只從數據庫同步一次購物車，件數優先讀取會話緩存"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cart', password='x')
+        self.coffee = CoffeeItem.objects.create(
+            name='Latte', price=Decimal('38.00'), image='coffee_images/latte.jpg'
+        )
+        CartItem.objects.create(
+            user=self.user, product_type='coffee', product_id=self.coffee.id,
+            quantity=2, cup_level='Medium',
+        )
+        self.client.force_login(self.user)
+
+    def _cart_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        queries = [q['sql'] for q in context.captured_queries]
+        return response, [sql for sql in queries if 'eshop_cartitem' in sql]
+
+    def test_page_uses_cached_count(self):
+        """菜單頁不加載購物車：件數來自會話緩存，緩存建立後不再查詢"""
+        response, queries = self._cart_queries('/coffee_menu/')
+        self.assertEqual(response.context['cart_count'], 2)
+        self.assertEqual(len(queries), 1)
+
+        response, queries = self._cart_queries('/coffee_menu/')
+        self.assertEqual(response.context['cart_count'], 2)
+        self.assertEqual(queries, [])
+
+    def test_cart_page_syncs_once(self):
+        """購物車頁面中間件、視圖和上下文處理器共用一次同步"""
+        response, queries = self._cart_queries('/cart/checkout/')
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.context['cart_count'], 2)
+
+
+class CartPersistenceTestCase(TestCase):
+    """保存購物車只寫入差異，查詢數不隨購物車大小增長"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulk', password='x')
+        self.coffees = [
+            CoffeeItem.objects.create(
+                name=f'Coffee {i}', price=Decimal('30.00'),
+                image='coffee_images/latte.jpg',
+            )
+            for i in range(21)
+        ]
+
+    def _cart_with_items(self, size):
+        CartItem.objects.filter(user=self.user).delete()
+        CartItem.objects.bulk_create(
+            CartItem(
+                user=self.user, product_type='coffee', product_id=coffee.id,
+                quantity=1, weight='200g',
+            )
+            for coffee in self.coffees[:size]
+        )
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.user = self.user
+        cart = Cart(request)
+        self.assertEqual(len(cart), size)
+        return cart
+
+    def _edit_queries(self, size):
+        cart = self._cart_with_items(size)
+        keys = list(cart.cart)
+        cart.cart[keys[0]]['quantity'] = 3
+        del cart.cart[keys[1]]
+        cart.cart[f'coffee_{self.coffees[20].id}'] = {
+            'quantity': 2, 'price': '30.00', 'name': 'Coffee 20',
+            'type': 'coffee', 'image': '', 'weight': '200g',
+        }
+        with CaptureQueriesContext(connection) as context:
+            cart.save()
+
+        quantities = dict(
+            CartItem.objects.filter(user=self.user).values_list(
+                'product_id', 'quantity'
+            )
+        )
+        self.assertEqual(len(quantities), size)
+        self.assertEqual(quantities[self.coffees[0].id], 3)
+        self.assertNotIn(self.coffees[1].id, quantities)
+        self.assertEqual(quantities[self.coffees[20].id], 2)
+
+        # 再次保存沒有差異，不寫入
+        with self.assertNumQueries(0):
+            cart.save()
+        return len(context.captured_queries)
+
+    def test_save_query_count_is_constant(self):
+        """新增、更新、刪除各一項：3 項和 20 項的購物車查詢數相同"""
+        self.assertEqual(self._edit_queries(3), self._edit_queries(20))
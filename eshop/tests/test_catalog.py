@@ -0,0 +1,67 @@
+"""
+商品目錄快照測試
+"""
+import json
+from decimal import Decimal
+
+from django.test import TestCase
+
+from eshop.catalog import get_catalog, get_catalog_cache
+from eshop.models import BeanItem, CoffeeItem, OrderModel
+
+
+class CatalogSnapshotTestCase(TestCase):
+    """訂單商品補全讀取快照，商品保存後快照失效"""
+
+    def setUp(self):
+        self.coffee = CoffeeItem.objects.create(
+            name='Latte', price=Decimal('38.00'), image='coffee_images/latte.jpg'
+        )
+        self.bean = BeanItem.objects.create(
+            name='Ethiopia',
+            price_200g=Decimal('120.00'),
+            price_500g=Decimal('260.00'),
+            image='bean_images/ethiopia.jpg',
+        )
+        # 每個測試從空快照開始（測試事務回滾不會觸發失效）
+        get_catalog_cache().invalidate()
+
+    def _make_order(self):
+        items = [
+            {'type': 'coffee', 'id': self.coffee.id, 'name': 'Latte', 'quantity': 2},
+            {
+                'type': 'bean',
+                'id': self.bean.id,
+                'name': 'Ethiopia',
+                'quantity': 1,
+                'weight': '500g',
+            },
+        ]
+        return OrderModel(items=json.dumps(items), total_price=Decimal('336.00'))
+
+    def test_get_items_reads_from_snapshot(self):
+        """快照建好後，補全價格、圖片和中文選項不再查詢商品表"""
+        get_catalog()
+
+        with self.assertNumQueries(0):
+            items = self._make_order().get_items(with_chinese_options=True)
+
+        self.assertEqual(items[0]['price'], 38.0)
+        self.assertEqual(items[0]['total_price'], 76.0)
+        self.assertTrue(items[0]['image'].endswith('coffee_images/latte.jpg'))
+        self.assertEqual(items[1]['price'], 260.0)
+        self.assertTrue(items[1]['image'].endswith('bean_images/ethiopia.jpg'))
+
+    def test_product_save_invalidates_snapshot(self):
+        """商品保存後下次讀取會重建快照並看到新價格"""
+        self.assertEqual(get_catalog().get_coffee(self.coffee.id).price, Decimal('38.00'))
+
+        self.coffee.price = Decimal('42.00')
+        self.coffee.save()
+
+        catalog = get_catalog()
+        self.assertEqual(catalog.get_coffee(self.coffee.id).price, Decimal('42.00'))
+        self.assertIsNone(catalog.get_coffee(self.coffee.id + 1000))
+
+        items = self._make_order().get_items()
+        self.assertEqual(items[0]['price'], 42.0)
@@ -0,0 +1,103 @@
+"""
+預先計算的商品顯示數據測試
+"""
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from eshop.models import OrderModel
+from eshop.models.order import DISPLAY_PAYLOAD_VERSION
+from eshop.serializers import OrderDataSerializer
+from eshop.utils.order_item_processor import OrderItemProcessor
+
+
+class DisplayPayloadTestCase(TestCase):
+    """支付時計算 display_payload，讀取路徑直接使用"""
+
+    def _create_order(self, payment_status):
+        items = [
+            {
+                'type': 'coffee',
+                'id': 1,
+                'name': 'Latte',
+                'quantity': 2,
+                'price': 38,
+                'image': '/media/latte.jpg',
+                'cup_level': 'Large',
+                'milk_level': 'Extra',
+            },
+            {
+                'type': 'bean',
+                'id': 2,
+                'name': 'Ethiopia',
+                'quantity': 1,
+                'price': 120,
+                'image': '/media/ethiopia.jpg',
+                'weight': '200g',
+            },
+        ]
+        return OrderModel.objects.create(
+            items=items, total_price=Decimal('196.00'), payment_status=payment_status
+        )
+
+    def test_payload_computed_on_payment(self):
+        """未支付訂單不保存，支付後保存並與即時計算的結果一致"""
+        order = self._create_order('pending')
+        self.assertIsNone(OrderModel.objects.get(id=order.id).display_payload)
+
+        order.payment_status = 'paid'
+        order.save(update_fields=['payment_status'])
+
+        stored = OrderModel.objects.get(id=order.id).display_payload
+        self.assertEqual(stored['version'], DISPLAY_PAYLOAD_VERSION)
+        self.assertEqual(stored['items']['coffee_count'], 2)
+        self.assertEqual(stored['items']['items_display'], '2項商品 - 咖啡2杯, 咖啡豆1包')
+        self.assertEqual(
+            stored['items']['coffee_items'][0]['cup_level_cn'],
+            OrderModel.translate_option('cup_level', 'Large'),
+        )
+
+        fresh = OrderModel.objects.get(id=order.id)
+        self.assertEqual(stored, fresh.build_display_payload())
+
+    def test_read_paths_use_stored_payload(self):
+        """隊列和 API 序列化直接讀取已保存的數據"""
+        order = OrderModel.objects.get(id=self._create_order('paid').id)
+        order.display_payload['items']['items_display'] = 'from-payload'
+        order.display_payload['items']['all_items'][0]['name'] = 'from-payload'
+
+        order_data = OrderItemProcessor.prepare_order_data(
+            order, include_queue_info=False
+        )
+        self.assertEqual(order_data['items_display'], 'from-payload')
+
+        serialized = OrderDataSerializer.serialize_order(
+            order, include_queue_info=False
+        )
+        self.assertEqual(serialized['items'][0]['name'], 'from-payload')
+        self.assertTrue(serialized['is_mixed_order'])
+
+    def test_image_srcset_added_on_read_not_stored(self):
+        """縮圖 srcset 不保存在 payload 中，讀取時按當前縮圖加上"""
+        order = OrderModel.objects.get(id=self._create_order('paid').id)
+        self.assertNotIn('image_srcset', order.display_payload['items']['all_items'][0])
+        self.assertEqual(
+            order.get_display_payload()['items']['coffee_items'][0]['image_srcset'], ''
+        )
+
+        # 支付後才生成的縮圖在下一次讀取時出現，覆蓋舊 payload 中的空值
+        order.display_payload['items']['all_items'][0]['image_srcset'] = ''
+        srcset = '/media/derivatives/latte-320w.webp 320w'
+        with patch(
+            'eshop.catalog.CatalogSnapshot.image_srcset',
+            side_effect=lambda product_type, product_id: (
+                srcset if product_type == 'coffee' else ''
+            ),
+        ):
+            items = order.get_display_payload()['items']
+        self.assertEqual(items['all_items'][0]['image_srcset'], srcset)
+        self.assertEqual(items['coffee_items'][0]['image_srcset'], srcset)
+        self.assertEqual(items['bean_items'][0]['image_srcset'], '')
+        self.assertEqual(order.display_payload['items']['all_items'][0]['image_srcset'], '')
+
@@ -0,0 +1,109 @@
+"""
+商品圖片縮圖測試
+"""
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from eshop.catalog import CatalogSnapshot
+from eshop.image_derivatives import (
+    _lookup_cache,
+    content_hash,
+    generate_derivatives,
+    get_formats,
+    responsive_image,
+)
+from eshop.models import CoffeeItem
+
+
+class ImageDerivativesTestCase(TestCase):
+    """生成內容雜湊命名的縮圖，srcset 只包含已生成的文件"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            MEDIA_URL='/media/',
+            IMAGE_DERIVATIVE_WIDTHS=(320, 640, 1600),
+            IMAGE_DERIVATIVE_FORMATS=('webp',),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(_lookup_cache.clear)
+
+        os.makedirs(os.path.join(self.media_root, 'coffee_images'))
+        self.name = 'coffee_images/latte.jpg'
+        Image.new('RGB', (1200, 800), 'brown').save(
+            os.path.join(self.media_root, self.name)
+        )
+
+    def test_generate_and_lookup(self):
+        """不放大：1200px 的原圖生成 320/640 兩個 WebP；重複執行不重寫"""
+        self.assertEqual(get_formats(), ('webp',))
+        self.assertEqual(responsive_image(self.name), {})
+
+        self.assertEqual(generate_derivatives(self.name), 2)
+        self.assertEqual(generate_derivatives(self.name), 0)
+
+        srcset = responsive_image(self.name)['webp']
+        urls = [part.split()[0] for part in srcset.split(', ')]
+        self.assertEqual([part.split()[1] for part in srcset.split(', ')],
+                         ['320w', '640w'])
+        self.assertTrue(all(url.startswith('/media/derivatives/coffee_images/latte-')
+                            for url in urls))
+        with Image.open(os.path.join(self.media_root, urls[0][len('/media/'):])) as im:
+            self.assertEqual((im.format, im.size), ('WEBP', (320, 213)))
+
+        # 替換原圖後文件名隨內容改變
+        Image.new('RGB', (1200, 800), 'white').save(
+            os.path.join(self.media_root, self.name)
+        )
+        self.assertEqual(responsive_image(self.name), {})
+
+    def test_template_tag_falls_back_to_img(self):
+        """沒有縮圖時只輸出 <img>，有縮圖時輸出 <picture> 和 WebP 來源"""
+        template = Template(
+            '{% load image_tags %}'
+            '{% responsive_img name "/media/coffee_images/latte.jpg" alt="Latte" %}'
+        )
+        html = template.render(Context({'name': self.name}))
+        self.assertTrue(html.startswith('<img src="/media/coffee_images/latte.jpg"'))
+
+        generate_derivatives(self.name)
+        html = template.render(Context({'name': self.name}))
+        self.assertIn('<picture><source type="image/webp" srcset="/media/', html)
+        self.assertIn('alt="Latte"', html)
+
+    @override_settings(IMAGE_DERIVATIVE_RECHECK_SECONDS=0)
+    def test_lookup_complete_without_upscaled_widths(self):
+        """比原圖寬的尺寸不會生成，也不算缺少：查詢結果不再重新雜湊原圖"""
+        generate_derivatives(self.name)
+        responsive_image(self.name)
+
+        with patch(
+            'eshop.image_derivatives.content_hash', side_effect=content_hash
+        ) as hashed:
+            srcset = responsive_image(self.name)['webp']
+        hashed.assert_not_called()
+        self.assertNotIn('1600w', srcset)
+
+    def test_catalog_srcset_not_cached_while_missing(self):
+        """目錄快照不緩存空的 srcset，稍後生成的縮圖在同一版本中出現"""
+        coffee = CoffeeItem.objects.create(
+            name='Latte', price=Decimal('38.00'), image=self.name
+        )
+        snapshot = CatalogSnapshot([coffee], [], version=1)
+        self.assertEqual(snapshot.image_srcset('coffee', coffee.id), '')
+
+        # 另一個進程（backfill 命令）生成縮圖，本進程的查詢緩存過了重新檢查間隔
+        generate_derivatives(self.name)
+        _lookup_cache.clear()
+        self.assertIn('320w', snapshot.image_srcset('coffee', coffee.id))
+
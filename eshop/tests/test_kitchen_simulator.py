@@ -0,0 +1,38 @@
+"""
+廚房離散事件模擬器測試
+"""
+from django.test import TestCase
+
+from eshop.kitchen_simulator import KitchenSimulator
+from eshop.models import Barista, OrderModel
+
+
+class KitchenSimulatorTestCase(TestCase):
+    """以重放的到達流驅動隊列代碼"""
+
+    def test_replay_processes_all_orders_and_rolls_back(self):
+        """所有訂單完成製作，報告包含各操作的統計，資料已回滾"""
+        arrivals = [
+            {'at_minute': 0, 'cups': 2, 'order_type': 'normal'},
+            {'at_minute': 1, 'cups': 1, 'order_type': 'quick',
+             'pickup_time_choice': '10'},
+            {'at_minute': 2, 'cups': 1, 'order_type': 'normal'},
+        ]
+        simulator = KitchenSimulator(
+            barista_efficiencies=[1.0], barista_capacity=2, noise=0, arrivals=arrivals
+        )
+
+        report = simulator.run()
+
+        self.assertEqual(report['orders'], 3)
+        self.assertEqual(report['orders_ready'], 3)
+        # 2杯訂單佔滿唯一員工，快速訂單在普通訂單前開始：
+        # 2杯 0-8 分鐘，快速 8-13 分鐘，最後一單 8-13 分鐘（1杯 + 1杯並發）
+        self.assertEqual(report['simulated_minutes'], 13)
+        self.assertEqual(report['queue_length']['max'], 2)
+        for operation in ('place_order', 'start_preparation', 'mark_as_ready'):
+            self.assertEqual(report['operations'][operation]['count'], 3)
+            self.assertGreater(report['operations'][operation]['mean_queries'], 0)
+
+        self.assertFalse(OrderModel.objects.exists())
+        self.assertFalse(Barista.objects.exists())
@@ -0,0 +1,89 @@
+"""
+持久化學習優化器測試
+"""
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from eshop.learning_optimizer import LearningOptimizer
+from eshop.models import (
+    BaristaPerformanceStat,
+    CoffeeQueue,
+    OrderModel,
+    PreparationHourlyRollup,
+)
+
+
+class LearningOptimizerTestCase(TestCase):
+    """增量統計、每小時彙總和歷史重建測試"""
+
+    def setUp(self):
+        self.optimizer = LearningOptimizer(ewma_alpha=0.5)
+
+    def test_incremental_statistics_match_batch(self):
+        """Welford 均值 / 方差和 EWMA 與批量計算一致，每次記錄查詢數固定"""
+        actual_times = [5.0, 10.0, 4.0]
+        for index, actual in enumerate(actual_times):
+            with self.assertNumQueries(6):
+                self.optimizer.record_performance(
+                    index, 'Amy', actual, estimated_time=5, coffee_count=1
+                )
+
+        stat = BaristaPerformanceStat.objects.get(barista='Amy', coffee_count=0)
+        ratios = [1.0, 0.5, 1.25]
+        self.assertEqual(stat.sample_count, 3)
+        self.assertAlmostEqual(stat.ratio_mean, sum(ratios) / 3)
+        self.assertAlmostEqual(stat.ratio_variance, 0.145833333, places=6)
+        self.assertAlmostEqual(stat.actual_minutes_mean, 19 / 3)
+        # EWMA: 1.0 → 0.75 → 1.0
+        self.assertAlmostEqual(stat.ratio_ewma, 1.0)
+        self.assertEqual(
+            BaristaPerformanceStat.objects.get(barista='Amy', coffee_count=1)
+            .sample_count,
+            3,
+        )
+
+        with self.assertNumQueries(1):
+            self.assertAlmostEqual(self.optimizer.get_barista_efficiency('Amy'), 1.0)
+        self.assertEqual(self.optimizer.get_barista_efficiency('Nobody'), 1.0)
+
+        rollup = PreparationHourlyRollup.objects.get(barista='Amy')
+        self.assertEqual(rollup.order_count, 3)
+        self.assertAlmostEqual(rollup.total_actual_minutes, 19)
+
+    def test_analysis_reads_rollups(self):
+        """歷史分析來自每小時彙總"""
+        self.optimizer.record_performance(1, 'Amy', 4, 5, coffee_count=1)
+        self.optimizer.record_performance(2, 'Ben', 8, 5, coffee_count=1)
+
+        with self.assertNumQueries(3):
+            result = self.optimizer.analyze_historical_data(days=1)
+
+        data = result['data']
+        self.assertEqual(data['total_orders'], 2)
+        self.assertEqual(data['average_preparation_time'], 6)
+        self.assertEqual(data['efficiency_by_barista']['Amy']['efficiency_factor'], 1.5)
+        self.assertEqual(data['efficiency_by_barista']['Ben']['average_time'], 8)
+
+    def test_mark_ready_records_and_rebuild_matches(self):
+        """標記就緒時記錄統計；從歷史重建得到相同結果"""
+        order = OrderModel.objects.create(items=[], status='preparing')
+        now = timezone.now()
+        queue_item = CoffeeQueue.objects.create(
+            order=order,
+            status='ready',
+            barista='Amy',
+            coffee_count=2,
+            preparation_time_minutes=8,
+            actual_start_time=now - timedelta(minutes=10),
+            actual_completion_time=now,
+        )
+
+        self.assertTrue(self.optimizer.record_queue_completion(queue_item))
+        recorded = self.optimizer.get_performance_stats('Amy')
+
+        self.assertEqual(self.optimizer.rebuild_from_history(days=1), 1)
+        self.assertEqual(self.optimizer.get_performance_stats('Amy'), recorded)
+        self.assertEqual(recorded[2]['ratio_mean'], 0.8)
+        self.assertEqual(PreparationHourlyRollup.objects.get().order_count, 1)
@@ -0,0 +1,117 @@
+"""
+顧客端預計時間推送和條件輪詢測試
+"""
+import json
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.utils import timezone
+
+from eshop.consumers import OrderConsumer
+from eshop.models import CoffeeQueue, OrderModel
+from eshop.queue_manager_refactored import CoffeeQueueManager
+
+
+class OrderEtaTestCase(TestCase):
+    """只推送真正改變的預計時間；輪詢未變化時返回 304"""
+
+    def setUp(self):
+        items = json.dumps([{'type': 'coffee', 'id': 1, 'quantity': 1}])
+        self.orders = [
+            OrderModel.objects.create(
+                contact_name='倒數', phone=f'5333333{i}', items=items,
+                total_price=25.00, payment_status='paid',
+            )
+            for i in range(2)
+        ]
+
+    def test_pushes_only_changed_estimates(self):
+        """重新計算預計時間後只推送有變化的訂單，結果不變時不推送"""
+        fixed_now = timezone.now() + timedelta(minutes=5)
+        manager = CoffeeQueueManager()
+
+        with patch(
+            'eshop.queue_manager_refactored.unified_time_service.get_hong_kong_time',
+            return_value=fixed_now,
+        ), patch('eshop.websocket_utils.send_order_update') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                manager.update_estimated_times()
+            pushed = {call.args[0]: call.args[2] for call in send.call_args_list}
+            self.assertEqual(set(pushed), {order.id for order in self.orders})
+            self.assertTrue(
+                all(call.args[1] == 'queue_position' for call in send.call_args_list)
+            )
+
+            queue = CoffeeQueue.objects.get(order=self.orders[0])
+            self.assertEqual(
+                pushed[self.orders[0].id]['estimated_time'],
+                queue.estimated_completion_time.isoformat(),
+            )
+            self.assertEqual(pushed[self.orders[0].id]['position'], queue.position)
+
+            send.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                manager.update_estimated_times()
+            send.assert_not_called()
+
+    def test_status_poll_returns_304_until_queue_changes(self):
+        """帶 If-None-Match 的輪詢在訂單和隊列未變化時返回 304"""
+        url = f'/eshop/order/api/order-status/{self.orders[1].id}/'
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('remaining_seconds', response.json())
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # 前面的訂單開始製作會改變提示文字，ETag 隨之改變
+        with self.captureOnCommitCallbacks(execute=True):
+            queue = CoffeeQueue.objects.get(order=self.orders[0])
+            queue.status = 'preparing'
+            queue.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_status_poll_ignores_orders_behind(self):
+        """後面的訂單加入或變化時，前面訂單的輪詢仍返回 304"""
+        url = f'/eshop/order/api/order-status/{self.orders[0].id}/'
+        etag = self.client.get(url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderModel.objects.create(
+                contact_name='後來', phone='53333339',
+                items=json.dumps([{'type': 'coffee', 'id': 1, 'quantity': 2}]),
+                total_price=50.00, payment_status='paid',
+            )
+            behind = CoffeeQueue.objects.get(order=self.orders[1])
+            behind.estimated_completion_time = timezone.now() + timedelta(minutes=20)
+            behind.save()
+        self.assertEqual(CoffeeQueue.objects.filter(status='waiting').count(), 3)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_confirmation_page_has_countdown_hooks(self):
+        """顧客訂單頁有 order_status_cards.js 寫入的排隊位置和倒數元素"""
+        response = self.client.get(
+            '/eshop/order/payment-confirmation/', {'order_id': self.orders[1].id}
+        )
+        self.assertContains(response, 'js/order_status_cards.js')
+        self.assertContains(response, 'data-eta-countdown')
+        position = response.context['status_info']['queue_info']['queue_position']
+        self.assertContains(response, f'<span data-queue-position>{position}</span>')
+
+    def test_countdown_fields_from_estimated_time(self):
+        """推送的 ISO 預計時間換算為剩餘秒數並附上服務端時間"""
+        eta = timezone.now() + timedelta(seconds=90)
+        fields = OrderConsumer._countdown_fields({'estimated_time': eta.isoformat()})
+        self.assertTrue(85 <= fields['remaining_seconds'] <= 90)
+        self.assertIn('server_time', fields)
+
+        fields = OrderConsumer._countdown_fields({'estimated_time': '計算中...'})
+        self.assertIsNone(fields['remaining_seconds'])
@@ -0,0 +1,55 @@
+"""
+菜單頁面緩存測試
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from eshop.models import CoffeeItem
+
+
+class PageCacheTestCase(TestCase):
+    """ETag 跟隨商品目錄版本，未變化時返回 304"""
+
+    def setUp(self):
+        self.coffee = CoffeeItem.objects.create(
+            name='Latte', price=Decimal('38.00'), image='coffee_images/latte.jpg'
+        )
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+
+    def test_menu_revalidates_until_catalog_changes(self):
+        response = self.client.get('/coffee_menu/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertTrue(response.has_header('Last-Modified'))
+
+        response = self.client.get('/coffee_menu/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # 商品保存後目錄版本改變，重新渲染
+        self.coffee.name = 'Flat White'
+        self.coffee.save()
+        response = self.client.get('/coffee_menu/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Flat White')
+
+    def test_detail_etag_depends_on_product(self):
+        first = self.client.get(f'/coffee/{self.coffee.id}/')
+        other = CoffeeItem.objects.create(
+            name='Mocha', price=Decimal('40.00'), image='coffee_images/mocha.jpg'
+        )
+        second = self.client.get(f'/coffee/{other.id}/')
+        self.assertEqual(first.status_code, 200)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_landing_skips_conditional_for_users(self):
+        """首頁包含頭像和上次訂單，已登入用戶不使用條件請求"""
+        self.assertTrue(self.client.get('/').has_header('ETag'))
+
+        user = User.objects.create_user(username='page', password='x')
+        self.client.force_login(user)
+        self.assertFalse(self.client.get('/').has_header('ETag'))
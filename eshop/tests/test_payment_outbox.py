@@ -0,0 +1,149 @@
+"""
+支付成功副作用發件箱測試
+"""
+import json
+import threading
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from eshop.models import AuditLog, OrderModel, PaymentOutbox
+from eshop.order_status.payment_handler import PaymentHandler
+from eshop.payment_outbox import (
+    HANDLERS,
+    PaymentOutboxDrainer,
+    drain_outbox,
+    start_payment_outbox_worker,
+)
+from socialuser.models_enhanced import CustomerLoyalty
+
+
+@override_settings(PAYMENT_OUTBOX_SYNC=True)
+class PaymentOutboxTestCase(TestCase):
+    """支付狀態和發件箱同一事務提交，副作用在提交後執行且只執行一次"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='outbox', password='x')
+        self.order = OrderModel.objects.create(
+            user=self.user,
+            contact_name='發件箱',
+            phone='54444444',
+            items=json.dumps([{'type': 'coffee', 'id': 1, 'quantity': 1}]),
+            total_price=58.00,
+            payment_method='alipay',
+        )
+        for target in (
+            'eshop.queue_scheduler.request_queue_recalculation',
+            'eshop.websocket_utils.send_payment_update',
+            'eshop.websocket_utils.send_queue_update',
+        ):
+            patcher = patch(target)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_side_effects_run_after_commit_once(self):
+        """回調提交狀態和發件箱，積分和審計在提交後執行；重複回調不重複發放"""
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            result = PaymentHandler.process_payment_success(self.order.id)
+
+        self.assertTrue(result['success'])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'paid')
+        self.assertEqual(
+            set(PaymentOutbox.objects.values_list('event', 'status')),
+            {('notify', 'pending'), ('loyalty_points', 'pending'),
+             ('audit', 'pending')},
+        )
+        self.assertFalse(CustomerLoyalty.objects.filter(user=self.user).exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(CustomerLoyalty.objects.get(user=self.user).points, 5)
+        self.assertEqual(
+            AuditLog.objects.get(order=self.order).action, 'payment_auto_paid'
+        )
+        self.assertFalse(PaymentOutbox.objects.exclude(status='done').exists())
+
+        # 支付網關重複回調
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentHandler.process_payment_success(self.order.id)
+        self.assertEqual(PaymentOutbox.objects.count(), 3)
+        self.assertEqual(CustomerLoyalty.objects.get(user=self.user).points, 5)
+
+    def test_failed_side_effect_is_retried(self):
+        """失敗的副作用保留為待處理，其他副作用照常完成，下次處理時重試"""
+        failing = {'loyalty_points': self._fail}
+        with patch.dict(HANDLERS, failing):
+            with self.captureOnCommitCallbacks(execute=True):
+                PaymentHandler.process_payment_success(self.order.id)
+
+        row = PaymentOutbox.objects.get(event='loyalty_points')
+        self.assertEqual((row.status, row.attempts), ('pending', 1))
+        self.assertIn('積分服務不可用', row.last_error)
+        self.assertEqual(
+            PaymentOutbox.objects.filter(status='done').count(), 2
+        )
+
+        self.assertEqual(drain_outbox(), {'done': 1, 'failed': 0})
+        row.refresh_from_db()
+        self.assertEqual(row.status, 'done')
+        self.assertEqual(CustomerLoyalty.objects.get(user=self.user).points, 5)
+
+    def test_update_status_is_atomic_with_queue_and_outbox(self):
+        """加入隊列失敗時支付狀態和發件箱一併回滾；成功後重複回調不重複寫入"""
+        with patch(
+            'eshop.queue_manager_refactored.CoffeeQueueManager.add__to_queue',
+            side_effect=RuntimeError('隊列不可用'),
+        ):
+            result = PaymentHandler.process_payment_and_update_status(
+                self.order.id, 'alipay'
+            )
+        self.assertFalse(result['success'])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, 'pending')
+        self.assertFalse(PaymentOutbox.objects.exists())
+
+        with self.captureOnCommitCallbacks(execute=False):
+            result = PaymentHandler.process_payment_and_update_status(
+                self.order.id, 'alipay'
+            )
+            PaymentHandler.process_payment_and_update_status(self.order.id, 'alipay')
+        self.assertTrue(result['success'])
+        self.order.refresh_from_db()
+        self.assertEqual(
+            (self.order.payment_status, self.order.status), ('paid', 'waiting')
+        )
+        self.assertEqual(PaymentOutbox.objects.count(), 3)
+
+    @staticmethod
+    def _fail(row, order):
+        raise RuntimeError('積分服務不可用')
+
+
+class PaymentOutboxDrainerTestCase(TestCase):
+    """沒有 Celery 時，進程啟動即處理遺留記錄，之後不需新支付也會定時掃描"""
+
+    def test_startup_drain_then_periodic_sweep(self):
+        calls = []
+        swept = threading.Event()
+
+        def drain():
+            calls.append(1)
+            if len(calls) >= 3:
+                swept.set()
+            return {'done': 0, 'failed': 0}
+
+        drainer = PaymentOutboxDrainer(sweep_seconds=0.05, drain=drain)
+        self.addCleanup(drainer.stop)
+        with patch('eshop.payment_outbox._payment_outbox_drainer', drainer):
+            self.assertTrue(start_payment_outbox_worker())
+
+        # 只在啟動時喚醒一次，之後的處理來自定時掃描
+        self.assertTrue(swept.wait(timeout=2))
+        self.assertEqual(drainer.get_stats()['woken'], 1)
+
+    @override_settings(PAYMENT_OUTBOX_SYNC=True)
+    def test_sync_mode_does_not_start_worker(self):
+        self.assertFalse(start_payment_outbox_worker())
+
@@ -0,0 +1,80 @@
+"""
+取餐碼池分配器測試
+"""
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from eshop.models import OrderModel, PickupCodePool
+from eshop.pickup_codes import PICKUP_CODE_SPACE, PickupCodeAllocator
+
+
+class PickupCodeAllocatorTestCase(TestCase):
+    """取餐碼分配、回收和冷卻期測試"""
+
+    def setUp(self):
+        self.allocator = PickupCodeAllocator(quiet_minutes=60)
+
+    def _create_order(self, pickup_code, status):
+        return OrderModel.objects.create(
+            items=[],
+            pickup_code=pickup_code,
+            status=status,
+        )
+
+    def test_first_allocation_seeds_pool(self):
+        """空池首次分配時生成全部取餐碼，未完成訂單的碼不會被分配"""
+        self._create_order('0042', 'waiting')
+
+        code = self.allocator.allocate()
+
+        self.assertEqual(PickupCodePool.objects.count(), len(PICKUP_CODE_SPACE))
+        self.assertNotEqual(code, '0042')
+        self.assertIsNotNone(PickupCodePool.objects.get(code='0042').allocated_at)
+        self.assertIsNotNone(PickupCodePool.objects.get(code=code).allocated_at)
+
+    @skipUnless(
+        connection.vendor == 'postgresql', '單條 UPDATE ... RETURNING 只用於 PostgreSQL'
+    )
+    def test_allocation_is_single_query(self):
+        """池生成後每次分配只需一次往返"""
+        self.allocator.seed()
+
+        with self.assertNumQueries(1):
+            code = self.allocator.allocate()
+
+        self.assertIn(code, PICKUP_CODE_SPACE)
+
+    def test_completed_code_recycled_after_quiet_period(self):
+        """池用盡時回收已過冷卻期的完成訂單取餐碼"""
+        self.allocator.seed()
+        old = self._create_order('0042', 'completed')
+        recent = self._create_order('0043', 'completed')
+        self._create_order('0044', 'preparing')
+        long_ago = timezone.now() - timedelta(hours=2)
+        PickupCodePool.objects.update(allocated_at=long_ago)
+        OrderModel.objects.filter(id=old.id).update(updated_at=long_ago)
+
+        code = self.allocator.allocate()
+
+        self.assertEqual(code, '0042')
+        # 0043 仍在冷卻期，0044 被未完成訂單佔用
+        self.assertIsNone(self.allocator.allocate())
+        recycled = PickupCodePool.objects.get(code='0043')
+        self.assertIsNone(recycled.allocated_at)
+        self.assertEqual(
+            recycled.released_at, OrderModel.objects.get(id=recent.id).updated_at
+        )
+        self.assertIsNotNone(PickupCodePool.objects.get(code='0044').allocated_at)
+
+    def test_active_orders_keep_unique_codes(self):
+        """已完成訂單的取餐碼可以被新訂單重用"""
+        self._create_order('0042', 'completed')
+
+        order = self._create_order('0042', 'waiting')
+
+        self.assertEqual(OrderModel.objects.filter(pickup_code='0042').count(), 2)
+        self.assertEqual(order.pickup_code, '0042')
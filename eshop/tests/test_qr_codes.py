@@ -0,0 +1,63 @@
+"""
+訂單二維碼按需生成和緩存測試
+"""
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from eshop import qr_codes
+from eshop.models import OrderModel
+
+
+class OrderQRCodeTestCase(TestCase):
+    """二維碼延遲生成、內容摘要緩存和圖片端點測試"""
+
+    def setUp(self):
+        cache.clear()
+        self.order = OrderModel.objects.create(
+            items=[{'type': 'coffee', 'id': 1, 'quantity': 1}],
+            total_price=35,
+            payment_status='paid',
+            status='ready',
+        )
+
+    def test_save_does_not_render_qr_code(self):
+        """保存訂單時不再渲染二維碼"""
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.qr_code)
+
+    def test_endpoint_serves_cached_png_with_etag(self):
+        """第一次訪問時渲染，之後從緩存提供，ETag 匹配時返回 304"""
+        url = self.order.qr_code_url
+
+        with patch.object(
+            qr_codes, 'render_qr_png', wraps=qr_codes.render_qr_png
+        ) as render:
+            first = self.client.get(url)
+            second = self.client.get(url)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'image/png')
+        self.assertIn('immutable', first['Cache-Control'])
+        self.assertEqual(first.content, second.content)
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_endpoint_requires_current_digest(self):
+        """摘要不匹配（例如取餐碼已改變）時返回 404"""
+        url = self.order.fps_qr_code_url
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.order.total_price = 40
+        self.order.save()
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get(self.order.fps_qr_code_url).status_code, 200)
+
+    def test_listing_queryset_defers_qr_fields(self):
+        """列表查詢不載入二維碼大字段"""
+        order = OrderModel.objects.without_qr_codes().get(id=self.order.id)
+        self.assertEqual(order.get_deferred_fields(), {'qr_code', 'fps_qr_code'})
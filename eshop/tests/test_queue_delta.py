@@ -0,0 +1,83 @@
+"""
+員工端隊列數據增量查詢測試
+"""
+import json
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from eshop.models import CoffeeQueue, OrderModel, QueueChange
+
+
+@override_settings(QUEUE_DELTA_OVERLAP_SECONDS=0)
+class QueueDeltaTestCase(TestCase):
+    """以變更序號為游標的增量隊列數據"""
+
+    def setUp(self):
+        self.url = reverse('eshop:unified_queue_data')
+
+    def _create_order(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return OrderModel.objects.create(
+                contact_name='增量測試',
+                phone='55555555',
+                items=json.dumps([{'type': 'coffee', 'id': 1, 'quantity': 1}]),
+                total_price=25.00,
+                payment_status='paid',
+            )
+
+    def _get(self, since=None):
+        params = {} if since is None else {'since': since}
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_delta_returns_only_changed_orders(self):
+        """增量響應只包含游標之後變化的訂單，並報告離開列表的訂單"""
+        first = self._create_order()
+        second = self._create_order()
+
+        full = self._get()
+        self.assertFalse(full['is_incremental'])
+        waiting_ids = {o['id'] for o in full['data']['waiting_orders']}
+        self.assertEqual(waiting_ids, {first.id, second.id})
+
+        unchanged = self._get(full['cursor'])
+        self.assertTrue(unchanged['is_incremental'])
+        self.assertEqual(unchanged['data']['waiting_orders'], [])
+        self.assertEqual(unchanged['data']['badge_summary']['waiting'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CoffeeQueue.objects.filter(order=first).update(status='ready')
+            OrderModel.objects.filter(id=first.id).update(
+                status='cancelled', updated_at=timezone.now()
+            )
+            CoffeeQueue.objects.get(order=second).save()
+
+        delta = self._get(full['cursor'])
+        self.assertTrue(delta['is_incremental'])
+        self.assertGreater(delta['cursor'], full['cursor'])
+        self.assertEqual([o['id'] for o in delta['data']['waiting_orders']], [second.id])
+        self.assertEqual(delta['data']['removed_order_ids'], [])
+        self.assertEqual(delta['data']['badge_summary']['waiting'], 1)
+
+        # update() 不觸發信號：由調用方記錄變更後，訂單在增量中被移除
+        from eshop.queue_changes import record_queue_changes
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_queue_changes([first.id])
+        removed = self._get(delta['cursor'])
+        self.assertEqual(removed['data']['removed_order_ids'], [first.id])
+
+    def test_expired_cursor_falls_back_to_full_snapshot(self):
+        """游標早於保留的記錄或不是序號時返回全量數據"""
+        order = self._create_order()
+        oldest = QueueChange.objects.order_by('id').first().id
+
+        stale = self._get(oldest - 5)
+        self.assertFalse(stale['is_incremental'])
+        self.assertEqual([o['id'] for o in stale['data']['waiting_orders']], [order.id])
+
+        legacy = self._get(timezone.now().isoformat())
+        self.assertFalse(legacy['is_incremental'])
@@ -0,0 +1,331 @@
+"""
+CoffeeQueueManager 隊列操作測試
+"""
+import json
+from datetime import timedelta
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from eshop.models import CoffeeQueue, OrderModel
+from eshop.queue_manager_refactored import CoffeeQueueManager
+from eshop.queue_scheduler import QueueRecalculationScheduler
+from eshop import queue_state_store
+from eshop.queue_state_store import (
+    QueueStateStore,
+    RedisQueueStateStore,
+    get_queue_state_store,
+)
+
+try:
+    import fakeredis
+except ImportError:  # 可選的測試依賴
+    fakeredis = None
+
+
+User = get_user_model()
+
+
+class QueueManagerTestBase(TestCase):
+    """隊列測試共用設置"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reorderuser',
+            email='reorder@example.com',
+            password='testpass123'
+        )
+        self.manager = CoffeeQueueManager()
+        self.base_time = timezone.now() - timedelta(minutes=30)
+
+    def _create_queue_item(self, order_type, minutes_offset):
+        order = OrderModel.objects.create(
+            user=self.user,
+            contact_name='排序測試',
+            phone='55555555',
+            items=json.dumps([{'type': 'coffee', 'id': 1, 'quantity': 1}]),
+            total_price=25.00,
+            payment_status='paid',
+            status='waiting',
+            order_type=order_type,
+        )
+        # 已支付訂單保存時會自動加入隊列，這裡只覆寫加入時間
+        CoffeeQueue.objects.filter(order=order).update(
+            added_at=self.base_time + timedelta(minutes=minutes_offset),
+        )
+        return CoffeeQueue.objects.get(order=order)
+
+    def _set_positions(self, positions):
+        for queue_item, position in positions:
+            CoffeeQueue.objects.filter(id=queue_item.id).update(position=position)
+
+
+class QueueReorderTestCase(QueueManagerTestBase):
+    """集合式重新排序測試"""
+
+    def test_reorder_moves_quick_orders_first(self):
+        """快速訂單排到普通訂單前，只返回移動的行"""
+        normal = self._create_queue_item('normal', 0)
+        quick = self._create_queue_item('quick', 5)
+        later = self._create_queue_item('normal', 10)
+        self._set_positions([(normal, 1), (quick, 2), (later, 3)])
+
+        moved = self.manager.reorder_waiting_queue()
+
+        moved_ids = {change['queue_item_id'] for change in moved}
+        self.assertEqual(moved_ids, {normal.id, quick.id})
+        positions = dict(CoffeeQueue.objects.values_list('id', 'position'))
+        self.assertEqual(positions[quick.id], 1)
+        self.assertEqual(positions[normal.id], 2)
+        self.assertEqual(positions[later.id], 3)
+
+    def test_reorder_noop_returns_empty_diff(self):
+        """順序正確時不寫入任何行"""
+        quick = self._create_queue_item('quick', 0)
+        normal = self._create_queue_item('normal', 5)
+        self._set_positions([(quick, 1), (normal, 2)])
+
+        with self.assertNumQueries(3):
+            # SAVEPOINT + SELECT ... FOR UPDATE + RELEASE SAVEPOINT
+            moved = self.manager.reorder_waiting_queue()
+
+        self.assertEqual(moved, [])
+
+    def test_reorder_query_count_is_constant(self):
+        """重新排序的查詢數不隨隊列長度增長"""
+        items = [self._create_queue_item('normal', index) for index in range(10)]
+        self._set_positions([(queue_item, 0) for queue_item in items])
+
+        with self.assertNumQueries(4):
+            # SAVEPOINT + SELECT ... FOR UPDATE + bulk UPDATE + RELEASE SAVEPOINT
+            moved = self.manager.reorder_waiting_queue()
+
+        self.assertEqual(len(moved), 10)
+        self.assertEqual(
+            sorted(CoffeeQueue.objects.values_list('position', flat=True)),
+            list(range(1, 11)),
+        )
+
+
+class EstimatedTimesTestCase(QueueManagerTestBase):
+    """窗口函數累計預計時間測試"""
+
+    def test_full_recompute_is_cumulative(self):
+        """每一項的開始時間等於前面所有項製作時間之和"""
+        items = [self._create_queue_item('normal', index) for index in range(3)]
+        CoffeeQueue.objects.filter(id=items[1].id).update(preparation_time_minutes=8)
+
+        result = self.manager.update_estimated_times()
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['data']['total_preparation_minutes'], 18)
+        rows = [CoffeeQueue.objects.get(id=queue_item.id) for queue_item in items]
+        self.assertEqual(rows[0].estimated_completion_time, rows[1].estimated_start_time)
+        self.assertEqual(rows[1].estimated_completion_time, rows[2].estimated_start_time)
+        self.assertEqual(
+            rows[1].estimated_completion_time - rows[1].estimated_start_time,
+            timedelta(minutes=8),
+        )
+
+    def test_dirty_from_position_keeps_head(self):
+        """從第 k 項開始計算時，前面的項不會被改寫"""
+        items = [self._create_queue_item('normal', index) for index in range(4)]
+        self.manager.update_estimated_times()
+        head_before = CoffeeQueue.objects.get(id=items[0].id)
+        anchor = CoffeeQueue.objects.get(id=items[2].id)
+        CoffeeQueue.objects.filter(id=items[3].id).update(preparation_time_minutes=12)
+
+        result = self.manager.update_estimated_times(from_position=4)
+
+        self.assertEqual(result['data']['waiting_s_updated'], 1)
+        head_after = CoffeeQueue.objects.get(id=items[0].id)
+        self.assertEqual(head_before.updated_at, head_after.updated_at)
+        tail = CoffeeQueue.objects.get(id=items[3].id)
+        self.assertEqual(tail.estimated_start_time, anchor.estimated_completion_time)
+        self.assertEqual(
+            tail.estimated_completion_time,
+            anchor.estimated_completion_time + timedelta(minutes=12),
+        )
+
+    def test_recompute_query_count_is_constant(self):
+        """重新計算的查詢數不隨隊列長度增長"""
+        for index in range(10):
+            self._create_queue_item('normal', index)
+        CoffeeQueue.objects.update(estimated_start_time=None)
+
+        with self.assertNumQueries(2):
+            # 窗口函數 SELECT + bulk UPDATE
+            result = self.manager.update_estimated_times()
+
+        self.assertEqual(result['data']['waiting_s_updated'], 10)
+
+
+class QueueSchedulerTestCase(TestCase):
+    """重新計算調度器合併測試"""
+
+    def test_burst_is_coalesced_into_one_run(self):
+        """窗口內的多次請求只執行一次，且合併所有原因"""
+        scheduler = QueueRecalculationScheduler(window_ms=100)
+        runs = []
+        scheduler._execute = lambda full, reasons, order_ids: runs.append(
+            (full, reasons, order_ids)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for order_id in range(5):
+                scheduler.request_recalculation(reason='click', order_id=order_id)
+            scheduler.request_recalculation(reason='batch', full=True)
+
+        self.assertTrue(scheduler.wait_until_idle(timeout=2))
+        self.assertEqual(len(runs), 1)
+        full, reasons, order_ids = runs[0]
+        self.assertTrue(full)
+        self.assertEqual(order_ids, [0, 1, 2, 3, 4])
+        self.assertEqual(len(reasons), 6)
+
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['requested'], 6)
+        self.assertEqual(stats['coalesced'], 5)
+
+
+class QueueStateStoreTestCase(QueueManagerTestBase):
+    """內存隊列狀態存儲測試"""
+
+    def setUp(self):
+        super().setUp()
+        self.store = self._make_store()
+        patcher = patch(
+            'eshop.queue_manager_refactored.get_queue_state_store',
+            return_value=self.store,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _make_store(self):
+        return QueueStateStore(flush_interval_ms=0)
+
+    def test_reorder_reads_store_and_writes_behind(self):
+        """重新排序不查詢資料庫，位置在 flush 時才寫回"""
+        normal = self._create_queue_item('normal', 0)
+        quick = self._create_queue_item('quick', 5)
+        self._set_positions([(normal, 1), (quick, 2)])
+        self.store.load()
+
+        with self.assertNumQueries(0):
+            moved = self.manager.reorder_waiting_queue()
+
+        self.assertEqual(len(moved), 2)
+        self.assertEqual(CoffeeQueue.objects.get(id=quick.id).position, 2)
+
+        self.assertEqual(self.store.flush(), 2)
+        positions = dict(CoffeeQueue.objects.values_list('id', 'position'))
+        self.assertEqual(positions[quick.id], 1)
+        self.assertEqual(positions[normal.id], 2)
+
+    def test_estimated_times_flushed_from_store(self):
+        """存儲計算的預計時間寫回後與串聯規則一致"""
+        items = [self._create_queue_item('normal', index) for index in range(3)]
+        self.store.load()
+
+        result = self.manager.update_estimated_times()
+        self.store.flush()
+
+        self.assertEqual(result['data']['total_preparation_minutes'], 15)
+        rows = [CoffeeQueue.objects.get(id=queue_item.id) for queue_item in items]
+        self.assertEqual(rows[0].estimated_completion_time, rows[1].estimated_start_time)
+        self.assertEqual(rows[1].estimated_completion_time, rows[2].estimated_start_time)
+
+    def test_reconcile_prefers_database(self):
+        """對賬以資料庫為準並返回差異"""
+        queue_item = self._create_queue_item('normal', 0)
+        self.store.load()
+        CoffeeQueue.objects.filter(id=queue_item.id).update(
+            status='preparing', barista='阿明'
+        )
+
+        differences = self.store.reconcile()
+
+        changed_fields = {difference['field'] for difference in differences}
+        self.assertIn('status', changed_fields)
+        self.assertEqual(self.store.get_counts()['preparing'], 1)
+        self.assertEqual(
+            self.store.get_barista_loads(), {'阿明': queue_item.coffee_count}
+        )
+
+    def test_signals_follow_database_writes(self):
+        """信號在 ready() 中連接，不經 get_queue_state_store() 也會同步存儲"""
+        queue_item = self._create_queue_item('normal', 0)
+        self.store.load()
+
+        with patch.object(queue_state_store, '_queue_state_store', self.store):
+            queue_item.status = 'preparing'
+            queue_item.barista = '阿明'
+            queue_item.save()
+            self.assertEqual(self.store.get_entry(queue_item.id)['status'], 'preparing')
+            self.assertEqual(self.store.get_counts()['preparing'], 1)
+
+            queue_item_id = queue_item.id
+            queue_item.delete()
+        self.assertIsNone(self.store.get_entry(queue_item_id))
+        self.assertEqual(self.store.get_counts()['preparing'], 0)
+
+
+@skipUnless(fakeredis, '需要 fakeredis')
+class RedisQueueStateStoreTestCase(QueueStateStoreTestCase):
+    """Redis 隊列狀態存儲：與內存存儲相同的行為，且多個進程共享"""
+
+    def _make_store(self):
+        self.server = fakeredis.FakeServer()
+        return RedisQueueStateStore(
+            client=fakeredis.FakeRedis(server=self.server), flush_interval_ms=0
+        )
+
+    def test_entries_shared_between_processes(self):
+        """另一個進程的存儲讀取同一份狀態，時間欄位完整往返"""
+        queue_item = self._create_queue_item('quick', 0)
+        self.store.load()
+        self.manager.update_estimated_times()
+
+        other = RedisQueueStateStore(
+            client=fakeredis.FakeRedis(server=self.server), flush_interval_ms=0
+        )
+        other._loaded = True
+        entry = other.get_entry(queue_item.id)
+        self.assertEqual(entry, self.store.get_entry(queue_item.id))
+        self.assertEqual(entry['order_type'], 'quick')
+        self.assertEqual(entry['added_at'], queue_item.added_at)
+        self.assertIsNotNone(entry['estimated_completion_time'])
+        self.assertEqual(other.get_counts(), {'waiting': 1, 'preparing': 0, 'ready': 0})
+
+
+@override_settings(
+    QUEUE_STATE_STORE_ENABLED=True,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+)
+class QueueStateStoreSelectionTestCase(TestCase):
+    """沒有 Redis 時只在單進程部署中啟用內存存儲"""
+
+    def setUp(self):
+        for name in ('_queue_state_store', '_memory_store_refused'):
+            patcher = patch.object(
+                queue_state_store, name, getattr(queue_state_store, name)
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        queue_state_store._queue_state_store = None
+        queue_state_store._memory_store_refused = False
+
+    @override_settings(QUEUE_STATE_STORE_PROCESSES=1)
+    def test_single_process_uses_memory_store(self):
+        store = get_queue_state_store()
+        self.assertIsInstance(store, QueueStateStore)
+        self.assertEqual(store.backend, 'memory')
+
+    @override_settings(QUEUE_STATE_STORE_PROCESSES=4)
+    def test_multiple_processes_refuse_memory_store(self):
+        self.assertIsNone(get_queue_state_store())
+        self.assertIsNone(get_queue_state_store())
+
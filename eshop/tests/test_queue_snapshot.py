@@ -0,0 +1,106 @@
+"""
+隊列快照引擎測試
+"""
+import json
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from eshop.models import CoffeeQueue, OrderModel
+from eshop.views.queue_processors import READY_ORDERS_LIMIT, QueueSnapshot
+
+
+class QueueSnapshotTestCase(TestCase):
+    """五個列表由最多兩次查詢生成"""
+
+    def setUp(self):
+        now = timezone.now()
+        items = json.dumps([{'type': 'coffee', 'id': 1, 'quantity': 1}])
+
+        self.waiting = OrderModel.objects.create(
+            contact_name='等待', phone='51111111', items=items,
+            total_price=25.00, payment_status='paid',
+        )
+        self.preparing = OrderModel.objects.create(
+            contact_name='製作', phone='52222222', items=items,
+            total_price=25.00, payment_status='paid',
+        )
+        CoffeeQueue.objects.filter(order=self.preparing).update(status='preparing')
+        OrderModel.objects.filter(id=self.preparing.id).update(
+            status='preparing', preparation_started_at=now
+        )
+
+        codes = iter(range(9000, 9100))
+
+        def build(offset, **fields):
+            return OrderModel(
+                items=items, total_price=25.00, contact_name='快照',
+                pickup_code=str(next(codes)),
+                created_at=now - timedelta(minutes=offset), **fields
+            )
+
+        self.pending = OrderModel.objects.bulk_create(
+            [build(1, payment_status='payment_pending', status='pending')]
+        )[0]
+        self.ready = OrderModel.objects.bulk_create(
+            [
+                build(
+                    i, payment_status='paid', status='ready',
+                    ready_at=now - timedelta(minutes=i),
+                )
+                for i in range(READY_ORDERS_LIMIT + 2)
+            ]
+        )
+        self.completed, self.expired = OrderModel.objects.bulk_create(
+            [
+                build(
+                    10, payment_status='paid', status='completed',
+                    picked_up_at=now - timedelta(hours=1),
+                ),
+                build(
+                    400, payment_status='paid', status='completed',
+                    picked_up_at=now - timedelta(hours=5),
+                ),
+            ]
+        )
+
+    def test_full_snapshot_uses_two_queries(self):
+        """全量快照最多兩次查詢，並按各列表的窗口分組"""
+        with self.assertNumQueries(2):
+            sections = QueueSnapshot().build()
+
+        def ids(section):
+            return [order['id'] for order in sections[section]]
+
+        self.assertEqual(ids('payment_pending_orders'), [self.pending.id])
+        self.assertEqual(ids('waiting_orders'), [self.waiting.id])
+        self.assertEqual(ids('preparing_orders'), [self.preparing.id])
+        self.assertEqual(ids('completed_orders'), [self.completed.id])
+        # 就緒列表只取最新的 READY_ORDERS_LIMIT 筆
+        self.assertEqual(
+            ids('ready_orders'),
+            [order.id for order in self.ready[:READY_ORDERS_LIMIT]],
+        )
+        self.assertEqual(sections['ready_orders'][0]['barista'], '未分配')
+
+    def test_incremental_snapshot_keeps_windows(self):
+        """增量快照只返回指定訂單，窗口外的訂單不會出現"""
+        outside_window = self.ready[-1]
+        snapshot = QueueSnapshot(
+            order_ids={self.waiting.id, self.ready[0].id, outside_window.id}
+        )
+        with self.assertNumQueries(2):
+            sections = snapshot.build()
+
+        self.assertEqual(
+            [order['id'] for order in sections['waiting_orders']], [self.waiting.id]
+        )
+        self.assertEqual(
+            [order['id'] for order in sections['ready_orders']], [self.ready[0].id]
+        )
+        self.assertEqual(sections['preparing_orders'], [])
+
+        # 只請求隊列項列表時不執行訂單查詢
+        with self.assertNumQueries(1):
+            QueueSnapshot().build_section('waiting_orders')
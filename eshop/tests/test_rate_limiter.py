@@ -0,0 +1,115 @@
+"""
+令牌桶速率限制測試
+"""
+import json
+from unittest.mock import patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+
+from eshop.rate_limiter import (
+    LocalTokenBuckets,
+    RateLimiter,
+    RateLimitMiddleware,
+    rate_limit,
+)
+from eshop.utils.security_utils import SecurityUtils
+
+
+class RateLimiterTestCase(TestCase):
+    """本地令牌桶、中間件和裝飾器"""
+
+    def setUp(self):
+        self.limiter = RateLimiter(redis_client=False)
+        patcher = patch('eshop.rate_limiter._rate_limiter', self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.factory = RequestFactory()
+
+    def test_bucket_denies_then_refills(self):
+        """超過 limit 後拒絕，按窗口速率補充令牌"""
+        with patch('eshop.rate_limiter.time.time', return_value=1000.0):
+            results = [
+                self.limiter.check('user:1', 'test', limit=3, window_minutes=1)
+                for _ in range(4)
+            ]
+        self.assertEqual([r['allowed'] for r in results], [True, True, True, False])
+        self.assertEqual(results[-1]['reset_in'], 20)
+
+        # 20 秒補充一個令牌
+        with patch('eshop.rate_limiter.time.time', return_value=1020.0):
+            self.assertTrue(
+                self.limiter.check('user:1', 'test', limit=3, window_minutes=1)[
+                    'allowed'
+                ]
+            )
+            self.assertFalse(
+                self.limiter.check('user:1', 'test', limit=3, window_minutes=1)[
+                    'allowed'
+                ]
+            )
+
+    def test_local_buckets_are_bounded(self):
+        """本地後備只保留最近使用的桶"""
+        buckets = LocalTokenBuckets(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            buckets.take(key, 5, 1.0, 0.0)
+        self.assertEqual(list(buckets._buckets), ['b', 'c'])
+
+    def test_middleware_applies_path_policy(self):
+        """中間件按路徑策略限制，超出時返回 429 和 Retry-After"""
+        middleware = RateLimitMiddleware(lambda request: HttpResponse('ok'))
+        policy = {'limit': 2, 'window_minutes': 1}
+
+        def post(path):
+            request = self.factory.post(path)
+            request.user = AnonymousUser()
+            return middleware(request)
+
+        with patch(
+            'eshop.security_config.security_config.get_rate_limit_config',
+            return_value=policy,
+        ):
+            codes = [post('/eshop/order/confirm/').status_code for _ in range(3)]
+            # 支付回調不受限制
+            callback_codes = [
+                post('/eshop/payment/alipay/notify/').status_code for _ in range(3)
+            ]
+
+        self.assertEqual(codes, [200, 200, 429])
+        self.assertEqual(callback_codes, [200, 200, 200])
+
+        request = self.factory.get('/eshop/order/confirm/')
+        request.user = AnonymousUser()
+        self.assertEqual(middleware(request).status_code, 200)
+
+    def test_decorator_returns_json_for_api(self):
+        """裝飾器對 API 請求返回 JSON 429"""
+
+        @rate_limit('payment')
+        def view(request):
+            return HttpResponse('ok')
+
+        with patch(
+            'eshop.security_config.security_config.get_rate_limit_config',
+            return_value={'limit': 1, 'window_minutes': 1},
+        ):
+            request = self.factory.get('/eshop/api/pay/')
+            request.user = AnonymousUser()
+            self.assertEqual(view(request).status_code, 200)
+            response = view(request)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(json.loads(response.content)['error_code'], 'rate_limited')
+        self.assertEqual(response['Retry-After'], '60')
+
+    def test_security_utils_delegates_to_limiter(self):
+        """SecurityUtils.check_rate_limit 使用共享的令牌桶"""
+        utils = SecurityUtils()
+        results = [
+            utils.check_rate_limit('test_user', '/api/test', limit=2, window_minutes=1)
+            for _ in range(3)
+        ]
+        self.assertEqual([r['allowed'] for r in results], [True, True, False])
+        self.assertEqual(self.limiter.get_stats()['denied'], 1)
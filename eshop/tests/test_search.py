@@ -0,0 +1,86 @@
+"""
+商品搜索測試
+"""
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from eshop.models import BeanItem, CoffeeItem
+from eshop.search import search_products
+
+
+class ProductSearchTestCase(TestCase):
+    """PostgreSQL 全文搜索和進程內 n-gram 索引返回相同的排序結果"""
+
+    def setUp(self):
+        def coffee(name, **fields):
+            return CoffeeItem.objects.create(
+                name=name, price=Decimal('38.00'), image='coffee_images/x.jpg',
+                **fields,
+            )
+
+        self.latte = coffee('Latte', highlight='絲滑奶香', origin='Brazil')
+        self.mocha = coffee('Mocha', flavor='chocolate, latte-like body')
+        self.yirga = coffee('耶加雪菲手沖', origin='Ethiopia', flavor='花香 柑橘')
+        coffee('Lavender Latte', is_published=False)
+        BeanItem.objects.create(
+            name='Latte Blend', price_200g=Decimal('120'), image='bean_images/x.jpg'
+        )
+
+    def _assert_results(self):
+        def names(query):
+            return [c.name for c in search_products(query, 'coffee')]
+
+        # 前綴匹配，名稱命中排在風味命中之前，未上架的不返回
+        self.assertEqual(names('lat'), ['Latte', 'Mocha'])
+        # 中文子串和其他欄位
+        self.assertEqual(names('雪菲'), ['耶加雪菲手沖'])
+        self.assertEqual(names('ethiopia'), ['耶加雪菲手沖'])
+        self.assertEqual(names('ＬＡＴＴＥ'), ['Latte', 'Mocha'])
+        self.assertEqual(names('espresso'), [])
+        self.assertEqual(names('  '), [])
+        self.assertEqual(
+            [b.name for b in search_products('latte', 'bean')], ['Latte Blend']
+        )
+
+    def test_postgres_backend(self):
+        with override_settings(PRODUCT_SEARCH_BACKEND='postgres'):
+            self._assert_results()
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='memory')
+    def test_memory_backend(self):
+        self._assert_results()
+        # n-gram 重疊容忍錯字
+        self.assertEqual(
+            [c.name for c in search_products('mocah', 'coffee')], ['Mocha']
+        )
+
+    def test_suggest_endpoint_caches_prefix(self):
+        response = self.client.get('/search/suggest/', {'q': 'Lat'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(
+            [(r['type'], r['name']) for r in results],
+            [('coffee', 'Latte'), ('coffee', 'Mocha'), ('bean', 'Latte Blend')],
+        )
+        self.assertEqual(results[0]['url'], f'/coffee/{self.latte.id}/')
+        self.assertIn('max-age=60', response['Cache-Control'])
+
+        # 同一前綴再次查詢直接讀取緩存
+        with self.assertNumQueries(0):
+            self.client.get('/search/suggest/', {'q': 'lat ', 'type': ''})
+
+        self.assertEqual(
+            self.client.get('/search/suggest/', {'q': 'x', 'type': 'tea'}).status_code,
+            400,
+        )
+
+    def test_search_page_renders_results(self):
+        response = self.client.get('/coffee_menu/search/', {'q': 'mocha'})
+        self.assertEqual([c.name for c in response.context['coffee_menu']], ['Mocha'])
+        self.assertContains(response, 'Mocha')
+        self.assertNotContains(response, '耶加雪菲手沖')
+
+        # 菜單頁的片段緩存不受搜索結果影響
+        response = self.client.get('/coffee_menu/')
+        self.assertContains(response, '耶加雪菲手沖')
@@ -0,0 +1,117 @@
+"""
+智能分配工作負載快照測試
+"""
+from django.test import TestCase
+
+from eshop.models import Barista, CoffeeQueue, OrderModel
+from eshop.smart_allocation import (
+    BaristaWorkloadManager,
+    SmartOrderAllocator,
+    workload_snapshot,
+)
+
+
+class WorkloadSnapshotTestCase(TestCase):
+    """工作負載快照聚合查詢和共享測試"""
+
+    def setUp(self):
+        self.manager = BaristaWorkloadManager()
+        self.baristas = [
+            Barista.objects.create(name=f'barista-{index}', max_concurrent_orders=4)
+            for index in range(3)
+        ]
+        Barista.objects.create(name='off-duty', is_active=False)
+
+    def _create_queue_item(self, barista, status, coffee_count):
+        order = OrderModel.objects.create(items=[], status='preparing')
+        return CoffeeQueue.objects.create(
+            order=order,
+            barista=barista.name,
+            status=status,
+            coffee_count=coffee_count,
+        )
+
+    def test_loads_aggregated_in_constant_queries(self):
+        """負載按員工彙總正在製作的杯數，查詢數不隨員工數增加"""
+        first, second, _ = self.baristas
+        self._create_queue_item(first, 'preparing', 2)
+        self._create_queue_item(first, 'preparing', 1)
+        self._create_queue_item(second, 'waiting', 3)
+
+        with self.assertNumQueries(1):
+            workloads = self.manager.get_all_baristas_workload(include_orders=False)
+        with self.assertNumQueries(2):
+            detailed = self.manager.get_all_baristas_workload()
+
+        loads = {w['name']: w['current_load'] for w in workloads}
+        self.assertEqual(loads, {'barista-0': 3, 'barista-1': 0, 'barista-2': 0})
+        self.assertEqual(workloads[-1]['name'], 'barista-0')
+        self.assertEqual(workloads[-1]['available_slots'], 1)
+
+        first_detail = next(w for w in detailed if w['name'] == 'barista-0')
+        self.assertEqual(len(first_detail['current_orders']), 2)
+
+    def test_snapshot_shared_within_block(self):
+        """同一區塊內的讀取（包括嵌套）共享快照，訂單明細只載入一次"""
+        with workload_snapshot() as snapshot:
+            with self.assertNumQueries(1):
+                with workload_snapshot() as inner:
+                    self.manager.get_system_workload()
+                    self.manager.get_system_workload()
+                    workload = self.manager.get_barista_workload(self.baristas[0].id)
+
+        self.assertIs(inner, snapshot)
+        self.assertEqual(workload['current_orders'], [])
+        self.assertIsNone(self.manager.get_barista_workload(-1))
+
+
+class BatchAllocationTestCase(TestCase):
+    """批量 LPT 分配測試"""
+
+    def setUp(self):
+        self.allocator = SmartOrderAllocator()
+        for name in ('A', 'B'):
+            Barista.objects.create(name=name, max_concurrent_orders=4)
+
+    def _create_waiting_item(self, position, coffee_count):
+        order = OrderModel.objects.create(items=[], status='waiting')
+        return CoffeeQueue.objects.create(
+            order=order,
+            position=position,
+            status='waiting',
+            coffee_count=coffee_count,
+        )
+
+    def test_lpt_shortens_makespan_and_applies(self):
+        """大訂單先分配，最後完成時間短於逐個均衡分配"""
+        self._create_waiting_item(1, 1)
+        self._create_waiting_item(2, 1)
+        large = self._create_waiting_item(3, 4)
+
+        result = self.allocator.allocate_batch(apply=True)
+
+        self.assertTrue(result['success'])
+        # 逐個分配: A = 1杯 + 4杯 = 5 + 14 分鐘；LPT: A = 4杯，B = 1杯 + 1杯
+        self.assertEqual(result['greedy_makespan'], 19)
+        self.assertEqual(result['predicted_makespan'], 14)
+        self.assertEqual(result['improvement'], 5)
+
+        large.refresh_from_db()
+        small_baristas = set(
+            CoffeeQueue.objects.exclude(id=large.id).values_list('barista', flat=True)
+        )
+        self.assertEqual(len(small_baristas), 1)
+        self.assertNotIn(large.barista, small_baristas)
+        self.assertIn(large.barista, ('A', 'B'))
+
+    def test_max_orders_bounds_batch(self):
+        """超過 max_orders 的訂單不參與本次分配"""
+        for position in range(1, 4):
+            self._create_waiting_item(position, 1)
+
+        result = self.allocator.allocate_batch(max_orders=2)
+
+        self.assertEqual(result['orders_considered'], 2)
+        self.assertTrue(result['truncated'])
+        self.assertFalse(result['applied'])
+        self.assertFalse(CoffeeQueue.objects.filter(barista__in=['A', 'B']).exists())
@@ -0,0 +1,80 @@
+"""
+隊列廣播合併器測試
+"""
+from unittest.mock import Mock
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+
+from eshop.consumers import QueueConsumer
+from eshop.websocket_batcher import QueueBroadcastBatcher
+
+
+class QueueBroadcastBatcherTestCase(TestCase):
+    """合併窗口內的隊列事件按訂單合併為一個 queue_batch"""
+
+    def test_events_merge_per_order_into_one_frame(self):
+        mock_broadcast = Mock(return_value=True)
+        batcher = QueueBroadcastBatcher(window_ms=100, broadcast=mock_broadcast)
+
+        batcher.enqueue('queue_updates', {
+            'type': 'queue_update', 'update_type': 'reorder',
+            'data': {'order_id': 1, 'position': 2},
+        })
+        batcher.enqueue('queue_updates', {
+            'type': 'queue_update', 'update_type': 'time_update',
+            'data': {'order_id': 2},
+        })
+        batcher.enqueue('queue_updates', {
+            'type': 'queue_update', 'update_type': 'preparation_started',
+            'data': {'order_id': 1, 'status': 'preparing'},
+        })
+        batcher.enqueue('queue_updates', {
+            'type': 'queue_update', 'update_type': 'queue_recalculated',
+            'data': {'order_ids': [1, 2]},
+        })
+
+        self.assertTrue(batcher.wait_until_idle(timeout=2))
+        self.assertEqual(mock_broadcast.call_count, 1)
+        group_name, message_type, payload = mock_broadcast.call_args[0]
+        self.assertEqual(group_name, 'queue_updates')
+        self.assertEqual(message_type, 'queue_batch')
+        # 同一訂單以最後一次為準，保留首次出現的順序
+        self.assertEqual(
+            [event['update_type'] for event in payload['events']],
+            ['preparation_started', 'time_update', 'queue_recalculated'],
+        )
+
+        stats = batcher.get_stats()
+        self.assertEqual(stats['events_in'], 4)
+        self.assertEqual(stats['merged'], 1)
+        self.assertEqual(stats['frames_out'], 1)
+        self.assertEqual(stats['merge_ratio'], 4.0)
+
+    def test_queue_consumer_unpacks_batch(self):
+        """QueueConsumer 把批次拆成 queue_update 事件，以一個訊息發送"""
+        consumer = QueueConsumer()
+        sent = []
+
+        async def capture(data):
+            sent.append(data)
+
+        consumer._send_json = capture
+        async_to_sync(consumer.queue_batch)({
+            'type': 'queue_batch',
+            'events': [
+                {'type': 'queue_update', 'update_type': 'add',
+                 'data': {'order_id': 5, 'message': '已加入隊列'}},
+                {'type': 'queue_update', 'update_type': 'queue_recalculated',
+                 'data': {'full': False}},
+            ],
+        })
+
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0]['type'], 'queue_batch')
+        self.assertEqual(sent[0]['order_ids'], [5])
+        self.assertEqual(
+            [event['type'] for event in sent[0]['events']],
+            ['queue_update', 'queue_update'],
+        )
+        self.assertEqual(sent[0]['events'][0]['update_type'], 'add')
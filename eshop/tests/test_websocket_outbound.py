@@ -0,0 +1,90 @@
+"""
+WebSocket 出站隊列測試
+"""
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+
+from eshop.websocket_batcher import get_queue_broadcast_batcher
+from eshop.websocket_manager import OutboundMessageQueue, websocket_manager
+
+
+class FakeChannelLayer:
+    """記錄發送的訊息，可設定前幾次 group_send 失敗"""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    async def group_send(self, group_name, message):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('channel layer unavailable')
+        self.sent.append((group_name, message))
+
+    async def send(self, channel_name, message):
+        self.sent.append((channel_name, message))
+
+
+class OutboundMessageQueueTestCase(TestCase):
+    """有界出站隊列：不阻塞排入、丟棄最舊、重試"""
+
+    def setUp(self):
+        self.queues = []
+        self.addCleanup(self._close_queues)
+
+    def _close_queues(self):
+        for queue in self.queues:
+            queue.close()
+        # 其他測試留下的全局後台發送不能影響後續測試
+        get_queue_broadcast_batcher().close()
+        websocket_manager.outbound.close()
+
+    def _queue(self, layer, **kwargs):
+        queue = OutboundMessageQueue(websocket_manager, channel_layer=layer, **kwargs)
+        self.queues.append(queue)
+        return queue
+
+    def test_full_queue_drops_oldest_in_event_loop(self):
+        """事件循環中排入不阻塞；隊列滿時丟棄最舊的訊息"""
+        layer = FakeChannelLayer()
+        queue = self._queue(layer, maxsize=2)
+
+        async def scenario():
+            for i in range(3):
+                queue.put('group', 'queue_updates', {'type': 'queue_update', 'i': i})
+            # 排空任務還沒有機會運行
+            self.assertEqual(queue.get_stats()['dropped'], 1)
+            self.assertEqual(queue.get_stats()['running_on'], 'server')
+            joined = await queue.ajoin(timeout=2)
+            # 在事件循環結束前停止排空任務
+            queue.close()
+            await asyncio.sleep(0)
+            return joined
+
+        self.assertTrue(async_to_sync(scenario)())
+
+        self.assertEqual([message['i'] for _, message in layer.sent], [1, 2])
+        stats = queue.get_stats()
+        self.assertEqual(stats['enqueued'], 3)
+        self.assertEqual(stats['delivered'], 2)
+
+    def test_sync_enqueue_retries_with_backoff(self):
+        """同步代碼排入後由後備排空任務發送，失敗時以退避重試"""
+        layer = FakeChannelLayer(failures=1)
+        queue = self._queue(layer)
+
+        queue.put(
+            'group', 'queue_updates', {'type': 'queue_update'},
+            retry={'base_delay': 0.01, 'jitter': False},
+        )
+        deadline = time.monotonic() + 2
+        while not layer.sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(len(layer.sent), 1)
+        stats = queue.get_stats()
+        self.assertEqual(stats['running_on'], 'fallback')
+        self.assertEqual(stats['retried'], 1)
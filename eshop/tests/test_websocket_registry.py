@@ -0,0 +1,115 @@
+"""
+WebSocket 連線註冊表測試
+"""
+import json
+import threading
+from datetime import timedelta
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+from django.utils import timezone
+
+from eshop.websocket_manager import websocket_manager
+
+
+class ConnectionRegistryTestCase(TestCase):
+    """索引查詢、堆清理與連線數統計"""
+
+    def setUp(self):
+        self.conn_ids = []
+
+    def tearDown(self):
+        for conn_id in self.conn_ids:
+            websocket_manager.unregister_connection(conn_id, 'test cleanup')
+
+    def register(self, conn_id, user_id, user_type='staff'):
+        self.conn_ids.append(conn_id)
+        websocket_manager.register_connection(
+            conn_id,
+            f'channel.{conn_id}',
+            {'user_id': user_id, 'user_type': user_type},
+        )
+
+    def test_indexes_follow_lifecycle(self):
+        """channel/使用者索引在註冊、斷開、註銷時保持一致"""
+        self.register('registry-a', 91001)
+        self.register('registry-b', 91001, user_type='customer')
+
+        conn_id, conn = websocket_manager.get_connection_by_channel(
+            'channel.registry-a'
+        )
+        self.assertEqual(conn_id, 'registry-a')
+        self.assertEqual(conn['user_type'], 'staff')
+        self.assertEqual(
+            websocket_manager.get_connections_for_user(91001),
+            ['registry-a', 'registry-b'],
+        )
+
+        websocket_manager.disconnect('registry-a', 'test')
+        self.assertEqual(
+            websocket_manager.get_connections_for_user(91001), ['registry-b']
+        )
+        self.assertNotIn('registry-a', websocket_manager.connection_pool['staff'])
+
+        websocket_manager.unregister_connection('registry-b')
+        self.assertEqual(websocket_manager.get_connections_for_user(91001), [])
+        self.assertEqual(
+            websocket_manager.get_connection_by_channel('channel.registry-b'),
+            (None, None),
+        )
+
+    def test_cleanup_skips_refreshed_connections(self):
+        """清理只斷開心跳真正過期的連線，刷新過的舊堆條目被忽略"""
+        started = timezone.now() - timedelta(minutes=20)
+        with patch('eshop.websocket_manager.timezone.now', return_value=started):
+            self.register('registry-stale', 91002)
+            self.register('registry-fresh', 91003)
+
+        websocket_manager.update_heartbeat('registry-fresh')
+        websocket_manager.cleanup_inactive_connections(heartbeat_timeout_minutes=10)
+
+        self.assertEqual(
+            websocket_manager.connections['registry-stale']['status'], 'disconnected'
+        )
+        self.assertEqual(
+            websocket_manager.connections['registry-fresh']['status'], 'active'
+        )
+
+    def test_cluster_counts_fall_back_to_local(self):
+        """未配置 channels_redis 時只統計本進程"""
+        self.register('registry-count', 91004)
+
+        counts = websocket_manager.get_cluster_counts()
+        self.assertEqual(counts['processes'], 1)
+        self.assertEqual(
+            counts['active_connections'],
+            websocket_manager.get_active_connections_count(),
+        )
+        self.assertEqual(
+            counts['staff'], websocket_manager.get_active_connections_count('staff')
+        )
+
+    def test_counts_published_off_event_loop(self):
+        """consumer 在事件循環中註冊 / 斷開時，Redis 寫入在線程池中執行"""
+        writes = []
+        published = threading.Event()
+
+        class Client:
+            def hset(self, key, field, value):
+                writes.append((threading.get_ident(), json.loads(value)))
+                published.set()
+
+        async def connect():
+            self.register('registry-async', 91005, user_type='customer')
+            websocket_manager.disconnect('registry-async', 'test')
+            return threading.get_ident()
+
+        with patch.object(websocket_manager, '_redis', Client()):
+            loop_thread = async_to_sync(connect)()
+            self.assertTrue(published.wait(timeout=2))
+
+        self.assertNotIn(loop_thread, [thread for thread, _ in writes])
+        self.assertIn('customer', writes[-1][1])
+        self.assertFalse(websocket_manager._counts_write_pending)
+
@@ -9,6 +9,7 @@ from .views.order_views import (
     continue_payment,
     order_detail,
     order_payment_confirmation,
+    order_qr_code,
     order_status_api,
     quick_order,
 )
@@ -32,6 +33,8 @@ urlpatterns = [
     # ========================================
     # 訂單詳情頁面（原名稱保持不變）
     path("detail/<int:order_id>/", order_detail, name="order_detail"),
+    # 訂單二維碼圖片（取餐碼 / FPS 付款，按需生成並緩存）
+    path("qr/<int:order_id>/<str:kind>/", order_qr_code, name="order_qr_code"),
     # 訂單狀態API
     path("api/order-status/<int:order_id>/", order_status_api, name="order_status_api"),
     # 快速訂單相關
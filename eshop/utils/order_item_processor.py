@@ -107,6 +107,31 @@ class OrderItemProcessor:
             "items_options": items_options,
         }
 
+    @staticmethod
+    def with_image_srcsets(item_result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        為商品項目加上 image_srcset（WebP 縮圖，沒有時為空字符串）
+
+        縮圖在商品保存後才由後台生成，所以不保存在 display_payload 中，
+        每次讀取時從商品目錄快照查詢（按目錄版本緩存）。返回新的字典，
+        不修改傳入的數據。
+        """
+        from eshop.catalog import get_catalog
+
+        catalog = get_catalog()
+        result = dict(item_result)
+        for key in ("all_items", "coffee_items", "bean_items"):
+            items = []
+            for item in item_result.get(key, []):
+                item = dict(item)
+                if item.get("type") in ("coffee", "bean"):
+                    item["image_srcset"] = catalog.image_srcset(
+                        item["type"], item.get("id")
+                    )
+                items.append(item)
+            result[key] = items
+        return result
+
     @staticmethod
     def _get_default_image_url(item_type: str) -> str:
         """根據項目類型獲取默認圖片URL"""
@@ -225,11 +250,8 @@ class OrderItemProcessor:
 
         from eshop.time_calculation import unified_time_service
 
-        # 獲取訂單項目
-        items = order.get_items_with_chinese_options()
-
-        # 處理項目
-        item_result = OrderItemProcessor.process_order_items(items)
+        # 商品相關數據（支付時預先計算，見 OrderModel.get_display_payload）
+        item_result = order.get_display_payload()["items"]
 
         # 獲取取貨時間信息
         pickup_time_info = unified_time_service.format_pickup_time_for_order(order)
@@ -311,7 +333,11 @@ class OrderItemProcessor:
             "position": queue_item.position,
             "status": queue_item.status,
             "preparation_time_minutes": queue_item.preparation_time_minutes,
-            "is_expedited": queue_item.is_expedited if hasattr(queue_item, "is_expedited") else False,
+            "is_expedited": (
+                queue_item.is_expedited
+                if hasattr(queue_item, "is_expedited")
+                else False
+            ),
         }
 
         # 添加咖啡師信息
@@ -362,6 +388,21 @@ class OrderItemProcessor:
 
         return queue_info
 
+    @staticmethod
+    def get_queue_item(order):
+        """
+        獲取訂單的隊列項
+
+        訂單以 select_related("queue_item") 載入時直接使用已載入的記錄，
+        否則查詢一次；沒有隊列項時返回 None。
+        """
+        from eshop.models import CoffeeQueue
+
+        try:
+            return order.queue_item
+        except CoffeeQueue.DoesNotExist:
+            return None
+
     @staticmethod
     def prepare_ready_order_data(order, now=None, hk_tz=None) -> Dict[str, Any]:
         """
@@ -377,8 +418,6 @@ class OrderItemProcessor:
         """
         from django.utils import timezone
 
-        from eshop.models import CoffeeQueue
-
         # 使用基礎處理器準備數據
         order_data = OrderItemProcessor.prepare_order_data(
             order, now=now, hk_tz=hk_tz, include_queue_info=False
@@ -390,10 +429,7 @@ class OrderItemProcessor:
         else:
             # 添加咖啡師信息 - 從 CoffeeQueue 記錄中獲取
             try:
-                # 查找與此訂單相關的 CoffeeQueue 記錄
-                coffee_queue = (
-                    CoffeeQueue.objects.filter(order=order).order_by("-id").first()
-                )
+                coffee_queue = OrderItemProcessor.get_queue_item(order)
                 if coffee_queue:
                     order_data["barista"] = coffee_queue.barista or "未分配"
                     order_data["is_expedited"] = coffee_queue.is_expedited
@@ -441,8 +477,6 @@ class OrderItemProcessor:
         """
         from django.utils import timezone
 
-        from eshop.models import CoffeeQueue
-
         # 使用基礎處理器準備數據
         order_data = OrderItemProcessor.prepare_order_data(
             order, now=now, hk_tz=hk_tz, include_queue_info=False
@@ -450,10 +484,7 @@ class OrderItemProcessor:
 
         # 添加咖啡師信息 - 從 CoffeeQueue 記錄中獲取
         try:
-            # 查找與此訂單相關的 CoffeeQueue 記錄
-            coffee_queue = (
-                CoffeeQueue.objects.filter(order=order).order_by("-id").first()
-            )
+            coffee_queue = OrderItemProcessor.get_queue_item(order)
             if coffee_queue:
                 order_data["barista"] = coffee_queue.barista or "未分配"
                 order_data["is_expedited"] = coffee_queue.is_expedited
@@ -81,7 +81,6 @@ class SecurityUtils:
     def __init__(self):
         """初始化安全工具"""
         self.error_handler = ErrorHandler(module_name="security_utils")
-        self.rate_limit_cache = {}  # 簡單的速率限制緩存
 
     # ==================== 輸入驗證 ====================
 
@@ -570,7 +569,7 @@ class SecurityUtils:
         self, identifier: str, endpoint: str, limit: int = 100, window_minutes: int = 60
     ) -> Dict[str, Any]:
         """
-        檢查速率限制
+        檢查速率限制（委託給 eshop.rate_limiter 的令牌桶，多進程共享）
 
         參數:
             identifier: 識別符（用戶ID、IP地址等）
@@ -581,20 +580,13 @@ class SecurityUtils:
         返回:
             速率限制檢查結果
         """
-        cache_key = f"rate_limit:{identifier}:{endpoint}"
-        current_time = time.time()
-        window_seconds = window_minutes * 60
-
-        # 獲取歷史記錄
-        if cache_key in self.rate_limit_cache:
-            history = self.rate_limit_cache[cache_key]
-            # 清理過期記錄
-            history = [t for t in history if current_time - t < window_seconds]
-        else:
-            history = []
+        from eshop.rate_limiter import get_rate_limiter
+
+        result = get_rate_limiter().check(
+            identifier, policy=endpoint, limit=limit, window_minutes=window_minutes
+        )
 
-        # 檢查是否超過限制
-        if len(history) >= limit:
+        if not result["allowed"]:
             self.log_security_event(
                 "warning",
                 "rate_limit_exceeded",
@@ -603,29 +595,10 @@ class SecurityUtils:
                     "endpoint": endpoint,
                     "limit": limit,
                     "window_minutes": window_minutes,
-                    "current_count": len(history),
                 },
             )
 
-            return {
-                "allowed": False,
-                "remaining": 0,
-                "reset_in": int(window_seconds - (current_time - history[0])),
-                "limit": limit,
-                "window_minutes": window_minutes,
-            }
-
-        # 添加當前請求
-        history.append(current_time)
-        self.rate_limit_cache[cache_key] = history
-
-        return {
-            "allowed": True,
-            "remaining": limit - len(history),
-            "reset_in": window_seconds,
-            "limit": limit,
-            "window_minutes": window_minutes,
-        }
+        return result
 
     # ==================== 請求驗證 ====================
 
@@ -31,6 +31,7 @@ from .order_views import (
     get_order_summary,
     order_detail,
     order_payment_confirmation,
+    order_qr_code,
     order_status_api,
     quick_order,
     remove_from_cart,
@@ -96,6 +97,7 @@ __all__ = [
     "check_order_status",
     "continue_payment",
     "order_payment_confirmation",
+    "order_qr_code",
     "order_status_api",
     "get_order_summary",
     "add_to_cart",
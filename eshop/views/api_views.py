@@ -17,6 +17,11 @@ from django.views.decorators.http import require_GET, require_POST
 from core.api_response import api_error, api_success
 from eshop.api_utils import BaseApiView, OrderApiMixin, staff_api_required
 from eshop.models import CoffeeQueue, OrderModel
+from eshop.order_eta import (
+    not_modified_response,
+    order_status_version,
+    set_version_headers,
+)
 from eshop.order_status_manager import OrderStatusManager
 from eshop.queue_manager_refactored import CoffeeQueueManager
 
@@ -499,10 +504,23 @@ def api_expedite_order(request, order_id):
 
 @method_decorator(login_required, name="dispatch")
 class CountdownAPI(View):
-    """倒數計時API"""
+    """
+    倒數計時API
+
+    顧客頁面通過 WebSocket 接收預計時間推送，此API只作為後備輪詢：
+    響應帶 ETag，訂單和隊列都沒有變化時返回 304，不再序列化訂單。
+    """
 
     def get(self, request, order_id):
         try:
+            owner_id, etag = order_status_version(order_id)
+            if etag and not (
+                request.user.is_authenticated and owner_id != request.user.id
+            ):
+                not_modified = not_modified_response(request, etag)
+                if not_modified:
+                    return not_modified
+
             order = OrderModel.objects.get(id=order_id)
 
             # 驗證訂單屬於當前用戶
@@ -527,8 +545,11 @@ class CountdownAPI(View):
             order_data = OrderDataSerializer.serialize_order(
                 order, include_queue_info=True, include_items=False
             )
+            order_data["server_time"] = timezone.now().timestamp()
 
-            return api_success(data=order_data, message="訂單倒計時信息獲取成功")
+            return set_version_headers(
+                api_success(data=order_data, message="訂單倒計時信息獲取成功"), etag
+            )
 
         except OrderModel.DoesNotExist:
             return api_error(
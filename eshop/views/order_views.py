@@ -5,7 +5,7 @@ from decimal import Decimal
 
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
@@ -15,12 +15,18 @@ from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_POST
 
-from cart.cart import Cart
+from cart.cart import get_cart
 
 # ✅ 修復：使用絕對導入，避免相對導入問題
 from eshop.models import BeanItem, CoffeeItem, CoffeeQueue, OrderModel
+from eshop.order_eta import (
+    not_modified_response,
+    order_status_version,
+    set_version_headers,
+)
 from eshop.order_status_manager import OrderStatusManager
 from eshop.payment_utils import get_payment_tools
+from eshop.utils.order_item_processor import OrderItemProcessor
 from eshop.view_utils import (
     find_existing_pending_order,
     handle_order_error,
@@ -528,7 +534,7 @@ class OrderConfirm(View):
             request.session.modified = True
 
             try:
-                cart = Cart(request)
+                cart = get_cart(request)
                 cart.clear()
                 logger.info(f"訂單 #{order.id} 創建成功，購物車已清空")
             except Exception as e:
@@ -776,11 +782,57 @@ def order_detail(request, order_id):
         return handle_order_error(request, e, redirect_url="/", error_type="general")
 
 
+@require_GET
+def order_qr_code(request, order_id, kind):
+    """
+    訂單二維碼圖片（取餐碼 / FPS 付款）
+
+    URL 中的 v 參數是內容摘要，只有頁面上給出的地址才能訪問；內容改變時
+    地址也會改變，所以可以長期緩存。
+    """
+    from eshop.qr_codes import QR_RENDER_OPTIONS, get_qr_png, qr_digest, qr_payload
+
+    if kind not in QR_RENDER_OPTIONS:
+        raise Http404("未知的二維碼類型")
+
+    order = get_object_or_404(OrderModel.objects.without_qr_codes(), id=order_id)
+    payload = qr_payload(order, kind)
+    digest = qr_digest(kind, payload)
+    if request.GET.get("v") != digest:
+        raise Http404("二維碼不存在")
+
+    etag = f'"{digest}"'
+    if request.headers.get("If-None-Match") == etag:
+        response = HttpResponseNotModified()
+    else:
+        digest, png = get_qr_png(kind, payload)
+        response = HttpResponse(png, content_type="image/png")
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
 @require_GET
 def order_status_api(request, order_id):
+    """
+    訂單狀態API（WebSocket 不可用時的輪詢後備）
+
+    響應帶 ETag；訂單、隊列項和隊列變更序號都沒有變化時返回 304。
+    倒數由客戶端以 remaining_seconds 和 server_time 在本地插值。
+    """
     try:
-        order = get_object_or_404(OrderModel, id=order_id)
-        if request.user.is_authenticated and order.user != request.user:
+        owner_id, etag = order_status_version(order_id)
+        if etag and not (
+            request.user.is_authenticated and owner_id != request.user.id
+        ):
+            not_modified = not_modified_response(request, etag)
+            if not_modified:
+                return not_modified
+
+        order = get_object_or_404(
+            OrderModel.objects.select_related("queue_item"), id=order_id
+        )
+        if request.user.is_authenticated and order.user_id != request.user.id:
             return JsonResponse(
                 {"success": False, "error": "無權查看此訂單"}, status=403
             )
@@ -808,7 +860,22 @@ def order_status_api(request, order_id):
             "estimated_time": status_info.get("estimated_time", ""),
             "status_message": status_info.get("status_message", ""),
         }
-        return JsonResponse(response_data)
+
+        # 客戶端以剩餘秒數和服務端時間在本地倒數
+        now = timezone.now()
+        queue_item = OrderItemProcessor.get_queue_item(order)
+        eta = queue_item.estimated_completion_time if queue_item else None
+        response_data.update(
+            {
+                "queue_position": queue_item.position if queue_item else None,
+                "estimated_completion_time": eta.isoformat() if eta else None,
+                "remaining_seconds": (
+                    max(int((eta - now).total_seconds()), 0) if eta else None
+                ),
+                "server_time": now.timestamp(),
+            }
+        )
+        return set_version_headers(JsonResponse(response_data), etag)
     except Exception as e:
         logger.error(f"訂單狀態API錯誤: {str(e)}")
         from eshop.view_utils import OrderErrorHandler
@@ -980,7 +1047,7 @@ def continue_payment(request, order_id):
 
 def get_order_summary(request):
     try:
-        cart = Cart(request)
+        cart = get_cart(request)
         total_amount = 0
         item_count = 0
         for item in cart:
@@ -1009,7 +1076,7 @@ def add_to_cart(request):
             product_id = request.POST.get("product_id")
             quantity = int(request.POST.get("quantity", 1))
             product = get_object_or_404(CoffeeItem, id=product_id)
-            cart = Cart(request)
+            cart = get_cart(request)
             cart.add(
                 product=product,
                 product_type="coffee",
@@ -1040,7 +1107,7 @@ def remove_from_cart(request):
     if request.method == "POST":
         try:
             product_id = request.POST.get("product_id")
-            cart = Cart(request)
+            cart = get_cart(request)
             cart.remove(product_id)
             cart_data = {"items": cart.cart, "total_price": str(cart.get_total_price())}
             request.session["pending_order"] = cart_data
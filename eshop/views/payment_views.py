@@ -636,10 +636,10 @@ def safe_redirect_to_confirmation(order_id):
 def clear_user_cart_and_session(request):
     """清除用戶購物車和相關session數據"""
     try:
-        from cart.cart import Cart
+        from cart.cart import get_cart
 
         # 1. 清空購物車對象
-        cart = Cart(request)
+        cart = get_cart(request)
         cart.clear()
 
         # 2. 清除所有相關session鍵
@@ -693,10 +693,8 @@ def fps_payment(request, order_id):
         else:
             fps_reference = f"BC{order.id:06d}"
 
-        # 生成動態QR Code
-        from eshop.fps_utils import generate_fps_qr_code
-
-        fps_qr_code = generate_fps_qr_code(order)
+        # 動態QR Code 由 order_qr_code 視圖按需生成並緩存
+        fps_qr_code_url = order.fps_qr_code_url
 
         # 訂單商品與狀態資訊（與現金付款頁面一致）
         items = order.get_items_with_chinese_options()
@@ -710,7 +708,7 @@ def fps_payment(request, order_id):
         context = {
             "order": order,
             "fps_reference": order.fps_reference or fps_reference,
-            "fps_qr_code": fps_qr_code,
+            "fps_qr_code_url": fps_qr_code_url,
             "amount": order.total_price,
             "phone": order.phone or "",
             "items": items,
@@ -8,9 +8,12 @@ from datetime import timedelta
 from typing import Any, Dict, List, Optional
 
 import pytz
+from django.db.models import Case, Count, F, Q, Value, When, Window
+from django.db.models.functions import RowNumber
 from django.utils import timezone
 
 from eshop.models import CoffeeQueue, OrderModel
+from eshop.models.order import QR_CODE_FIELDS
 from eshop.order_status_manager import OrderStatusManager
 from eshop.time_calculation import unified_time_service
 from eshop.utils.order_item_processor import OrderItemProcessor
@@ -18,6 +21,15 @@ from eshop.utils.time_formatter import TimeFormatter
 
 logger = logging.getLogger(__name__)
 
+# 隊列查詢通過 select_related 載入訂單時延遲的二維碼大字段
+ORDER_QR_CODE_FIELDS = tuple(f"order__{field}" for field in QR_CODE_FIELDS)
+
+# 員工端各列表的窗口
+PAYMENT_PENDING_LIMIT = 50
+READY_ORDERS_LIMIT = 20
+COMPLETED_ORDERS_LIMIT = 50
+COMPLETED_ORDERS_HOURS = 4
+
 
 class BaseQueueProcessor:
     """基礎隊列處理器"""
@@ -249,20 +261,206 @@ class CompletedOrderProcessor(BaseQueueProcessor):
         return completed_data
 
 
+class PaymentPendingOrderProcessor(BaseQueueProcessor):
+    """待確認付款訂單處理器（FPS 付款待確認）"""
+
+    def process(self, orders: List[OrderModel]) -> List[Dict[str, Any]]:
+        """
+        處理待確認付款訂單數據
+
+        參數:
+            orders: 待確認付款訂單列表
+
+        返回:
+            待確認付款訂單數據列表
+        """
+        pending_data = []
+
+        for order in orders:
+            try:
+                order_data = self.process_order(order)
+                if order_data:
+                    # 確保包含支付相關資訊
+                    order_data["payment_status"] = order.payment_status
+                    order_data["payment_method"] = order.payment_method or "fps"
+                    order_data["total_price"] = (
+                        str(order.total_price) if order.total_price else "0"
+                    )
+                    pending_data.append(order_data)
+            except Exception as e:
+                logger.error(f"處理待確認付款訂單 {order.id} 失敗: {str(e)}")
+                continue
+
+        # 按創建時間排序（最新的在前）
+        pending_data.sort(key=lambda x: x.get("created_at") or "", reverse=True)
+        return pending_data
+
+
+class QueueSnapshot:
+    """
+    隊列快照引擎 - 員工端五個列表的唯一數據來源
+
+    查詢計劃（最多兩次查詢）：
+    1. 等待中 / 製作中的隊列項，select_related 訂單（延遲二維碼字段）
+    2. 待確認付款 / 就緒 / 已完成的訂單，select_related 隊列項（延遲二維碼字段），
+       以窗口函數在資料庫中取各列表的前 N 筆
+
+    兩次查詢的結果在一次遍歷中分入五個列表；now / hk_tz 只取一次，
+    由所有子處理器共用。只請求部分列表時，不需要的查詢不會執行。
+    """
+
+    QUEUE_SECTIONS = ("waiting_orders", "preparing_orders")
+    ORDER_SECTIONS = ("payment_pending_orders", "ready_orders", "completed_orders")
+    SECTIONS = (
+        "payment_pending_orders",
+        "waiting_orders",
+        "preparing_orders",
+        "ready_orders",
+        "completed_orders",
+    )
+
+    def __init__(self, now=None, hk_tz=None, order_ids=None):
+        """
+        初始化快照
+
+        參數:
+            now: 當前時間（可選）
+            hk_tz: 香港時區（可選）
+            order_ids: 只返回這些訂單（增量查詢，None 表示全部）
+        """
+        self.now = now or timezone.now()
+        self.hk_tz = hk_tz or pytz.timezone("Asia/Hong_Kong")
+        self.order_ids = set(order_ids) if order_ids is not None else None
+
+        self.processors = {
+            "payment_pending_orders": PaymentPendingOrderProcessor(
+                self.now, self.hk_tz
+            ),
+            "waiting_orders": WaitingQueueProcessor(self.now, self.hk_tz),
+            "preparing_orders": PreparingQueueProcessor(self.now, self.hk_tz),
+            "ready_orders": ReadyOrderProcessor(self.now, self.hk_tz),
+            "completed_orders": CompletedOrderProcessor(self.now, self.hk_tz),
+        }
+
+    @staticmethod
+    def queue_rows():
+        """查詢 1：等待中 / 製作中的隊列項及其訂單"""
+        return (
+            CoffeeQueue.objects.filter(status__in=["waiting", "preparing"])
+            .select_related("order")
+            .defer(*ORDER_QR_CODE_FIELDS)
+            .order_by("position", "id")
+        )
+
+    @staticmethod
+    def order_rows(now, completed_hours=COMPLETED_ORDERS_HOURS):
+        """
+        查詢 2：待確認付款 / 就緒 / 已完成的訂單及其隊列項
+
+        每行帶 section 註解（所屬列表）；各列表的窗口（最新的前 N 筆）
+        以 ROW_NUMBER() 在資料庫中截取。
+        """
+        time_threshold = now - timedelta(hours=completed_hours)
+        payment_pending = Q(payment_status="payment_pending", status="pending")
+        ready = Q(status="ready", payment_status="paid", picked_up_at__isnull=True)
+        completed = Q(status="completed", picked_up_at__gte=time_threshold)
+
+        return (
+            OrderModel.objects.without_qr_codes()
+            .filter(payment_pending | ready | completed)
+            .select_related("queue_item")
+            .annotate(
+                section=Case(
+                    When(payment_pending, then=Value("payment_pending_orders")),
+                    When(ready, then=Value("ready_orders")),
+                    default=Value("completed_orders"),
+                ),
+                section_sort_at=Case(
+                    When(payment_pending, then=F("created_at")),
+                    When(ready, then=F("ready_at")),
+                    default=F("picked_up_at"),
+                ),
+            )
+            .annotate(
+                section_rank=Window(
+                    RowNumber(),
+                    partition_by=F("section"),
+                    order_by=F("section_sort_at").desc(),
+                )
+            )
+            .filter(
+                Q(
+                    section="payment_pending_orders",
+                    section_rank__lte=PAYMENT_PENDING_LIMIT,
+                )
+                | Q(section="ready_orders", section_rank__lte=READY_ORDERS_LIMIT)
+                | Q(
+                    section="completed_orders", section_rank__lte=COMPLETED_ORDERS_LIMIT
+                )
+            )
+            .order_by("section", "section_rank")
+        )
+
+    def fetch(self, sections=SECTIONS) -> Dict[str, list]:
+        """
+        載入並分組各列表的模型對象
+
+        返回:
+            {列表名: [CoffeeQueue 或 OrderModel, ...]}
+        """
+        buckets = {section: [] for section in sections}
+
+        rows = []
+        if any(section in buckets for section in self.QUEUE_SECTIONS):
+            queue_rows = self.queue_rows()
+            if self.order_ids is not None:
+                # 隊列項沒有窗口，可以直接在資料庫中限定
+                queue_rows = queue_rows.filter(order_id__in=self.order_ids)
+            rows.extend(
+                (f"{queue_item.status}_orders", queue_item.order_id, queue_item)
+                for queue_item in queue_rows
+            )
+        if any(section in buckets for section in self.ORDER_SECTIONS):
+            # 窗口需要在全部訂單中排名，增量查詢的訂單限定在分組時進行
+            rows.extend(
+                (order.section, order.id, order) for order in self.order_rows(self.now)
+            )
+
+        for section, order_id, row in rows:
+            if section not in buckets:
+                continue
+            if self.order_ids is not None and order_id not in self.order_ids:
+                continue
+            buckets[section].append(row)
+
+        return buckets
+
+    def build(self, sections=SECTIONS) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        生成各列表的訂單數據
+
+        返回:
+            {列表名: [訂單數據字典, ...]}
+        """
+        buckets = self.fetch(sections)
+        return {
+            section: self.processors[section].process(rows)
+            for section, rows in buckets.items()
+        }
+
+    def build_section(self, section) -> List[Dict[str, Any]]:
+        """生成單個列表的訂單數據（只執行該列表需要的查詢）"""
+        return self.build((section,))[section]
+
+
 class UnifiedQueueProcessor:
-    """統一隊列處理器 - 整合所有處理器"""
+    """統一隊列處理器 - 基於隊列快照引擎"""
 
     def __init__(self):
         """初始化統一處理器"""
         self.now = timezone.now()
         self.hk_tz = pytz.timezone("Asia/Hong_Kong")
 
-        # 初始化子處理器
-        self.waiting_processor = WaitingQueueProcessor(self.now, self.hk_tz)
-        self.preparing_processor = PreparingQueueProcessor(self.now, self.hk_tz)
-        self.ready_processor = ReadyOrderProcessor(self.now, self.hk_tz)
-        self.completed_processor = CompletedOrderProcessor(self.now, self.hk_tz)
-
     def get_unified_queue_data(self) -> Dict[str, Any]:
         """
         獲取統一隊列數據
@@ -271,46 +469,22 @@ class UnifiedQueueProcessor:
             統一隊列數據字典
         """
         try:
-            # 獲取等待隊列數據
-            waiting_queues = CoffeeQueue.objects.filter(status="waiting").order_by(
-                "position"
+            sections = QueueSnapshot(self.now, self.hk_tz).build(
+                (
+                    "waiting_orders",
+                    "preparing_orders",
+                    "ready_orders",
+                    "completed_orders",
+                )
             )
-            waiting_data = self.waiting_processor.process(waiting_queues)
-
-            # 獲取製作中隊列數據
-            preparing_queues = CoffeeQueue.objects.filter(status="preparing")
-            preparing_data = self.preparing_processor.process(preparing_queues)
-
-            # 獲取就緒訂單數據
-            ready_orders = OrderModel.objects.filter(
-                status="ready", payment_status="paid", picked_up_at__isnull=True
-            ).order_by("-ready_at")[:20]
-            ready_data = self.ready_processor.process(ready_orders)
-
-            # 獲取已完成訂單數據
-            time_threshold = self.now - timedelta(hours=4)
-            completed_orders = OrderModel.objects.filter(
-                status="completed",
-                picked_up_at__isnull=False,
-                picked_up_at__gte=time_threshold,
-            ).order_by("-picked_up_at")[:50]
-            completed_data = self.completed_processor.process(completed_orders)
 
             # 徽章摘要
             badge_summary = {
-                "waiting": len(waiting_data),
-                "preparing": len(preparing_data),
-                "ready": len(ready_data),
-                "completed": len(completed_data),
+                key.replace("_orders", ""): len(orders)
+                for key, orders in sections.items()
             }
 
-            return {
-                "waiting_orders": waiting_data,
-                "preparing_orders": preparing_data,
-                "ready_orders": ready_data,
-                "completed_orders": completed_data,
-                "badge_summary": badge_summary,
-            }
+            return {**sections, "badge_summary": badge_summary}
 
         except Exception as e:
             logger.error(f"獲取統一隊列數據失敗: {str(e)}", exc_info=True)
@@ -335,7 +509,7 @@ def get_unified_queue_data() -> Dict[str, Any]:
     return processor.get_unified_queue_data()
 
 
-def process_payment_pending_orders(now, hk_tz) -> List[Dict[str, Any]]:
+def process_payment_pending_orders(now, hk_tz, order_ids=None) -> List[Dict[str, Any]]:
     """
     處理待確認付款訂單（FPS 付款待確認）
 
@@ -346,75 +520,68 @@ def process_payment_pending_orders(now, hk_tz) -> List[Dict[str, Any]]:
     Args:
         now: 當前時間
         hk_tz: 香港時區
+        order_ids: 只處理這些訂單（增量查詢，None 表示全部）
 
     Returns:
         待確認付款訂單數據列表
     """
     try:
-        orders = OrderModel.objects.filter(
-            payment_status="payment_pending",
-            status="pending",
-        ).order_by("-created_at")[:50]
-
-        pending_data = []
-        for order in orders:
-            try:
-                order_data = OrderItemProcessor.prepare_order_data(
-                    order=order,
-                    queue_item=None,
-                    now=now,
-                    hk_tz=hk_tz,
-                    include_queue_info=False,
-                )
-                if order_data:
-                    # 確保包含支付相關資訊
-                    order_data["payment_status"] = order.payment_status
-                    order_data["payment_method"] = order.payment_method or "fps"
-                    order_data["total_price"] = (
-                        str(order.total_price) if order.total_price else "0"
-                    )
-                    pending_data.append(order_data)
-            except Exception as e:
-                logger.error(f"處理待確認付款訂單 {order.id} 失敗: {str(e)}")
-                continue
-
-        # 按創建時間排序（最新的在前）
-        pending_data.sort(key=lambda x: x.get("created_at") or "", reverse=True)
-        return pending_data
-
+        return QueueSnapshot(now, hk_tz, order_ids).build_section(
+            "payment_pending_orders"
+        )
     except Exception as e:
         logger.error(f"獲取待確認付款訂單失敗: {str(e)}", exc_info=True)
         return []
 
 
-def process_waiting_queues(now, hk_tz) -> List[Dict[str, Any]]:
-    """簡化接口：處理等待隊列"""
-    processor = WaitingQueueProcessor(now, hk_tz)
-    queue_items = CoffeeQueue.objects.filter(status="waiting").order_by("position")
-    return processor.process(queue_items)
+def process_waiting_queues(now, hk_tz, order_ids=None) -> List[Dict[str, Any]]:
+    """簡化接口：處理等待隊列（order_ids 限定增量查詢的訂單）"""
+    return QueueSnapshot(now, hk_tz, order_ids).build_section("waiting_orders")
 
 
-def process_preparing_queues(now, hk_tz) -> List[Dict[str, Any]]:
-    """簡化接口：處理製作中隊列"""
-    processor = PreparingQueueProcessor(now, hk_tz)
-    queue_items = CoffeeQueue.objects.filter(status="preparing")
-    return processor.process(queue_items)
+def process_preparing_queues(now, hk_tz, order_ids=None) -> List[Dict[str, Any]]:
+    """簡化接口：處理製作中隊列（order_ids 限定增量查詢的訂單）"""
+    return QueueSnapshot(now, hk_tz, order_ids).build_section("preparing_orders")
 
 
-def process_ready_orders(now, hk_tz) -> List[Dict[str, Any]]:
-    """簡化接口：處理就緒訂單"""
-    processor = ReadyOrderProcessor(now, hk_tz)
-    orders = OrderModel.objects.filter(
-        status="ready", payment_status="paid", picked_up_at__isnull=True
-    ).order_by("-ready_at")[:20]
-    return processor.process(orders)
+def process_ready_orders(now, hk_tz, order_ids=None) -> List[Dict[str, Any]]:
+    """簡化接口：處理就緒訂單（order_ids 限定增量查詢的訂單）"""
+    return QueueSnapshot(now, hk_tz, order_ids).build_section("ready_orders")
 
 
-def process_completed_orders(now, hk_tz) -> List[Dict[str, Any]]:
-    """簡化接口：處理已完成訂單"""
-    processor = CompletedOrderProcessor(now, hk_tz)
-    time_threshold = now - timedelta(hours=4)
-    orders = OrderModel.objects.filter(
-        status="completed", picked_up_at__isnull=False, picked_up_at__gte=time_threshold
-    ).order_by("-picked_up_at")[:50]
-    return processor.process(orders)
+def process_completed_orders(now, hk_tz, order_ids=None) -> List[Dict[str, Any]]:
+    """簡化接口：處理已完成訂單（order_ids 限定增量查詢的訂單）"""
+    return QueueSnapshot(now, hk_tz, order_ids).build_section("completed_orders")
+
+
+def get_badge_summary(now) -> Dict[str, int]:
+    """
+    以一次聚合查詢統計各狀態的訂單數（與各列表的窗口上限一致）
+
+    Returns:
+        dict: {'payment_pending': 0, 'waiting': 0, 'preparing': 0,
+               'ready': 0, 'completed': 0}
+    """
+    time_threshold = now - timedelta(hours=COMPLETED_ORDERS_HOURS)
+    counts = OrderModel.objects.filter(
+        Q(status__in=["pending", "waiting", "preparing", "ready"])
+        | Q(status="completed", picked_up_at__gte=time_threshold)
+    ).aggregate(
+        payment_pending=Count(
+            "id", filter=Q(payment_status="payment_pending", status="pending")
+        ),
+        waiting=Count("id", filter=Q(queue_item__status="waiting")),
+        preparing=Count("id", filter=Q(queue_item__status="preparing")),
+        ready=Count(
+            "id",
+            filter=Q(status="ready", payment_status="paid", picked_up_at__isnull=True),
+        ),
+        completed=Count("id", filter=Q(status="completed")),
+    )
+    return {
+        "payment_pending": min(counts["payment_pending"], PAYMENT_PENDING_LIMIT),
+        "waiting": counts["waiting"],
+        "preparing": counts["preparing"],
+        "ready": min(counts["ready"], READY_ORDERS_LIMIT),
+        "completed": min(counts["completed"], COMPLETED_ORDERS_LIMIT),
+    }
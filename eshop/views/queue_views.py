@@ -6,6 +6,7 @@
 import logging
 
 import pytz
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
@@ -19,16 +20,18 @@ from eshop.queue_manager_refactored import (
     CoffeeQueueManager,
     force_sync_queue_and_orders,
 )
-from eshop.views.queue_processors import (
-    process_completed_orders,
-    process_payment_pending_orders,
-    process_preparing_queues,
-    process_ready_orders,
-    process_waiting_queues,
+from eshop.queue_changes import (
+    get_changes_since,
+    get_current_cursor,
+    prune_queue_changes,
 )
+from eshop.views.queue_processors import QueueSnapshot, get_badge_summary
 
 logger = logging.getLogger(__name__)
 
+# get_unified_queue_data 返回的訂單列表
+QUEUE_SECTIONS = QueueSnapshot.SECTIONS
+
 
 # ==================== 队列管理页面 ====================
 
@@ -88,77 +91,72 @@ def staff_order_management(request):
 
 def get_unified_queue_data(request):
     """返回統一的隊列數據，格式符合前端 UnifiedDataManager 要求
-    
-    支持增量查詢：?since=<ISO timestamp>
-    - 首次請求（無 since）：返回全量數據
-    - 後續請求（有 since）：只返回 updated_at > since 的變更
+
+    支持增量查詢：?since=<cursor>（上次響應中的 cursor，變更序號）
+    - 首次請求（無 since）或游標失效：返回全量數據
+    - 後續請求：只處理序號大於 since 的變更涉及的訂單，
+      並以 removed_order_ids 告知已離開所有列表的訂單
     """
     try:
         # 獲取香港時區與當前時間
         hk_tz = pytz.timezone("Asia/Hong_Kong")
         now = timezone.now().astimezone(hk_tz)
-        
-        # 檢查是否為增量查詢
-        since_str = request.GET.get('since')
+
+        # 解析游標（舊客戶端傳入的時間字符串視為無效，返回全量）
         since = None
-        is_incremental = False
+        since_str = request.GET.get("since")
         if since_str:
             try:
-                since = timezone.datetime.fromisoformat(since_str)
-                is_incremental = True
-            except (ValueError, TypeError):
-                pass
-
-        # 使用現有的處理函數取得各類訂單數據
-        payment_pending_orders = process_payment_pending_orders(now, hk_tz)
-        waiting_orders = process_waiting_queues(now, hk_tz)
-        preparing_orders = process_preparing_queues(now, hk_tz)
-        ready_orders = process_ready_orders(now, hk_tz)
-        completed_orders = process_completed_orders(now, hk_tz)
+                since = int(since_str)
+            except (TypeError, ValueError):
+                since = None
+
+        changes = None
+        if since is not None:
+            changes = get_changes_since(since)
+            max_orders = getattr(settings, "QUEUE_DELTA_MAX_ORDERS", 200)
+            if changes["expired"] or len(changes["order_ids"]) > max_orders:
+                changes = None
+        is_incremental = changes is not None
+
+        if is_incremental:
+            cursor = changes["cursor"]
+            order_ids = changes["order_ids"]
+        else:
+            prune_queue_changes()
+            cursor = get_current_cursor()
+            order_ids = None
 
-        # 徽章摘要（不區分增量/全量，總是返回最新）
-        badge_summary = {
-            "payment_pending": len(payment_pending_orders),
-            "waiting": len(waiting_orders),
-            "preparing": len(preparing_orders),
-            "ready": len(ready_orders),
-            "completed": len(completed_orders),
-        }
+        if order_ids is not None and not order_ids:
+            # 沒有變化：不需要運行任何處理器
+            sections = {key: [] for key in QUEUE_SECTIONS}
+        else:
+            # 一個快照（最多兩次查詢）生成所有列表
+            sections = QueueSnapshot(now, hk_tz, order_ids).build(QUEUE_SECTIONS)
 
-        # 增量模式：過濾出有變化的訂單
-        if is_incremental and since:
-            payment_pending_orders = [
-                o for o in payment_pending_orders 
-                if o.get('updated_at') and o['updated_at'] > since_str
-            ]
-            waiting_orders = [
-                o for o in waiting_orders 
-                if o.get('updated_at') and o['updated_at'] > since_str
-            ]
-            preparing_orders = [
-                o for o in preparing_orders 
-                if o.get('updated_at') and o['updated_at'] > since_str
-            ]
-            ready_orders = [
-                o for o in ready_orders 
-                if o.get('updated_at') and o['updated_at'] > since_str
-            ]
-            completed_orders = [
-                o for o in completed_orders 
-                if o.get('updated_at') and o['updated_at'] > since_str
-            ]
+        # 徽章摘要（不區分增量/全量，總是返回最新）
+        if is_incremental:
+            badge_summary = get_badge_summary(now)
+            present = {
+                order["id"] for orders in sections.values() for order in orders
+            }
+            removed_order_ids = sorted(order_ids - present)
+        else:
+            badge_summary = {
+                key.replace("_orders", ""): len(orders)
+                for key, orders in sections.items()
+            }
+            removed_order_ids = []
 
         # ✅ 關鍵：將所有數據包裝在 data 欄位中
         response_data = {
             "success": True,
             "data": {
-                "payment_pending_orders": payment_pending_orders,
-                "waiting_orders": waiting_orders,
-                "preparing_orders": preparing_orders,
-                "ready_orders": ready_orders,
-                "completed_orders": completed_orders,
+                **sections,
                 "badge_summary": badge_summary,
+                "removed_order_ids": removed_order_ids,
             },
+            "cursor": cursor,
             "timestamp": timezone.now().isoformat(),
             "message": "隊列數據加載成功",
             "is_incremental": is_incremental,  # 標記是否為增量響應
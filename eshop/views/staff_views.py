@@ -52,21 +52,29 @@ def staff_order_management(request):
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
         # 获取制作中订单
-        preparing_orders = OrderModel.objects.filter(
-            status="preparing", payment_status="paid"
-        ).order_by("-created_at")
+        preparing_orders = (
+            OrderModel.objects.without_qr_codes()
+            .filter(status="preparing", payment_status="paid")
+            .order_by("-created_at")
+        )
 
         # 获取已就绪订单
-        ready_orders = OrderModel.objects.filter(
-            status="ready", payment_status="paid", picked_up_at__isnull=True
-        ).order_by("-ready_at", "-updated_at")
+        ready_orders = (
+            OrderModel.objects.without_qr_codes()
+            .filter(status="ready", payment_status="paid", picked_up_at__isnull=True)
+            .order_by("-ready_at", "-updated_at")
+        )
 
         # 获取最近4小时已提取的订单
-        recent_completed_orders = OrderModel.objects.filter(
-            status="completed",
-            picked_up_at__isnull=False,
-            picked_up_at__gte=now - timedelta(hours=4),
-        ).order_by("-picked_up_at")
+        recent_completed_orders = (
+            OrderModel.objects.without_qr_codes()
+            .filter(
+                status="completed",
+                picked_up_at__isnull=False,
+                picked_up_at__gte=now - timedelta(hours=4),
+            )
+            .order_by("-picked_up_at")
+        )
 
         # 获取今日订单总数
         total_orders_today = OrderModel.objects.filter(
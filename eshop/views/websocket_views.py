@@ -20,7 +20,7 @@ from django.views.decorators.http import require_GET, require_POST
 
 # ✅ 修正：使用正確的函式名稱 send_system_message
 from eshop.websocket_manager import websocket_manager
-from eshop.websocket_utils import send_system_message
+from eshop.websocket_utils import get_websocket_stats, send_system_message
 
 logger = logging.getLogger(__name__)
 
@@ -44,7 +44,8 @@ def websocket_stats_api(request):
             activity_timeout_minutes=activity_timeout,
         )
 
-        stats = websocket_manager.get_stats()
+        # 包含隊列廣播合併器的統計（events_in / frames_out / merge_ratio）
+        stats = get_websocket_stats()
 
         return JsonResponse(
             {
@@ -216,12 +217,8 @@ def websocket_disconnect_user(request):
             if websocket_manager.disconnect(connection_id, "管理員強制斷開"):
                 disconnected.append(connection_id)
         elif user_id:
-            for conn_id, conn_data in websocket_manager.connections.items():
-                if (
-                    conn_data["user_info"].get("user_id") == int(user_id)
-                    and conn_data["status"] == "active"
-                ):
-                    websocket_manager.disconnect(conn_id, "管理員強制斷開")
+            for conn_id in websocket_manager.get_connections_for_user(int(user_id)):
+                if websocket_manager.disconnect(conn_id, "管理員強制斷開"):
                     disconnected.append(conn_id)
 
         return JsonResponse(
@@ -0,0 +1,189 @@
+# eshop/websocket_batcher.py
+"""
+隊列廣播合併器
+
+每次隊列變動（重新排序、時間更新、狀態變更）都會各自 group_send 一次，
+隊列頁面在多台平板上打開時，咖啡師每次點擊都會產生一串訊息和整頁刷新請求。
+
+這個模塊提供進程內唯一的合併器：
+1. 在合併窗口（預設 150ms）內按群組累積隊列事件
+2. 同一訂單的事件以最後一次為準（沒有訂單ID的事件按 update_type 合併）
+3. 每個群組每個窗口只發送一次 queue_batch 訊息，由 QueueConsumer 拆包
+4. 記錄收到的事件數、發出的訊息數和合併比例
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger("eshop.websocket_batcher")
+
+
+def _event_key(message):
+    """合併鍵：同一訂單只保留最後一次事件"""
+    data = message.get("data") or {}
+    order_id = message.get("order_id") or data.get("order_id")
+    if order_id is not None:
+        return ("order", str(order_id))
+    return ("update_type", message.get("update_type") or message.get("type"))
+
+
+class QueueBroadcastBatcher:
+    """隊列廣播合併器 - 按群組累積事件，每個窗口發送一次"""
+
+    def __init__(self, window_ms=None, broadcast=None):
+        """
+        Args:
+            window_ms: 合併窗口（毫秒）
+            broadcast: 發送函數 (group_name, message_type, data) -> bool，
+                預設排入 websocket_manager 的出站隊列（enqueue_broadcast）
+        """
+        self._broadcast = broadcast
+        if window_ms is None:
+            window_ms = getattr(settings, "QUEUE_BROADCAST_WINDOW_MS", 150)
+        self.window_seconds = max(window_ms, 0) / 1000.0
+
+        self._condition = threading.Condition()
+        self._worker = None
+        # close() 後遞增，舊的工作線程看到世代改變即退出
+        self._generation = 0
+        self._sending = False
+        # {group_name: {合併鍵: 事件}}，dict 保留事件首次出現的順序
+        self._pending = {}
+
+        self.stats = {
+            "events_in": 0,  # 收到的事件數
+            "merged": 0,  # 被同一訂單的後續事件覆蓋的事件數
+            "frames_out": 0,  # 發出的 queue_batch 訊息數
+            "failed": 0,  # 發送失敗次數
+            "last_flush_at": None,
+            "last_batch_size": 0,
+        }
+
+    def enqueue(self, group_name, message):
+        """
+        加入一個事件（不阻塞）
+
+        Args:
+            group_name: 目標群組（例如 queue_updates）
+            message: 原本會直接 group_send 的事件字典
+        """
+        with self._condition:
+            self.stats["events_in"] += 1
+            events = self._pending.setdefault(group_name, {})
+            key = _event_key(message)
+            if key in events:
+                self.stats["merged"] += 1
+            events[key] = message
+
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run_loop,
+                    args=(self._generation,),
+                    name="queue-broadcast",
+                    daemon=True,
+                )
+                self._worker.start()
+
+            self._condition.notify_all()
+        return True
+
+    def _run_loop(self, generation):
+        """工作線程：等待事件，經過合併窗口後每個群組發送一次"""
+        while True:
+            with self._condition:
+                while not self._pending and generation == self._generation:
+                    self._condition.wait()
+                if generation != self._generation:
+                    return
+
+            # 合併窗口內到達的事件併入本次發送
+            time.sleep(self.window_seconds)
+
+            with self._condition:
+                if generation != self._generation:
+                    return
+                pending = self._pending
+                self._pending = {}
+                self._sending = True
+
+            try:
+                for group_name, events in pending.items():
+                    self._send(group_name, list(events.values()))
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _send(self, group_name, events):
+        """發送一個 queue_batch 訊息"""
+        broadcast = self._broadcast
+        if broadcast is None:
+            from .websocket_manager import websocket_manager
+
+            broadcast = websocket_manager.enqueue_broadcast
+
+        success = broadcast(
+            group_name, "queue_batch", {"events": events, "event_count": len(events)}
+        )
+        with self._condition:
+            if success:
+                self.stats["frames_out"] += 1
+                self.stats["last_flush_at"] = timezone.now().isoformat()
+                self.stats["last_batch_size"] = len(events)
+            else:
+                self.stats["failed"] += 1
+
+        logger.debug(f"📦 合併廣播到群組 {group_name}: {len(events)} 個事件")
+
+    def wait_until_idle(self, timeout=5.0):
+        """等待所有已累積的事件發送完成（供管理命令和測試使用）"""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._sending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def close(self, timeout=1.0):
+        """停止工作線程並丟棄未發送的事件（供測試和進程退出使用）"""
+        with self._condition:
+            self._generation += 1
+            self._pending = {}
+            worker, self._worker = self._worker, None
+            self._condition.notify_all()
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+
+    def get_stats(self):
+        """獲取合併器統計"""
+        with self._condition:
+            stats = dict(self.stats)
+            stats["pending_events"] = sum(
+                len(events) for events in self._pending.values()
+            )
+
+        stats["merge_ratio"] = (
+            round(stats["events_in"] / stats["frames_out"], 2)
+            if stats["frames_out"]
+            else 0
+        )
+        stats["window_ms"] = int(self.window_seconds * 1000)
+        return stats
+
+
+# 全局實例
+_queue_broadcast_batcher = None
+
+
+def get_queue_broadcast_batcher():
+    """獲取隊列廣播合併器實例"""
+    global _queue_broadcast_batcher
+    if _queue_broadcast_batcher is None:
+        _queue_broadcast_batcher = QueueBroadcastBatcher()
+    return _queue_broadcast_batcher
@@ -1,23 +1,318 @@
 # eshop/websocket_manager.py
 """
 WebSocket 連接管理器（單一職責）- 增強版
-- 連線註冊/註銷
-- 心跳更新與超時檢查
+- 連線註冊/註銷（按連線ID、channel、使用者建立索引，查詢為 O(1)）
+- 心跳更新與超時檢查（心跳/活動最小堆，清理為 O(k log n)）
 - 訊息發送（含重試機制：指數退避 + 抖動）
 - 群組廣播（可選重試）
-- 統計報表
+- 有界出站隊列：同步視圖與 async consumer 都可以不阻塞地排入訊息，
+  由每個進程一個的排空任務發送（滿時丟棄最舊的訊息）
+- 統計報表（使用 channels_redis 時，各進程的連線數經 Redis 匯總）
 """
 import asyncio
+import heapq
+import itertools
+import json
 import logging
+import os
 import random
+import socket
+import threading
+import time
+from collections import deque
 from datetime import timedelta
 
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.conf import settings
 from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+# 各進程連線數在 Redis 中的 hash（field 為 主機名:進程ID）
+CONNECTION_COUNTS_KEY = "websocket:connection_counts"
+
+
+class OutboundMessageQueue:
+    """
+    有界出站訊息隊列 - 每個進程一個排空任務
+
+    - put() 只把訊息放入 deque，不阻塞、不開線程，任何線程或事件循環都可以調用
+    - 排空任務優先運行在 ASGI 服務器的事件循環上（第一次在事件循環中排入訊息
+      或註冊連線時綁定）；沒有事件循環時（WSGI、管理命令）使用一個後備線程
+    - 隊列滿時丟棄最舊的訊息並計數（背壓）
+    - 需要重試的訊息首次發送失敗後，以 send_with_retry_async 相同的
+      指數退避 + 抖動在獨立任務中重試，不阻塞隊列
+    """
+
+    def __init__(self, manager, maxsize=None, channel_layer=None):
+        """
+        Args:
+            manager: WebSocketManager（發送統計和重試）
+            maxsize: 隊列容量（默認 WEBSOCKET_OUTBOUND_QUEUE_SIZE）
+            channel_layer: 使用的 channel layer，None 表示發送時 get_channel_layer()
+        """
+        if maxsize is None:
+            maxsize = getattr(settings, "WEBSOCKET_OUTBOUND_QUEUE_SIZE", 1000)
+        self.manager = manager
+        self.maxsize = max(int(maxsize), 1)
+        self.channel_layer = channel_layer
+
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+
+        # 排空任務及其事件循環
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._fallback_loop = None
+
+        self.stats = {
+            "enqueued": 0,  # 排入的訊息數
+            "delivered": 0,  # 成功發送數
+            "dropped": 0,  # 隊列滿時丟棄的最舊訊息數
+            "retried": 0,  # 首次發送失敗、轉入重試的訊息數
+            "failed": 0,  # 最終發送失敗數
+            "max_depth": 0,  # 隊列最大深度
+        }
+
+    # ---------- 排入 ----------
+
+    def put(self, kind, target, message, retry=None):
+        """
+        排入一條訊息（不阻塞）
+
+        Args:
+            kind: "group"（group_send）或 "channel"（send）
+            target: 群組名稱或 channel 名稱
+            message: Channels 訊息字典
+            retry: 重試參數字典（None 表示不重試）
+
+        Returns:
+            bool: 是否已排入
+        """
+        with self._lock:
+            if len(self._items) >= self.maxsize:
+                dropped_kind, dropped_target, _, _ = self._items.popleft()
+                self.stats["dropped"] += 1
+                logger.warning(
+                    f"⚠️ 出站隊列已滿（{self.maxsize}），丟棄最舊的訊息: "
+                    f"{dropped_kind}:{dropped_target}"
+                )
+            self._items.append((kind, target, message, retry))
+            self.stats["enqueued"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], len(self._items))
+
+        self._wake()
+        return True
+
+    def bind_running_loop(self):
+        """在當前運行的事件循環上啟動排空任務（由 consumer 連線時調用）"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        self._wake()
+        return True
+
+    def _wake(self):
+        """確保排空任務存在並喚醒它"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        with self._lock:
+            loop, wakeup = self._ensure_task(running)
+
+        if loop is running:
+            wakeup.set()
+        else:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # 事件循環剛剛關閉，下一次排入時會重新綁定
+                pass
+
+    def _ensure_task(self, running):
+        """返回排空任務所在的事件循環（調用方持有 self._lock）"""
+        alive = (
+            self._task is not None
+            and not self._task.done()
+            and not self._loop.is_closed()
+            and self._loop.is_running()
+        )
+
+        # 優先使用服務器的事件循環：在事件循環中調用時從後備線程遷移過來
+        if running is not None and (not alive or self._loop is self._fallback_loop):
+            if alive:
+                self._task.cancel()
+            self._loop = running
+            self._wakeup = asyncio.Event()
+            self._task = running.create_task(self._drain(self._wakeup))
+            return self._loop, self._wakeup
+
+        if alive:
+            return self._loop, self._wakeup
+
+        # 沒有事件循環：使用後備線程
+        if self._fallback_loop is None or self._fallback_loop.is_closed():
+            self._fallback_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=self._run_fallback_loop,
+                args=(self._fallback_loop,),
+                name="websocket-outbound",
+                daemon=True,
+            ).start()
+        self._loop = self._fallback_loop
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.run_coroutine_threadsafe(
+            self._drain(self._wakeup), self._loop
+        )
+        return self._loop, self._wakeup
+
+    # ---------- 排空 ----------
+
+    def _pop(self):
+        with self._lock:
+            if not self._items:
+                return None
+            self._in_flight += 1
+            return self._items.popleft()
+
+    async def _drain(self, wakeup):
+        """排空任務：逐條發送，隊列為空時等待喚醒"""
+        while True:
+            item = self._pop()
+            if item is None:
+                wakeup.clear()
+                if self._items:
+                    continue
+                await wakeup.wait()
+                continue
+
+            try:
+                await self._deliver(*item)
+            finally:
+                with self._lock:
+                    self._in_flight = max(self._in_flight - 1, 0)
+
+    async def _deliver(self, kind, target, message, retry):
+        channel_layer = self.channel_layer or get_channel_layer()
+        if kind == "group":
+
+            def operation():
+                return channel_layer.group_send(target, message)
+
+        else:
+
+            def operation():
+                return channel_layer.send(target, message)
+
+        try:
+            await operation()
+            self.manager.stats["messages_sent"] += 1
+            self._count("delivered")
+        except Exception as e:
+            if retry is None:
+                self.manager.stats["errors"] += 1
+                self._count("failed")
+                logger.error(f"❌ 出站訊息發送失敗 {kind}:{target}: {e}")
+                return
+
+            self._count("retried")
+            asyncio.get_running_loop().create_task(
+                self._retry(operation, target, retry)
+            )
+
+    async def _retry(self, operation, target, retry):
+        success = await self.manager._with_retry_async(
+            operation, target, attempt=1, **retry
+        )
+        self._count("delivered" if success else "failed")
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def close(self):
+        """停止排空任務和後備線程，丟棄未發送的訊息（供測試和進程退出使用）"""
+        with self._lock:
+            task, loop, fallback = self._task, self._loop, self._fallback_loop
+            self._items.clear()
+            self._in_flight = 0
+            self._task = self._loop = self._wakeup = self._fallback_loop = None
+
+        if isinstance(task, asyncio.Task) and loop is not fallback:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is loop:
+                task.cancel()
+            else:
+                try:
+                    loop.call_soon_threadsafe(task.cancel)
+                except RuntimeError:
+                    pass
+        if fallback is not None and not fallback.is_closed():
+            # 取消後備線程上的所有任務後再停止並關閉事件循環
+            asyncio.run_coroutine_threadsafe(self._stop_fallback_loop(), fallback)
+
+    @staticmethod
+    def _run_fallback_loop(loop):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_forever()
+        finally:
+            loop.close()
+
+    @staticmethod
+    async def _stop_fallback_loop():
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        asyncio.get_running_loop().stop()
+
+    # ---------- 查詢 ----------
+
+    def wait_until_idle(self, timeout=5.0):
+        """等待隊列排空（供管理命令和測試使用，不可在事件循環中調用）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._items and not self._in_flight:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    async def ajoin(self, timeout=5.0):
+        """等待隊列排空（事件循環中使用）"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._items and not self._in_flight:
+                    return True
+            await asyncio.sleep(0.01)
+        return False
+
+    def get_stats(self):
+        """獲取出站隊列統計"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["depth"] = len(self._items)
+            stats["in_flight"] = self._in_flight
+        stats["maxsize"] = self.maxsize
+        stats["running_on"] = (
+            None
+            if self._loop is None
+            else "fallback" if self._loop is self._fallback_loop else "server"
+        )
+        return stats
+
 
 class WebSocketManager:
     """WebSocket 連接管理器（單例模式）- 增強版"""
@@ -40,13 +335,32 @@ class WebSocketManager:
         # value: 連線資訊字典
         self.connections = {}
 
-        # ========== 連線池（依使用者類型分組）==========
+        # ========== 連線池（依使用者類型分組，只含活動連線）==========
         self.connection_pool = {
-            "staff": [],  # 員工連線 ID 列表
-            "customer": [],  # 顧客連線 ID 列表
-            "unknown": [],  # 未識別連線
+            "staff": set(),  # 員工連線 ID
+            "customer": set(),  # 顧客連線 ID
+            "unknown": set(),  # 未識別連線
         }
 
+        # ========== 索引 ==========
+        self._by_channel = {}  # channel_name -> connection_id
+        self._by_user = {}  # user_id -> {connection_id}
+
+        # ========== 超時檢查（最小堆，舊條目延遲刪除）==========
+        # 條目: (時間, 序號, connection_id)，時間與連線當前值不同的條目已過期
+        self._heartbeat_heap = []
+        self._activity_heap = []
+        self._heap_seq = itertools.count()
+
+        # consumer 在事件循環中、視圖在線程池中同時修改註冊表
+        self._lock = threading.RLock()
+
+        # ========== 跨進程連線數（channels_redis 可用時）==========
+        self._process_key = f"{socket.gethostname()}:{os.getpid()}"
+        self._redis = None
+        self._counts_published_at = 0.0
+        self._counts_write_pending = False
+
         # ========== 統計資料 ==========
         self.stats = {
             "total_connections": 0,  # 歷史累計連線數
@@ -65,6 +379,9 @@ class WebSocketManager:
             "jitter": True,
         }
 
+        # ========== 出站隊列（每個進程一個排空任務）==========
+        self.outbound = OutboundMessageQueue(self)
+
         self._initialized = True
         logger.info("✅ WebSocketManager 增強版初始化完成")
 
@@ -83,57 +400,87 @@ class WebSocketManager:
         if user_info and user_info.get("user_type") in ["staff", "customer"]:
             user_type = user_info["user_type"]
 
-        # 儲存連線資訊
-        self.connections[connection_id] = {
-            "channel_name": channel_name,
-            "user_info": user_info or {},
-            "user_type": user_type,
-            "connected_at": timezone.now(),
-            "last_heartbeat": timezone.now(),
-            "last_activity": timezone.now(),
-            "status": "active",
-            "message_count": 0,
-            "disconnect_reason": None,
-            "disconnected_at": None,
-        }
+        now = timezone.now()
+        with self._lock:
+            # 同一 ID 重新註冊時先移除舊記錄的索引
+            if connection_id in self.connections:
+                self._remove_connection(connection_id)
+
+            # 儲存連線資訊
+            conn = {
+                "channel_name": channel_name,
+                "user_info": user_info or {},
+                "user_type": user_type,
+                "connected_at": now,
+                "last_heartbeat": now,
+                "last_activity": now,
+                "status": "active",
+                "message_count": 0,
+                "disconnect_reason": None,
+                "disconnected_at": None,
+            }
+            self.connections[connection_id] = conn
 
-        # 加入連線池
-        if connection_id not in self.connection_pool[user_type]:
-            self.connection_pool[user_type].append(connection_id)
+            # 加入連線池與索引
+            self.connection_pool[user_type].add(connection_id)
+            self._by_channel[channel_name] = connection_id
+            user_id = conn["user_info"].get("user_id")
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(connection_id)
+            self._push_deadlines(connection_id, conn, activity_only=False)
 
-        # 更新統計
-        self.stats["total_connections"] += 1
-        self.stats["active_connections"] += 1
+            # 更新統計
+            self.stats["total_connections"] += 1
+            self.stats["active_connections"] += 1
+
+        # 出站隊列的排空任務運行在服務器的事件循環上
+        self.outbound.bind_running_loop()
+        self._publish_counts(force=True)
 
         logger.info(f"✅ WebSocket 連線註冊: {connection_id}, 類型: {user_type}")
         return True
 
     def unregister_connection(self, connection_id, reason="正常斷開"):
         """註銷連線（完整移除）"""
-        if connection_id in self.connections:
-            # 從所有連線池中移除
-            for pool in self.connection_pool.values():
-                if connection_id in pool:
-                    pool.remove(connection_id)
+        with self._lock:
+            if connection_id not in self.connections:
+                return False
+            self._remove_connection(connection_id)
 
-            # 更新統計
-            if self.connections[connection_id]["status"] == "active":
-                self.stats["active_connections"] -= 1
+        self._publish_counts(force=True)
+        logger.info(f"✅ WebSocket 連線註銷: {connection_id}, 原因: {reason}")
+        return True
 
-            # 刪除連線記錄
-            del self.connections[connection_id]
+    def _remove_connection(self, connection_id):
+        """從連線記錄、連線池和索引中移除（調用方持有 self._lock）"""
+        conn = self.connections.pop(connection_id)
 
-            logger.info(f"✅ WebSocket 連線註銷: {connection_id}, 原因: {reason}")
-            return True
-        return False
+        # 更新統計
+        if conn["status"] == "active":
+            self.stats["active_connections"] -= 1
+            self.connection_pool[conn["user_type"]].discard(connection_id)
+
+        if self._by_channel.get(conn["channel_name"]) == connection_id:
+            del self._by_channel[conn["channel_name"]]
+        self._discard_user_index(connection_id, conn)
+
+    def _discard_user_index(self, connection_id, conn):
+        user_id = conn["user_info"].get("user_id")
+        user_connections = self._by_user.get(user_id)
+        if user_connections is not None:
+            user_connections.discard(connection_id)
+            if not user_connections:
+                del self._by_user[user_id]
 
     def disconnect(self, connection_id, reason="正常斷開"):
         """
         標記連線為已斷開（保留記錄供統計）
         不同於 unregister_connection，此方法保留連線記錄
         """
-        if connection_id in self.connections:
-            conn = self.connections[connection_id]
+        with self._lock:
+            conn = self.connections.get(connection_id)
+            if conn is None:
+                return False
 
             # 如果已經是斷開狀態，不再重複處理
             if conn["status"] == "disconnected":
@@ -143,38 +490,80 @@ class WebSocketManager:
             conn["disconnect_reason"] = reason
             conn["disconnected_at"] = timezone.now()
 
-            # 從連線池中移除（但保留在 connections 中）
-            for pool in self.connection_pool.values():
-                if connection_id in pool:
-                    pool.remove(connection_id)
+            # 從連線池和使用者索引中移除（但保留在 connections 中）
+            self.connection_pool[conn["user_type"]].discard(connection_id)
+            self._discard_user_index(connection_id, conn)
 
             # 更新統計
             self.stats["active_connections"] -= 1
 
-            logger.info(f"🔌 WebSocket 連線斷開: {connection_id}, 原因: {reason}")
-            return True
-        return False
+        self._publish_counts(force=True)
+        logger.info(f"🔌 WebSocket 連線斷開: {connection_id}, 原因: {reason}")
+        return True
 
     # ------------------------------------------------------------
     # 2. 心跳與活動監控
     # ------------------------------------------------------------
 
+    def _push_deadlines(self, connection_id, conn, activity_only):
+        """記錄連線的心跳/活動時間到最小堆（調用方持有 self._lock）"""
+        seq = next(self._heap_seq)
+        heapq.heappush(self._activity_heap, (conn["last_activity"], seq, connection_id))
+        if not activity_only:
+            heapq.heappush(
+                self._heartbeat_heap, (conn["last_heartbeat"], seq, connection_id)
+            )
+
+        # 舊條目過多時按當前連線重建
+        limit = 4 * max(len(self.connections), 16)
+        if len(self._heartbeat_heap) > limit or len(self._activity_heap) > limit:
+            self._rebuild_heaps()
+
+    def _rebuild_heaps(self):
+        active = [
+            (conn_id, conn)
+            for conn_id, conn in self.connections.items()
+            if conn["status"] == "active"
+        ]
+        self._heartbeat_heap = [
+            (conn["last_heartbeat"], next(self._heap_seq), conn_id)
+            for conn_id, conn in active
+        ]
+        self._activity_heap = [
+            (conn["last_activity"], next(self._heap_seq), conn_id)
+            for conn_id, conn in active
+        ]
+        heapq.heapify(self._heartbeat_heap)
+        heapq.heapify(self._activity_heap)
+
     def update_heartbeat(self, connection_id):
         """更新心跳時間（由 consumer 的 ping 觸發）"""
-        if connection_id in self.connections:
-            self.connections[connection_id]["last_heartbeat"] = timezone.now()
-            self.connections[connection_id]["last_activity"] = timezone.now()
-            self.connections[connection_id]["message_count"] += 1
-            return True
-        return False
+        with self._lock:
+            conn = self.connections.get(connection_id)
+            if conn is None:
+                return False
+            now = timezone.now()
+            conn["last_heartbeat"] = now
+            conn["last_activity"] = now
+            conn["message_count"] += 1
+            if conn["status"] == "active":
+                self._push_deadlines(connection_id, conn, activity_only=False)
+
+        # 定期刷新本進程在 Redis 中的連線數，避免被視為過期
+        self._publish_counts()
+        return True
 
     def update_activity(self, connection_id):
         """更新最後活動時間（收到任何訊息時觸發）"""
-        if connection_id in self.connections:
-            self.connections[connection_id]["last_activity"] = timezone.now()
-            self.connections[connection_id]["message_count"] += 1
-            return True
-        return False
+        with self._lock:
+            conn = self.connections.get(connection_id)
+            if conn is None:
+                return False
+            conn["last_activity"] = timezone.now()
+            conn["message_count"] += 1
+            if conn["status"] == "active":
+                self._push_deadlines(connection_id, conn, activity_only=True)
+        return True
 
     def cleanup_inactive_connections(
         self, heartbeat_timeout_minutes=10, activity_timeout_minutes=30
@@ -183,62 +572,182 @@ class WebSocketManager:
         清理不活動連線
         - heartbeat_timeout: 心跳超時（未回覆 ping）
         - activity_timeout: 活動超時（完全無訊息）
+
+        只彈出早於截止時間的堆頂條目，不遍歷所有連線
         """
         now = timezone.now()
         heartbeat_timeout = now - timedelta(minutes=heartbeat_timeout_minutes)
         activity_timeout = now - timedelta(minutes=activity_timeout_minutes)
 
-        inactive_ids = []
+        inactive_ids = set()
+        with self._lock:
+            for heap, field, cutoff in (
+                (self._heartbeat_heap, "last_heartbeat", heartbeat_timeout),
+                (self._activity_heap, "last_activity", activity_timeout),
+            ):
+                while heap and heap[0][0] < cutoff:
+                    timestamp, _, conn_id = heapq.heappop(heap)
+                    conn = self.connections.get(conn_id)
+                    # 只處理狀態為 active、且條目仍是當前時間的連線
+                    if (
+                        conn is not None
+                        and conn["status"] == "active"
+                        and conn[field] == timestamp
+                    ):
+                        inactive_ids.add(conn_id)
+
+            # 斷開不活動連線
+            for conn_id in inactive_ids:
+                self.disconnect(conn_id, "心跳超時或無活動")
+
+            # 記錄清理時間
+            self.stats["last_cleanup"] = now
 
-        for conn_id, conn_data in self.connections.items():
-            # 只處理狀態為 active 的連線
-            if conn_data["status"] != "active":
-                continue
+        if inactive_ids:
+            logger.info(f"🧹 清理了 {len(inactive_ids)} 個不活動連線")
 
-            last_heartbeat = conn_data["last_heartbeat"]
-            last_activity = conn_data["last_activity"]
+        return len(inactive_ids)
 
-            # 心跳超時 或 完全無活動超時
-            if last_heartbeat < heartbeat_timeout or last_activity < activity_timeout:
-                inactive_ids.append(conn_id)
+    # ------------------------------------------------------------
+    # 跨進程連線數（channels_redis）
+    # ------------------------------------------------------------
 
-        # 斷開不活動連線
-        for conn_id in inactive_ids:
-            self.disconnect(conn_id, "心跳超時或無活動")
+    def _get_redis(self):
+        """CHANNEL_LAYERS 使用 channels_redis 時返回 Redis 客戶端，否則 None"""
+        if self._redis is None:
+            from .queue_state_store import _redis_url_from_channel_layers
 
-        # 記錄清理時間
-        self.stats["last_cleanup"] = now
+            self._redis = False
+            redis_url = _redis_url_from_channel_layers()
+            if redis_url:
+                try:
+                    import redis
 
-        if inactive_ids:
-            logger.info(f"🧹 清理了 {len(inactive_ids)} 個不活動連線")
+                    self._redis = redis.Redis.from_url(
+                        redis_url, socket_timeout=0.5, socket_connect_timeout=0.5
+                    )
+                except Exception as e:
+                    logger.warning(f"⚠️ 無法連接 Redis，連線數只統計本進程: {e}")
+        return self._redis or None
 
-        return len(inactive_ids)
+    def _local_counts(self):
+        with self._lock:
+            return {
+                "active_connections": self.stats["active_connections"],
+                **{
+                    user_type: len(pool)
+                    for user_type, pool in self.connection_pool.items()
+                },
+            }
+
+    def _publish_counts(self, force=False):
+        """
+        把本進程的連線數寫入 Redis（連線變化時立即寫，否則定期刷新）
+
+        consumer 在事件循環中註冊、斷開和更新心跳，同步的 Redis 寫入交給
+        線程池執行，不阻塞事件循環；同時只排一個寫入，寫入時讀取最新的連線數。
+        """
+        interval = getattr(settings, "WEBSOCKET_COUNTS_PUBLISH_SECONDS", 30)
+        if not force and time.time() - self._counts_published_at < interval:
+            return
+        if self._get_redis() is None:
+            return
+
+        self._counts_published_at = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write_counts()
+            return
+
+        with self._lock:
+            if self._counts_write_pending:
+                return
+            self._counts_write_pending = True
+        loop.run_in_executor(None, self._write_counts)
+
+    def _write_counts(self):
+        with self._lock:
+            self._counts_write_pending = False
+        client = self._get_redis()
+        try:
+            client.hset(
+                CONNECTION_COUNTS_KEY,
+                self._process_key,
+                json.dumps({**self._local_counts(), "updated_at": time.time()}),
+            )
+        except Exception as e:
+            logger.debug(f"寫入 Redis 連線數失敗: {e}")
+
+    def get_cluster_counts(self):
+        """
+        所有進程的活動連線數
+
+        沒有 Redis 時只包含本進程；超過 WEBSOCKET_COUNTS_STALE_SECONDS
+        未刷新的進程視為已退出並從 Redis 中移除。
+        """
+        local = self._local_counts()
+        client = self._get_redis()
+        if client is None:
+            return {"processes": 1, **local}
+
+        stale_seconds = getattr(settings, "WEBSOCKET_COUNTS_STALE_SECONDS", 120)
+        totals = {key: 0 for key in local}
+        processes = 0
+        try:
+            self._publish_counts(force=True)
+            now = time.time()
+            for process_key, raw in client.hgetall(CONNECTION_COUNTS_KEY).items():
+                counts = json.loads(raw)
+                if now - counts.get("updated_at", 0) > stale_seconds:
+                    client.hdel(CONNECTION_COUNTS_KEY, process_key)
+                    continue
+                processes += 1
+                for key in totals:
+                    totals[key] += counts.get(key, 0)
+        except Exception as e:
+            logger.warning(f"⚠️ 讀取 Redis 連線數失敗，只統計本進程: {e}")
+            return {"processes": 1, **local}
+
+        return {"processes": processes, **totals}
 
     # ------------------------------------------------------------
     # 3. 訊息發送（增強版：重試 + 指數退避 + 抖動）
     # ------------------------------------------------------------
 
-    async def send_with_retry_async(
+    def _retry_delay(self, attempt, base_delay, max_delay, exponential, jitter):
+        """計算第 attempt 次重試前的延遲（指數退避 + ±20% 抖動）"""
+        if exponential:
+            delay = base_delay * (2 ** (attempt - 1))
+        else:
+            delay = base_delay * attempt
+        delay = min(delay, max_delay)
+
+        # 加入隨機抖動 (±20%)
+        if jitter:
+            jitter_range = delay * 0.2
+            delay += random.uniform(-jitter_range, jitter_range)
+            delay = max(0.1, delay)  # 確保不小於 0.1 秒
+        return delay
+
+    async def _with_retry_async(
         self,
-        channel_name,
-        message,
+        operation,
+        target,
         max_retries=None,
         base_delay=None,
         max_delay=None,
         exponential=True,
         jitter=True,
+        attempt=0,
     ):
         """
-        非同步發送訊息，失敗時以指數退避 + 抖動重試
+        執行非同步發送操作，失敗時以指數退避 + 抖動重試
 
         Args:
-            channel_name: 目標 channel 名稱
-            message: 要發送的訊息 dict
-            max_retries: 最大重試次數（預設使用 self.default_retry_config）
-            base_delay: 初始延遲秒數（預設 0.5）
-            max_delay: 最大延遲秒數（預設 30）
-            exponential: 是否使用指數退避（預設 True）
-            jitter: 是否加入隨機抖動（預設 True）
+            operation: 無參數、返回 awaitable 的函數（例如 channel_layer.send 的包裝）
+            target: 目標 channel 或群組名稱（用於日誌）
+            attempt: 已失敗的次數（外部已嘗試過一次時傳 1）
 
         Returns:
             bool: 是否成功發送
@@ -249,35 +758,28 @@ class WebSocketManager:
         base_delay = base_delay if base_delay is not None else cfg["base_delay"]
         max_delay = max_delay if max_delay is not None else cfg["max_delay"]
 
-        channel_layer = get_channel_layer()
-        attempt = 0
+        if attempt:
+            await asyncio.sleep(
+                self._retry_delay(attempt, base_delay, max_delay, exponential, jitter)
+            )
 
         while attempt <= max_retries:
             try:
-                await channel_layer.send(channel_name, message)
+                await operation()
                 self.stats["messages_sent"] += 1
-                logger.debug(f"📤 訊息發送成功至 {channel_name}")
+                logger.debug(f"📤 訊息發送成功至 {target}")
                 return True
             except Exception as e:
                 attempt += 1
                 if attempt > max_retries:
                     self.stats["errors"] += 1
-                    logger.error(f"❌ 訊息發送最終失敗至 {channel_name}，錯誤: {e}")
+                    logger.error(f"❌ 訊息發送最終失敗至 {target}，錯誤: {e}")
                     return False
 
                 # 計算重試延遲
-                if exponential:
-                    delay = base_delay * (2 ** (attempt - 1))
-                else:
-                    delay = base_delay * attempt
-                delay = min(delay, max_delay)
-
-                # 加入隨機抖動 (±20%)
-                if jitter:
-                    jitter_range = delay * 0.2
-                    delay += random.uniform(-jitter_range, jitter_range)
-                    delay = max(0.1, delay)  # 確保不小於 0.1 秒
-
+                delay = self._retry_delay(
+                    attempt, base_delay, max_delay, exponential, jitter
+                )
                 logger.warning(
                     f"⚠️ 訊息發送失敗（嘗試 {attempt}/{max_retries}），"
                     f"{delay:.2f}秒後重試: {e}"
@@ -286,6 +788,42 @@ class WebSocketManager:
 
         return False  # 不會執行到此
 
+    async def send_with_retry_async(
+        self,
+        channel_name,
+        message,
+        max_retries=None,
+        base_delay=None,
+        max_delay=None,
+        exponential=True,
+        jitter=True,
+    ):
+        """
+        非同步發送訊息，失敗時以指數退避 + 抖動重試
+
+        Args:
+            channel_name: 目標 channel 名稱
+            message: 要發送的訊息 dict
+            max_retries: 最大重試次數（預設使用 self.default_retry_config）
+            base_delay: 初始延遲秒數（預設 0.5）
+            max_delay: 最大延遲秒數（預設 30）
+            exponential: 是否使用指數退避（預設 True）
+            jitter: 是否加入隨機抖動（預設 True）
+
+        Returns:
+            bool: 是否成功發送
+        """
+        channel_layer = get_channel_layer()
+        return await self._with_retry_async(
+            lambda: channel_layer.send(channel_name, message),
+            channel_name,
+            max_retries=max_retries,
+            base_delay=base_delay,
+            max_delay=max_delay,
+            exponential=exponential,
+            jitter=jitter,
+        )
+
     def send_with_retry_sync(
         self,
         channel_name,
@@ -341,16 +879,9 @@ class WebSocketManager:
                     return False
 
                 # 計算重試延遲（同步環境使用 time.sleep）
-                if exponential:
-                    delay = base_delay * (2 ** (attempt - 1))
-                else:
-                    delay = base_delay * attempt
-                delay = min(delay, max_delay)
-
-                if jitter:
-                    jitter_range = delay * 0.2
-                    delay += random.uniform(-jitter_range, jitter_range)
-                    delay = max(0.1, delay)
+                delay = self._retry_delay(
+                    attempt, base_delay, max_delay, exponential, jitter
+                )
 
                 logger.warning(
                     f"⚠️ [同步] 訊息發送失敗（嘗試 {attempt}/{max_retries}），"
@@ -373,19 +904,18 @@ class WebSocketManager:
     ):
         """
         廣播訊息到群組（可選重試）- ✅ 最終修復版
-        - 在事件循環中返回普通字典，避免被 await 時出錯
+        - 在事件循環中改為排入出站隊列（不阻塞），返回普通字典
         - 修復：確保返回字典，而不是可以被 await 的對象
         """
         try:
             # 檢查是否在事件循環中
             try:
                 _ = asyncio.get_running_loop()
-                logger.warning(
-                    f"⚠️ broadcast_to_group 在事件循環中被調用，但當前是同步方法。"
-                    f"廣播至 {group_name} 將跳過，返回空字典。"
+                accepted = self.enqueue_broadcast(
+                    group_name, message_type, data, retry=retry, **retry_kwargs
                 )
                 # ✅ 返回普通字典，絕對不可 await
-                return {"success": 0, "failed": 0}
+                return {"success": int(accepted), "failed": 0}
             except RuntimeError:
                 # 沒有運行中的事件循環，可以安全使用 async_to_sync
                 pass
@@ -420,52 +950,62 @@ class WebSocketManager:
 
     def get_connection_by_channel(self, channel_name):
         """根據 channel_name 查詢 connection_id"""
-        for conn_id, conn_data in self.connections.items():
-            if conn_data["channel_name"] == channel_name:
-                return conn_id, conn_data
-        return None, None
+        with self._lock:
+            conn_id = self._by_channel.get(channel_name)
+            if conn_id is None:
+                return None, None
+            return conn_id, self.connections[conn_id]
+
+    def get_connections_for_user(self, user_id):
+        """取得使用者的活動連線 ID 列表"""
+        with self._lock:
+            return sorted(self._by_user.get(user_id, ()))
 
     def get_active_connections(self, user_type=None):
         """取得活動連線列表（可過濾使用者類型）"""
-        result = []
-        for conn_id, conn_data in self.connections.items():
-            if conn_data["status"] == "active":
-                if user_type is None or conn_data["user_type"] == user_type:
-                    result.append(
-                        {
-                            "id": conn_id,
-                            "channel_name": conn_data["channel_name"],
-                            "user_info": conn_data["user_info"],
-                            "connected_at": conn_data["connected_at"],
-                            "last_activity": conn_data["last_activity"],
-                            "message_count": conn_data["message_count"],
-                        }
-                    )
+        with self._lock:
+            if user_type is None:
+                conn_ids = set().union(*self.connection_pool.values())
+            else:
+                conn_ids = self.connection_pool.get(user_type, set())
+
+            result = []
+            for conn_id in conn_ids:
+                conn_data = self.connections[conn_id]
+                result.append(
+                    {
+                        "id": conn_id,
+                        "channel_name": conn_data["channel_name"],
+                        "user_info": conn_data["user_info"],
+                        "connected_at": conn_data["connected_at"],
+                        "last_activity": conn_data["last_activity"],
+                        "message_count": conn_data["message_count"],
+                    }
+                )
         return result
 
     def get_active_connections_count(self, user_type=None):
         """快速取得活動連線數量（依類型）"""
-        count = 0
-        for conn_data in self.connections.values():
-            if conn_data["status"] == "active":
-                if user_type is None or conn_data["user_type"] == user_type:
-                    count += 1
-        return count
+        with self._lock:
+            if user_type is None:
+                return self.stats["active_connections"]
+            return len(self.connection_pool.get(user_type, ()))
 
     def get_stats(self):
         """取得完整統計資訊"""
         # 計算各類型連線數量
         user_type_stats = {}
-        for conn_data in self.connections.values():
-            ut = conn_data["user_type"]
-            status = conn_data["status"]
+        with self._lock:
+            for conn_data in self.connections.values():
+                ut = conn_data["user_type"]
+                status = conn_data["status"]
 
-            if ut not in user_type_stats:
-                user_type_stats[ut] = {"total": 0, "active": 0}
+                if ut not in user_type_stats:
+                    user_type_stats[ut] = {"total": 0, "active": 0}
 
-            user_type_stats[ut]["total"] += 1
-            if status == "active":
-                user_type_stats[ut]["active"] += 1
+                user_type_stats[ut]["total"] += 1
+                if status == "active":
+                    user_type_stats[ut]["active"] += 1
 
         return {
             "summary": {
@@ -478,6 +1018,8 @@ class WebSocketManager:
             },
             "user_type_stats": user_type_stats,
             "pool_size": {k: len(v) for k, v in self.connection_pool.items()},
+            "outbound": self.outbound.get_stats(),
+            "cluster": self.get_cluster_counts(),
         }
 
     def reset_stats(self):
@@ -491,6 +1033,45 @@ class WebSocketManager:
         }
         logger.info("📊 WebSocket 統計資料已重置")
 
+    # ------------------------------------------------------------
+    # 5. 出站隊列（不阻塞，可在同步視圖和事件循環中調用）
+    # ------------------------------------------------------------
+
+    def _retry_options(self, retry, retry_kwargs):
+        """重試參數（None 表示不重試）"""
+        return dict(retry_kwargs) if retry else None
+
+    def enqueue_broadcast(
+        self, group_name, message_type, data, retry=False, **retry_kwargs
+    ):
+        """排入群組廣播（同步接口，不阻塞、不開線程）"""
+        message = {
+            "type": message_type,
+            **data,
+            "timestamp": timezone.now().isoformat(),
+        }
+        return self.outbound.put(
+            "group", group_name, message, self._retry_options(retry, retry_kwargs)
+        )
+
+    def enqueue_send(self, channel_name, message, retry=True, **retry_kwargs):
+        """排入單個 channel 的訊息（同步接口，不阻塞、不開線程）"""
+        return self.outbound.put(
+            "channel", channel_name, message, self._retry_options(retry, retry_kwargs)
+        )
+
+    async def abroadcast(
+        self, group_name, message_type, data, retry=False, **retry_kwargs
+    ):
+        """排入群組廣播（async consumer 使用）"""
+        return self.enqueue_broadcast(
+            group_name, message_type, data, retry=retry, **retry_kwargs
+        )
+
+    async def asend(self, channel_name, message, retry=True, **retry_kwargs):
+        """排入單個 channel 的訊息（async consumer 使用）"""
+        return self.enqueue_send(channel_name, message, retry=retry, **retry_kwargs)
+
     async def async_broadcast_to_group(
         self,
         group_name,
@@ -501,18 +1082,12 @@ class WebSocketManager:
         **retry_kwargs,
     ):
         """
-        異步廣播到群組（供事件循環中調用）
+        異步廣播到群組（供事件循環中調用，經出站隊列發送）
         """
-        channel_layer = get_channel_layer()
-        message = {
-            "type": message_type,
-            **data,
-            "timestamp": timezone.now().isoformat(),
-        }
-        # 如果有排除邏輯，可在這裡處理，簡化版本直接發送
-        await channel_layer.group_send(group_name, message)
-        self.stats["messages_sent"] += 1
-        return {"success": 1, "failed": 0}
+        accepted = await self.abroadcast(
+            group_name, message_type, data, retry=retry, **retry_kwargs
+        )
+        return {"success": int(accepted), "failed": 0}
 
 
 # ========== 全域單例 ==========
@@ -1,12 +1,12 @@
 # eshop/websocket_utils.py
 # ==================== WebSocket 發送工具 - 最終調試版 ====================
 
-import asyncio
 import logging
 from typing import Any, Dict, List
 
 from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
 
 from .websocket_manager import websocket_manager
 
@@ -47,17 +47,13 @@ def send_message(
 ) -> bool:
     """
     發送訊息到指定頻道（增強：支持重試）
+
+    訊息排入 WebSocketManager 的出站隊列，不阻塞調用方
     """
     try:
-        if retry:
-            success = async_to_sync(websocket_manager.send_with_retry_async)(
-                channel_name, message, max_retries=max_retries, **kwargs
-            )
-            return success
-        else:
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.send)(channel_name, message)
-            return True
+        return websocket_manager.enqueue_send(
+            channel_name, message, retry=retry, max_retries=max_retries, **kwargs
+        )
     except Exception as e:
         logger.error(f"❌ 發送訊息失敗: {e}")
         return False
@@ -67,85 +63,20 @@ def broadcast_to_group(
     group_name: str, message: Dict[str, Any], retry: bool = True, **kwargs
 ) -> Dict[str, int]:
     """
-    修復版本：總是返回普通字典，避免在事件循環中返回 coroutine 導致 await 錯誤
-    增強版：在事件循環中時，使用線程執行同步調用
+    廣播訊息到群組，總是返回普通字典
+
+    訊息排入 WebSocketManager 的有界出站隊列，由每個進程一個的排空任務發送；
+    同步視圖和事件循環中都可以直接調用，不阻塞也不開線程。
     """
     try:
-        # 檢查是否在事件循環中
-        try:
-            _ = asyncio.get_running_loop()
-            # 在事件循環中，使用線程執行同步調用
-            logger.warning(
-                f"⚠️ 在事件循環中調用 broadcast_to_group（{group_name}），"
-                "使用線程執行同步調用"
-            )
-
-            import queue
-            import threading
-
-            result_queue = queue.Queue()
-
-            def sync_broadcast():
-                try:
-                    result = websocket_manager.broadcast_to_group(
-                        group_name=group_name,
-                        message_type=message.get("type", "unknown"),
-                        data=message,
-                        retry=retry,
-                        **kwargs,
-                    )
-                    result_queue.put(result)
-                except Exception as e:
-                    logger.error(f"線程中廣播失敗: {e}")
-                    result_queue.put({"success": 0, "failed": 0})
-
-            thread = threading.Thread(target=sync_broadcast)
-            thread.start()
-            thread.join(timeout=5)  # 5秒超時
-
-            if thread.is_alive():
-                logger.error(f"廣播線程超時: {group_name}")
-                return {"success": 0, "failed": 0}
-
-            try:
-                result = result_queue.get_nowait()
-            except queue.Empty:
-                return {"success": 0, "failed": 0}
-
-            # 確保返回普通字典
-            if isinstance(result, dict):
-                return {
-                    "success": int(result.get("success", 0)),
-                    "failed": int(result.get("failed", 0)),
-                }
-            elif isinstance(result, bool):
-                return {"success": 1 if result else 0, "failed": 0}
-            else:
-                return {"success": 0, "failed": 0}
-
-        except RuntimeError:
-            # 沒有運行中的事件循環，正常同步執行
-            pass
-
-        # 同步版本（無事件循環）- 直接調用同步函數
-        result = websocket_manager.broadcast_to_group(
-            group_name=group_name,
-            message_type=message.get("type", "unknown"),
-            data=message,
+        accepted = websocket_manager.enqueue_broadcast(
+            group_name,
+            message.get("type", "unknown"),
+            message,
             retry=retry,
             **kwargs,
         )
-
-        # 確保返回普通字典
-        if isinstance(result, dict):
-            return {
-                "success": int(result.get("success", 0)),
-                "failed": int(result.get("failed", 0)),
-            }
-        elif isinstance(result, bool):
-            return {"success": 1 if result else 0, "failed": 0}
-        else:
-            return {"success": 0, "failed": 0}
+        return {"success": int(accepted), "failed": 0}
 
     except Exception as e:
         logger.error(f"❌ 群組廣播失敗 {group_name}: {e}")
@@ -190,13 +121,21 @@ def send_order_update(
 def send_queue_update(update_type: str, data: Dict[str, Any] = None) -> int:
     """
     發送隊列更新
+
+    預設交由隊列廣播合併器在短窗口內按訂單合併後發送 queue_batch
+    （QUEUE_BROADCAST_BATCHING = False 時直接廣播）
     """
     message = {
         "type": "queue_update",
         "update_type": update_type,
         "data": data or {},
-        "timestamp": None,
+        "timestamp": timezone.now().isoformat(),
     }
+    if getattr(settings, "QUEUE_BROADCAST_BATCHING", True):
+        from .websocket_batcher import get_queue_broadcast_batcher
+
+        return int(get_queue_broadcast_batcher().enqueue("queue_updates", message))
+
     result = broadcast_to_group("queue_updates", message)
     return result.get("success", 0)
 
@@ -260,7 +199,11 @@ def send_system_message(message: str, message_type: str = "info") -> int:
 
 def get_websocket_stats() -> Dict[str, Any]:
     """獲取 WebSocket 統計資訊"""
-    return websocket_manager.get_stats()
+    from .websocket_batcher import get_queue_broadcast_batcher
+
+    stats = websocket_manager.get_stats()
+    stats["queue_batching"] = get_queue_broadcast_batcher().get_stats()
+    return stats
 
 
 def get_connection_list(user_type: str = None) -> List[Dict]:
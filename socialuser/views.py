@@ -506,9 +506,11 @@ def order_history(request):
     total_orders = OrderModel.objects.filter(user=request.user).count()
 
     # 獲取分頁訂單
-    orders = OrderModel.objects.filter(user=request.user).order_by("-created_at")[
-        offset : offset + limit
-    ]
+    orders = (
+        OrderModel.objects.without_qr_codes()
+        .filter(user=request.user)
+        .order_by("-created_at")[offset : offset + limit]
+    )
 
     # 檢查是否還有更多訂單
     has_more = (offset + limit) < total_orders
@@ -564,7 +566,7 @@ def order_history(request):
             }
 
             # 獲取訂單項目
-            for item in order.get_items_with_chinese_options():
+            for item in order.get_display_payload()["items"]["all_items"]:
                 item_data = {
                     "name": str(item.get("name", "")),
                     "quantity": int(item.get("quantity", 0)),
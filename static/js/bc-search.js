@@ -4,6 +4,7 @@
    - 桌面 hover：mouseenter → is-on（背景圖浮入）、mouseleave → is-out（浮出）
    - 行動端（≤767px）：GSAP ScrollTrigger 進入/離開視窗 50% 觸發
    相依：GSAP + ScrollTrigger（CDN，見 index.html）
+   另含菜單搜索框自動補全（input[data-bc-suggest]，見檔案後半）
    ============================================================ */
 (function () {
     'use strict';
@@ -74,3 +75,134 @@
         });
     }
 })();
+
+/* ============================================================
+   菜單搜索框自動補全（2026-10-17）
+   - input[data-bc-suggest] 的值為 /search/suggest/ 端點，data-type 為 coffee / bean
+   - 輸入停頓 150ms 後查詢；每個前綴的結果在頁面內快取（伺服器端另按前綴快取）
+   - 上 / 下鍵選擇、Enter 前往、Esc 關閉
+   ============================================================ */
+(function () {
+    'use strict';
+
+    var inputs = document.querySelectorAll('input[data-bc-suggest]');
+    if (!inputs.length) {
+        return;
+    }
+
+    var DEBOUNCE_MS = 150;
+    var cache = {};
+
+    function escapeHtml(text) {
+        var div = document.createElement('div');
+        div.textContent = text == null ? '' : String(text);
+        return div.innerHTML;
+    }
+
+    function setup(input) {
+        var endpoint = input.getAttribute('data-bc-suggest');
+        var type = input.getAttribute('data-type') || '';
+        var list = document.createElement('ul');
+        var timer = null;
+        var active = -1;
+        var latest = '';
+
+        list.className = 'bc-suggest-list';
+        list.setAttribute('role', 'listbox');
+        list.hidden = true;
+        input.parentNode.classList.add('bc-suggest');
+        input.parentNode.appendChild(list);
+
+        function close() {
+            list.hidden = true;
+            active = -1;
+        }
+
+        function render(results) {
+            if (!results.length) {
+                list.innerHTML = '';
+                close();
+                return;
+            }
+            list.innerHTML = results.map(function (item) {
+                return '<li role="option"><a href="' + escapeHtml(item.url) + '">' +
+                    '<img src="' + escapeHtml(item.image) + '" alt="" loading="lazy">' +
+                    '<span class="bc-suggest-name">' + escapeHtml(item.name) + '</span>' +
+                    (item.highlight ? '<span class="bc-suggest-highlight">' + escapeHtml(item.highlight) + '</span>' : '') +
+                    '</a></li>';
+            }).join('');
+            list.hidden = false;
+            active = -1;
+        }
+
+        function lookup(query) {
+            var key = type + ':' + query.toLowerCase();
+            latest = key;
+            if (cache[key]) {
+                render(cache[key]);
+                return;
+            }
+            var url = endpoint + '?q=' + encodeURIComponent(query) + (type ? '&type=' + type : '');
+            fetch(url, { headers: { 'Accept': 'application/json' } })
+                .then(function (response) {
+                    return response.ok ? response.json() : { results: [] };
+                })
+                .then(function (data) {
+                    cache[key] = data.results || [];
+                    // 只顯示最後一次輸入的結果（較早的請求可能較晚返回）
+                    if (latest === key) {
+                        render(cache[key]);
+                    }
+                })
+                .catch(function () {
+                    close();
+                });
+        }
+
+        function highlight(index) {
+            var items = list.querySelectorAll('li');
+            if (!items.length) {
+                return;
+            }
+            active = (index + items.length) % items.length;
+            Array.prototype.forEach.call(items, function (item, i) {
+                item.classList.toggle('is-active', i === active);
+            });
+        }
+
+        input.addEventListener('input', function () {
+            var query = input.value.trim();
+            clearTimeout(timer);
+            if (!query) {
+                latest = '';
+                close();
+                return;
+            }
+            timer = setTimeout(function () {
+                lookup(query);
+            }, DEBOUNCE_MS);
+        });
+
+        input.addEventListener('keydown', function (event) {
+            if (list.hidden) {
+                return;
+            }
+            if (event.key === 'ArrowDown' || event.key === 'ArrowUp') {
+                event.preventDefault();
+                highlight(active + (event.key === 'ArrowDown' ? 1 : -1));
+            } else if (event.key === 'Enter' && active >= 0) {
+                event.preventDefault();
+                window.location.href = list.querySelectorAll('li a')[active].href;
+            } else if (event.key === 'Escape') {
+                close();
+            }
+        });
+
+        // 延遲關閉，讓點擊建議連結先生效
+        input.addEventListener('blur', function () {
+            setTimeout(close, 150);
+        });
+    }
+
+    Array.prototype.forEach.call(inputs, setup);
+})();
@@ -29,6 +29,14 @@ class OrderStatusCardsManager {
         // 記錄最後一次從服務器收到的狀態（用於去重，防止輪詢重複彈 Toast）
         this.lastServerStatus = null;
 
+        // 預計完成時間：服務端只在位置/預計時間改變時推送，倒數在本地插值
+        this.etaDeadline = null;
+        this.queuePosition = null;
+        this._countdownTimer = null;
+
+        // 後備輪詢的 ETag（未變化時服務端返回 304）
+        this._statusEtag = null;
+
         
         // 記錄每個狀態的實際時間
         this.actualStatusTimes = {
@@ -393,6 +401,13 @@ class OrderStatusCardsManager {
                 })
             );
             
+            // 監聽預計時間推送（位置或預計完成時間改變時才會收到）
+            ['message:queue_position', 'message:estimated_time'].forEach((eventName) => {
+                this._wsUnsubscribers.push(
+                    core.on(eventName, (data) => this.handleEtaUpdate(data))
+                );
+            });
+            
             // 🔥 修復：監聽 order_update 類型（後端 send_order_update 發送的實際類型）
             // 後端 websocket_utils.py 中 send_order_update 發送 type: 'order_update'
             // WebSocketCore 會將其分發為 message:order_update 事件
@@ -472,6 +487,8 @@ class OrderStatusCardsManager {
                     } else if (data.type === 'order_status') {
                         // 格式2: {type: 'order_status', data: {status: 'preparing', ...}, ...}
                         this.handleOrderStatusData(data);
+                    } else if (data.type === 'queue_position' || data.type === 'estimated_time') {
+                        this.handleEtaUpdate(data);
                     } else if (data.type === 'ping') {
                         // 回應ping消息
                         this.websocket.send(JSON.stringify({ type: 'pong' }));
@@ -557,6 +574,76 @@ class OrderStatusCardsManager {
             
             // 根據狀態更新卡片
             this.updateStatusFromServer(status);
+            this.handleEtaUpdate({ order_id: orderId, ...statusData });
+        }
+    }
+    
+    // 處理預計時間（WebSocket 推送或輪詢響應）
+    handleEtaUpdate(data) {
+        const orderId = data.order_id || data.orderId;
+        if (orderId && orderId.toString() !== this.orderId) {
+            return;
+        }
+        
+        const position = data.position ?? data.queue_position;
+        if (position !== undefined && position !== null) {
+            this.queuePosition = position;
+        }
+        
+        if (data.remaining_seconds !== undefined && data.remaining_seconds !== null) {
+            // 以收到消息的本地時間為基準，不依賴客戶端與服務端的時鐘一致
+            this.etaDeadline = Date.now() + data.remaining_seconds * 1000;
+            this.startCountdown();
+        }
+        
+        this.renderCountdown();
+    }
+    
+    // 本地每秒更新倒數，不需要向服務器請求
+    startCountdown() {
+        if (this._countdownTimer) {
+            return;
+        }
+        // 頁面沒有倒數元素（例如純咖啡豆訂單）時不啟動定時器
+        if (!document.querySelector('[data-eta-countdown]')) {
+            return;
+        }
+        this._countdownTimer = setInterval(() => this.renderCountdown(), 1000);
+    }
+    
+    stopCountdown() {
+        if (this._countdownTimer) {
+            clearInterval(this._countdownTimer);
+            this._countdownTimer = null;
+        }
+    }
+    
+    renderCountdown() {
+        // 就緒或完成後不再顯示排隊位置和倒數
+        const finished = ['ready', 'completed'].includes(this.lastServerStatus);
+        document.querySelectorAll('[data-order-eta]').forEach((el) => {
+            el.hidden = finished || (this.queuePosition === null && this.etaDeadline === null);
+        });
+        
+        if (this.queuePosition !== null) {
+            document.querySelectorAll('[data-queue-position]').forEach((el) => {
+                el.textContent = this.queuePosition;
+            });
+        }
+        
+        if (this.etaDeadline === null) {
+            return;
+        }
+        
+        const remaining = Math.max(0, Math.round((this.etaDeadline - Date.now()) / 1000));
+        const minutes = Math.floor(remaining / 60);
+        const seconds = remaining % 60;
+        document.querySelectorAll('[data-eta-countdown]').forEach((el) => {
+            el.textContent = `${String(minutes).padStart(2, '0')}:${String(seconds).padStart(2, '0')}`;
+        });
+        
+        if (remaining === 0 || finished) {
+            this.stopCountdown();
         }
     }
     
@@ -772,19 +859,36 @@ class OrderStatusCardsManager {
     // 設置定期狀態檢查
 
     setupPeriodicCheck() {
-        // 每30秒檢查一次訂單狀態
-        setInterval(() => {
-            this.checkOrderStatus();
-        }, 30000);
+        // WebSocket 已連線時只作偶爾的校驗（2分鐘），斷線時每30秒輪詢一次
+        const scheduleNext = () => {
+            const interval = this.isConnected ? 120000 : 30000;
+            this._periodicCheckTimer = setTimeout(async () => {
+                await this.checkOrderStatus();
+                scheduleNext();
+            }, interval);
+        };
+        scheduleNext();
     }
     
-    // 檢查訂單狀態
+    // 檢查訂單狀態（帶 If-None-Match，未變化時服務器返回 304）
     async checkOrderStatus() {
         try {
-            const response = await fetch(`/eshop/order/api/order-status/${this.orderId}/`);
+            const headers = {};
+            if (this._statusEtag) {
+                headers['If-None-Match'] = this._statusEtag;
+            }
+            const response = await fetch(`/eshop/order/api/order-status/${this.orderId}/`, {
+                headers,
+                cache: 'no-store'
+            });
+            if (response.status === 304) {
+                return;
+            }
             if (response.ok) {
+                this._statusEtag = response.headers.get('ETag');
                 const data = await response.json();
                 this.handleOrderStatusUpdate(data);
+                this.handleEtaUpdate(data);
             }
         } catch (error) {
             console.error("檢查訂單狀態失敗:", error);
@@ -805,6 +909,13 @@ class OrderStatusCardsManager {
             this.websocket = null;
         }
         
+        // 停止倒數和後備輪詢
+        this.stopCountdown();
+        if (this._periodicCheckTimer) {
+            clearTimeout(this._periodicCheckTimer);
+            this._periodicCheckTimer = null;
+        }
+        
         console.log("✅ WebSocket資源已清理");
     }
 }
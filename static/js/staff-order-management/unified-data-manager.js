@@ -9,6 +9,10 @@ class UnifiedDataManager {
         // 數據狀態
         this.currentData = null;
         this.lastUpdateTime = null;
+        // 增量查詢游標（服務端變更序號）；定期仍做一次全量刷新以更新相對時間文字
+        this.cursor = null;
+        this.lastFullLoadAt = 0;
+        this.fullRefreshInterval = 60000; // 60秒
         this.isLoading = false;
         this.hasError = false;
         this.errorCount = 0;
@@ -66,7 +70,10 @@ class UnifiedDataManager {
             
             // 添加隨機參數防止緩存
             const timestamp = Date.now();
-            const response = await fetch(`/eshop/queue/unified-data/?_=${timestamp}`, {
+            const useDelta = this.cursor !== null && this.currentData &&
+                timestamp - this.lastFullLoadAt < this.fullRefreshInterval;
+            const sinceParam = useDelta ? `&since=${this.cursor}` : '';
+            const response = await fetch(`/eshop/queue/unified-data/?_=${timestamp}${sinceParam}`, {
                 headers: {
                     'Cache-Control': 'no-cache',
                     'Pragma': 'no-cache'
@@ -95,8 +102,14 @@ class UnifiedDataManager {
             this.errorCount = 0;
             this.hasError = false;
             
-            // 更新當前數據
-            this.currentData = result.data;
+            // 更新當前數據（增量響應合併到現有數據）
+            if (result.is_incremental && this.currentData) {
+                this.currentData = this.mergeDelta(this.currentData, result.data);
+            } else {
+                this.currentData = result.data;
+                this.lastFullLoadAt = timestamp;
+            }
+            this.cursor = (typeof result.cursor === 'number') ? result.cursor : null;
             this.lastUpdateTime = result.timestamp;
             
             const loadTime = Date.now() - startTime;
@@ -181,6 +194,40 @@ class UnifiedDataManager {
         }
     }
     
+    // ==================== 增量合併 ====================
+    
+    /**
+     * 將增量響應合併到現有數據：
+     * 移除有變化（或已離開列表）的訂單，再加入增量中的最新數據並重新排序
+     */
+    mergeDelta(previous, delta) {
+        const sections = {
+            payment_pending_orders: (a, b) => (b.created_at || '').localeCompare(a.created_at || ''),
+            waiting_orders: (a, b) => (a.position || 0) - (b.position || 0),
+            preparing_orders: (a, b) => (a.estimated_start_time || '').localeCompare(b.estimated_start_time || ''),
+            ready_orders: (a, b) => (b.ready_at || '').localeCompare(a.ready_at || ''),
+            completed_orders: (a, b) => (b.picked_up_at || '').localeCompare(a.picked_up_at || '')
+        };
+        
+        const changed = new Set(delta.removed_order_ids || []);
+        Object.keys(sections).forEach(section => {
+            (delta[section] || []).forEach(order => changed.add(order.id));
+        });
+        
+        const merged = {
+            ...previous,
+            badge_summary: delta.badge_summary,
+            removed_order_ids: delta.removed_order_ids || []
+        };
+        Object.entries(sections).forEach(([section, compare]) => {
+            merged[section] = (previous[section] || [])
+                .filter(order => !changed.has(order.id))
+                .concat(delta[section] || [])
+                .sort(compare);
+        });
+        return merged;
+    }
+    
     // ==================== 新增：數據驗證方法 ====================
     
     /**
@@ -450,6 +450,9 @@ class WebSocketManager {
             case 'queue_update':
                 this.handleQueueUpdate(data);
                 break;
+            case 'queue_batch':
+                this.handleQueueBatch(data);
+                break;
             case 'order_update':
                 this.handleOrderUpdate(data);
                 break;
@@ -492,6 +495,25 @@ class WebSocketManager {
         }
     }
     
+    /**
+     * 處理合併後的隊列更新（服務端在短窗口內按訂單合併的 queue_update）
+     * 整個批次只觸發一次數據重新加載
+     */
+    handleQueueBatch(data) {
+        const events = data.events || [];
+        console.log(`📦 合併隊列更新: ${events.length} 個事件`, data.order_ids || []);
+        const messages = events
+            .map(event => (event.data && event.data.message) || event.message)
+            .filter(Boolean);
+        if (messages.length && window.toast) {
+            window.toast.info(`📊 ${messages[messages.length - 1]}`);
+        }
+        
+        if (window.unifiedDataManager) {
+            window.unifiedDataManager.loadUnifiedData(true);
+        }
+    }
+    
     /**
      * 處理訂單更新
      */
@@ -103,6 +103,9 @@ class StaffWebSocket {
         this._unsubscribers.push(
             core.on('message:queue_update', (data) => this._handleQueueUpdate(data))
         );
+        this._unsubscribers.push(
+            core.on('message:queue_batch', (data) => this._handleQueueBatch(data))
+        );
         this._unsubscribers.push(
             core.on('message:new_order', (data) => this._handleNewOrder(data))
         );
@@ -182,6 +185,18 @@ class StaffWebSocket {
         }
     }
 
+    /**
+     * 處理合併後的隊列更新（整個批次只回調一次）
+     */
+    _handleQueueBatch(data) {
+        const events = data.events || [];
+        console.log(`📦 合併隊列更新: ${events.length} 個事件`);
+
+        if (this.options.onQueueUpdate && events.length) {
+            this.options.onQueueUpdate({ ...events[events.length - 1], batch: events });
+        }
+    }
+
     /**
      * 處理新訂單通知
      */